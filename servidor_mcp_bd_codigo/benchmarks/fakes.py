@@ -0,0 +1,66 @@
+import asyncio
+import hashlib
+import re
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class FakeLLMPrompter:
+    """
+    Prompter que simula la latencia del LLM sin hacer peticiones. Guarda el tamaño de los prompts generados.
+    """
+    model = "fake-llm"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.prompt_characters = 0
+
+    async def async_execute_prompt(self, prompt_messages):
+        self.calls += 1
+        self.prompt_characters += sum(len(message.content) for message in prompt_messages)
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return SimpleNamespace(content=f"Documentación del chunk {self.calls}")
+
+
+class FakeEmbedder:
+    def __init__(self, latency: float = 0.0, dimensions: int = 1536):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    async def async_embed_document(self, document: str):
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return [(len(document) % 100) / 100.0] * self.dimensions
+
+
+class HashingEmbedder(Embeddings):
+    """
+    Embedder determinista sin API: bolsa de palabras del texto en minúsculas, cada palabra suma en una dimensión
+    según su hash, normalizado. Cuenta las llamadas de consultas.
+    """
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+        self.query_calls = 0
+
+    def embed(self, text: str) -> List[float]:
+        embedding = np.zeros(self.dimensions, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            embedding[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimensions] += 1.0
+        norm = np.linalg.norm(embedding)
+        return (embedding / norm if norm > 0 else embedding).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        self.query_calls += 1
+        return self.embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed(text) for text in texts]
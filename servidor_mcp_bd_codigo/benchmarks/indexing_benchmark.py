@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+# El proyecto y su directorio padre deben estar en el path: el chunker carga las queries con
+# importlib.resources.files("servidor_mcp_bd_codigo")
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(PROJECT_DIR))
+os.environ.setdefault("INITIALIZE_DB", "false")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.fakes import FakeLLMPrompter, FakeEmbedder
+from benchmarks.synthetic_repo import generate_synthetic_repo
+from src.chunker.repo_chunker import FileChunker
+from src.code_indexer.repo_async_pipeline import run_documentation_pipeline
+from src.db.models import Base, FileChunk
+
+"""
+Benchmark del chunking y del pipeline de documentación.
+
+Genera un repositorio sintético (o usa uno existente), lo divide en chunks con FileChunker y ejecuta el pipeline
+de documentación con un LLM y un embedder falsos. El resultado es un JSON con ficheros/s, chunks/s, round trips a
+la base de datos, pico de memoria y latencias por etapa, que se puede comparar entre commits con el comando compare.
+
+Uso:
+    python benchmarks/indexing_benchmark.py run --files 200 --languages python=0.6,java=0.2,javascript=0.2 --output base.json
+    python benchmarks/indexing_benchmark.py compare base.json new.json
+
+Por defecto se usa una base de datos SQLite en memoria, con --db-url se puede indicar una base de datos PostgreSQL.
+"""
+
+
+class DBRoundTripCounter:
+    """Cuenta las sentencias enviadas a la base de datos"""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def reset(self) -> int:
+        count = self.count
+        self.count = 0
+        return count
+
+
+def peak_rss_mb() -> float:
+    # En linux ru_maxrss se indica en KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(latencies: List[float]) -> dict:
+    if len(latencies) == 0:
+        return {"count": 0}
+    sorted_latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean": statistics.mean(latencies),
+        "p50": sorted_latencies[len(sorted_latencies) // 2],
+        "p95": sorted_latencies[min(len(sorted_latencies) - 1, int(len(sorted_latencies) * 0.95))],
+        "max": sorted_latencies[-1]
+    }
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def count_repo_files(repo_path: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(repo_path))
+
+
+def create_benchmark_session(db_url: str):
+    if db_url.startswith("sqlite"):
+        engine = create_engine(db_url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(db_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    return engine, session
+
+
+def run_indexing_benchmark(repo_path: str, db_url: str = "sqlite://", llm_latency: float = 0.0,
+                           embedding_latency: float = 0.0, chunk_max_line_size: int = 200,
+                           chunk_minimum_proportion: float = 0.2, run_pipeline: bool = True) -> dict:
+    engine, session = create_benchmark_session(db_url)
+    round_trip_counter = DBRoundTripCounter(engine)
+    num_files = count_repo_files(repo_path)
+    report = {
+        "commit": get_git_commit(),
+        "repo_path": repo_path,
+        "db_url": db_url.split("@")[-1],
+        "files": num_files
+    }
+
+    # Chunking
+    chunking_start = time.perf_counter()
+    file_chunker = FileChunker(
+        chunk_max_line_size=chunk_max_line_size,
+        chunk_minimum_proportion=chunk_minimum_proportion,
+        session=session
+    )
+    file_chunker.chunk_repo(repo_path, [".git"])
+    chunking_time = time.perf_counter() - chunking_start
+    num_chunks = session.query(FileChunk).count()
+    report["chunking"] = {
+        "seconds": chunking_time,
+        "chunks": num_chunks,
+        "files_per_second": num_files / chunking_time,
+        "chunks_per_second": num_chunks / chunking_time,
+        "db_round_trips": round_trip_counter.reset(),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+    # Pipeline de documentación
+    if run_pipeline:
+        llm_prompter = FakeLLMPrompter(latency=llm_latency)
+        llm_embedder = FakeEmbedder(latency=embedding_latency)
+        pipeline_start = time.perf_counter()
+        result_context = asyncio.run(run_documentation_pipeline(
+            repo_path,
+            files_to_ignore=[],
+            log_frequency=10 ** 9,
+            db_session=session,
+            llm_prompter=llm_prompter,
+            llm_embedder=llm_embedder
+        ))
+        pipeline_time = time.perf_counter() - pipeline_start
+        documented_chunks = result_context.stats.get("total_chunks", 0)
+
+        report["pipeline"] = {
+            "seconds": pipeline_time,
+            "chunks": documented_chunks,
+            "chunks_per_second": documented_chunks / pipeline_time if pipeline_time > 0 else 0,
+            "db_round_trips": round_trip_counter.reset(),
+            "peak_rss_mb": peak_rss_mb(),
+            "llm_calls": llm_prompter.calls,
+            "prompt_characters": llm_prompter.prompt_characters,
+            "embedding_calls": llm_embedder.calls,
+            "stage_latencies": {
+                stage_name: latency_stats(progress.latencies)
+                for stages in result_context.stage_progress.values()
+                for stage_name, progress in stages.items()
+            }
+        }
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    session.close()
+    engine.dispose()
+    return report
+
+
+def flatten_report(report: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in report.items():
+        if key == "parameters":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten_report(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_reports(base_report: dict, new_report: dict) -> str:
+    """
+    Devuelve una tabla con la variación de cada métrica numérica entre dos ejecuciones.
+    """
+    base = flatten_report(base_report)
+    new = flatten_report(new_report)
+    lines = [f"base: {base_report.get('commit')}  nuevo: {new_report.get('commit')}",
+             f"{'métrica':<55}{'base':>14}{'nuevo':>14}{'cambio':>10}"]
+    for metric in sorted(set(base) & set(new)):
+        change = ((new[metric] - base[metric]) / base[metric] * 100) if base[metric] else 0.0
+        lines.append(f"{metric:<55}{base[metric]:>14.3f}{new[metric]:>14.3f}{change:>9.1f}%")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del chunker y del pipeline de documentación")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--repo-path", help="Repositorio a indexar, si no se indica se genera uno sintético")
+    run_parser.add_argument("--files", type=int, default=100)
+    run_parser.add_argument("--languages", default="python=0.6,java=0.2,javascript=0.2")
+    run_parser.add_argument("--functions-per-file", type=int, default=8)
+    run_parser.add_argument("--lines-per-function", type=int, default=15)
+    run_parser.add_argument("--no-example-files", action="store_true")
+    run_parser.add_argument("--db-url", default="sqlite://")
+    run_parser.add_argument("--llm-latency", type=float, default=0.0)
+    run_parser.add_argument("--embedding-latency", type=float, default=0.0)
+    run_parser.add_argument("--chunk-max-line-size", type=int, default=200)
+    run_parser.add_argument("--skip-pipeline", action="store_true")
+    run_parser.add_argument("--output", help="Fichero JSON donde guardar el resultado")
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base) as base_file, open(args.new) as new_file:
+            print(compare_reports(json.load(base_file), json.load(new_file)))
+        return
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        repo_path = args.repo_path or generate_synthetic_repo(
+            os.path.join(temporary_dir, "synthetic_repo"),
+            num_files=args.files,
+            language_mix=args.languages,
+            functions_per_file=args.functions_per_file,
+            lines_per_function=args.lines_per_function,
+            include_example_files=not args.no_example_files
+        )
+        report = run_indexing_benchmark(
+            repo_path,
+            db_url=args.db_url,
+            llm_latency=args.llm_latency,
+            embedding_latency=args.embedding_latency,
+            chunk_max_line_size=args.chunk_max_line_size,
+            run_pipeline=not args.skip_pipeline
+        )
+        report["parameters"] = vars(args)
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(report_json)
+    print(report_json)
+
+
+if __name__ == "__main__":
+    main()
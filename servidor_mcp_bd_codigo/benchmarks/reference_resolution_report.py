@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(PROJECT_DIR))
+os.environ.setdefault("INITIALIZE_DB", "false")
+
+from src.chunker.repo_chunker import FileChunker
+from src.chunker.reference_resolver import ReferenceResolver
+
+"""
+Informe de aristas de referencias antes y después de la resolución por imports y ámbitos.
+
+Divide cada repositorio en chunks en modo exportación (sin base de datos) y muestra el número de aristas que se
+crearían enlazando cada referencia con todas las definiciones del mismo nombre frente a las que se crean con el
+resolver, junto a los nombres con más aristas en cada caso.
+
+Uso:
+    python benchmarks/reference_resolution_report.py tests/chunker/example_files src --max-fanout 5
+"""
+
+DEFAULT_FIXTURE_REPOS = [os.path.join(PROJECT_DIR, "tests", "chunker", "example_files")]
+
+
+def get_reference_resolution_report(repo_path: str, max_fanout: int = None, chunk_max_line_size: int = 100,
+                                    ignored_entries: List[str] = None) -> dict:
+    reference_resolver = ReferenceResolver() if max_fanout is None else ReferenceResolver(max_fanout=max_fanout)
+    file_chunker = FileChunker(chunk_max_line_size=chunk_max_line_size)
+    file_chunker.chunk_creator.reference_resolver = reference_resolver
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        snapshot = file_chunker.chunk_repo(repo_path, list(ignored_entries or [".git"]), export_dir=export_dir)
+    stats = reference_resolver.stats
+
+    report = {
+        "repo_path": repo_path,
+        "max_fanout": reference_resolver.max_fanout,
+        "chunks": len(snapshot.chunks),
+        "stored_edges": len(snapshot.references),
+        **stats.to_dict()
+    }
+    if stats.naive_edges > 0:
+        report["edge_reduction"] = round(1 - stats.resolved_edges / stats.naive_edges, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aristas de referencias antes y después de resolverlas")
+    parser.add_argument("repos", nargs="*", default=DEFAULT_FIXTURE_REPOS)
+    parser.add_argument("--max-fanout", type=int, default=None)
+    parser.add_argument("--chunk-max-line-size", type=int, default=100)
+    args = parser.parse_args()
+
+    for repo_path in args.repos:
+        report = get_reference_resolution_report(
+            os.path.abspath(repo_path),
+            max_fanout=args.max_fanout,
+            chunk_max_line_size=args.chunk_max_line_size
+        )
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import os
+import random
+import shutil
+from typing import Dict
+
+from config import ROOT_DIR, TEST_EXAMPLE_FILES_PATH
+
+"""
+Generador de repositorios sintéticos para los benchmarks de indexación.
+
+Cada fichero contiene clases y funciones que llaman a definiciones de otros ficheros, de forma que el chunker
+encuentra tanto definiciones como referencias entre ficheros.
+"""
+
+LANGUAGE_EXTENSIONS = {
+    "python": "py",
+    "java": "java",
+    "javascript": "js"
+}
+
+
+def parse_language_mix(language_mix: str) -> Dict[str, float]:
+    """
+    Convierte una cadena del tipo python=0.6,java=0.2,javascript=0.2 en un diccionario de proporciones.
+    """
+    mix = {}
+    for part in language_mix.split(","):
+        language, proportion = part.split("=")
+        if language not in LANGUAGE_EXTENSIONS:
+            raise ValueError(f"Lenguaje no soportado: {language}")
+        mix[language] = float(proportion)
+    total = sum(mix.values())
+    return {language: proportion / total for language, proportion in mix.items()}
+
+
+def python_file(file_index: int, functions_per_file: int, lines_per_function: int, referenced_names: list) -> str:
+    lines = ["import os", "", "", f"class Module{file_index}:"]
+    for i in range(functions_per_file):
+        lines.append(f"    def method_{file_index}_{i}(self, value):")
+        for j in range(lines_per_function):
+            lines.append(f"        value = value + {j}  # paso {j}")
+        lines.append(f"        {random.choice(referenced_names)}(value)")
+        lines.append("        return value")
+        lines.append("")
+    for i in range(functions_per_file):
+        lines.append(f"def function_{file_index}_{i}(value):")
+        for j in range(lines_per_function):
+            lines.append(f"    value = value * {j + 1}")
+        lines.append(f"    return {random.choice(referenced_names)}(value)")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def java_file(file_index: int, functions_per_file: int, lines_per_function: int, referenced_names: list) -> str:
+    lines = ["package synthetic;", "", f"public class Module{file_index} {{"]
+    for i in range(functions_per_file):
+        lines.append(f"    public int method_{file_index}_{i}(int value) {{")
+        for j in range(lines_per_function):
+            lines.append(f"        value = value + {j};")
+        lines.append(f"        {random.choice(referenced_names)}(value);")
+        lines.append("        return value;")
+        lines.append("    }")
+        lines.append("")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def javascript_file(file_index: int, functions_per_file: int, lines_per_function: int, referenced_names: list) -> str:
+    lines = [f"class Module{file_index} {{"]
+    for i in range(functions_per_file):
+        lines.append(f"    method_{file_index}_{i}(value) {{")
+        for j in range(lines_per_function):
+            lines.append(f"        value = value + {j};")
+        lines.append(f"        {random.choice(referenced_names)}(value);")
+        lines.append("        return value;")
+        lines.append("    }")
+        lines.append("")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+LANGUAGE_GENERATORS = {
+    "python": python_file,
+    "java": java_file,
+    "javascript": javascript_file
+}
+
+
+def generate_synthetic_repo(repo_path: str, num_files: int = 100, language_mix: str = "python=1",
+                            functions_per_file: int = 8, lines_per_function: int = 15, files_per_directory: int = 10,
+                            include_example_files: bool = True, seed: int = 42) -> str:
+    """
+    Genera el repositorio sintético en repo_path. Si include_example_files es True también se copian los ficheros
+    de ejemplo de los tests del chunker.
+    """
+    random.seed(seed)
+    mix = parse_language_mix(language_mix)
+    if os.path.exists(repo_path):
+        shutil.rmtree(repo_path)
+    os.makedirs(repo_path)
+
+    languages = list(mix.keys())
+    weights = [mix[language] for language in languages]
+    all_names = [f"function_{i}_{j}" for i in range(num_files) for j in range(functions_per_file)]
+
+    for file_index in range(num_files):
+        language = random.choices(languages, weights=weights)[0]
+        directory = os.path.join(repo_path, f"package_{file_index // files_per_directory}")
+        os.makedirs(directory, exist_ok=True)
+
+        file_text = LANGUAGE_GENERATORS[language](
+            file_index, functions_per_file, lines_per_function, random.sample(all_names, min(5, len(all_names)))
+        )
+        file_name = f"module_{file_index}.{LANGUAGE_EXTENSIONS[language]}"
+        with open(os.path.join(directory, file_name), "w", encoding="utf-8") as file:
+            file.write(file_text)
+
+    if include_example_files:
+        example_files_path = os.path.join(ROOT_DIR, TEST_EXAMPLE_FILES_PATH)
+        shutil.copytree(example_files_path, os.path.join(repo_path, "example_files"))
+
+    return repo_path
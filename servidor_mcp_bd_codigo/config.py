@@ -1,4 +1,5 @@
 import os
+import json
 #from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_openai import OpenAIEmbeddings
 
@@ -22,7 +23,93 @@ MAX_REFERENCING_CHUNKS = 1
 
 LLM_TEMPERATURE = 0.5
 
+# Número máximo de chunks con los que se enlaza una referencia al resolverla
+REFERENCE_MAX_FANOUT = int(os.environ.get("REFERENCE_MAX_FANOUT", 5))
+# Multiplicador del peso de las referencias entre chunks del mismo fichero
+REFERENCE_SAME_FILE_WEIGHT = 1.25
+# Número de vecinos por chunk y dirección que se guardan en la tabla chunk_neighbours
+CHUNK_NEIGHBOURS_TOP_K = 10
+
+# Unidad con la que se mide el tamaño de los chunks (lines o tokens), límite en tokens y codificación del tokenizador
+# (la del modelo de embeddings). Con lines el límite es el chunk_max_line_size del FileChunker
+CHUNK_SIZE_UNIT = os.environ.get("CHUNK_SIZE_UNIT", "lines")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", 1500))
+CHUNK_TOKENIZER_ENCODING = os.environ.get("CHUNK_TOKENIZER_ENCODING", "cl100k_base")
+
+# Ficheros más grandes se guardan solo como entrada del árbol, sin chunks
+FILE_CLASSIFIER_MAX_BYTES = int(os.environ.get("FILE_CLASSIFIER_MAX_BYTES", 1_000_000))
+# Categorías del clasificador de ficheros (binary, lockfile, generated, minified, data, too_large) que no se añaden al
+# árbol, el resto de ficheros descartados se guardan sin chunks
+FILE_CLASSIFIER_SKIP_CATEGORIES = [
+    category for category in os.environ.get("FILE_CLASSIFIER_SKIP_CATEGORIES", "").split(",") if category
+]
+
+# Endpoints entre los que se reparten las peticiones de documentación, en formato JSON:
+# [{"name": "azure-1", "model": "gpt-4o-mini", "base_url": "...", "api_key": "...", "weight": 2, "max_concurrency": 16}]
+# Si no se indica ninguno se usa un único cliente de OpenAI
+LLM_ENDPOINTS = json.loads(os.environ.get("LLM_ENDPOINTS", "[]"))
+
+# Modo batch del pipeline de documentación
+BATCH_WORK_DIR = os.environ.get("BATCH_WORK_DIR", "/tmp/code_indexer_batches")
+BATCH_POLL_INTERVAL = 30
+
+# Índice aproximado sobre file_chunks.embedding (hnsw, ivfflat o none para buscar siempre de forma exacta), sus
+# parámetros de construcción (VECTOR_INDEX_IVFFLAT_LISTS=0 calcula las listas según el número de chunks) y los
+# parámetros de búsqueda que se fijan en cada consulta
+VECTOR_INDEX_TYPE = os.environ.get("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_INDEX_HNSW_M = int(os.environ.get("VECTOR_INDEX_HNSW_M", 16))
+VECTOR_INDEX_HNSW_EF_CONSTRUCTION = int(os.environ.get("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", 64))
+VECTOR_INDEX_IVFFLAT_LISTS = int(os.environ.get("VECTOR_INDEX_IVFFLAT_LISTS", 0))
+VECTOR_SEARCH_HNSW_EF_SEARCH = int(os.environ.get("VECTOR_SEARCH_HNSW_EF_SEARCH", 40))
+VECTOR_SEARCH_IVFFLAT_PROBES = int(os.environ.get("VECTOR_SEARCH_IVFFLAT_PROBES", 10))
+# Planificador de las búsquedas en un directorio: hasta cuántos chunks del subárbol se busca de forma exacta, margen de
+# candidatos que se piden al índice aproximado sobre los esperados y máximo de candidatos (hnsw.ef_search <= 1000)
+SEARCH_PLANNER_EXACT_MAX_CHUNKS = int(os.environ.get("SEARCH_PLANNER_EXACT_MAX_CHUNKS", 2000))
+SEARCH_PLANNER_ANN_OVERFETCH = float(os.environ.get("SEARCH_PLANNER_ANN_OVERFETCH", 2.0))
+SEARCH_PLANNER_ANN_MAX_CANDIDATES = int(os.environ.get("SEARCH_PLANNER_ANN_MAX_CANDIDATES", 1000))
+# Representación compacta de los embeddings para la búsqueda aproximada (none, halfvec o binary) y cuántas veces más
+# candidatos se piden a la columna compacta antes de reordenarlos con los embeddings completos
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+VECTOR_QUANTIZATION_RERANK_FACTOR = int(os.environ.get("VECTOR_QUANTIZATION_RERANK_FACTOR", 4))
+# Modo de las búsquedas (vector, lexical o hybrid). hybrid combina los rankings vectorial y léxico con reciprocal rank
+# fusion (constante k de RRF) sobre los primeros candidatos de cada uno, y responde las consultas que son solo
+# identificadores con la búsqueda léxica, sin calcular el embedding
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "hybrid")
+HYBRID_SEARCH_CANDIDATES = int(os.environ.get("HYBRID_SEARCH_CANDIDATES", 30))
+HYBRID_SEARCH_RRF_K = int(os.environ.get("HYBRID_SEARCH_RRF_K", 60))
+# Máximo de consultas de la herramienta de búsqueda múltiple, se ejecutan en una sola sentencia por tipo de búsqueda
+MULTI_QUERY_MAX_QUERIES = int(os.environ.get("MULTI_QUERY_MAX_QUERIES", 8))
+# Caché de los embeddings de las consultas de búsqueda: entradas en memoria de cada proceso, validez de las entradas
+# (también las de la tabla compartida query_embeddings) y fichero opcional con las métricas en formato Prometheus
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+QUERY_EMBEDDING_CACHE_SHARED = os.environ.get("QUERY_EMBEDDING_CACHE_SHARED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_METRICS_PATH = os.environ.get("QUERY_EMBEDDING_CACHE_METRICS_PATH")
+# Herramientas de ir a la definición y buscar referencias: máximo de símbolos devueltos y de líneas de código de cada
+# definición
+SYMBOL_SEARCH_MAX_RESULTS = int(os.environ.get("SYMBOL_SEARCH_MAX_RESULTS", 20))
+SYMBOL_DEFINITION_MAX_LINES = int(os.environ.get("SYMBOL_DEFINITION_MAX_LINES", 60))
+# Herramienta de listado de ficheros: ficheros por página por defecto y máximo que se puede pedir
+FILE_LIST_PAGE_SIZE = int(os.environ.get("FILE_LIST_PAGE_SIZE", 200))
+FILE_LIST_MAX_PAGE_SIZE = int(os.environ.get("FILE_LIST_MAX_PAGE_SIZE", 1000))
+
+# Pool de conexiones asíncronas (asyncpg) de los servidores MCP. Cada llamada a una herramienta usa una conexión
+# mientras dura, el pool debe cubrir las llamadas simultáneas de los agentes; las que excedan pool_size + max_overflow
+# esperan hasta pool_timeout segundos
+DB_ASYNC_POOL_SIZE = int(os.environ.get("DB_ASYNC_POOL_SIZE", 10))
+DB_ASYNC_MAX_OVERFLOW = int(os.environ.get("DB_ASYNC_MAX_OVERFLOW", 10))
+DB_ASYNC_POOL_TIMEOUT = float(os.environ.get("DB_ASYNC_POOL_TIMEOUT", 30))
+
 DIRECTROY_TO_INDEX=os.getenv("DIRECTORY_TO_INDEX")
+# Ramas o tags a indexar desde los objetos de git, separados por comas. Si no se indica se indexa el directorio de trabajo
+GIT_REFS_TO_INDEX = [ref for ref in os.getenv("GIT_REFS_TO_INDEX", "").split(",") if ref]
+
+# Watcher del directorio de trabajo: segundos sin cambios antes de actualizar el índice, espera máxima durante una
+# ráfaga de cambios, intervalo del sondeo si no hay inotify y fichero de métricas en formato textfile de Prometheus
+INDEX_WATCHER_DEBOUNCE_SECONDS = float(os.environ.get("INDEX_WATCHER_DEBOUNCE_SECONDS", 2.0))
+INDEX_WATCHER_MAX_DELAY_SECONDS = float(os.environ.get("INDEX_WATCHER_MAX_DELAY_SECONDS", 30.0))
+INDEX_WATCHER_POLL_INTERVAL = float(os.environ.get("INDEX_WATCHER_POLL_INTERVAL", 1.0))
+INDEX_WATCHER_METRICS_PATH = os.environ.get("INDEX_WATCHER_METRICS_PATH")
 
 # No se usa para los tests por lo que no es necesario cambiarlo
 REPO_ROOT_ABSOLUTE_PATH = os.environ.get("REPO_ROOT_ABSOLUTE_PATH", "/home/martin/open_source/ia-core-tools")
@@ -32,6 +119,10 @@ ROOT_DIR = os.environ.get("ROOT_DIR", os.path.dirname(os.path.abspath(__file__))
 
 # directorios a ignorar solo para la visualización del aŕbol
 TREE_STR_IGNORE_DIRS = [".git"]
+# Tokens máximos del árbol del repositorio de get_repository_tree_tool (0 sin límite), los directorios que no caben se
+# muestran contraídos con su número de ficheros, y árboles renderizados que se guardan por versión del índice
+REPOSITORY_TREE_TOKEN_BUDGET = int(os.environ.get("REPOSITORY_TREE_TOKEN_BUDGET", 4000)) or None
+REPOSITORY_TREE_MAX_RENDERED = int(os.environ.get("REPOSITORY_TREE_MAX_RENDERED", 256))
 
 files_to_ignore = [".git",
                    "app/static/css/style.css",
@@ -1,4 +1,4 @@
-from config import files_to_ignore, DIRECTROY_TO_INDEX
+from config import files_to_ignore, DIRECTROY_TO_INDEX, GIT_REFS_TO_INDEX
 from dotenv import load_dotenv
 
 from src.db.db_connection import DBConnection
@@ -12,17 +12,25 @@ if __name__ == '__main__':
     try:
         print(__package__)
 
-        file_chunker = FileChunker(
-            chunk_max_line_size=200,
-            chunk_minimum_proportion=0.2
-        )
-        file_chunker.chunk_repo(DIRECTROY_TO_INDEX,
-                                [".git",
-                                 "app/static/css/style.css",
-                                 "app/static/js/bootstrap.bundle.js",
-                                 "app/static/js/bootstrap.bundle.min.js",
-                                 "app/static/vendor"]
-                                )
+        if GIT_REFS_TO_INDEX:
+            # los ficheros sin cambios entre refs comparten chunks, solo se documentan una vez
+            for ref in GIT_REFS_TO_INDEX:
+                FileChunker(
+                    chunk_max_line_size=200,
+                    chunk_minimum_proportion=0.2
+                ).chunk_git_ref(DIRECTROY_TO_INDEX, ref, files_to_ignore)
+        else:
+            file_chunker = FileChunker(
+                chunk_max_line_size=200,
+                chunk_minimum_proportion=0.2
+            )
+            file_chunker.chunk_repo(DIRECTROY_TO_INDEX,
+                                    [".git",
+                                     "app/static/css/style.css",
+                                     "app/static/js/bootstrap.bundle.js",
+                                     "app/static/js/bootstrap.bundle.min.js",
+                                     "app/static/vendor"]
+                                    )
 
         """
         file_chunker.chunk_repo("/home/martin/open_source/ia-core-tools",
@@ -1,7 +1,17 @@
+from collections import Counter
 from typing import List
 
-from src.db.models import FileChunk, FSEntry
+from sqlalchemy import update, bindparam, delete, insert
+
+from src.db.models import FileChunk, FSEntry, Symbol, chunk_references
+from src.db.db_utils import add_fs_entry
+from src.chunker.reference_resolver import ReferenceResolver, ReferenceEdge
+from src.chunker.chunk_hashing import get_normalized_code_lines, compute_content_hash
+from src.chunker.chunk_identifiers import get_chunk_identifiers
+from src.chunker.chunk_symbols import get_file_symbol_rows
+from src.chunker.chunk_size import FileTokenCounter, ChunkSizeReport, create_chunk_size_measure
 from src.utils.utils import get_count_text_lines
+from config import CHUNK_SIZE_UNIT, CHUNK_MAX_TOKENS
 
 
 class ChunkCreator:
@@ -13,18 +23,109 @@ class ChunkCreator:
     not_solved_references: dict[int, List[str]]
     # nombre definiciones -> lista chunk ids en las que se definen (puede que los chunks se solapen o que una referencia sea ambigua)
     name_definitions: dict[str, List[int]]
+    # (id chunk origen, id chunk destino) -> arista con los datos para calcular su peso
+    reference_edges: dict[tuple[int, int], ReferenceEdge]
 
-    def __init__(self, db_session, chunk_max_line_size: int = 100, chunk_minimum_proportion: float = 0.2, overlap_size: int = 10):
+    def __init__(self, db_session, chunk_max_line_size: int = 100, chunk_minimum_proportion: float = 0.2, overlap_size: int = 10,
+                 reference_resolver: ReferenceResolver = None, size_unit: str = CHUNK_SIZE_UNIT,
+                 chunk_max_tokens: int = CHUNK_MAX_TOKENS):
         self.db_session = db_session
         self.chunk_max_line_size = chunk_max_line_size
         self.minimum_proportion = chunk_minimum_proportion
         # si mínimo queremos 20 líneas y máximo 100, entonces la esperada será 60
         self.chunk_expected_size =int((chunk_max_line_size + chunk_max_line_size * chunk_minimum_proportion) // 2)
         self.overlap_size = overlap_size
+        # tamaño de los chunks en líneas o tokens, los tokens se cuentan siempre para el informe de tamaños
+        self.token_counter = FileTokenCounter()
+        self.size_measure = create_chunk_size_measure(self.token_counter, size_unit, chunk_max_line_size, chunk_max_tokens)
+        self.size_report = ChunkSizeReport(max_tokens=chunk_max_tokens)
 
         self.solved_references = {}
         self.not_solved_references = {}
         self.name_definitions = {}
+        self.reference_edges = {}
+        self.reference_resolver = reference_resolver or ReferenceResolver()
+        # líneas del fichero que se está chunkeando sin comentarios, para calcular el hash de los chunks
+        self.file_normalized_lines = []
+        # blob de git del fichero que se está chunkeando, None si se lee del directorio de trabajo
+        self.file_blob_sha = None
+        # (blob, línea inicial, línea final) -> id del chunk, para reutilizar los chunks de blobs ya indexados
+        self.blob_chunk_ids = {}
+        # (id fichero, línea inicial, línea final) -> id del chunk, para reutilizar los chunks de ficheros sin cambios
+        self.file_chunk_ids = {}
+        # (id del chunk, línea inicial, línea final) de los chunks del fichero actual, para asignar sus símbolos
+        self.file_chunk_ranges = []
+
+    def set_file_content(self, code_text: str, root_node=None, blob_sha: str = None):
+        self.file_normalized_lines = get_normalized_code_lines(code_text, root_node)
+        self.token_counter.set_file_content(code_text)
+        self.file_blob_sha = blob_sha
+        self.file_chunk_ranges = []
+
+    def register_file(self, file_id: int, relative_path: str, language: str = None, root_node=None):
+        """
+        Registra la ruta de módulo y los imports del fichero para resolver sus referencias
+        """
+        self.reference_resolver.register_file(file_id, relative_path, language, root_node)
+
+    def add_file_symbols_to_db(self, file_id: int, definitions: list, references: list):
+        """
+        Sustituye los símbolos del fichero por las definiciones y referencias encontradas al chunkearlo
+        """
+        self.db_session.execute(delete(Symbol).where(Symbol.file_id == file_id))
+        rows = get_file_symbol_rows(file_id, definitions, references, self.file_chunk_ranges)
+        if rows:
+            self.db_session.execute(insert(Symbol), rows)
+
+    def get_referenced_definition_chunks(self, chunk_id: int, ref_name: str, reference_count: int = 1) -> List[int]:
+        """
+        Devuelve los chunks que definen el nombre referenciado, ordenados y filtrados por el resolver según imports y ámbito.
+        En el caso de que la referencia sea una función que se define fuera del repositorio, devuelve None.
+        Anota las aristas resultantes con el número de referencias y la confianza para calcular su peso.
+        """
+        chunk_id_definitions = self.name_definitions.get(ref_name)
+        if chunk_id_definitions is None:
+            return None
+        resolved_candidates = self.reference_resolver.resolve(chunk_id, ref_name, chunk_id_definitions)
+        for candidate in resolved_candidates:
+            self.anotate_reference_edge(chunk_id, candidate.chunk_id, candidate.confidence, reference_count)
+        return [candidate.chunk_id for candidate in resolved_candidates]
+
+    def anotate_reference_edge(self, chunk_id: int, definition_chunk_id: int, confidence: float, reference_count: int):
+        """
+        Si varias referencias del chunk apuntan al mismo chunk se suman sus apariciones y se queda la mayor confianza
+        """
+        edge = self.reference_edges.get((chunk_id, definition_chunk_id))
+        if edge is None:
+            edge = ReferenceEdge(
+                referencing_id=chunk_id,
+                referenced_id=definition_chunk_id,
+                same_file=self.reference_resolver.is_same_file(chunk_id, definition_chunk_id)
+            )
+            self.reference_edges[(chunk_id, definition_chunk_id)] = edge
+        edge.reference_count += reference_count
+        edge.confidence = max(edge.confidence, confidence)
+
+    def add_chunk_reference_weights_to_db(self):
+        """
+        Actualiza el peso de las referencias ya añadidas a la base de datos con un único executemany
+        """
+        rows = [
+            {**edge.to_row(), "b_referencing_id": edge.referencing_id, "b_referenced_id": edge.referenced_id}
+            for edge in self.reference_edges.values()
+        ]
+        if not rows:
+            return
+        stmt = update(chunk_references).where(
+            chunk_references.c.referencing_id == bindparam("b_referencing_id"),
+            chunk_references.c.referenced_id == bindparam("b_referenced_id")
+        ).values(
+            reference_count=bindparam("reference_count"),
+            confidence=bindparam("confidence"),
+            same_file=bindparam("same_file"),
+            weight=bindparam("weight")
+        )
+        self.db_session.connection().execute(stmt, rows)
 
     def solve_unsolved_references(self):
         for chunk_id, ref_names in self.not_solved_references.items():
@@ -36,8 +137,9 @@ class ChunkCreator:
     def add_chunk_references_to_db(self):
         for chunk_id, ref_names in self.solved_references.items():
             chunk = self.db_session.query(FileChunk).filter(FileChunk.chunk_id==chunk_id).one()
-            for ref_name in ref_names:
-                chunk_id_definitions = self.name_definitions.get(ref_name)
+            ref_name_counts = Counter(ref_names)
+            for ref_name in ref_name_counts:
+                chunk_id_definitions = self.get_referenced_definition_chunks(chunk_id, ref_name, ref_name_counts[ref_name])
                 """
                 En el caso de que un chunk sea referenciado por un chunk al que quiere referenciar no referenciarlo para evitar 
                 dependencias cíclicas.
@@ -93,6 +195,7 @@ class ChunkCreator:
             definition_is_inside_chunk = self.definition_is_inside_chunk(definition, chunk_start_line, chunk_end_line)
             if (definition_is_inside_chunk):
                 defined_definitions.append(definition.name)
+                self.reference_resolver.add_definition(chunk_id, definition.name, definition.class_name)
         for definition in defined_definitions:
             if definition not in self.name_definitions:
                 self.name_definitions[definition] = []
@@ -103,7 +206,8 @@ class ChunkCreator:
         self.not_solved_references[chunk_id] = []
         for reference in references:
             if reference.start_point.row >= chunk_start_line and reference.end_point.row <= chunk_end_line:
-                reference_text = reference.text.decode("utf-8")
+                reference_text = reference.name
+                self.reference_resolver.add_reference(chunk_id, reference)
                 if reference_text in self.name_definitions:
                     if chunk_id not in self.solved_references:
                         self.solved_references[chunk_id] = []
@@ -119,38 +223,69 @@ class ChunkCreator:
         if references is None:
             references = {}
 
-        chunk_size = chunk_end_line - chunk_start_line
-        num_chunks = (chunk_size // self.chunk_max_line_size) + 1
-        if num_chunks >= 2:
-            chunk_size = (chunk_size // num_chunks) + 1
-        for i in range(num_chunks):
+        for range_start_line, range_end_line in self.size_measure.split(chunk_start_line, chunk_end_line):
             self.create_chunk(
-                chunk_start_line=chunk_start_line,
-                chunk_end_line=chunk_start_line + chunk_size,
+                chunk_start_line=range_start_line,
+                chunk_end_line=range_end_line,
                 definitions=definitions,
                 references=references,
                 file_id=file_id
             )
-            chunk_start_line += chunk_size
 
-    def create_chunk(self, chunk_start_line: int, chunk_end_line: int, definitions: dict, references: dict, file_id: int):
+    def add_fs_entry(self, name: str, parent_id: int, is_directory: bool, skip_reason: str = None,
+                     blob_sha: str = None):
         """
-        Crea los chunk y los añade a la base de datos.
-        Aplica el overlap indicado.
+        Añade el fichero o directorio a la base de datos. Devuelve la entrada con su id asignado.
         """
-        chunk_start_line = max(0, chunk_start_line - self.overlap_size)
-        # no se considera si el en line es mayor que el final del chunk -> más rentable ignorarlo
-        chunk_end_line = chunk_end_line + self.overlap_size
+        return add_fs_entry(
+            session=self.db_session,
+            name=name,
+            parent_id=parent_id,
+            is_directory=is_directory,
+            skip_reason=skip_reason,
+            blob_sha=blob_sha
+        )
 
+    def persist_chunk(self, file_id: int, chunk_start_line: int, chunk_end_line: int, content_hash: str = None,
+                      blob_sha: str = None, identifiers: str = None) -> int:
+        """
+        Añade el chunk a la base de datos y devuelve su id.
+        """
         chunk = FileChunk(
             file_id=file_id,
             start_line=chunk_start_line,
-            end_line=chunk_end_line
+            end_line=chunk_end_line,
+            content_hash=content_hash,
+            blob_sha=blob_sha,
+            identifiers=identifiers
         )
         self.db_session.add(chunk)
         self.db_session.flush()
-        chunk_id = chunk.chunk_id
+        return chunk.chunk_id
+
+    def create_chunk(self, chunk_start_line: int, chunk_end_line: int, definitions: dict, references: dict, file_id: int):
+        """
+        Crea los chunk y los añade a la base de datos.
+        Aplica el overlap indicado.
+        """
+        # no se considera si el en line es mayor que el final del chunk -> más rentable ignorarlo
+        chunk_start_line, chunk_end_line = self.size_measure.add_overlap(chunk_start_line, chunk_end_line, self.overlap_size)
+
+        # el chunkeado es determinista, un blob ya indexado en otra ref o un fichero sin cambios tiene los mismos chunks
+        if self.file_blob_sha is not None:
+            existing_chunk_ids, chunk_key = self.blob_chunk_ids, (self.file_blob_sha, chunk_start_line, chunk_end_line)
+        else:
+            existing_chunk_ids, chunk_key = self.file_chunk_ids, (file_id, chunk_start_line, chunk_end_line)
+        chunk_id = existing_chunk_ids.get(chunk_key)
+        if chunk_id is None:
+            chunk_lines = self.file_normalized_lines[chunk_start_line:chunk_end_line + 1]
+            chunk_id = self.persist_chunk(file_id, chunk_start_line, chunk_end_line, compute_content_hash(chunk_lines),
+                                          self.file_blob_sha, get_chunk_identifiers(chunk_lines))
+            existing_chunk_ids[chunk_key] = chunk_id
+        self.reference_resolver.register_chunk(chunk_id, file_id)
+        self.file_chunk_ranges.append((chunk_id, chunk_start_line, chunk_end_line))
+        self.size_report.add(chunk_end_line - chunk_start_line, self.token_counter.count(chunk_start_line, chunk_end_line))
 
         self.anotate_definitions(chunk_id, definitions, chunk_start_line, chunk_end_line)
         self.anotate_references(chunk_id, references, chunk_start_line, chunk_end_line)
-        return chunk.chunk_id
+        return chunk_id
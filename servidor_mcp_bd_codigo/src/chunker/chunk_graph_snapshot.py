@@ -0,0 +1,344 @@
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+from sqlalchemy import insert, select, func
+from sqlalchemy.orm import Session
+
+from src.chunker.chunk_creator import ChunkCreator
+from src.chunker.chunk_symbols import get_file_symbol_rows
+from src.chunker.reference_resolver import ReferenceResolver, ReferenceEdge
+from src.db.db_utils import compute_chunk_neighbours, mark_duplicate_chunks, reset_postgres_sequence, \
+    bump_index_version
+from src.db.models import FSEntry, Ancestor, FileChunk, Symbol, chunk_references
+from config import CHUNK_SIZE_UNIT, CHUNK_MAX_TOKENS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+"""
+Exportación e importación del grafo de chunks sin acceso a base de datos.
+
+El modo exportación de FileChunker.chunk_repo utiliza SnapshotChunkCreator, que asigna los ids en memoria en lugar de
+hacer un flush por cada fsentry y chunk. El resultado se escribe en un directorio con un fichero por tabla:
+- fsentry, ancestors, file_chunks y chunk_references: Las mismas columnas que las tablas de la base de datos.
+- definitions: Las definiciones encontradas en cada chunk, no se guardan en base de datos.
+- symbols: Las filas de la tabla symbols de cada fichero (definiciones y llamadas), creadas con get_file_symbol_rows
+  como al chunkear en base de datos.
+- manifest.json: Formato, número de filas de cada tabla y repositorio de origen.
+
+import_chunk_graph_snapshot carga el directorio en la base de datos en una sola transacción. Los ids del snapshot
+empiezan en 1, por lo que se desplazan a partir de los ids máximos existentes para no colisionar con otros repositorios.
+"""
+
+SNAPSHOT_FORMATS = ["jsonl", "parquet"]
+SNAPSHOT_TABLES = ["fsentry", "ancestors", "file_chunks", "definitions", "symbols", "chunk_references"]
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+@dataclass
+class SnapshotFSEntry:
+    """Entrada del árbol de ficheros del snapshot, tiene los mismos atributos que usa FileChunker de FSEntry"""
+    id: int
+    name: str
+    parent_id: Optional[int]
+    is_directory: bool
+    path: str
+
+
+class ChunkGraphSnapshot:
+    fs_entries: List[dict]
+    ancestors: List[dict]
+    chunks: List[dict]
+    definitions: List[dict]
+    symbols: List[dict]
+    references: List[dict]
+
+    def __init__(self, repo_path: str = None):
+        self.repo_path = repo_path
+        self.fs_entries = []
+        self.ancestors = []
+        self.chunks = []
+        self.definitions = []
+        self.symbols = []
+        self.references = []
+        # informe del clasificador de ficheros de la ejecución que generó el snapshot
+        self.file_classification = None
+        self.chunk_sizes = None
+
+        # id fsentry -> ruta relativa, id fsentry -> lista (id ancestro, profundidad)
+        self._entry_paths = {}
+        self._entry_ancestors = {}
+        self._reference_pairs = set()
+
+    def add_fs_entry(self, name: str, parent_id: Optional[int], is_directory: bool,
+                     skip_reason: str = None, blob_sha: str = None) -> SnapshotFSEntry:
+        """
+        Misma lógica que db_utils.add_fs_entry: la raíz tiene ruta vacía y cada entrada es ancestro de sí misma con
+        profundidad 0.
+        """
+        entry_id = len(self.fs_entries) + 1
+        if parent_id is None:
+            path = ""
+        else:
+            path = os.path.join(self._entry_paths[parent_id], name)
+
+        entry_ancestors = [(entry_id, 0)]
+        if parent_id is not None:
+            entry_ancestors += [(ancestor_id, depth + 1) for ancestor_id, depth in self._entry_ancestors[parent_id]]
+
+        self._entry_paths[entry_id] = path
+        self._entry_ancestors[entry_id] = entry_ancestors
+        self.fs_entries.append({
+            "id": entry_id,
+            "name": name,
+            "parent_id": parent_id,
+            "is_directory": is_directory,
+            "path": path,
+            "skip_reason": skip_reason,
+            "blob_sha": blob_sha
+        })
+        for ancestor_id, depth in entry_ancestors:
+            self.ancestors.append({"descendant_id": entry_id, "ancestor_id": ancestor_id, "depth": depth})
+
+        return SnapshotFSEntry(id=entry_id, name=name, parent_id=parent_id, is_directory=is_directory, path=path)
+
+    def add_chunk(self, file_id: int, start_line: int, end_line: int, content_hash: str = None,
+                  blob_sha: str = None, identifiers: str = None) -> int:
+        chunk_id = len(self.chunks) + 1
+        self.chunks.append({
+            "chunk_id": chunk_id,
+            "file_id": file_id,
+            "start_line": start_line,
+            "end_line": end_line,
+            "content_hash": content_hash,
+            "blob_sha": blob_sha,
+            "identifiers": identifiers
+        })
+        return chunk_id
+
+    def add_definition(self, chunk_id: int, name: str, is_class: bool, start_line: int, end_line: int):
+        self.definitions.append({
+            "chunk_id": chunk_id,
+            "name": name,
+            "is_class": is_class,
+            "start_line": start_line,
+            "end_line": end_line
+        })
+
+    def add_symbols(self, rows: List[dict]):
+        self.symbols.extend(rows)
+
+    def add_reference(self, edge: ReferenceEdge):
+        # importante no añadirla si ya existe
+        if edge.referencing_id == edge.referenced_id or (edge.referencing_id, edge.referenced_id) in self._reference_pairs:
+            return
+        self._reference_pairs.add((edge.referencing_id, edge.referenced_id))
+        self.references.append(edge.to_row())
+
+    def get_tables(self) -> Dict[str, List[dict]]:
+        return {
+            "fsentry": self.fs_entries,
+            "ancestors": self.ancestors,
+            "file_chunks": self.chunks,
+            "definitions": self.definitions,
+            "symbols": self.symbols,
+            "chunk_references": self.references
+        }
+
+    def write(self, output_dir: str, export_format: str = "jsonl"):
+        if export_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Formato de exportación no soportado: {export_format}, formatos: {SNAPSHOT_FORMATS}")
+        if export_format == "parquet" and pa is None:
+            raise ImportError("Es necesario instalar pyarrow para exportar el snapshot en formato parquet")
+
+        os.makedirs(output_dir, exist_ok=True)
+        tables = self.get_tables()
+        for table_name, rows in tables.items():
+            table_path = os.path.join(output_dir, f"{table_name}.{export_format}")
+            if export_format == "jsonl":
+                with open(table_path, "w", encoding="utf-8") as file:
+                    for row in rows:
+                        file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            else:
+                pq.write_table(pa.Table.from_pylist(rows), table_path)
+
+        manifest = {
+            "format": export_format,
+            "repo_path": self.repo_path,
+            "row_counts": {table_name: len(rows) for table_name, rows in tables.items()}
+        }
+        if self.file_classification is not None:
+            manifest["file_classification"] = self.file_classification
+        if self.chunk_sizes is not None:
+            manifest["chunk_sizes"] = self.chunk_sizes
+        with open(os.path.join(output_dir, MANIFEST_FILE_NAME), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2)
+
+    @classmethod
+    def read(cls, snapshot_dir: str) -> "ChunkGraphSnapshot":
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE_NAME), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        export_format = manifest["format"]
+        if export_format == "parquet" and pa is None:
+            raise ImportError("Es necesario instalar pyarrow para leer un snapshot en formato parquet")
+
+        tables = {}
+        for table_name in SNAPSHOT_TABLES:
+            table_path = os.path.join(snapshot_dir, f"{table_name}.{export_format}")
+            if export_format == "jsonl":
+                with open(table_path, "r", encoding="utf-8") as file:
+                    tables[table_name] = [json.loads(line) for line in file if line.strip() != ""]
+            else:
+                tables[table_name] = pq.read_table(table_path).to_pylist()
+
+        snapshot = cls(repo_path=manifest.get("repo_path"))
+        snapshot.fs_entries = tables["fsentry"]
+        snapshot.ancestors = tables["ancestors"]
+        snapshot.chunks = tables["file_chunks"]
+        snapshot.definitions = tables["definitions"]
+        snapshot.symbols = tables["symbols"]
+        snapshot.references = tables["chunk_references"]
+        return snapshot
+
+
+class SnapshotChunkCreator(ChunkCreator):
+    """
+    ChunkCreator que guarda el resultado en un ChunkGraphSnapshot en lugar de en la base de datos.
+    """
+    def __init__(self, snapshot: ChunkGraphSnapshot, chunk_max_line_size: int = 100,
+                 chunk_minimum_proportion: float = 0.2, overlap_size: int = 10,
+                 reference_resolver: ReferenceResolver = None, size_unit: str = CHUNK_SIZE_UNIT,
+                 chunk_max_tokens: int = CHUNK_MAX_TOKENS):
+        super().__init__(
+            db_session=None,
+            chunk_max_line_size=chunk_max_line_size,
+            chunk_minimum_proportion=chunk_minimum_proportion,
+            overlap_size=overlap_size,
+            reference_resolver=reference_resolver,
+            size_unit=size_unit,
+            chunk_max_tokens=chunk_max_tokens
+        )
+        self.snapshot = snapshot
+
+    def add_fs_entry(self, name: str, parent_id: int, is_directory: bool, skip_reason: str = None,
+                     blob_sha: str = None):
+        return self.snapshot.add_fs_entry(name=name, parent_id=parent_id, is_directory=is_directory,
+                                          skip_reason=skip_reason, blob_sha=blob_sha)
+
+    def persist_chunk(self, file_id: int, chunk_start_line: int, chunk_end_line: int, content_hash: str = None,
+                      blob_sha: str = None, identifiers: str = None) -> int:
+        return self.snapshot.add_chunk(file_id, chunk_start_line, chunk_end_line, content_hash, blob_sha, identifiers)
+
+    def anotate_definitions(self, chunk_id, definitions, chunk_start_line, chunk_end_line):
+        super().anotate_definitions(chunk_id, definitions, chunk_start_line, chunk_end_line)
+        for definition in definitions:
+            if self.definition_is_inside_chunk(definition, chunk_start_line, chunk_end_line):
+                self.snapshot.add_definition(
+                    chunk_id=chunk_id,
+                    name=definition.name,
+                    is_class=definition.is_class,
+                    start_line=definition.start_point.row,
+                    end_line=definition.end_point.row
+                )
+
+    def add_file_symbols_to_db(self, file_id: int, definitions: list, references: list):
+        self.snapshot.add_symbols(get_file_symbol_rows(file_id, definitions, references, self.file_chunk_ranges))
+
+    def add_chunk_references_to_db(self):
+        for chunk_id, ref_names in self.solved_references.items():
+            ref_name_counts = Counter(ref_names)
+            for ref_name in ref_name_counts:
+                # si la referencia es a una función definida fuera del repositorio no habrá definiciones
+                self.get_referenced_definition_chunks(chunk_id, ref_name, ref_name_counts[ref_name])
+        # las aristas se añaden al final, cuando ya se han acumulado las apariciones de todas las referencias
+        for edge in self.reference_edges.values():
+            self.snapshot.add_reference(edge)
+
+    def add_chunk_reference_weights_to_db(self):
+        # los pesos se exportan junto a las aristas
+        pass
+
+
+def _get_max_id(session: Session, column) -> int:
+    return session.execute(select(func.coalesce(func.max(column), 0))).scalar_one()
+
+
+def import_chunk_graph_snapshot(session: Session, snapshot_dir: str, commit: bool = True) -> Dict[str, int]:
+    """
+    Importa el snapshot en las tablas fsentry, ancestors, file_chunks, symbols y chunk_references en una sola transacción con
+    inserts multi-fila. Si algo falla se hace rollback y no queda ninguna fila del snapshot en la base de datos.
+    Devuelve el número de filas insertadas por tabla.
+    """
+    snapshot = ChunkGraphSnapshot.read(snapshot_dir)
+
+    try:
+        fsentry_offset = _get_max_id(session, FSEntry.id)
+        chunk_offset = _get_max_id(session, FileChunk.chunk_id)
+
+        def offset_fsentry_id(entry_id):
+            return None if entry_id is None else entry_id + fsentry_offset
+
+        fs_entry_rows = [
+            {**row, "id": row["id"] + fsentry_offset, "parent_id": offset_fsentry_id(row["parent_id"])}
+            for row in snapshot.fs_entries
+        ]
+        ancestor_rows = [
+            {**row, "descendant_id": row["descendant_id"] + fsentry_offset, "ancestor_id": row["ancestor_id"] + fsentry_offset}
+            for row in snapshot.ancestors
+        ]
+        chunk_rows = [
+            {**row, "chunk_id": row["chunk_id"] + chunk_offset, "file_id": row["file_id"] + fsentry_offset}
+            for row in snapshot.chunks
+        ]
+        reference_rows = [
+            {**row, "referencing_id": row["referencing_id"] + chunk_offset, "referenced_id": row["referenced_id"] + chunk_offset}
+            for row in snapshot.references
+        ]
+
+        symbol_rows = [
+            {**row, "file_id": row["file_id"] + fsentry_offset,
+             "chunk_id": None if row["chunk_id"] is None else row["chunk_id"] + chunk_offset}
+            for row in snapshot.symbols
+        ]
+
+        # el orden importa por las claves ajenas
+        for table, rows in [
+            (FSEntry.__table__, fs_entry_rows),
+            (Ancestor.__table__, ancestor_rows),
+            (FileChunk.__table__, chunk_rows),
+            (Symbol.__table__, symbol_rows),
+            (chunk_references, reference_rows)
+        ]:
+            if rows:
+                session.execute(insert(table), rows)
+
+        # los ids se han insertado explícitamente, hay que avanzar las secuencias
+        reset_postgres_sequence(session, "fsentry", "id")
+        reset_postgres_sequence(session, "file_chunks", "chunk_id")
+
+        compute_chunk_neighbours(session, min_chunk_id=chunk_offset + 1)
+        mark_duplicate_chunks(session)
+        bump_index_version(session)
+
+        if commit:
+            session.commit()
+        else:
+            session.flush()
+    except Exception:
+        session.rollback()
+        raise
+
+    return {
+        "fsentry": len(fs_entry_rows),
+        "ancestors": len(ancestor_rows),
+        "file_chunks": len(chunk_rows),
+        "symbols": len(symbol_rows),
+        "chunk_references": len(reference_rows)
+    }
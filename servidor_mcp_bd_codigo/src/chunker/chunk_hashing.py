@@ -0,0 +1,49 @@
+import hashlib
+import re
+from typing import List, Optional
+
+"""
+Hash normalizado del contenido de los chunks para detectar duplicados.
+
+Antes de calcular el hash se eliminan los comentarios (con el árbol de tree-sitter, para no confundir un # o // dentro
+de un string con un comentario) y se colapsan los espacios en blanco, de forma que copias de un mismo fichero con
+distinto formato o comentarios tengan el mismo hash.
+"""
+
+COMMENT_NODE_TYPES = ["comment", "line_comment", "block_comment"]
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def strip_comments(code_text: str, root_node) -> str:
+    """
+    Sustituye los comentarios por espacios manteniendo los saltos de línea, para que los números de línea de los
+    chunks sigan siendo válidos.
+    """
+    code_bytes = bytearray(code_text, "utf-8")
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if node.type in COMMENT_NODE_TYPES:
+            for i in range(node.start_byte, node.end_byte):
+                if code_bytes[i] != ord("\n"):
+                    code_bytes[i] = ord(" ")
+        else:
+            stack.extend(node.children)
+    return code_bytes.decode("utf-8", errors="ignore")
+
+
+def get_normalized_code_lines(code_text: str, root_node=None) -> List[str]:
+    if root_node is not None:
+        code_text = strip_comments(code_text, root_node)
+    return code_text.splitlines()
+
+
+def compute_content_hash(code_lines: List[str]) -> Optional[str]:
+    """
+    Devuelve None si el contenido está vacío, los chunks vacíos no se consideran duplicados entre sí.
+    """
+    normalized_code = WHITESPACE_PATTERN.sub(" ", "\n".join(code_lines)).strip()
+    if normalized_code == "":
+        return None
+    return hashlib.sha256(normalized_code.encode("utf-8")).hexdigest()
@@ -0,0 +1,35 @@
+import re
+from typing import List
+
+"""
+Identificadores del código de los chunks para la búsqueda léxica.
+
+Se guardan los identificadores completos y sus partes (camelCase, snake_case, nombres con puntos), de forma que una
+consulta por getSession, get_session o session encuentre el chunk. Las palabras de los strings también se incluyen:
+mensajes de error y claves de configuración suelen estar en literales. Los comentarios ya vienen eliminados por la
+normalización del contenido.
+"""
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+MIN_IDENTIFIER_LENGTH = 2
+
+
+def split_identifier(identifier: str) -> List[str]:
+    """
+    Partes de un identificador: getHTTPResponse_code -> get, HTTP, Response, code
+    """
+    return IDENTIFIER_PART_PATTERN.findall(identifier)
+
+
+def get_chunk_identifiers(code_lines: List[str]) -> str:
+    """
+    Identificadores y sus partes en minúsculas, sin repetir y en orden de aparición, separados por espacios
+    """
+    identifiers = {}
+    for identifier in IDENTIFIER_PATTERN.findall("\n".join(code_lines)):
+        for term in [identifier, *split_identifier(identifier)]:
+            term = term.lower().strip("_")
+            if len(term) >= MIN_IDENTIFIER_LENGTH:
+                identifiers[term] = None
+    return " ".join(identifiers)
@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from typing import Optional
+
 from tree_sitter import Point
 
 
@@ -8,3 +10,19 @@ class Definition:
     end_point: Point
     name: str
     is_class: bool
+    # clase en la que está definida, None si no está dentro de una clase
+    class_name: Optional[str] = None
+
+
+@dataclass
+class Reference:
+    """
+    Llamada encontrada por tree-sitter, sin el nodo para no mantener el árbol del fichero en memoria
+    """
+    start_point: Point
+    end_point: Point
+    name: str
+    # objeto sobre el que se llama (self.x(), modulo.x(), Clase.x()), None si es una llamada directa
+    qualifier: Optional[str] = None
+    # clase desde la que se llama
+    class_name: Optional[str] = None
@@ -0,0 +1,212 @@
+import bisect
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import accumulate
+from typing import Callable, Dict, List
+
+from config import CHUNK_SIZE_UNIT, CHUNK_MAX_TOKENS, CHUNK_TOKENIZER_ENCODING
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+"""
+Medida del tamaño de los chunks en líneas o en tokens.
+
+Con líneas, un chunk de 200 líneas cortas y otro de 200 líneas largas tienen un coste muy distinto en el prompt y en
+el embedding. Con tokens, la máquina de estados de file_chunk_state compara los límites con el número de tokens de
+las líneas, que se calcula una vez por fichero (sumas acumuladas por línea) para medir cualquier rango en O(1).
+
+Los tokens se cuentan con tiktoken y la codificación del modelo de embeddings. Si tiktoken no está instalado o no se
+puede cargar la codificación (sin conexión la primera vez), se usa una aproximación local por palabras y símbolos.
+"""
+
+SIZE_UNIT_LINES = "lines"
+SIZE_UNIT_TOKENS = "tokens"
+# Caracteres por token de las palabras largas en la aproximación sin tiktoken
+APPROXIMATE_CHARS_PER_TOKEN = 4
+APPROXIMATE_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Proporción del límite de tokens reservada al solapamiento de cada lado del chunk
+OVERLAP_TOKEN_PROPORTION = 0.1
+# Límites superiores de los intervalos del histograma del informe
+TOKEN_HISTOGRAM_BUCKETS = [128, 256, 512, 1024, 2048, 4096, 8192]
+
+
+def count_approximate_tokens(text: str) -> int:
+    return sum(
+        max(1, -(-len(token) // APPROXIMATE_CHARS_PER_TOKEN)) for token in APPROXIMATE_TOKEN_PATTERN.findall(text)
+    )
+
+
+@lru_cache(maxsize=None)
+def load_token_counter(encoding_name: str = CHUNK_TOKENIZER_ENCODING) -> Callable[[List[str]], List[int]]:
+    """
+    Devuelve una función que cuenta los tokens de cada texto de una lista
+    """
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.get_encoding(encoding_name)
+            return lambda texts: [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+        except Exception as e:
+            print(f"No se ha podido cargar la codificación {encoding_name}, se aproximan los tokens: {e}")
+    return lambda texts: [count_approximate_tokens(text) for text in texts]
+
+
+class FileTokenCounter:
+    """
+    Tokens del fichero que se está chunkeando por rangos de líneas (ambas incluidas)
+    """
+    def __init__(self, encoding_name: str = CHUNK_TOKENIZER_ENCODING):
+        self.count_tokens = load_token_counter(encoding_name)
+        # tokens acumulados hasta el inicio de cada línea
+        self.line_offsets = [0]
+
+    def set_file_content(self, code_text: str):
+        line_tokens = self.count_tokens(code_text.splitlines(keepends=True)) if code_text else []
+        self.line_offsets = [0] + list(accumulate(line_tokens))
+
+    def count(self, start_line: int, end_line: int) -> int:
+        start_line = min(max(start_line, 0), len(self.line_offsets) - 1)
+        end_line = min(max(end_line + 1, start_line), len(self.line_offsets) - 1)
+        return self.line_offsets[end_line] - self.line_offsets[start_line]
+
+    def find_last_line_within(self, start_line: int, tokens: int) -> int:
+        """
+        Última línea hasta la que los tokens desde start_line no superan los indicados
+        """
+        start_line = min(max(start_line, 0), len(self.line_offsets) - 1)
+        return bisect.bisect_right(self.line_offsets, self.line_offsets[start_line] + tokens) - 2
+
+
+class LineSizeMeasure:
+    unit = SIZE_UNIT_LINES
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+
+    def size(self, start_line: int, end_line: int) -> int:
+        return end_line - start_line
+
+    def split(self, start_line: int, end_line: int) -> List[tuple]:
+        """
+        Divide el rango en partes iguales que no superen el tamaño máximo
+        """
+        chunk_size = end_line - start_line
+        num_chunks = (chunk_size // self.max_size) + 1
+        if num_chunks >= 2:
+            chunk_size = (chunk_size // num_chunks) + 1
+        ranges = []
+        for _ in range(num_chunks):
+            ranges.append((start_line, start_line + chunk_size))
+            start_line += chunk_size
+        return ranges
+
+    def add_overlap(self, start_line: int, end_line: int, overlap_size: int) -> tuple:
+        return max(0, start_line - overlap_size), end_line + overlap_size
+
+
+class TokenSizeMeasure:
+    """
+    El límite de tokens incluye el solapamiento: el contenido del chunk se limita a max_tokens menos el solapamiento
+    máximo de ambos lados, y el solapamiento se corta antes de superar su parte de tokens
+    """
+    unit = SIZE_UNIT_TOKENS
+
+    def __init__(self, token_counter: FileTokenCounter, max_tokens: int = CHUNK_MAX_TOKENS):
+        self.token_counter = token_counter
+        self.overlap_tokens = int(max_tokens * OVERLAP_TOKEN_PROPORTION)
+        self.max_size = max_tokens - 2 * self.overlap_tokens
+
+    def size(self, start_line: int, end_line: int) -> int:
+        return self.token_counter.count(start_line, end_line)
+
+    def split(self, start_line: int, end_line: int) -> List[tuple]:
+        """
+        Divide el rango en partes de como mucho max_size tokens, cortando siempre en un final de línea. Como en la
+        división por líneas, cada parte empieza en la última línea de la anterior. Una línea que por sí sola supera el
+        límite queda en su propia parte.
+        """
+        ranges = []
+        range_start_line = start_line
+        while True:
+            range_end_line = max(self.token_counter.find_last_line_within(range_start_line, self.max_size),
+                                 range_start_line + 1)
+            if range_end_line >= end_line:
+                ranges.append((range_start_line, end_line))
+                return ranges
+            ranges.append((range_start_line, range_end_line))
+            range_start_line = range_end_line
+
+    def add_overlap(self, start_line: int, end_line: int, overlap_size: int) -> tuple:
+        overlap_start_line = start_line
+        while overlap_start_line > 0 and start_line - overlap_start_line < overlap_size \
+                and self.size(overlap_start_line - 1, start_line - 1) <= self.overlap_tokens:
+            overlap_start_line -= 1
+        overlap_end_line = end_line
+        while overlap_end_line - end_line < overlap_size \
+                and self.size(end_line + 1, overlap_end_line + 1) <= self.overlap_tokens:
+            overlap_end_line += 1
+        return overlap_start_line, overlap_end_line
+
+
+def create_chunk_size_measure(token_counter: FileTokenCounter, size_unit: str = CHUNK_SIZE_UNIT,
+                              chunk_max_line_size: int = 100, chunk_max_tokens: int = CHUNK_MAX_TOKENS):
+    if size_unit == SIZE_UNIT_TOKENS:
+        return TokenSizeMeasure(token_counter, chunk_max_tokens)
+    if size_unit == SIZE_UNIT_LINES:
+        return LineSizeMeasure(chunk_max_line_size)
+    raise ValueError(f"Unidad de tamaño no soportada: {size_unit}, unidades: {[SIZE_UNIT_LINES, SIZE_UNIT_TOKENS]}")
+
+
+def get_distribution(values: List[int]) -> Dict:
+    if not values:
+        return {}
+    sorted_values = sorted(values)
+    percentile = lambda p: sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+    return {
+        "min": sorted_values[0],
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": sorted_values[-1],
+        "mean": round(sum(sorted_values) / len(sorted_values), 1)
+    }
+
+
+@dataclass
+class ChunkSizeReport:
+    """
+    Distribución del tamaño en líneas y tokens de los chunks creados, incluido el solapamiento
+    """
+    max_tokens: int = CHUNK_MAX_TOKENS
+    line_sizes: List[int] = field(default_factory=list)
+    token_sizes: List[int] = field(default_factory=list)
+
+    def add(self, line_size: int, token_size: int):
+        self.line_sizes.append(line_size)
+        self.token_sizes.append(token_size)
+
+    def get_token_histogram(self) -> Dict[str, int]:
+        histogram = {}
+        for token_size in self.token_sizes:
+            bucket = next((f"<={limit}" for limit in TOKEN_HISTOGRAM_BUCKETS if token_size <= limit),
+                          f">{TOKEN_HISTOGRAM_BUCKETS[-1]}")
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        return histogram
+
+    def to_dict(self) -> Dict:
+        return {
+            "chunks": len(self.token_sizes),
+            "lines": get_distribution(self.line_sizes),
+            "tokens": get_distribution(self.token_sizes),
+            "token_histogram": self.get_token_histogram(),
+            "chunks_over_max_tokens": sum(1 for token_size in self.token_sizes if token_size > self.max_tokens)
+        }
+
+    def print_report(self):
+        report = self.to_dict()
+        print(f"Tamaño de los chunks ({report['chunks']}): tokens {report['tokens']}, líneas {report['lines']}, "
+              f"histograma {report['token_histogram']}, más de {self.max_tokens} tokens: "
+              f"{report['chunks_over_max_tokens']}")
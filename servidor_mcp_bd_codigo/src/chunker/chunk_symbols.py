@@ -0,0 +1,61 @@
+from typing import List, Optional
+
+from src.chunker.chunk_objects import Definition, Reference
+
+"""
+Símbolos de cada fichero para la tabla symbols: las definiciones (clases, funciones y métodos) y las referencias
+(llamadas) que tree-sitter encuentra al chunkear, con su rango de líneas y el chunk que las contiene.
+
+Los chunks se solapan, un símbolo se asigna al chunk que contiene más líneas suyas y con empate al primero.
+"""
+
+SYMBOL_KIND_CLASS = "class"
+SYMBOL_KIND_FUNCTION = "function"
+SYMBOL_KIND_METHOD = "method"
+SYMBOL_KIND_REFERENCE = "reference"
+DEFINITION_KINDS = [SYMBOL_KIND_CLASS, SYMBOL_KIND_FUNCTION, SYMBOL_KIND_METHOD]
+
+
+def get_definition_kind(definition: Definition) -> str:
+    if definition.is_class:
+        return SYMBOL_KIND_CLASS
+    return SYMBOL_KIND_METHOD if definition.class_name else SYMBOL_KIND_FUNCTION
+
+
+def get_symbol_chunk_id(chunk_ranges: List[tuple], start_line: int, end_line: int) -> Optional[int]:
+    """
+    chunk_ranges: (id del chunk, línea inicial, línea final) de los chunks del fichero
+    """
+    best_chunk_id = None
+    best_overlap = 0
+    for chunk_id, chunk_start_line, chunk_end_line in chunk_ranges:
+        overlap = min(end_line, chunk_end_line) - max(start_line, chunk_start_line) + 1
+        if overlap > best_overlap:
+            best_chunk_id, best_overlap = chunk_id, overlap
+    return best_chunk_id
+
+
+def get_file_symbol_rows(file_id: int, definitions: List[Definition], references: List[Reference],
+                         chunk_ranges: List[tuple]) -> List[dict]:
+    """
+    Filas de la tabla symbols del fichero. references son las llamadas del fichero
+    """
+    rows = [{
+        "name": definition.name,
+        "kind": get_definition_kind(definition),
+        "class_name": definition.class_name,
+        "file_id": file_id,
+        "chunk_id": get_symbol_chunk_id(chunk_ranges, definition.start_point.row, definition.end_point.row),
+        "start_line": definition.start_point.row,
+        "end_line": definition.end_point.row
+    } for definition in definitions]
+    rows += [{
+        "name": reference.name,
+        "kind": SYMBOL_KIND_REFERENCE,
+        "class_name": None,
+        "file_id": file_id,
+        "chunk_id": get_symbol_chunk_id(chunk_ranges, reference.start_point.row, reference.end_point.row),
+        "start_line": reference.start_point.row,
+        "end_line": reference.end_point.row
+    } for reference in references]
+    return rows
@@ -3,18 +3,22 @@ from typing import List, Any
 
 from src.chunker.chunk_creator import ChunkCreator
 from src.chunker.chunk_objects import Definition
+from src.chunker.chunk_size import LineSizeMeasure
 
 class ChunkingContext:
     chunk_creator: ChunkCreator
     definitions: List[Definition]
     references: List[Any]
     file_id: int
-    def __init__(self, chunk_creator: ChunkCreator, definitions: List[Definition], references: List[Any], file_id: int, file_line_size: int):
+    def __init__(self, chunk_creator: ChunkCreator, definitions: List[Definition], references: List[Any], file_id: int, file_line_size: int,
+                 size_measure=None):
         self.chunk_creator = chunk_creator
         self.definitions = definitions
         self.references = references
         self.file_id = file_id
-        self.chunk_max_line_size = chunk_creator.chunk_max_line_size
+        # tamaño máximo en la unidad de la medida indicada (líneas o tokens), por defecto en líneas
+        self.size_measure = size_measure or LineSizeMeasure(chunk_creator.chunk_max_line_size)
+        self.chunk_max_size = self.size_measure.max_size
         self.file_line_size = file_line_size
         self.create_last_chunk = False
 
@@ -35,11 +39,14 @@ class ChunkingContext:
     def next_definition_is_last(self):
         return self.next_definition_index + 1 >= len(self.definitions)
 
+    def get_size(self, start_line: int, end_line: int):
+        return self.size_measure.size(start_line, end_line)
+
     def get_current_chunk_size(self):
-        return self.chunk_end_line - self.chunk_start_line
+        return self.get_size(self.chunk_start_line, self.chunk_end_line)
 
     def last_definition_too_small(self):
-        return self.file_line_size - self.chunk_end_line < self.chunk_max_line_size * self.chunk_creator.minimum_proportion
+        return self.get_size(self.chunk_end_line, self.file_line_size) < self.chunk_max_size * self.chunk_creator.minimum_proportion
 
     def next_definition_is_last_and_too_small(self):
         return self.next_definition_is_last() and self.last_definition_too_small()
@@ -55,11 +62,11 @@ class ChunkingContext:
         """
         next_definition = self.definitions[self.next_definition_index]
         # Considerar las líneas entre el final del chunk actual y el inicio de la siguiente definición como parte de la siguiente definición
-        next_definition_line_size = next_definition.end_point.row - self.chunk_end_line
-        current_chunk_size = self.chunk_end_line - self.chunk_start_line
+        chunk_size_with_next_definition = self.get_size(self.chunk_start_line, next_definition.end_point.row)
+        current_chunk_size = self.get_current_chunk_size()
 
-        next_definition_fits_current_chunk = next_definition_line_size + current_chunk_size <= self.chunk_max_line_size
-        current_chunk_too_small = current_chunk_size <= self.chunk_max_line_size * self.chunk_creator.minimum_proportion
+        next_definition_fits_current_chunk = chunk_size_with_next_definition <= self.chunk_max_size
+        current_chunk_too_small = current_chunk_size <= self.chunk_max_size * self.chunk_creator.minimum_proportion
 
         return next_definition_fits_current_chunk or current_chunk_too_small or self.next_definition_is_last_and_too_small()
 
@@ -79,14 +86,14 @@ class ChunkingContext:
         Si las últimas líneas sin definición son suficientes como para crear un chunk, crearlo
         """
         if self.current_definition_is_last():
-            remaining_lines = self.file_line_size - self.chunk_end_line
-            if remaining_lines >= self.chunk_max_line_size * self.chunk_creator.minimum_proportion:
+            remaining_size = self.get_size(self.chunk_end_line, self.file_line_size)
+            if remaining_size >= self.chunk_max_size * self.chunk_creator.minimum_proportion:
                 self.create_last_chunk=True
             else:
                 self.chunk_end_line = self.file_line_size
     
     def create_chunk(self):
-        if self.chunk_end_line - self.chunk_start_line > self.chunk_max_line_size:
+        if self.get_current_chunk_size() > self.chunk_max_size:
             self.chunk_creator.create_multiple_chunks(
                 chunk_start_line=self.chunk_start_line,
                 chunk_end_line=self.chunk_end_line,
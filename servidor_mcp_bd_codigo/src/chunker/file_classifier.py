@@ -0,0 +1,191 @@
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import FILE_CLASSIFIER_MAX_BYTES, FILE_CLASSIFIER_SKIP_CATEGORIES
+
+"""
+Clasificador rápido de ficheros para no chunkear ni documentar ficheros generados, minificados, binarios o de datos.
+
+Solo se lee una muestra del principio del fichero y se aplican heurísticas baratas: detección de binarios por bytes
+nulos y caracteres de control, marcas de código generado, distribución de la longitud de las líneas, entropía de la
+muestra y un tamaño máximo. Los ficheros descartados se guardan solo como entrada del árbol (metadata-only), sin
+chunks, o se omiten del todo si su categoría está en FILE_CLASSIFIER_SKIP_CATEGORIES.
+"""
+
+CATEGORY_SOURCE = "source"
+CATEGORY_BINARY = "binary"
+CATEGORY_TOO_LARGE = "too_large"
+CATEGORY_LOCKFILE = "lockfile"
+CATEGORY_GENERATED = "generated"
+CATEGORY_MINIFIED = "minified"
+CATEGORY_DATA = "data"
+
+ACTION_INDEX = "index"
+ACTION_METADATA_ONLY = "metadata_only"
+ACTION_SKIP = "skip"
+
+SAMPLE_BYTES = 64 * 1024
+# Número de líneas del principio del fichero en las que se buscan las marcas de código generado
+GENERATED_MARKER_LINES = 20
+# Percentil 90 de la longitud de las líneas a partir del que se considera minificado, si además casi no hay espacios
+# (los párrafos de markdown también tienen líneas largas)
+MINIFIED_LINE_LENGTH = 500
+MINIFIED_MAX_WHITESPACE_RATIO = 0.08
+# Bits por byte a partir de los que una muestra con líneas largas se considera datos codificados (base64, hashes...)
+DATA_ENTROPY_THRESHOLD = 5.5
+DATA_MIN_AVERAGE_LINE_LENGTH = 120
+# Proporción de caracteres de control a partir de la que un fichero sin bytes nulos se considera binario
+BINARY_CONTROL_CHARS_RATIO = 0.3
+# Estimación habitual de caracteres por token para el informe
+CHARS_PER_TOKEN = 4
+
+LOCKFILE_NAMES = [
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock", "Cargo.lock",
+    "composer.lock", "Gemfile.lock", "go.sum", "uv.lock"
+]
+GENERATED_FILE_SUFFIXES = [
+    "_pb2.py", "_pb2_grpc.py", ".pb.go", ".pb.cc", ".pb.h", ".g.dart", ".designer.cs", ".min.js", ".min.css", ".map"
+]
+DATA_FILE_EXTENSIONS = [".csv", ".tsv", ".jsonl", ".ndjson", ".parquet", ".sqlite", ".db"]
+# Solo marcas explícitas, para no descartar ficheros que hablan de código generado (migraciones, documentación...)
+GENERATED_MARKERS = re.compile(
+    r"@generated|DO NOT EDIT|(?i:generated by the protocol buffer compiler)|"
+    r"(?i:this file (is|was|has been) (automatically |auto-?)generated)"
+)
+
+# Caracteres de control que no aparecen en ficheros de texto (se excluyen \t, \n, \f y \r)
+TEXT_CONTROL_CHARS = bytes(range(32)).translate(None, b"\t\n\f\r")
+
+
+@dataclass
+class FileClassification:
+    category: str
+    action: str
+    reason: Optional[str] = None
+    size_bytes: int = 0
+
+
+@dataclass
+class FileClassificationReport:
+    """
+    Ficheros descartados por categoría y bytes y tokens estimados que no se han chunkeado ni documentado
+    """
+    files_by_category: Counter = field(default_factory=Counter)
+    bytes_avoided: int = 0
+    skipped_files: List[str] = field(default_factory=list)
+
+    @property
+    def estimated_tokens_avoided(self) -> int:
+        return self.bytes_avoided // CHARS_PER_TOKEN
+
+    def add(self, file_path: str, classification: FileClassification):
+        self.files_by_category[classification.category] += 1
+        if classification.action != ACTION_INDEX:
+            self.bytes_avoided += classification.size_bytes
+            self.skipped_files.append(file_path)
+
+    def to_dict(self) -> Dict:
+        return {
+            "files_by_category": dict(self.files_by_category),
+            "bytes_avoided": self.bytes_avoided,
+            "estimated_tokens_avoided": self.estimated_tokens_avoided
+        }
+
+
+def get_sample_entropy(sample: bytes) -> float:
+    if not sample:
+        return 0.0
+    byte_counts = Counter(sample)
+    return -sum(count / len(sample) * math.log2(count / len(sample)) for count in byte_counts.values())
+
+
+def is_binary_sample(sample: bytes) -> bool:
+    if b"\x00" in sample:
+        return True
+    if not sample:
+        return False
+    control_chars = len(sample) - len(sample.translate(None, TEXT_CONTROL_CHARS))
+    return control_chars / len(sample) > BINARY_CONTROL_CHARS_RATIO
+
+
+def get_percentile(values: List[int], percentile: float) -> int:
+    if not values:
+        return 0
+    sorted_values = sorted(values)
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile))]
+
+
+class FileClassifier:
+    def __init__(self, max_file_bytes: int = FILE_CLASSIFIER_MAX_BYTES,
+                 skip_categories: List[str] = None):
+        self.max_file_bytes = max_file_bytes
+        self.skip_categories = FILE_CLASSIFIER_SKIP_CATEGORIES if skip_categories is None else skip_categories
+        self.report = FileClassificationReport()
+
+    def get_classification(self, category: str, reason: str, size_bytes: int) -> FileClassification:
+        action = ACTION_SKIP if category in self.skip_categories else ACTION_METADATA_ONLY
+        return FileClassification(category=category, action=action, reason=reason, size_bytes=size_bytes)
+
+    def classify_by_name(self, file_name: str, size_bytes: int) -> Optional[FileClassification]:
+        if file_name in LOCKFILE_NAMES:
+            return self.get_classification(CATEGORY_LOCKFILE, f"lockfile {file_name}", size_bytes)
+        for suffix in GENERATED_FILE_SUFFIXES:
+            if file_name.endswith(suffix):
+                category = CATEGORY_MINIFIED if ".min." in suffix else CATEGORY_GENERATED
+                return self.get_classification(category, f"sufijo {suffix}", size_bytes)
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension in DATA_FILE_EXTENSIONS:
+            return self.get_classification(CATEGORY_DATA, f"extensión {extension}", size_bytes)
+        return None
+
+    def classify_by_content(self, sample: bytes, size_bytes: int) -> Optional[FileClassification]:
+        if is_binary_sample(sample):
+            return self.get_classification(CATEGORY_BINARY, "contenido binario", size_bytes)
+
+        sample_text = sample.decode("utf-8", errors="ignore")
+        lines = sample_text.splitlines()
+        if GENERATED_MARKERS.search("\n".join(lines[:GENERATED_MARKER_LINES])):
+            return self.get_classification(CATEGORY_GENERATED, "marca de código generado", size_bytes)
+
+        line_lengths = [len(line) for line in lines if line.strip()]
+        whitespace_ratio = sum(1 for char in sample_text if char.isspace()) / len(sample_text) if sample_text else 0
+        if get_percentile(line_lengths, 0.9) > MINIFIED_LINE_LENGTH and whitespace_ratio < MINIFIED_MAX_WHITESPACE_RATIO:
+            return self.get_classification(CATEGORY_MINIFIED, "líneas demasiado largas", size_bytes)
+
+        average_line_length = sum(line_lengths) / len(line_lengths) if line_lengths else 0
+        if average_line_length > DATA_MIN_AVERAGE_LINE_LENGTH and get_sample_entropy(sample) > DATA_ENTROPY_THRESHOLD:
+            return self.get_classification(CATEGORY_DATA, "entropía alta", size_bytes)
+        return None
+
+    def classify(self, file_path: str, blob_content: bytes = None) -> FileClassification:
+        """
+        Clasifica el fichero y lo añade al informe de la ejecución. Si se indica blob_content (ficheros leídos de git)
+        se clasifica ese contenido en lugar de leer el fichero.
+        """
+        size_bytes = os.path.getsize(file_path) if blob_content is None else len(blob_content)
+        classification = self.classify_by_name(os.path.basename(file_path), size_bytes)
+        if classification is None and size_bytes > self.max_file_bytes:
+            classification = self.get_classification(
+                CATEGORY_TOO_LARGE, f"tamaño {size_bytes} > {self.max_file_bytes}", size_bytes)
+        if classification is None:
+            if blob_content is None:
+                with open(file_path, "rb") as file:
+                    sample = file.read(SAMPLE_BYTES)
+            else:
+                sample = blob_content[:SAMPLE_BYTES]
+            classification = self.classify_by_content(sample, size_bytes)
+        if classification is None:
+            classification = FileClassification(category=CATEGORY_SOURCE, action=ACTION_INDEX, size_bytes=size_bytes)
+
+        self.report.add(file_path, classification)
+        return classification
+
+    def print_report(self):
+        report = self.report.to_dict()
+        print(f"Ficheros por categoría: {report['files_by_category']}, "
+              f"sin chunkear: {len(self.report.skipped_files)} ({report['bytes_avoided']} bytes, "
+              f"~{report['estimated_tokens_avoided']} tokens evitados)")
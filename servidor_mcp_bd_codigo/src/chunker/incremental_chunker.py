@@ -0,0 +1,313 @@
+import os
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, delete, or_, bindparam
+from sqlalchemy.orm import Session
+
+from src.chunker.chunk_creator import ChunkCreator
+from src.chunker.chunk_objects import Definition, Reference
+from src.chunker.file_classifier import FileClassifier
+from src.chunker.reference_resolver import FileScope
+from src.chunker.repo_chunker import FileChunker
+from src.db.db_utils import get_root_fs_entry, delete_file_chunks, delete_fs_entries
+from src.db.models import FSEntry, Ancestor, FileChunk, chunk_references
+
+"""
+Actualización incremental del índice del directorio de trabajo a partir de una lista de ficheros modificados.
+
+Se vuelve a recorrer el árbol de directorios, pero solo se analizan con tree-sitter y se chunkean los ficheros
+modificados:
+- Las entradas del árbol existentes se reutilizan por ruta, las que ya no existen se borran con sus chunks.
+- Los ficheros sin cambios reutilizan sus chunks (y su documentación) por (fichero, línea inicial, línea final). Para
+  resolver las referencias entre ficheros se registran sus imports, definiciones y referencias en esos chunks a
+  partir del análisis guardado en file_parses, sin leer ni analizar el fichero. Los ficheros sin análisis guardado
+  (la primera actualización de un proceso) se analizan de nuevo y su análisis se guarda para las siguientes.
+- Los chunks de los ficheros modificados con el mismo rango de líneas y hash de contenido también se mantienen, el
+  resto se borran y se crean de nuevo.
+- Las referencias se vuelven a resolver en todo el repositorio, porque un cambio en un fichero puede cambiar la
+  resolución de las referencias de otros. Se añaden las nuevas y se borran las que ya no se generan, de forma que el
+  índice queda igual que si se chunkease el repositorio desde cero.
+"""
+
+
+@dataclass
+class FileParse:
+    """
+    Análisis de un fichero sin cambios necesario para resolver las referencias del repositorio
+    """
+    # ámbito (módulo e imports) del fichero, None si no se ha podido analizar
+    scope: Optional[FileScope]
+    definitions: List[Definition]
+    references: List[Reference]
+
+
+@dataclass
+class IncrementalUpdateResult:
+    changed_files: int = 0
+    new_chunk_ids: List[int] = field(default_factory=list)
+    deleted_chunk_ids: List[int] = field(default_factory=list)
+    deleted_entries: int = 0
+    # chunks que hay que volver a documentar: los nuevos, sus vecinos directos y los duplicados de chunks borrados
+    affected_chunk_ids: List[int] = field(default_factory=list)
+
+
+class IncrementalChunkCreator(ChunkCreator):
+    # ruta relativa -> entrada del árbol que ya existía en la base de datos
+    existing_entries: Dict[str, FSEntry]
+    # (id fichero, línea inicial, línea final) -> (id chunk, hash) de los chunks anteriores de los ficheros modificados
+    previous_chunks: Dict[tuple, tuple]
+
+    # ruta relativa -> análisis de los ficheros, se mantiene entre actualizaciones
+    file_parses: Dict[str, FileParse]
+
+    def __init__(self, db_session, existing_entries: Dict[str, FSEntry], file_chunk_ids: Dict[tuple, int],
+                 previous_chunks: Dict[tuple, tuple], file_parses: Dict[str, FileParse] = None, **kwargs):
+        super().__init__(db_session, **kwargs)
+        self.existing_entries = existing_entries
+        self.file_chunk_ids = file_chunk_ids
+        self.previous_chunks = previous_chunks
+        self.file_parses = {} if file_parses is None else file_parses
+        # los ficheros sin cambios conservan sus chunks y sus símbolos
+        self.unchanged_file_ids = {file_id for file_id, _, _ in file_chunk_ids}
+        # id fichero -> (id chunk, línea inicial, línea final) de los chunks de los ficheros sin cambios
+        self.unchanged_file_chunks = {}
+        for (file_id, start_line, end_line), chunk_id in sorted(file_chunk_ids.items()):
+            self.unchanged_file_chunks.setdefault(file_id, []).append((chunk_id, start_line, end_line))
+        self.entry_paths = {}
+        self.visited_entry_ids = set()
+        self.kept_chunk_ids = set()
+        self.new_chunk_ids = []
+
+    def get_entry_path(self, name: str, parent_id: int) -> str:
+        return "" if parent_id is None else os.path.join(self.entry_paths[parent_id], name)
+
+    def add_fs_entry(self, name: str, parent_id: int, is_directory: bool, skip_reason: str = None,
+                     blob_sha: str = None):
+        """
+        Devuelve la entrada existente con la misma ruta o la crea si es nueva
+        """
+        path = self.get_entry_path(name, parent_id)
+        entry = self.existing_entries.get(path)
+        if entry is not None and entry.is_directory == is_directory:
+            entry.skip_reason = skip_reason
+        else:
+            entry = super().add_fs_entry(name, parent_id, is_directory, skip_reason, blob_sha)
+        self.entry_paths[entry.id] = path
+        self.visited_entry_ids.add(entry.id)
+        return entry
+
+    def persist_chunk(self, file_id: int, chunk_start_line: int, chunk_end_line: int, content_hash: str = None,
+                      blob_sha: str = None, identifiers: str = None) -> int:
+        previous_chunk = self.previous_chunks.get((file_id, chunk_start_line, chunk_end_line))
+        if previous_chunk is not None and previous_chunk[1] == content_hash:
+            self.kept_chunk_ids.add(previous_chunk[0])
+            return previous_chunk[0]
+        chunk_id = super().persist_chunk(file_id, chunk_start_line, chunk_end_line, content_hash, blob_sha,
+                                         identifiers)
+        self.new_chunk_ids.append(chunk_id)
+        return chunk_id
+
+    def add_file_symbols_to_db(self, file_id: int, definitions: list, references: list):
+        self.save_file_parse(file_id, definitions, references)
+        if file_id in self.unchanged_file_ids:
+            return
+        super().add_file_symbols_to_db(file_id, definitions, references)
+
+    def save_file_parse(self, file_id: int, definitions: list, references: list):
+        """
+        Guarda el análisis del fichero recién chunkeado. Si el chunkeado ha fallado después de registrar el fichero
+        en el resolver no se guarda, los chunks creados antes del fallo no se podrían reproducir y el fichero se vuelve
+        a analizar en cada actualización
+        """
+        path = self.entry_paths[file_id]
+        scope = self.reference_resolver.file_scopes.get(file_id)
+        if scope is not None and not definitions:
+            self.file_parses.pop(path, None)
+        else:
+            self.file_parses[path] = FileParse(scope=scope, definitions=definitions, references=references)
+
+    def reuse_file_parse(self, path: str, parent_id: int) -> bool:
+        """
+        Registra un fichero sin cambios con su análisis guardado: su ámbito y, en cada uno de sus chunks, las
+        definiciones y referencias que contiene, igual que al chunkearlo. Devuelve False si no hay análisis guardado o
+        el fichero no estaba indexado, en ese caso hay que chunkearlo
+        """
+        file_parse = self.file_parses.get(path)
+        entry = self.existing_entries.get(path)
+        if file_parse is None or entry is None or entry.is_directory:
+            return False
+        entry = self.add_fs_entry(entry.name, parent_id, False, entry.skip_reason, entry.blob_sha)
+        if file_parse.scope is not None:
+            self.reference_resolver.add_file_scope(replace(file_parse.scope, file_id=entry.id))
+        for chunk_id, start_line, end_line in self.unchanged_file_chunks.get(entry.id, []):
+            self.reference_resolver.register_chunk(chunk_id, entry.id)
+            self.anotate_definitions(chunk_id, file_parse.definitions, start_line, end_line)
+            self.anotate_references(chunk_id, file_parse.references, start_line, end_line)
+        return True
+
+    def get_tree_chunk_ids(self) -> set:
+        return set(self.file_chunk_ids.values())
+
+    def delete_stale_references(self):
+        """
+        Borra las referencias de los chunks del árbol que ya no se generan al resolver las referencias de nuevo
+        """
+        current_edges = {key for key in self.reference_edges if key[0] != key[1]}
+        tree_chunk_ids = self.get_tree_chunk_ids()
+        stored_edges = self.db_session.execute(
+            select(chunk_references.c.referencing_id, chunk_references.c.referenced_id)
+        ).all()
+        stale_edges = [
+            {"b_referencing_id": referencing_id, "b_referenced_id": referenced_id}
+            for referencing_id, referenced_id in stored_edges
+            if referencing_id in tree_chunk_ids and (referencing_id, referenced_id) not in current_edges
+        ]
+        if stale_edges:
+            self.db_session.connection().execute(
+                delete(chunk_references).where(
+                    chunk_references.c.referencing_id == bindparam("b_referencing_id"),
+                    chunk_references.c.referenced_id == bindparam("b_referenced_id")
+                ),
+                stale_edges
+            )
+
+    def add_chunk_references_to_db(self):
+        super().add_chunk_references_to_db()
+        self.db_session.flush()
+        self.delete_stale_references()
+
+
+class IncrementalFileChunker(FileChunker):
+    """
+    Solo lee y analiza los ficheros modificados y los que no tienen un análisis guardado
+    """
+    chunk_creator: IncrementalChunkCreator
+
+    def __init__(self, changed_paths: set, **kwargs):
+        super().__init__(**kwargs)
+        self.changed_paths = changed_paths
+
+    def chunk_file(self, file_path: str, parent_id: int, blob_sha: str = None, blob_content: bytes = None):
+        path = self.chunk_creator.get_entry_path(os.path.basename(file_path), parent_id)
+        if path in self.changed_paths or not self.chunk_creator.reuse_file_parse(path, parent_id):
+            super().chunk_file(file_path, parent_id, blob_sha, blob_content)
+
+
+def get_tree_entries(session: Session, root_id: int) -> Dict[str, FSEntry]:
+    entries = session.query(FSEntry)\
+        .join(Ancestor, Ancestor.descendant_id == FSEntry.id)\
+        .filter(Ancestor.ancestor_id == root_id)\
+        .all()
+    return {entry.path: entry for entry in entries}
+
+
+def get_tree_chunks(session: Session, file_ids: Iterable[int]) -> List[tuple]:
+    file_ids = list(file_ids)
+    if not file_ids:
+        return []
+    return session.execute(
+        select(FileChunk.file_id, FileChunk.start_line, FileChunk.end_line, FileChunk.chunk_id, FileChunk.content_hash)
+        .where(FileChunk.file_id.in_(file_ids))
+    ).all()
+
+
+def get_affected_chunk_ids(session: Session, chunk_ids: Iterable[int]) -> List[int]:
+    """
+    Los chunks indicados y sus vecinos directos en ambas direcciones, sin los duplicados
+    """
+    chunk_ids = set(chunk_ids)
+    if not chunk_ids:
+        return []
+    edges = session.execute(
+        select(chunk_references.c.referencing_id, chunk_references.c.referenced_id).where(or_(
+            chunk_references.c.referencing_id.in_(chunk_ids), chunk_references.c.referenced_id.in_(chunk_ids)
+        ))
+    ).all()
+    affected_ids = set(chunk_ids)
+    for referencing_id, referenced_id in edges:
+        affected_ids.update((referencing_id, referenced_id))
+    return sorted(session.execute(
+        select(FileChunk.chunk_id)
+        .where(FileChunk.chunk_id.in_(affected_ids))
+        .where(FileChunk.duplicate_of_id.is_(None))
+    ).scalars().all())
+
+
+def update_changed_files(session: Session, repo_path: str, changed_paths: Iterable[str],
+                         ignored_entries: List[str] = None, chunk_max_line_size: int = 100,
+                         chunk_minimum_proportion: float = 0.2, file_classifier: FileClassifier = None,
+                         file_parses: Dict[str, FileParse] = None) -> IncrementalUpdateResult:
+    """
+    Actualiza el índice del directorio de trabajo tras modificar, añadir o borrar los ficheros indicados (rutas
+    relativas a repo_path). Los ficheros borrados no hace falta indicarlos, cualquier entrada que ya no exista se borra.
+    file_parses guarda el análisis de los ficheros entre llamadas, sin él se analizan todos los ficheros.
+    Hace commit de la sesión.
+    """
+    changed_paths = {os.path.normpath(path) for path in changed_paths}
+    root_entry = get_root_fs_entry(session)
+    existing_entries = get_tree_entries(session, root_entry.id) if root_entry is not None else {}
+
+    # los chunks de los ficheros sin cambios se reutilizan, los de los modificados se comparan por hash
+    file_chunk_ids = {}
+    previous_chunks = {}
+    changed_file_ids = {
+        entry.id for path, entry in existing_entries.items() if path in changed_paths and not entry.is_directory
+    }
+    file_ids = [entry.id for entry in existing_entries.values() if not entry.is_directory]
+    for file_id, start_line, end_line, chunk_id, content_hash in get_tree_chunks(session, file_ids):
+        if file_id in changed_file_ids:
+            previous_chunks[(file_id, start_line, end_line)] = (chunk_id, content_hash)
+        else:
+            file_chunk_ids[(file_id, start_line, end_line)] = chunk_id
+
+    chunk_creator = IncrementalChunkCreator(
+        session,
+        existing_entries=existing_entries,
+        file_chunk_ids=file_chunk_ids,
+        previous_chunks=previous_chunks,
+        file_parses=file_parses,
+        chunk_max_line_size=chunk_max_line_size,
+        chunk_minimum_proportion=chunk_minimum_proportion
+    )
+    file_chunker = IncrementalFileChunker(
+        changed_paths=changed_paths,
+        chunk_max_line_size=chunk_max_line_size,
+        chunk_minimum_proportion=chunk_minimum_proportion,
+        session=session,
+        chunk_creator=chunk_creator,
+        file_classifier=file_classifier or FileClassifier()
+    )
+    file_chunker.ignored_entries = [os.path.join(repo_path, ignored_entry) for ignored_entry in ignored_entries or []]
+    file_chunker.chunk_directory_recursive(repo_path, None)
+
+    # chunks de los ficheros modificados que ya no se generan y entradas del árbol que ya no existen
+    removed_entries = [entry for entry in existing_entries.values() if entry.id not in chunk_creator.visited_entry_ids]
+    removed_entry_ids = {entry.id for entry in removed_entries}
+    stale_chunk_ids = [
+        chunk_id for chunk_id, _ in previous_chunks.values() if chunk_id not in chunk_creator.kept_chunk_ids
+    ]
+    stale_chunk_ids += [chunk_id for file_id, _, _, chunk_id, _ in get_tree_chunks(session, removed_entry_ids)]
+    orphan_duplicate_ids = delete_file_chunks(session, stale_chunk_ids)
+    for chunk_key in [key for key in file_chunk_ids if key[0] in removed_entry_ids]:
+        del file_chunk_ids[chunk_key]
+    delete_fs_entries(session, removed_entry_ids)
+    for entry in removed_entries:
+        chunk_creator.file_parses.pop(entry.path, None)
+    session.expire_all()
+
+    chunk_creator.solve_unsolved_references()
+    chunk_creator.add_chunk_references_to_db()
+    file_chunker.finish_db_chunking()
+
+    result = IncrementalUpdateResult(
+        changed_files=len(changed_paths),
+        new_chunk_ids=list(chunk_creator.new_chunk_ids),
+        deleted_chunk_ids=stale_chunk_ids,
+        deleted_entries=len(removed_entries),
+        affected_chunk_ids=get_affected_chunk_ids(
+            session, set(chunk_creator.new_chunk_ids) | set(orphan_duplicate_ids)
+        )
+    )
+    session.commit()
+    return result
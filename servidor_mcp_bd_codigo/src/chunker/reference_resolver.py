@@ -0,0 +1,425 @@
+import math
+import os
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Set
+
+from src.chunker.chunk_objects import Reference
+from config import REFERENCE_MAX_FANOUT, REFERENCE_SAME_FILE_WEIGHT
+
+"""
+Resolución de referencias entre chunks teniendo en cuenta imports y ámbitos.
+
+Sin resolver, una referencia se enlaza con todos los chunks en los que se define una función o clase con el mismo
+nombre, por lo que nombres comunes como get, run o __init__ generan cientos de aristas irrelevantes.
+
+Para cada fichero se guardan su ruta de módulo y sus imports (extraídos del árbol de tree-sitter), para cada
+definición la clase en la que está definida y para cada referencia el objeto sobre el que se llama (self.x(),
+modulo.x(), Clase.x()) y la clase desde la que se llama. Con esa información se puntúan los candidatos, se mantienen
+solo los del nivel de confianza más alto y se limita el número de aristas por referencia a max_fanout.
+
+Si no hay información de ámbito de un chunk (por ejemplo, ficheros que no se han podido analizar), se mantiene el
+comportamiento original de enlazar con todas las definiciones del mismo nombre.
+"""
+
+SELF_QUALIFIERS = ["self", "cls", "this"]
+
+# Confianza a partir de la cual se considera que la referencia está resuelta, por debajo de este valor solo se
+# mantienen los candidatos si no superan el max_fanout
+STRONG_CONFIDENCE = 0.5
+
+CLASS_NODE_TYPES = ["class_definition", "class_declaration", "class", "interface_declaration", "enum_declaration"]
+# tipo de nodo padre de la referencia -> campo con el objeto sobre el que se llama
+QUALIFIED_CALL_NODE_FIELDS = {
+    "attribute": "object",
+    "member_expression": "object",
+    "method_invocation": "object"
+}
+SOURCE_FILE_EXTENSIONS = [".py", ".java", ".js", ".jsx", ".mjs", ".ts", ".tsx"]
+INDEX_MODULE_NAMES = ["__init__", "index"]
+
+
+@dataclass
+class FileScope:
+    file_id: int
+    module_path: str
+    # nombre local -> módulos de los que puede venir
+    imports: Dict[str, List[str]] = field(default_factory=dict)
+    # módulos importados completos, incluidos los import *
+    imported_modules: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class DefinitionSite:
+    chunk_id: int
+    name: str
+    class_name: Optional[str]
+
+
+@dataclass
+class ReferenceSite:
+    chunk_id: int
+    name: str
+    qualifier: Optional[str]
+    class_name: Optional[str]
+
+
+@dataclass
+class ResolvedCandidate:
+    chunk_id: int
+    confidence: float
+
+
+@dataclass
+class ReferenceEdge:
+    """Arista entre dos chunks con los datos con los que se calcula su peso"""
+    referencing_id: int
+    referenced_id: int
+    reference_count: int = 0
+    confidence: float = 0.0
+    same_file: bool = False
+
+    @property
+    def weight(self) -> float:
+        """
+        Las referencias repetidas aumentan el peso de forma logarítmica para que una función llamada en un bucle
+        desenrollado no domine sobre el resto.
+        """
+        weight = self.confidence * (1 + math.log(max(self.reference_count, 1)))
+        if self.same_file:
+            weight *= REFERENCE_SAME_FILE_WEIGHT
+        return round(weight, 4)
+
+    def to_row(self) -> dict:
+        return {
+            "referencing_id": self.referencing_id,
+            "referenced_id": self.referenced_id,
+            "reference_count": self.reference_count,
+            "confidence": self.confidence,
+            "same_file": self.same_file,
+            "weight": self.weight
+        }
+
+
+@dataclass
+class ReferenceResolutionStats:
+    # aristas si se enlazase con todas las definiciones del mismo nombre
+    naive_edges: int = 0
+    resolved_edges: int = 0
+    # referencias descartadas por ser ambiguas
+    pruned_references: int = 0
+    naive_fanout_by_name: Dict[str, int] = field(default_factory=dict)
+    resolved_fanout_by_name: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self, top_names: int = 10) -> dict:
+        def top(fanout_by_name):
+            return dict(sorted(fanout_by_name.items(), key=lambda item: item[1], reverse=True)[:top_names])
+
+        return {
+            "naive_edges": self.naive_edges,
+            "resolved_edges": self.resolved_edges,
+            "pruned_references": self.pruned_references,
+            "top_naive_fanout": top(self.naive_fanout_by_name),
+            "top_resolved_fanout": top(self.resolved_fanout_by_name)
+        }
+
+
+def get_module_path(relative_path: str) -> str:
+    """
+    src/db/models.py -> src.db.models, app/utils/index.js -> app.utils
+    """
+    module_path, extension = os.path.splitext(relative_path)
+    if extension not in SOURCE_FILE_EXTENSIONS:
+        module_path = relative_path
+    parts = [part for part in module_path.replace("\\", "/").split("/") if part not in ["", "."]]
+    if parts and parts[-1] in INDEX_MODULE_NAMES:
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def module_matches(file_module: str, imported_module: str) -> bool:
+    """
+    Los imports pueden ser relativos a una raíz distinta a la del repositorio (src.db.models se define en
+    servidor/src/db/models.py), por lo que se compara por sufijo.
+    """
+    if not imported_module or not file_module:
+        return False
+    return file_module == imported_module or file_module.endswith("." + imported_module)
+
+
+def get_node_text(node) -> str:
+    return node.text.decode("utf-8")
+
+
+def get_enclosing_class_name(node) -> Optional[str]:
+    current = node.parent
+    while current is not None:
+        if current.type in CLASS_NODE_TYPES:
+            name_node = current.child_by_field_name("name")
+            return get_node_text(name_node) if name_node is not None else None
+        current = current.parent
+    return None
+
+
+def get_reference_qualifier(node) -> Optional[str]:
+    parent = node.parent
+    if parent is None or parent.type not in QUALIFIED_CALL_NODE_FIELDS:
+        return None
+    object_node = parent.child_by_field_name(QUALIFIED_CALL_NODE_FIELDS[parent.type])
+    # el nodo es el objeto de la llamada, no el método llamado
+    if object_node is None or object_node == node:
+        return None
+    return get_node_text(object_node)
+
+
+def get_reference(reference_node) -> Reference:
+    return Reference(
+        start_point=reference_node.start_point,
+        end_point=reference_node.end_point,
+        name=get_node_text(reference_node),
+        qualifier=get_reference_qualifier(reference_node),
+        class_name=get_enclosing_class_name(reference_node)
+    )
+
+
+def iterate_nodes(root_node, node_types: List[str]):
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if node.type in node_types:
+            yield node
+        else:
+            stack.extend(reversed(node.children))
+
+
+def resolve_python_relative_module(module_path: str, relative_module: str) -> str:
+    """
+    from ..db import models en src/chunker/x.py -> src.db
+    """
+    level = len(relative_module) - len(relative_module.lstrip("."))
+    package_parts = module_path.split(".")[:-1] if module_path else []
+    if level > 1:
+        package_parts = package_parts[:len(package_parts) - (level - 1)]
+    remaining_module = relative_module.lstrip(".")
+    return ".".join(package_parts + ([remaining_module] if remaining_module else []))
+
+
+def extract_python_imports(scope: FileScope, root_node):
+    for node in iterate_nodes(root_node, ["import_statement", "import_from_statement"]):
+        if node.type == "import_statement":
+            for name_node in node.children_by_field_name("name"):
+                if name_node.type == "aliased_import":
+                    module = get_node_text(name_node.child_by_field_name("name"))
+                    local_name = get_node_text(name_node.child_by_field_name("alias"))
+                else:
+                    module = get_node_text(name_node)
+                    local_name = module
+                scope.imports[local_name] = [module]
+                scope.imported_modules.add(module)
+            continue
+
+        module_node = node.child_by_field_name("module_name")
+        module = get_node_text(module_node)
+        if module.startswith("."):
+            module = resolve_python_relative_module(scope.module_path, module)
+        scope.imported_modules.add(module)
+
+        for name_node in node.children_by_field_name("name"):
+            if name_node.type == "aliased_import":
+                imported_name = get_node_text(name_node.child_by_field_name("name"))
+                local_name = get_node_text(name_node.child_by_field_name("alias"))
+            else:
+                imported_name = get_node_text(name_node)
+                local_name = imported_name
+            # el nombre importado puede ser una definición del módulo o un submódulo
+            scope.imports[local_name] = [module, f"{module}.{imported_name}" if module else imported_name]
+
+
+def extract_java_imports(scope: FileScope, root_node):
+    for node in iterate_nodes(root_node, ["import_declaration"]):
+        import_text = get_node_text(node).replace("import", "", 1).replace("static ", "").strip(" ;")
+        if import_text.endswith(".*"):
+            scope.imported_modules.add(import_text[:-2])
+            continue
+        local_name = import_text.split(".")[-1]
+        scope.imports[local_name] = [import_text]
+        scope.imported_modules.add(import_text)
+
+
+def extract_javascript_imports(scope: FileScope, root_node, relative_path: str):
+    for node in iterate_nodes(root_node, ["import_statement"]):
+        source_node = node.child_by_field_name("source")
+        if source_node is None:
+            continue
+        source = get_node_text(source_node).strip("'\"`")
+        if source.startswith("."):
+            source_path = os.path.normpath(os.path.join(os.path.dirname(relative_path), source))
+            module = get_module_path(source_path.lstrip("./"))
+        else:
+            module = source.replace("/", ".")
+        scope.imported_modules.add(module)
+
+        for identifier_node in iterate_nodes(node, ["identifier"]):
+            scope.imports[get_node_text(identifier_node)] = [module]
+
+
+class ReferenceResolver:
+    file_scopes: Dict[int, FileScope]
+    # id chunk -> id fichero
+    chunk_files: Dict[int, int]
+    # id chunk -> nombre definición -> definiciones del chunk con ese nombre
+    definition_sites: Dict[int, Dict[str, List[DefinitionSite]]]
+    # id chunk -> nombre referencia -> referencias del chunk con ese nombre
+    reference_sites: Dict[int, Dict[str, List[ReferenceSite]]]
+
+    def __init__(self, max_fanout: int = REFERENCE_MAX_FANOUT):
+        self.max_fanout = max_fanout
+        self.file_scopes = {}
+        self.chunk_files = {}
+        self.definition_sites = {}
+        self.reference_sites = {}
+        self.stats = ReferenceResolutionStats()
+
+    def register_file(self, file_id: int, relative_path: str, language: str = None, root_node=None):
+        scope = FileScope(file_id=file_id, module_path=get_module_path(relative_path))
+        if root_node is not None:
+            if language == "python":
+                extract_python_imports(scope, root_node)
+            elif language == "java":
+                extract_java_imports(scope, root_node)
+            elif language in ["javascript", "typescript", "tsx"]:
+                extract_javascript_imports(scope, root_node, relative_path)
+        self.file_scopes[file_id] = scope
+        return scope
+
+    def add_file_scope(self, scope: FileScope):
+        """
+        Registra el ámbito de un fichero obtenido en un análisis anterior, sin volver a recorrer su árbol
+        """
+        self.file_scopes[scope.file_id] = scope
+
+    def register_chunk(self, chunk_id: int, file_id: int):
+        self.chunk_files[chunk_id] = file_id
+
+    def add_definition(self, chunk_id: int, name: str, class_name: Optional[str]):
+        chunk_definitions = self.definition_sites.setdefault(chunk_id, {})
+        chunk_definitions.setdefault(name, []).append(
+            DefinitionSite(chunk_id=chunk_id, name=name, class_name=class_name)
+        )
+
+    def add_reference(self, chunk_id: int, reference: Reference):
+        chunk_references = self.reference_sites.setdefault(chunk_id, {})
+        chunk_references.setdefault(reference.name, []).append(
+            ReferenceSite(
+                chunk_id=chunk_id,
+                name=reference.name,
+                qualifier=reference.qualifier,
+                class_name=reference.class_name
+            )
+        )
+
+    def is_same_file(self, chunk_id: int, other_chunk_id: int) -> bool:
+        file_id = self.chunk_files.get(chunk_id)
+        return file_id is not None and file_id == self.chunk_files.get(other_chunk_id)
+
+    def get_chunk_scope(self, chunk_id: int) -> Optional[FileScope]:
+        file_id = self.chunk_files.get(chunk_id)
+        if file_id is None:
+            return None
+        return self.file_scopes.get(file_id)
+
+    def is_imported(self, scope: FileScope, local_name: str, definition_module: str) -> bool:
+        return any(module_matches(definition_module, module) for module in scope.imports.get(local_name, []))
+
+    def score_candidate(self, reference: ReferenceSite, reference_scope: FileScope,
+                        definition: DefinitionSite, definition_scope: FileScope) -> float:
+        same_file = reference_scope.file_id == definition_scope.file_id
+        definition_module = definition_scope.module_path
+
+        # self.metodo(): método de la propia clase
+        if reference.qualifier in SELF_QUALIFIERS:
+            if same_file and definition.class_name == reference.class_name:
+                return 1.0
+            if same_file and definition.class_name is not None:
+                return 0.6
+            return 0.1
+
+        # modulo.funcion() o Clase.metodo()
+        if reference.qualifier is not None:
+            if definition.class_name is None and self.is_imported(reference_scope, reference.qualifier, definition_module):
+                return 0.9
+            if definition.class_name == reference.qualifier:
+                return 0.9
+            if same_file:
+                return 0.4
+            if any(module_matches(definition_module, module) for module in reference_scope.imported_modules):
+                return 0.3
+            return 0.1
+
+        # funcion() o Clase()
+        if self.is_imported(reference_scope, reference.name, definition_module):
+            return 0.95
+        if same_file:
+            return 0.9 if definition.class_name is None else 0.5
+        if any(module_matches(definition_module, module) for module in reference_scope.imported_modules):
+            return 0.6
+        if definition.class_name is None:
+            return 0.3
+        return 0.1
+
+    def score_reference_candidates(self, chunk_id: int, reference_name: str,
+                                   candidate_chunk_ids: List[int]) -> Optional[Dict[int, float]]:
+        reference_scope = self.get_chunk_scope(chunk_id)
+        references = self.reference_sites.get(chunk_id, {}).get(reference_name)
+        if reference_scope is None or not references:
+            return None
+
+        scores = {}
+        for candidate_chunk_id in candidate_chunk_ids:
+            definition_scope = self.get_chunk_scope(candidate_chunk_id)
+            definitions = self.definition_sites.get(candidate_chunk_id, {}).get(reference_name)
+            if definition_scope is None or not definitions:
+                scores[candidate_chunk_id] = STRONG_CONFIDENCE
+                continue
+            scores[candidate_chunk_id] = max(
+                self.score_candidate(reference, reference_scope, definition, definition_scope)
+                for reference in references
+                for definition in definitions
+            )
+        return scores
+
+    def resolve(self, chunk_id: int, reference_name: str, candidate_chunk_ids: List[int]) -> List[ResolvedCandidate]:
+        """
+        Devuelve los chunks a los que debe apuntar la referencia ordenados por confianza.
+        """
+        candidate_chunk_ids = list(dict.fromkeys(candidate_chunk_ids))
+        naive_fanout = len([candidate for candidate in candidate_chunk_ids if candidate != chunk_id])
+        self.stats.naive_edges += naive_fanout
+        self.stats.naive_fanout_by_name[reference_name] = self.stats.naive_fanout_by_name.get(reference_name, 0) + naive_fanout
+
+        scores = self.score_reference_candidates(chunk_id, reference_name, candidate_chunk_ids)
+        if scores is None:
+            # sin información de ámbito se mantienen todos los candidatos
+            resolved = [ResolvedCandidate(candidate, 1.0) for candidate in candidate_chunk_ids if candidate != chunk_id]
+        else:
+            resolved = self.prune_candidates(chunk_id, scores)
+
+        self.stats.resolved_edges += len(resolved)
+        self.stats.resolved_fanout_by_name[reference_name] = self.stats.resolved_fanout_by_name.get(reference_name, 0) + len(resolved)
+        return resolved
+
+    def prune_candidates(self, chunk_id: int, scores: Dict[int, float]) -> List[ResolvedCandidate]:
+        if not scores:
+            return []
+        best_score = max(scores.values())
+        best_candidates = sorted(candidate for candidate, score in scores.items() if score == best_score)
+
+        # si la definición está en el propio chunk la referencia queda resuelta localmente
+        if chunk_id in best_candidates:
+            return []
+
+        # una referencia débil con demasiados candidatos es ambigua, no aporta contexto útil
+        if best_score < STRONG_CONFIDENCE and len(best_candidates) > self.max_fanout:
+            self.stats.pruned_references += 1
+            return []
+
+        return [ResolvedCandidate(candidate, best_score) for candidate in best_candidates[:self.max_fanout]]
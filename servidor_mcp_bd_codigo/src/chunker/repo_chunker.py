@@ -8,21 +8,34 @@ from importlib import resources
 
 from src.chunker.chunk_creator import ChunkCreator
 from src.chunker.file_chunk_state import ChunkingContext, FinalState, StartState
-from src.db.models import FSEntry, FileChunk
+from src.db.models import FSEntry, FileChunk, GitRef
 from src.db.db_connection import DBConnection
 
 from src.utils.utils import get_file_text, get_count_text_lines
-from src.db.db_utils import get_fsentry_relative_path, add_fs_entry
+from src.db.db_utils import get_fsentry_relative_path, compute_chunk_neighbours, mark_duplicate_chunks, get_git_ref, \
+    get_blob_chunk_ids, bump_index_version
+from src.utils.git_utils import resolve_git_commit, list_git_tree_blobs, read_git_blobs, decode_blob_text
+from src.chunker.chunk_graph_snapshot import ChunkGraphSnapshot, SnapshotChunkCreator
 from src.chunker.chunk_objects import Definition
+from src.chunker.reference_resolver import get_enclosing_class_name, get_reference
+from src.chunker.file_classifier import FileClassifier, ACTION_SKIP, ACTION_METADATA_ONLY
+from config import CHUNK_SIZE_UNIT, CHUNK_MAX_TOKENS
 
 
-def analyze_file_abstract_syntaxis_tree(code_text: str, file_path: str):
+# Número de blobs que se leen de git en cada llamada a git cat-file
+GIT_BLOB_BATCH_SIZE = 200
+
+def parse_file_abstract_syntaxis_tree(code_text: str, file_path: str):
     language = filename_to_lang(file_path)
     if not language:
         raise Exception(f"File {file_path} has no language")
 
-    lang = get_language(language)
     parser = get_parser(language)
+    tree = parser.parse(bytes(code_text, "utf-8"))
+    return language, tree
+
+def get_abstract_syntaxis_tree_captures(language: str, tree, file_path: str):
+    lang = get_language(language)
 
     scm_file = resources.files("servidor_mcp_bd_codigo").joinpath(
         "src",
@@ -35,8 +48,6 @@ def analyze_file_abstract_syntaxis_tree(code_text: str, file_path: str):
 
     query_scm = scm_file.read_text()
 
-    tree = parser.parse(bytes(code_text, "utf-8"))
-
     query = lang.query(query_scm)
     captures = query.captures(tree.root_node)
     if not captures:
@@ -44,20 +55,37 @@ def analyze_file_abstract_syntaxis_tree(code_text: str, file_path: str):
 
     return captures
 
+def analyze_file_abstract_syntaxis_tree(code_text: str, file_path: str):
+    language, tree = parse_file_abstract_syntaxis_tree(code_text, file_path)
+    return get_abstract_syntaxis_tree_captures(language, tree, file_path)
+
 class FileChunker:
     chunk_creator: ChunkCreator
     ignored_entries: List[str]
 
-    def __init__(self, chunk_max_line_size: int = 100, chunk_minimum_proportion: float = 0.2, session: Session = None, chunk_creator: ChunkCreator = None):
+    def __init__(self, chunk_max_line_size: int = 100, chunk_minimum_proportion: float = 0.2, session: Session = None,
+                 chunk_creator: ChunkCreator = None, file_classifier: FileClassifier = None,
+                 size_unit: str = CHUNK_SIZE_UNIT, chunk_max_tokens: int = CHUNK_MAX_TOKENS):
+        """
+        Con size_unit="tokens" el tamaño de los chunks se limita a chunk_max_tokens en lugar de chunk_max_line_size
+        """
         self.chunk_max_line_size = chunk_max_line_size
         self.chunk_minimum_proportion = chunk_minimum_proportion
-        self.db_session = session or DBConnection().get_session()
+        self.size_unit = size_unit
+        self.chunk_max_tokens = chunk_max_tokens
+        # La sesión se obtiene al chunkear el repositorio si no se indica, el modo exportación no usa base de datos
+        self.db_session = session
         self.chunk_creator = chunk_creator or ChunkCreator(
             db_session=self.db_session,
             chunk_minimum_proportion=self.chunk_minimum_proportion,
-            chunk_max_line_size=self.chunk_max_line_size
+            chunk_max_line_size=self.chunk_max_line_size,
+            size_unit=self.size_unit,
+            chunk_max_tokens=self.chunk_max_tokens
         )
         self.ignored_entries = []
+        self.file_classifier = file_classifier or FileClassifier()
+        # blobs chunkeados en la ref actual, las copias de un mismo blob solo se chunkean una vez
+        self.chunked_blob_shas = set()
 
     def get_definitions_from_tree_captures(self, abstract_tree_captures):
         definitions = []
@@ -68,7 +96,8 @@ class FileChunker:
                         start_point=class_definition.start_point,
                         end_point=class_definition.end_point,
                         is_class=True,
-                        name=class_definition.child_by_field_name("name").text.decode("utf-8")
+                        name=class_definition.child_by_field_name("name").text.decode("utf-8"),
+                        class_name=get_enclosing_class_name(class_definition)
                     )
                 )
         if "definition.function" in abstract_tree_captures:
@@ -78,7 +107,8 @@ class FileChunker:
                         start_point=function_definition.start_point,
                         end_point=function_definition.end_point,
                         is_class=False,
-                        name=function_definition.child_by_field_name("name").text.decode("utf-8")
+                        name=function_definition.child_by_field_name("name").text.decode("utf-8"),
+                        class_name=get_enclosing_class_name(function_definition)
                     )
                 )
         definitions.sort(key=lambda d: d.start_point.row)
@@ -90,21 +120,39 @@ class FileChunker:
         if "name.reference.call" in abstract_tree_captures:
             references += abstract_tree_captures["name.reference.call"]
         references.sort(key=lambda d: d.start_point.row)
-        return references
+        return [get_reference(reference) for reference in references]
+
 
+    def chunk_file(self, file_path: str, parent_id: int, blob_sha: str = None, blob_content: bytes = None):
+        """
+        Si se indica el blob de git, el contenido se toma de blob_content en lugar de leer file_path
+        """
+        # Los ficheros generados, minificados, binarios o de datos no se chunkean
+        classification = self.file_classifier.classify(file_path, blob_content)
+        if classification.action == ACTION_SKIP:
+            return
 
-    def chunk_file(self, file_path: str, parent_id: int):
-        file_entry = add_fs_entry(
-            session=self.db_session,
+        file_entry = self.chunk_creator.add_fs_entry(
             name=os.path.basename(file_path),
             parent_id=parent_id,
-            is_directory=False
+            is_directory=False,
+            skip_reason=f"{classification.category}: {classification.reason}" if classification.reason else None,
+            blob_sha=blob_sha
         )
+        if classification.action == ACTION_METADATA_ONLY:
+            return
+        if blob_sha is not None:
+            if blob_sha in self.chunked_blob_shas:
+                return
+            self.chunked_blob_shas.add(blob_sha)
 
-        code_text = get_file_text(file_path)
+        code_text = get_file_text(file_path) if blob_content is None else decode_blob_text(blob_content)
 
         try:
-            abstract_tree_captures = analyze_file_abstract_syntaxis_tree(code_text, file_path)
+            language, tree = parse_file_abstract_syntaxis_tree(code_text, file_path)
+            abstract_tree_captures = get_abstract_syntaxis_tree_captures(language, tree, file_path)
+            self.chunk_creator.register_file(file_entry.id, file_entry.path, language, tree.root_node)
+            self.chunk_creator.set_file_content(code_text, tree.root_node, blob_sha)
 
             definitions = self.get_definitions_from_tree_captures(abstract_tree_captures)
             references = self.get_references_from_tree_captures(abstract_tree_captures)
@@ -114,22 +162,25 @@ class FileChunker:
                 definitions=definitions,
                 references=references,
                 file_id=file_entry.id,
-                file_line_size=get_count_text_lines(code_text)
+                file_line_size=get_count_text_lines(code_text),
+                size_measure=self.chunk_creator.size_measure
             )
             state = StartState()
             while not isinstance(state, FinalState):
                 state = state.handle(context)
+            self.chunk_creator.add_file_symbols_to_db(file_entry.id, definitions, references)
 
         except Exception as e:
             print(f"{file_path}: {e}")
+            self.chunk_creator.set_file_content(code_text, blob_sha=blob_sha)
             self.chunk_creator.chunk_file_simple(file_entry, code_text)
+            self.chunk_creator.add_file_symbols_to_db(file_entry.id, [], [])
 
     def chunk_directory_recursive(self, dir_path: str, parent_id: int):
         if dir_path in self.ignored_entries:
             return
 
-        directory_entry = add_fs_entry(
-            session=self.db_session,
+        directory_entry = self.chunk_creator.add_fs_entry(
             name=os.path.basename(dir_path),
             parent_id=parent_id,
             is_directory=True,
@@ -154,13 +205,33 @@ class FileChunker:
             except Exception as e:
                 print(f"error, could not analyze file {entry_path}: {e}")
 
-    def chunk_repo(self, repo_path: str, ignored_entries: List[str] = None):
+    def chunk_repo(self, repo_path: str, ignored_entries: List[str] = None, export_dir: str = None,
+                   export_format: str = "jsonl"):
         """
         Se divide el repositorio en chunks.
         Se analizan las definiciones y referencias de cada chunk, si el nombre de la referencia ha sido definida se añade
         al diccionario de referencias resueltas, si no se añade al diccionario de referencias no resueltas.
         Finalmente se añaden las referencias a la base de datos
+
+        Si se indica export_dir no se accede a la base de datos: el árbol de ficheros, los chunks, las definiciones y
+        las referencias se exportan a ficheros jsonl o parquet que después se pueden importar con
+        import_chunk_graph_snapshot.
         """
+        snapshot = None
+        if export_dir is not None:
+            snapshot = ChunkGraphSnapshot(repo_path=repo_path)
+            self.chunk_creator = SnapshotChunkCreator(
+                snapshot=snapshot,
+                chunk_minimum_proportion=self.chunk_minimum_proportion,
+                chunk_max_line_size=self.chunk_max_line_size,
+                reference_resolver=self.chunk_creator.reference_resolver,
+                size_unit=self.size_unit,
+                chunk_max_tokens=self.chunk_max_tokens
+            )
+        elif self.db_session is None:
+            self.db_session = DBConnection.get_session()
+            self.chunk_creator.db_session = self.db_session
+
         if ignored_entries is None:
             ignored_entries = []
         for i, ignored_entry in enumerate(ignored_entries):
@@ -170,11 +241,12 @@ class FileChunker:
         self.solved_references = dict()
         self.not_solved_references = dict()
         self.name_definitions = dict()
-        self.db_session = DBConnection.get_session()
         self.ignored_entries = ignored_entries
 
         # crear chunks y referencias parciales
         self.chunk_directory_recursive(repo_path, None)
+        self.file_classifier.print_report()
+        self.chunk_creator.size_report.print_report()
 
         # resolver referencias no resueltas
         self.chunk_creator.solve_unsolved_references()
@@ -182,12 +254,119 @@ class FileChunker:
         # añadir referencias a base de datos
         self.chunk_creator.add_chunk_references_to_db()
 
-        self.db_session.flush()
+        if snapshot is not None:
+            snapshot.file_classification = self.file_classifier.report.to_dict()
+            snapshot.chunk_sizes = self.chunk_creator.size_report.to_dict()
+            snapshot.write(export_dir, export_format)
+            print(f"\n\n\n#####\n\nTodo el repo chunkeado: {repo_path}, exportado a {export_dir}\n\n#####")
+            return snapshot
+
+        self.finish_db_chunking()
         self.db_session.commit()
         self.db_session.close()
 
         print(f"\n\n\n#####\n\nTodo el repo chunkeado: {repo_path}\n\n#####")
 
+    def finish_db_chunking(self):
+        """
+        Una vez añadidas las referencias se calculan sus pesos, los vecinos de cada chunk y los chunks duplicados, y se
+        incrementa la versión del índice
+        """
+        self.db_session.flush()
+        self.chunk_creator.add_chunk_reference_weights_to_db()
+        compute_chunk_neighbours(self.db_session)
+        duplicate_chunks = mark_duplicate_chunks(self.db_session)
+        print(f"Chunks duplicados: {duplicate_chunks}, se documentarán una única vez")
+        bump_index_version(self.db_session)
+
+    def get_git_directory_id(self, file_path: str, directory_ids: dict) -> int:
+        """
+        Devuelve el id del directorio del fichero, creando las entradas de los directorios que todavía no existen
+        """
+        directory_path = os.path.dirname(file_path)
+        if directory_path not in directory_ids:
+            parent_id = self.get_git_directory_id(directory_path, directory_ids)
+            directory_ids[directory_path] = self.chunk_creator.add_fs_entry(
+                name=os.path.basename(directory_path),
+                parent_id=parent_id,
+                is_directory=True
+            ).id
+        return directory_ids[directory_path]
+
+    def chunk_git_ref(self, repo_path: str, ref: str, ignored_entries: List[str] = None) -> dict:
+        """
+        Se divide en chunks una rama o tag leyendo los árboles y blobs de git, sin necesidad de hacer checkout.
+        Cada ref tiene su propio árbol de fsentry, pero los chunks se identifican por blob: los ficheros sin cambios
+        respecto a otra ref ya indexada reutilizan sus chunks y con ellos su documentación y embedding. Los blobs
+        reutilizados se vuelven a analizar para registrar sus definiciones y resolver las referencias de la ref.
+
+        Las rutas de ignored_entries son relativas a la raíz del repositorio.
+        Devuelve un resumen con los ficheros, blobs reutilizados y chunks creados.
+        """
+        if self.db_session is None:
+            self.db_session = DBConnection.get_session()
+            self.chunk_creator.db_session = self.db_session
+
+        commit_sha = resolve_git_commit(repo_path, ref)
+        git_ref = get_git_ref(self.db_session, ref)
+        if git_ref is not None and git_ref.commit_sha == commit_sha:
+            print(f"La ref {ref} ya está indexada en el commit {commit_sha}")
+            return {"ref": ref, "commit_sha": commit_sha, "files": 0, "reused_blobs": 0, "new_chunks": 0}
+
+        ignored_entries = [ignored_entry.rstrip("/") for ignored_entry in ignored_entries or []]
+        blobs = [
+            blob for blob in list_git_tree_blobs(repo_path, commit_sha)
+            if not any(blob.path == ignored or blob.path.startswith(ignored + "/") for ignored in ignored_entries)
+        ]
+
+        # chunks de los blobs que ya se han indexado en otras refs
+        self.chunk_creator.blob_chunk_ids = get_blob_chunk_ids(self.db_session, {blob.blob_sha for blob in blobs})
+        reused_blob_shas = {blob_sha for blob_sha, _, _ in self.chunk_creator.blob_chunk_ids}
+        chunks_before = self.db_session.query(FileChunk).count()
+        self.chunked_blob_shas = set()
+
+        root_entry = self.chunk_creator.add_fs_entry(name=ref, parent_id=None, is_directory=True)
+        directory_ids = {"": root_entry.id}
+        for batch_start in range(0, len(blobs), GIT_BLOB_BATCH_SIZE):
+            batch = blobs[batch_start:batch_start + GIT_BLOB_BATCH_SIZE]
+            blob_contents = read_git_blobs(repo_path, [blob.blob_sha for blob in batch])
+            for blob in batch:
+                try:
+                    self.chunk_file(
+                        file_path=blob.path,
+                        parent_id=self.get_git_directory_id(blob.path, directory_ids),
+                        blob_sha=blob.blob_sha,
+                        blob_content=blob_contents[blob.blob_sha]
+                    )
+                except Exception as e:
+                    print(f"error, could not analyze file {blob.path}: {e}")
+        self.file_classifier.print_report()
+        self.chunk_creator.size_report.print_report()
+
+        self.chunk_creator.solve_unsolved_references()
+        self.chunk_creator.add_chunk_references_to_db()
+        self.finish_db_chunking()
+
+        # Si la ref ya existía se apunta al nuevo árbol
+        if git_ref is None:
+            self.db_session.add(GitRef(name=ref, commit_sha=commit_sha, root_id=root_entry.id))
+        else:
+            git_ref.commit_sha = commit_sha
+            git_ref.root_id = root_entry.id
+
+        summary = {
+            "ref": ref,
+            "commit_sha": commit_sha,
+            "files": len(blobs),
+            "reused_blobs": len({blob.blob_sha for blob in blobs} & reused_blob_shas),
+            "new_chunks": self.db_session.query(FileChunk).count() - chunks_before
+        }
+        self.db_session.commit()
+        self.db_session.close()
+
+        print(f"\n\n\n#####\n\nRef chunkeada: {ref} ({commit_sha}), {summary}\n\n#####")
+        return summary
+
     def visualize_chunks(self, repo_path: str):
         session = DBConnection.get_session()
         repo_files = session.query(FSEntry).filter(FSEntry.is_directory==False).all()
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Optional
+
+from langchain_core.messages import BaseMessage
+
+"""
+Envío de peticiones al LLM en modo batch.
+
+La indexación inicial de un repositorio no es sensible a la latencia, por lo que en lugar de lanzar una petición
+síncrona por chunk se escriben todas las peticiones en ficheros JSONL con el formato de la Batch API de OpenAI,
+se envían como un trabajo batch y se espera a que el proveedor lo complete.
+
+Se definen dos implementaciones de la interfaz BatchJobClient:
+- OpenAIBatchJobClient: Envía los ficheros a la Batch API de OpenAI.
+- LocalBatchJobClient: Procesa los ficheros localmente, permite probar todo el flujo sin conexión.
+"""
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+EMBEDDINGS_ENDPOINT = "/v1/embeddings"
+
+BATCH_FINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+# Mapeo de los tipos de mensaje de langchain a los roles de la API de OpenAI
+MESSAGE_TYPE_TO_ROLE = {
+    "system": "system",
+    "human": "user",
+    "ai": "assistant"
+}
+
+
+@dataclass
+class BatchJob:
+    """Estado de un trabajo batch enviado"""
+    job_id: str
+    input_file_path: str
+    endpoint: str
+    status: str = "validating"
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    request_counts: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in BATCH_FINAL_STATUSES
+
+
+def build_chat_batch_request(custom_id: str, model: str, messages: List[BaseMessage], temperature: float) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": CHAT_COMPLETIONS_ENDPOINT,
+        "body": {
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"role": MESSAGE_TYPE_TO_ROLE[message.type], "content": message.content}
+                for message in messages
+            ]
+        }
+    }
+
+
+def build_embedding_batch_request(custom_id: str, model: str, text: str) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": EMBEDDINGS_ENDPOINT,
+        "body": {
+            "model": model,
+            "input": text
+        }
+    }
+
+
+def write_batch_file(file_path: str, requests: List[dict]):
+    with open(file_path, "w", encoding="utf-8") as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+def parse_batch_response_body(body: dict) -> Any:
+    """
+    Extrae el resultado útil de la respuesta: el texto generado en el caso del chat y el vector en el caso
+    de los embeddings.
+    """
+    if "choices" in body:
+        return body["choices"][0]["message"]["content"]
+    if "data" in body:
+        return body["data"][0]["embedding"]
+    raise ValueError(f"Respuesta batch no reconocida: {list(body.keys())}")
+
+
+def parse_batch_output_text(output_text: str) -> Dict[str, Any]:
+    """
+    Devuelve un diccionario custom_id -> resultado. Las peticiones con error se omiten.
+    """
+    results = {}
+    for line in output_text.splitlines():
+        if line.strip() == "":
+            continue
+        line_result = json.loads(line)
+        response = line_result.get("response")
+        if line_result.get("error") or response is None or response.get("status_code") != 200:
+            print(f"Error en la petición batch {line_result.get('custom_id')}: {line_result.get('error')}")
+            continue
+        results[line_result["custom_id"]] = parse_batch_response_body(response["body"])
+    return results
+
+
+class BatchJobClient(ABC):
+    """Interfaz común para el envío y seguimiento de trabajos batch"""
+
+    @abstractmethod
+    async def submit_batch(self, input_file_path: str, endpoint: str) -> BatchJob:
+        """Envía el fichero JSONL de peticiones y devuelve el trabajo creado"""
+        pass
+
+    @abstractmethod
+    async def refresh_batch(self, job: BatchJob) -> BatchJob:
+        """Actualiza el estado del trabajo"""
+        pass
+
+    @abstractmethod
+    async def get_batch_output_text(self, job: BatchJob) -> str:
+        """Devuelve el contenido JSONL de los resultados de un trabajo completado"""
+        pass
+
+
+class OpenAIBatchJobClient(BatchJobClient):
+    def __init__(self, client=None, completion_window: str = "24h"):
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI()
+        self.client = client
+        self.completion_window = completion_window
+
+    async def submit_batch(self, input_file_path: str, endpoint: str) -> BatchJob:
+        with open(input_file_path, "rb") as file:
+            input_file = await self.client.files.create(file=file, purpose="batch")
+
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window
+        )
+        return BatchJob(
+            job_id=batch.id,
+            input_file_path=input_file_path,
+            endpoint=endpoint,
+            status=batch.status
+        )
+
+    async def refresh_batch(self, job: BatchJob) -> BatchJob:
+        batch = await self.client.batches.retrieve(job.job_id)
+        job.status = batch.status
+        job.output_file_id = batch.output_file_id
+        job.error_file_id = batch.error_file_id
+        if batch.request_counts is not None:
+            job.request_counts = {
+                "total": batch.request_counts.total,
+                "completed": batch.request_counts.completed,
+                "failed": batch.request_counts.failed
+            }
+        return job
+
+    async def get_batch_output_text(self, job: BatchJob) -> str:
+        if job.output_file_id is None:
+            return ""
+        output_file = await self.client.files.content(job.output_file_id)
+        return output_file.text
+
+
+class LocalBatchJobClient(BatchJobClient):
+    """
+    Implementación local de la interfaz batch. Al enviar un fichero lo procesa con las funciones indicadas y escribe
+    el fichero de resultados en el directorio de trabajo con el mismo formato que la Batch API.
+    """
+    def __init__(self, work_dir: str,
+                 chat_responder: Callable[[dict], str] = None,
+                 embedding_responder: Callable[[str], List[float]] = None):
+        self.work_dir = work_dir
+        self.chat_responder = chat_responder or (lambda body: body["messages"][-1]["content"][:100])
+        self.embedding_responder = embedding_responder or (lambda text: [float(len(text))])
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def _process_request(self, request: dict) -> dict:
+        body = request["body"]
+        if request["url"] == CHAT_COMPLETIONS_ENDPOINT:
+            response_body = {"choices": [{"message": {"role": "assistant", "content": self.chat_responder(body)}}]}
+        else:
+            response_body = {"data": [{"embedding": self.embedding_responder(body["input"])}]}
+        return {
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "body": response_body},
+            "error": None
+        }
+
+    async def submit_batch(self, input_file_path: str, endpoint: str) -> BatchJob:
+        job_id = f"local_batch_{uuid.uuid4().hex}"
+        output_file_path = os.path.join(self.work_dir, f"{job_id}_output.jsonl")
+
+        with open(input_file_path, "r", encoding="utf-8") as input_file:
+            requests = [json.loads(line) for line in input_file if line.strip() != ""]
+        write_batch_file(output_file_path, [self._process_request(request) for request in requests])
+
+        return BatchJob(
+            job_id=job_id,
+            input_file_path=input_file_path,
+            endpoint=endpoint,
+            status="completed",
+            output_file_id=output_file_path,
+            request_counts={"total": len(requests), "completed": len(requests), "failed": 0}
+        )
+
+    async def refresh_batch(self, job: BatchJob) -> BatchJob:
+        return job
+
+    async def get_batch_output_text(self, job: BatchJob) -> str:
+        with open(job.output_file_id, "r", encoding="utf-8") as output_file:
+            return output_file.read()
+
+
+class BatchRunner:
+    """
+    Escribe las peticiones en uno o varios ficheros JSONL, los envía, espera a que terminen y devuelve los resultados.
+    """
+    def __init__(self, batch_client: BatchJobClient, work_dir: str, poll_interval: float = 30.0,
+                 max_requests_per_batch: int = 50000, timeout: float = 24 * 60 * 60):
+        self.batch_client = batch_client
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_requests_per_batch = max_requests_per_batch
+        self.timeout = timeout
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    async def wait_for_batch(self, job: BatchJob) -> BatchJob:
+        start_time = time.time()
+        while not job.is_finished:
+            if time.time() - start_time > self.timeout:
+                raise TimeoutError(f"El trabajo batch {job.job_id} no ha terminado en {self.timeout} segundos")
+            await asyncio.sleep(self.poll_interval)
+            job = await self.batch_client.refresh_batch(job)
+            print(f"Trabajo batch {job.job_id}: {job.status} {job.request_counts}")
+        return job
+
+    async def run(self, name: str, endpoint: str, requests: List[dict]) -> Dict[str, Any]:
+        results = {}
+        for i in range(0, len(requests), self.max_requests_per_batch):
+            batch_requests = requests[i:i + self.max_requests_per_batch]
+            input_file_path = os.path.join(self.work_dir, f"{name}_{i // self.max_requests_per_batch}.jsonl")
+            write_batch_file(input_file_path, batch_requests)
+
+            job = await self.batch_client.submit_batch(input_file_path, endpoint)
+            print(f"Enviado trabajo batch {job.job_id} con {len(batch_requests)} peticiones ({input_file_path})")
+            job = await self.wait_for_batch(job)
+
+            if job.status != "completed":
+                print(f"El trabajo batch {job.job_id} ha terminado con estado {job.status}")
+                continue
+
+            output_text = await self.batch_client.get_batch_output_text(job)
+            results.update(parse_batch_output_text(output_text))
+
+        missing_results = len(requests) - len(results)
+        if missing_results > 0:
+            print(f"{missing_results} peticiones de {name} no tienen resultado")
+        return results
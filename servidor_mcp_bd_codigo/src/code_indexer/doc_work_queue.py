@@ -0,0 +1,363 @@
+import asyncio
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, update, func, and_, or_, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from src.code_indexer.llm_tools import create_llm_prompter
+from src.code_indexer.prompt_builder import DocPromptBuilder
+from src.code_indexer.repo_async_pipeline import PipelineContext, ChunkContext, ContextPreparationStage, \
+    DocumentationGeneratorStage, EmbeddingIndexingStage
+from src.db.models import DocJob, FileChunk
+from src.db.db_connection import DBConnection
+
+"""
+Cola de trabajo distribuida para la documentación y los embeddings de los chunks.
+
+Los trabajos se guardan en la tabla doc_jobs. Cada worker reclama un lote de trabajos con
+SELECT ... FOR UPDATE SKIP LOCKED, de forma que varios workers en distintas máquinas nunca reclaman el mismo trabajo
+y no se bloquean entre ellos. Estados de un trabajo:
+- pending: Esperando a ser reclamado (a partir de available_at).
+- running: Reclamado por un worker hasta lease_expires_at. Si el lease expira se puede volver a reclamar.
+- done: Completado.
+- dead: Ha fallado max_attempts veces, se deja para revisión manual (dead-letter).
+Al completar un trabajo de documentación se encola el trabajo de embedding del mismo chunk.
+"""
+
+JOB_TYPE_DOCUMENTATION = "documentation"
+JOB_TYPE_EMBEDDING = "embedding"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+
+@dataclass
+class ClaimedJob:
+    job_id: int
+    chunk_id: int
+    job_type: str
+    attempts: int
+    max_attempts: int
+
+
+def compute_failure_transition(attempts: int, max_attempts: int, base_backoff: float) -> Tuple[str, float]:
+    """
+    Devuelve el nuevo estado de un trabajo fallido y los segundos a esperar antes de reintentarlo.
+    """
+    if attempts >= max_attempts:
+        return STATUS_DEAD, 0.0
+    return STATUS_PENDING, base_backoff * 2 ** (attempts - 1)
+
+
+def enqueue_chunk_jobs(session: Session, job_type: str, chunk_ids: List[int] = None, max_attempts: int = 3,
+                       requeue: bool = False, commit: bool = True) -> int:
+    """
+    Encola trabajos para los chunks indicados. Si no se indican chunks se encolan los que no tienen documentación
+    (o embedding, según el tipo de trabajo).
+    Con requeue se reinician los trabajos que ya existían para esos chunks, aunque estuvieran completados.
+    """
+    table = DocJob.__table__
+    columns = [table.c.chunk_id, table.c.job_type, table.c.status, table.c.attempts, table.c.max_attempts]
+
+    if chunk_ids is None:
+        chunks_filter = FileChunk.docs.is_(None) if job_type == JOB_TYPE_DOCUMENTATION \
+            else and_(FileChunk.docs.is_not(None), FileChunk.embedding.is_(None))
+        # los duplicados comparten la documentación del chunk canónico
+        stmt = insert(table).from_select(
+            columns,
+            select(FileChunk.chunk_id, literal(job_type), literal(STATUS_PENDING), literal(0), literal(max_attempts))
+            .where(chunks_filter)
+            .where(FileChunk.duplicate_of_id.is_(None))
+        )
+    else:
+        if len(chunk_ids) == 0:
+            return 0
+        stmt = insert(table).values([
+            {"chunk_id": chunk_id, "job_type": job_type, "status": STATUS_PENDING, "attempts": 0,
+             "max_attempts": max_attempts}
+            for chunk_id in chunk_ids
+        ])
+
+    if requeue:
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_doc_jobs_chunk_type",
+            set_={
+                "status": STATUS_PENDING,
+                "attempts": 0,
+                "available_at": func.now(),
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "last_error": None
+            }
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(constraint="uq_doc_jobs_chunk_type")
+
+    result = session.execute(stmt)
+    if commit:
+        session.commit()
+    return result.rowcount
+
+
+def build_claim_statement(worker_id: str, job_types: List[str] = None, batch_size: int = 10,
+                          lease_seconds: float = 300):
+    """
+    Reclama trabajos pendientes o con el lease expirado. Las filas bloqueadas por otros workers se saltan.
+    """
+    claimable = select(DocJob.job_id).where(
+        or_(
+            and_(DocJob.status == STATUS_PENDING, DocJob.available_at <= func.now()),
+            and_(DocJob.status == STATUS_RUNNING, DocJob.lease_expires_at < func.now(),
+                 DocJob.attempts < DocJob.max_attempts)
+        )
+    )
+    if job_types:
+        claimable = claimable.where(DocJob.job_type.in_(job_types))
+    claimable = claimable.order_by(DocJob.job_id).limit(batch_size).with_for_update(skip_locked=True)
+
+    return update(DocJob).where(DocJob.job_id.in_(claimable)).values(
+        status=STATUS_RUNNING,
+        lease_owner=worker_id,
+        lease_expires_at=func.now() + timedelta(seconds=lease_seconds),
+        attempts=DocJob.attempts + 1
+    ).returning(DocJob.job_id, DocJob.chunk_id, DocJob.job_type, DocJob.attempts, DocJob.max_attempts)
+
+
+def claim_jobs(session: Session, worker_id: str, job_types: List[str] = None, batch_size: int = 10,
+               lease_seconds: float = 300) -> List[ClaimedJob]:
+    stmt = build_claim_statement(worker_id, job_types, batch_size, lease_seconds)
+    rows = session.execute(stmt, execution_options={"synchronize_session": False}).all()
+    session.commit()
+    return [ClaimedJob(*row) for row in rows]
+
+
+def extend_leases(session: Session, job_ids: List[int], worker_id: str, lease_seconds: float = 300):
+    session.execute(
+        update(DocJob)
+        .where(DocJob.job_id.in_(job_ids), DocJob.lease_owner == worker_id, DocJob.status == STATUS_RUNNING)
+        .values(lease_expires_at=func.now() + timedelta(seconds=lease_seconds)),
+        execution_options={"synchronize_session": False}
+    )
+    session.commit()
+
+
+def complete_job(session: Session, job: ClaimedJob, worker_id: str, next_job_type: str = None) -> bool:
+    """
+    Marca el trabajo como completado y guarda los cambios del chunk en la misma transacción.
+    Devuelve False si el worker ya no tiene el lease del trabajo (otro worker lo ha reclamado).
+    """
+    result = session.execute(
+        update(DocJob)
+        .where(DocJob.job_id == job.job_id, DocJob.lease_owner == worker_id, DocJob.status == STATUS_RUNNING)
+        .values(status=STATUS_DONE, lease_expires_at=None, last_error=None),
+        execution_options={"synchronize_session": False}
+    )
+    if result.rowcount == 0:
+        print(f"El worker {worker_id} ha perdido el lease del trabajo {job.job_id}")
+        session.commit()
+        return False
+
+    if next_job_type is not None:
+        enqueue_chunk_jobs(session, next_job_type, [job.chunk_id], max_attempts=job.max_attempts, requeue=True,
+                           commit=False)
+    session.commit()
+    return True
+
+
+def fail_job(session: Session, job: ClaimedJob, worker_id: str, error: str, base_backoff: float = 5.0) -> str:
+    status, delay = compute_failure_transition(job.attempts, job.max_attempts, base_backoff)
+    session.execute(
+        update(DocJob)
+        .where(DocJob.job_id == job.job_id, DocJob.lease_owner == worker_id)
+        .values(
+            status=status,
+            lease_expires_at=None,
+            available_at=func.now() + timedelta(seconds=delay),
+            last_error=error[:2000]
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    session.commit()
+    return status
+
+
+def dead_letter_expired_jobs(session: Session) -> int:
+    """
+    Los trabajos cuyo lease ha expirado y ya han agotado sus intentos no se pueden reclamar: pasan a dead.
+    """
+    result = session.execute(
+        update(DocJob)
+        .where(DocJob.status == STATUS_RUNNING, DocJob.lease_expires_at < func.now(),
+               DocJob.attempts >= DocJob.max_attempts)
+        .values(status=STATUS_DEAD, last_error="lease expirado tras el último intento"),
+        execution_options={"synchronize_session": False}
+    )
+    session.commit()
+    return result.rowcount
+
+
+def retry_dead_jobs(session: Session, job_type: str = None) -> int:
+    stmt = update(DocJob).where(DocJob.status == STATUS_DEAD)
+    if job_type is not None:
+        stmt = stmt.where(DocJob.job_type == job_type)
+    result = session.execute(
+        stmt.values(status=STATUS_PENDING, attempts=0, available_at=func.now()),
+        execution_options={"synchronize_session": False}
+    )
+    session.commit()
+    return result.rowcount
+
+
+def has_unfinished_jobs(session: Session, job_types: List[str] = None) -> bool:
+    """
+    Indica si quedan trabajos pendientes o en ejecución. Aunque no se pueda reclamar ninguno, los trabajos en
+    ejecución pueden encolar nuevos trabajos de embedding o volver a pendiente si fallan.
+    """
+    stmt = select(DocJob.job_id).where(DocJob.status.in_([STATUS_PENDING, STATUS_RUNNING]))
+    if job_types:
+        stmt = stmt.where(DocJob.job_type.in_(job_types))
+    unfinished = session.execute(stmt.limit(1)).first() is not None
+    session.commit()
+    return unfinished
+
+
+def get_queue_stats(session: Session) -> dict:
+    rows = session.execute(
+        select(DocJob.job_type, DocJob.status, func.count()).group_by(DocJob.job_type, DocJob.status)
+    ).all()
+    stats = {}
+    for job_type, status, count in rows:
+        stats.setdefault(job_type, {})[status] = count
+    return stats
+
+
+class JobHandler(ABC):
+    @abstractmethod
+    async def handle(self, job: ClaimedJob) -> Optional[str]:
+        """
+        Procesa el trabajo y devuelve el tipo del siguiente trabajo a encolar para el chunk, o None.
+        Los cambios en base de datos se confirman al completar el trabajo.
+        """
+        pass
+
+
+class ChunkDocumentationJobHandler(JobHandler):
+    """
+    Documenta o indexa un único chunk reutilizando las etapas del pipeline de documentación.
+    """
+    def __init__(self, session: Session, repo_path: str, llm_prompter=None, prompt_builder: DocPromptBuilder = None,
+                 embedding_stage: EmbeddingIndexingStage = None):
+        self.session = session
+        self.preparation_stage = ContextPreparationStage()
+        self.documentation_stage = DocumentationGeneratorStage(
+            llm_prompter or create_llm_prompter(),
+            prompt_builder or DocPromptBuilder()
+        )
+        self.embedding_stage = embedding_stage or EmbeddingIndexingStage()
+        self.pipeline_context = PipelineContext(
+            repo_path=repo_path,
+            db_session=session,
+            files_to_ignore=[],
+            repo_tree_str="",
+            extra_docs_path=""
+        )
+        self.pipeline_context_prepared = False
+
+    async def handle(self, job: ClaimedJob) -> Optional[str]:
+        if not self.pipeline_context_prepared:
+            await self.preparation_stage.prepare_pipeline_context(self.pipeline_context)
+            self.pipeline_context_prepared = True
+
+        chunk = self.session.get(FileChunk, job.chunk_id)
+        if chunk is None:
+            raise ValueError(f"El chunk {job.chunk_id} no existe")
+
+        if job.job_type == JOB_TYPE_DOCUMENTATION:
+            file_context = self.preparation_stage.create_file_context(self.pipeline_context, chunk.file)
+            if file_context is None:
+                return None
+            chunk_context = self.preparation_stage.create_chunk_context(file_context, chunk)
+            file_context.chunks.append(chunk_context)
+            await self.documentation_stage.process(chunk_context)
+            return JOB_TYPE_EMBEDDING
+
+        chunk_context = ChunkContext(chunk=chunk, file_context=None, chunk_code="",
+                                     results={'documentation': chunk.docs})
+        await self.embedding_stage.process(chunk_context)
+        return None
+
+
+class DocQueueWorker:
+    """
+    Worker que vacía la cola de trabajos. Se pueden ejecutar tantos workers como se quiera, en el mismo o en
+    distintos equipos, mientras compartan la base de datos.
+    """
+    def __init__(self, session: Session, handler: JobHandler, worker_id: str = None, job_types: List[str] = None,
+                 batch_size: int = 4, lease_seconds: float = 300, poll_interval: float = 5.0,
+                 base_backoff: float = 5.0):
+        self.session = session
+        self.handler = handler
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.job_types = job_types
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.processed_jobs = 0
+        self.failed_jobs = 0
+
+    async def _handle_job(self, job: ClaimedJob):
+        try:
+            return await self.handler.handle(job), None
+        except Exception as e:
+            return None, e
+
+    async def run_once(self) -> int:
+        """
+        Reclama y procesa un lote de trabajos de forma concurrente. Devuelve el número de trabajos reclamados.
+        """
+        jobs = claim_jobs(self.session, self.worker_id, self.job_types, self.batch_size, self.lease_seconds)
+        if len(jobs) == 0:
+            return 0
+
+        results = await asyncio.gather(*[self._handle_job(job) for job in jobs])
+        for job, (next_job_type, error) in zip(jobs, results):
+            if error is None:
+                if complete_job(self.session, job, self.worker_id, next_job_type):
+                    self.processed_jobs += 1
+            else:
+                status = fail_job(self.session, job, self.worker_id, str(error), self.base_backoff)
+                self.failed_jobs += 1
+                print(f"Error en el trabajo {job.job_id} (chunk {job.chunk_id}), nuevo estado {status}: {error}")
+        return len(jobs)
+
+    async def run(self, stop_when_empty: bool = True):
+        while True:
+            claimed_jobs = await self.run_once()
+            if claimed_jobs == 0:
+                dead_letter_expired_jobs(self.session)
+                if stop_when_empty and not has_unfinished_jobs(self.session, self.job_types):
+                    break
+                await asyncio.sleep(self.poll_interval)
+
+        print(f"Worker {self.worker_id}: {self.processed_jobs} trabajos completados, {self.failed_jobs} fallidos")
+        return self.processed_jobs
+
+
+async def run_documentation_worker(repo_path: str, session: Session = None, stop_when_empty: bool = True):
+    session = session or DBConnection.get_session()
+    enqueue_chunk_jobs(session, JOB_TYPE_DOCUMENTATION)
+    enqueue_chunk_jobs(session, JOB_TYPE_EMBEDDING)
+
+    handler = ChunkDocumentationJobHandler(session=session, repo_path=repo_path)
+    worker = DocQueueWorker(session=session, handler=handler)
+    return await worker.run(stop_when_empty=stop_when_empty)
@@ -0,0 +1,390 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from config import files_to_ignore, DIRECTROY_TO_INDEX, INDEX_WATCHER_DEBOUNCE_SECONDS, \
+    INDEX_WATCHER_MAX_DELAY_SECONDS, INDEX_WATCHER_POLL_INTERVAL, INDEX_WATCHER_METRICS_PATH
+from src.chunker.incremental_chunker import update_changed_files, IncrementalUpdateResult
+from src.code_indexer.doc_work_queue import enqueue_chunk_jobs, JOB_TYPE_DOCUMENTATION
+from src.db.db_connection import DBConnection
+from src.utils.utils import write_file_atomically
+
+"""
+Proceso de larga duración que mantiene actualizado el índice del directorio de trabajo.
+
+Los cambios se detectan con inotify (mediante ctypes, sin dependencias) o, si no está disponible, comparando
+periódicamente la fecha de modificación y el tamaño de los ficheros. Las ráfagas de cambios (guardar varios ficheros,
+un checkout...) se agrupan: el índice se actualiza cuando pasan debounce_seconds sin cambios, o como mucho
+max_delay_seconds después del primer cambio. Cada actualización solo crea chunks para los ficheros modificados
+(ver incremental_chunker) y encola la documentación de los chunks nuevos y sus vecinos directos.
+
+Se expone el retraso del índice (segundos desde el cambio más antiguo que todavía no se ha indexado) junto a otras
+métricas, y opcionalmente se escriben en un fichero textfile de Prometheus.
+
+Uso:
+    python -m src.code_indexer.index_watcher
+"""
+
+# Constantes de inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+# wd, mask, cookie, longitud del nombre
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+INOTIFY_READ_BYTES = 64 * 1024
+
+
+def is_ignored_path(relative_path: str, ignored_entries: List[str]) -> bool:
+    return any(relative_path == ignored or relative_path.startswith(ignored + "/") for ignored in ignored_entries)
+
+
+def list_repo_files(repo_path: str, ignored_entries: List[str]) -> Dict[str, tuple]:
+    """
+    Devuelve ruta relativa -> (fecha de modificación en ns, tamaño) de los ficheros del repositorio no ignorados
+    """
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(repo_path):
+        relative_dir = os.path.relpath(dir_path, repo_path)
+        relative_dir = "" if relative_dir == "." else relative_dir
+        dir_names[:] = [name for name in dir_names
+                        if not is_ignored_path(os.path.join(relative_dir, name), ignored_entries)]
+        for file_name in file_names:
+            relative_path = os.path.join(relative_dir, file_name)
+            if is_ignored_path(relative_path, ignored_entries):
+                continue
+            try:
+                file_stat = os.stat(os.path.join(dir_path, file_name))
+            except FileNotFoundError:
+                continue
+            files[relative_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+    return files
+
+
+class PollingChangeSource:
+    """
+    Detecta los cambios comparando la fecha de modificación y el tamaño de los ficheros entre dos recorridos
+    """
+    def __init__(self, repo_path: str, ignored_entries: List[str] = None):
+        self.repo_path = repo_path
+        self.ignored_entries = ignored_entries or []
+        self.files = list_repo_files(self.repo_path, self.ignored_entries)
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        time.sleep(timeout)
+        files = list_repo_files(self.repo_path, self.ignored_entries)
+        changed_paths = {path for path, file_state in files.items() if self.files.get(path) != file_state}
+        changed_paths.update(path for path in self.files if path not in files)
+        self.files = files
+        return changed_paths
+
+    def close(self):
+        pass
+
+
+class InotifyChangeSource:
+    """
+    Detecta los cambios con inotify. Se añade un watch por directorio, también a los directorios creados después.
+    """
+    def __init__(self, repo_path: str, ignored_entries: List[str] = None):
+        self.repo_path = repo_path
+        self.ignored_entries = ignored_entries or []
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # watch descriptor -> ruta relativa del directorio
+        self.watch_dirs = {}
+        self.add_watch_recursive("")
+
+    def add_watch_recursive(self, relative_dir: str) -> Set[str]:
+        """
+        Añade los watches del directorio y sus subdirectorios. Devuelve los ficheros que ya contienen, que pueden
+        haberse creado antes de añadir el watch.
+        """
+        files = set()
+        for dir_path, dir_names, file_names in os.walk(os.path.join(self.repo_path, relative_dir)):
+            current_dir = os.path.relpath(dir_path, self.repo_path)
+            current_dir = "" if current_dir == "." else current_dir
+            dir_names[:] = [name for name in dir_names
+                            if not is_ignored_path(os.path.join(current_dir, name), self.ignored_entries)]
+            watch_descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), INOTIFY_WATCH_MASK)
+            if watch_descriptor >= 0:
+                self.watch_dirs[watch_descriptor] = current_dir
+            files.update(os.path.join(current_dir, file_name) for file_name in file_names)
+        return {path for path in files if not is_ignored_path(path, self.ignored_entries)}
+
+    def read_events(self) -> bytes:
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self.fd, INOTIFY_READ_BYTES)
+            except BlockingIOError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed_paths = set()
+        data = self.read_events()
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+            watch_descriptor, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT_HEADER.size:offset + INOTIFY_EVENT_HEADER.size + name_length]
+            offset += INOTIFY_EVENT_HEADER.size + name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # se han perdido eventos, se consideran modificados todos los ficheros
+                changed_paths.update(list_repo_files(self.repo_path, self.ignored_entries))
+                continue
+            if mask & IN_IGNORED:
+                self.watch_dirs.pop(watch_descriptor, None)
+                continue
+            relative_dir = self.watch_dirs.get(watch_descriptor)
+            if relative_dir is None:
+                continue
+            relative_path = os.path.join(relative_dir, os.fsdecode(name.rstrip(b"\0"))) if name_length else relative_dir
+            if is_ignored_path(relative_path, self.ignored_entries):
+                continue
+            changed_paths.add(relative_path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed_paths.update(self.add_watch_recursive(relative_path))
+        return changed_paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_inotify_available() -> bool:
+    library = ctypes.util.find_library("c")
+    return library is not None and hasattr(ctypes.CDLL(library), "inotify_init1")
+
+
+class ChangeDebouncer:
+    """
+    Agrupa los cambios hasta que pasan debounce_seconds sin cambios nuevos, o max_delay_seconds desde el primero
+    """
+    def __init__(self, debounce_seconds: float, max_delay_seconds: float):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.pending_paths = set()
+        self.first_change_at = None
+        self.last_change_at = None
+
+    def add(self, paths: Set[str], changed_at: float = None):
+        if not paths:
+            return
+        changed_at = time.monotonic() if changed_at is None else changed_at
+        self.pending_paths.update(paths)
+        self.first_change_at = changed_at if self.first_change_at is None else min(self.first_change_at, changed_at)
+        self.last_change_at = changed_at if self.last_change_at is None else max(self.last_change_at, changed_at)
+
+    def pop_ready(self, now: float = None) -> Optional[tuple]:
+        """
+        Si la ráfaga ha terminado devuelve sus rutas y el momento del primer cambio, y vacía los cambios pendientes
+        """
+        if not self.pending_paths:
+            return None
+        now = time.monotonic() if now is None else now
+        if now - self.last_change_at < self.debounce_seconds and now - self.first_change_at < self.max_delay_seconds:
+            return None
+        ready = (self.pending_paths, self.first_change_at)
+        self.pending_paths = set()
+        self.first_change_at = None
+        self.last_change_at = None
+        return ready
+
+
+@dataclass
+class IndexWatcherMetrics:
+    index_lag_seconds: float = 0.0
+    pending_changes: int = 0
+    updates: int = 0
+    failed_updates: int = 0
+    files_reindexed: int = 0
+    new_chunks: int = 0
+    deleted_chunks: int = 0
+    requeued_chunks: int = 0
+    last_update_seconds: float = 0.0
+    # timestamp unix de la última actualización completada
+    last_indexed_at: float = 0.0
+
+    def to_prometheus(self) -> str:
+        return "".join(f"code_index_watcher_{name} {value}\n" for name, value in asdict(self).items())
+
+
+def enqueue_documentation_jobs(session: Session, chunk_ids: List[int]):
+    enqueue_chunk_jobs(session, JOB_TYPE_DOCUMENTATION, chunk_ids, requeue=True)
+
+
+class IndexWatcher:
+    def __init__(self, session_maker: Callable[[], Session], repo_path: str, ignored_entries: List[str] = None,
+                 debounce_seconds: float = INDEX_WATCHER_DEBOUNCE_SECONDS,
+                 max_delay_seconds: float = INDEX_WATCHER_MAX_DELAY_SECONDS,
+                 poll_interval: float = INDEX_WATCHER_POLL_INTERVAL, use_inotify: bool = None,
+                 on_chunks_changed: Callable[[Session, List[int]], None] = enqueue_documentation_jobs,
+                 metrics_path: str = INDEX_WATCHER_METRICS_PATH, chunk_max_line_size: int = 100,
+                 chunk_minimum_proportion: float = 0.2):
+        """
+        on_chunks_changed recibe los chunks a volver a documentar tras cada actualización, por defecto se encolan en
+        la cola de documentación. Si use_inotify es None se usa inotify cuando está disponible.
+        """
+        self.session_maker = session_maker
+        self.repo_path = repo_path
+        self.ignored_entries = [ignored_entry.rstrip("/") for ignored_entry in ignored_entries or []]
+        self.poll_interval = poll_interval
+        self.use_inotify = is_inotify_available() if use_inotify is None else use_inotify
+        self.on_chunks_changed = on_chunks_changed
+        self.metrics_path = metrics_path
+        self.chunk_max_line_size = chunk_max_line_size
+        self.chunk_minimum_proportion = chunk_minimum_proportion
+
+        self.debouncer = ChangeDebouncer(debounce_seconds, max_delay_seconds)
+        self.metrics = IndexWatcherMetrics()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.change_source = None
+        # momento del primer cambio de la actualización en curso, para el retraso del índice
+        self.updating_since = None
+        # análisis de los ficheros sin cambios, la primera actualización analiza todo el repositorio
+        self.file_parses = {}
+
+    def create_change_source(self):
+        if self.use_inotify:
+            return InotifyChangeSource(self.repo_path, self.ignored_entries)
+        return PollingChangeSource(self.repo_path, self.ignored_entries)
+
+    def get_metrics(self) -> IndexWatcherMetrics:
+        with self.lock:
+            oldest_change_at = min(
+                [changed_at for changed_at in [self.debouncer.first_change_at, self.updating_since] if changed_at is not None],
+                default=None
+            )
+            self.metrics.index_lag_seconds = 0.0 if oldest_change_at is None else time.monotonic() - oldest_change_at
+            self.metrics.pending_changes = len(self.debouncer.pending_paths)
+            return IndexWatcherMetrics(**asdict(self.metrics))
+
+    def write_metrics(self):
+        if self.metrics_path is None:
+            return
+        write_file_atomically(self.metrics_path, self.get_metrics().to_prometheus())
+
+    def is_idle(self) -> bool:
+        with self.lock:
+            return not self.debouncer.pending_paths and self.updating_since is None
+
+    def update_index(self, changed_paths: Set[str], first_change_at: float):
+        with self.lock:
+            self.updating_since = first_change_at
+        start_time = time.monotonic()
+        session = self.session_maker()
+        try:
+            result: IncrementalUpdateResult = update_changed_files(
+                session,
+                self.repo_path,
+                changed_paths,
+                ignored_entries=self.ignored_entries,
+                chunk_max_line_size=self.chunk_max_line_size,
+                chunk_minimum_proportion=self.chunk_minimum_proportion,
+                file_parses=self.file_parses
+            )
+            if result.affected_chunk_ids and self.on_chunks_changed is not None:
+                self.on_chunks_changed(session, result.affected_chunk_ids)
+        except Exception as e:
+            session.rollback()
+            print(f"Error al actualizar el índice, se reintentará: {e}")
+            with self.lock:
+                self.metrics.failed_updates += 1
+                self.debouncer.add(changed_paths, first_change_at)
+                self.updating_since = None
+            return
+        finally:
+            session.close()
+
+        with self.lock:
+            self.updating_since = None
+            self.metrics.updates += 1
+            self.metrics.files_reindexed += len(changed_paths)
+            self.metrics.new_chunks += len(result.new_chunk_ids)
+            self.metrics.deleted_chunks += len(result.deleted_chunk_ids)
+            self.metrics.requeued_chunks += len(result.affected_chunk_ids)
+            self.metrics.last_update_seconds = time.monotonic() - start_time
+            self.metrics.last_indexed_at = time.time()
+        print(f"Índice actualizado: {len(changed_paths)} cambios, {len(result.new_chunk_ids)} chunks nuevos, "
+              f"{len(result.deleted_chunk_ids)} borrados, {len(result.affected_chunk_ids)} a documentar, "
+              f"retraso {time.monotonic() - first_change_at:.2f}s")
+
+    def run_once(self):
+        changed_paths = self.change_source.wait_for_changes(self.poll_interval)
+        with self.lock:
+            self.debouncer.add(changed_paths)
+            ready = self.debouncer.pop_ready()
+        if ready is not None:
+            self.update_index(*ready)
+        self.write_metrics()
+
+    def run(self):
+        self.change_source = self.change_source or self.create_change_source()
+        try:
+            while not self.stop_event.is_set():
+                self.run_once()
+        finally:
+            self.change_source.close()
+            self.change_source = None
+
+    def start(self):
+        """
+        Empieza a vigilar el repositorio en un hilo. Se asume que el índice está actualizado en este momento.
+        """
+        self.stop_event.clear()
+        self.change_source = self.create_change_source()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def main():
+    watcher = IndexWatcher(
+        session_maker=DBConnection.get_session,
+        repo_path=DIRECTROY_TO_INDEX,
+        ignored_entries=files_to_ignore,
+        chunk_max_line_size=200
+    )
+    print(f"Vigilando {DIRECTROY_TO_INDEX} con {'inotify' if watcher.use_inotify else 'sondeo'}")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        DBConnection.close_current_session()
+
+
+if __name__ == "__main__":
+    main()
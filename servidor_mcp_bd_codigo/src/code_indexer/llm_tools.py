@@ -1,10 +1,14 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 #from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_openai import OpenAIEmbeddings
-from config import LLM_TEMPERATURE
+from config import LLM_TEMPERATURE, LLM_ENDPOINTS
 from langchain_core.messages import BaseMessage
-from typing import List
+from typing import List, Optional
 from config import EMBEDDER_MODEL_INSTANCE
 
 
@@ -14,6 +18,7 @@ class AsyncLLMPrompter:
 
     def __init__(self, model: str = "gpt-4o-mini", llm_chat: BaseChatModel = None):
         self.model = model
+        self.llm_chat = llm_chat
         if llm_chat is None:
             self.llm_chat = ChatOpenAI(
                 model=model,
@@ -24,6 +29,199 @@ class AsyncLLMPrompter:
         response = await self.llm_chat.ainvoke(prompt_messages)
         return response
 
+
+@dataclass
+class LLMEndpoint:
+    """
+    Endpoint o despliegue de un proveedor LLM con su peso y su límite de peticiones concurrentes.
+    Además guarda las estadísticas que usa el router para repartir el tráfico.
+    """
+    name: str
+    llm_chat: BaseChatModel
+    weight: float = 1.0
+    max_concurrency: int = 8
+
+    in_flight: int = 0
+    total_requests: int = 0
+    total_errors: int = 0
+    consecutive_errors: int = 0
+    # Medias móviles exponenciales de la latencia (segundos) y de la tasa de errores
+    latency_ewma: Optional[float] = None
+    error_rate_ewma: float = 0.0
+    # Peso actual del algoritmo smooth weighted round-robin
+    current_weight: float = 0.0
+    cooldown_until: float = 0.0
+
+    def has_capacity(self, now: float) -> bool:
+        return self.in_flight < self.max_concurrency and now >= self.cooldown_until
+
+
+class LLMEndpointRouter:
+    """
+    Reparte las peticiones entre varios endpoints con weighted round-robin (smooth weighted round-robin de nginx).
+
+    El peso efectivo de cada endpoint se corrige con su tasa de errores y su latencia respecto al endpoint más rápido,
+    de forma que el tráfico se desplaza automáticamente hacia los endpoints sanos. Un endpoint que falla entra en
+    enfriamiento con espera exponencial y la petición se reintenta en otro endpoint.
+    """
+    def __init__(self, endpoints: List[LLMEndpoint], max_attempts: int = 3, ewma_alpha: float = 0.2,
+                 base_cooldown: float = 1.0, max_cooldown: float = 60.0, min_weight_factor: float = 0.05):
+        if len(endpoints) == 0:
+            raise ValueError("Se necesita al menos un endpoint")
+        self.endpoints = endpoints
+        self.max_attempts = max_attempts
+        self.ewma_alpha = ewma_alpha
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.min_weight_factor = min_weight_factor
+        self._capacity_condition = asyncio.Condition()
+
+    def effective_weight(self, endpoint: LLMEndpoint) -> float:
+        latencies = [e.latency_ewma for e in self.endpoints if e.latency_ewma is not None]
+        latency_factor = 1.0
+        if endpoint.latency_ewma is not None and endpoint.latency_ewma > 0:
+            latency_factor = min(latencies) / endpoint.latency_ewma
+        health_factor = max(self.min_weight_factor, (1.0 - endpoint.error_rate_ewma) * latency_factor)
+        return endpoint.weight * health_factor
+
+    def select_endpoint(self, excluded: List[LLMEndpoint] = None) -> Optional[LLMEndpoint]:
+        """
+        Selecciona un endpoint con capacidad libre. Devuelve None si todos están ocupados o en enfriamiento.
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.has_capacity(now) and e not in (excluded or [])]
+        # Si solo quedan endpoints ya probados se permite repetir con ellos
+        if len(candidates) == 0 and excluded:
+            candidates = [e for e in self.endpoints if e.has_capacity(now)]
+        if len(candidates) == 0:
+            return None
+
+        total_weight = 0.0
+        selected = None
+        for endpoint in candidates:
+            weight = self.effective_weight(endpoint)
+            endpoint.current_weight += weight
+            total_weight += weight
+            if selected is None or endpoint.current_weight > selected.current_weight:
+                selected = endpoint
+        selected.current_weight -= total_weight
+        return selected
+
+    def _next_cooldown_wait(self) -> float:
+        now = time.monotonic()
+        waits = [e.cooldown_until - now for e in self.endpoints if e.cooldown_until > now]
+        return max(0.01, min(waits)) if waits else 1.0
+
+    async def acquire_endpoint(self, excluded: List[LLMEndpoint] = None) -> LLMEndpoint:
+        async with self._capacity_condition:
+            while True:
+                endpoint = self.select_endpoint(excluded)
+                if endpoint is not None:
+                    endpoint.in_flight += 1
+                    return endpoint
+                try:
+                    await asyncio.wait_for(self._capacity_condition.wait(), timeout=self._next_cooldown_wait())
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release_endpoint(self, endpoint: LLMEndpoint):
+        async with self._capacity_condition:
+            endpoint.in_flight -= 1
+            self._capacity_condition.notify_all()
+
+    def record_success(self, endpoint: LLMEndpoint, latency: float):
+        endpoint.total_requests += 1
+        endpoint.consecutive_errors = 0
+        if endpoint.latency_ewma is None:
+            endpoint.latency_ewma = latency
+        else:
+            endpoint.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.latency_ewma
+        endpoint.error_rate_ewma = (1 - self.ewma_alpha) * endpoint.error_rate_ewma
+
+    def record_error(self, endpoint: LLMEndpoint):
+        endpoint.total_requests += 1
+        endpoint.total_errors += 1
+        endpoint.consecutive_errors += 1
+        endpoint.error_rate_ewma = self.ewma_alpha + (1 - self.ewma_alpha) * endpoint.error_rate_ewma
+        cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (endpoint.consecutive_errors - 1))
+        endpoint.cooldown_until = time.monotonic() + cooldown
+
+    async def ainvoke(self, prompt_messages: List[BaseMessage]):
+        tried_endpoints = []
+        last_error = None
+        for _ in range(self.max_attempts):
+            endpoint = await self.acquire_endpoint(excluded=tried_endpoints)
+            tried_endpoints.append(endpoint)
+            start_time = time.monotonic()
+            try:
+                response = await endpoint.llm_chat.ainvoke(prompt_messages)
+                self.record_success(endpoint, time.monotonic() - start_time)
+                return response
+            except Exception as e:
+                self.record_error(endpoint)
+                last_error = e
+                print(f"Error en el endpoint {endpoint.name}, reintentando en otro endpoint: {e}")
+            finally:
+                await self.release_endpoint(endpoint)
+        raise last_error
+
+    def get_endpoint_stats(self) -> dict:
+        return {
+            endpoint.name: {
+                "requests": endpoint.total_requests,
+                "errors": endpoint.total_errors,
+                "in_flight": endpoint.in_flight,
+                "latency_ewma": endpoint.latency_ewma,
+                "error_rate_ewma": endpoint.error_rate_ewma,
+                "effective_weight": self.effective_weight(endpoint)
+            }
+            for endpoint in self.endpoints
+        }
+
+
+class LoadBalancedLLMPrompter(AsyncLLMPrompter):
+    """
+    Prompter que reparte las peticiones de documentación entre varios endpoints.
+    """
+    router: LLMEndpointRouter
+
+    def __init__(self, endpoints: List[LLMEndpoint], max_attempts: int = 3):
+        self.router = LLMEndpointRouter(endpoints, max_attempts=max_attempts)
+        self.model = getattr(endpoints[0].llm_chat, "model_name", endpoints[0].name)
+        self.llm_chat = None
+
+    async def async_execute_prompt(self, prompt_messages: List[BaseMessage]):
+        return await self.router.ainvoke(prompt_messages)
+
+
+def create_llm_prompter(endpoints_config: List[dict] = None) -> AsyncLLMPrompter:
+    """
+    Crea el prompter de documentación. Si hay varios endpoints configurados en LLM_ENDPOINTS se reparte la carga
+    entre ellos. Cada endpoint se configura con las claves model, base_url, api_key, weight y max_concurrency.
+    """
+    if endpoints_config is None:
+        endpoints_config = LLM_ENDPOINTS
+    if len(endpoints_config) == 0:
+        return AsyncLLMPrompter()
+
+    endpoints = []
+    for i, endpoint_config in enumerate(endpoints_config):
+        llm_chat = ChatOpenAI(
+            model=endpoint_config.get("model", "gpt-4o-mini"),
+            base_url=endpoint_config.get("base_url"),
+            api_key=endpoint_config.get("api_key"),
+            temperature=LLM_TEMPERATURE,
+            max_retries=0
+        )
+        endpoints.append(LLMEndpoint(
+            name=endpoint_config.get("name", f"endpoint_{i}"),
+            llm_chat=llm_chat,
+            weight=endpoint_config.get("weight", 1.0),
+            max_concurrency=endpoint_config.get("max_concurrency", 8)
+        ))
+    return LoadBalancedLLMPrompter(endpoints)
+
+
 class AsyncEmbedder:
     model: str
     embedder_instance: OpenAIEmbeddings
@@ -10,16 +10,21 @@ from sqlalchemy.orm import Session
 
 import os
 
-from src.utils.utils import get_file_text, get_start_to_end_lines_from_text_code
-from src.db.db_utils import get_chunk_code
+from src.utils.utils import get_start_to_end_lines_from_text_code
+from src.db.db_utils import get_chunk_code, get_fs_entry_text
 
 from src.db.db_connection import DBConnection
 from src.utils.proyect_tree import generate_repo_tree_str
-from src.code_indexer.llm_tools import AsyncLLMPrompter, AsyncEmbedder
+from src.code_indexer.llm_tools import AsyncLLMPrompter, AsyncEmbedder, create_llm_prompter
 from src.code_indexer.prompt_builder import DocPromptBuilder
 from src.code_indexer.extra_docs_generator import generate_extra_docs, get_extra_docs_if_exists
 
-from src.db.models import FileChunk, FSEntry
+from src.code_indexer.batch_jobs import BatchJobClient, BatchRunner, OpenAIBatchJobClient, build_chat_batch_request, \
+    build_embedding_batch_request, CHAT_COMPLETIONS_ENDPOINT, EMBEDDINGS_ENDPOINT
+from langchain_core.messages import BaseMessage
+from config import LLM_TEMPERATURE, EMBEDDER_MODEL, BATCH_WORK_DIR, BATCH_POLL_INTERVAL
+
+from src.db.models import FileChunk, FSEntry, EMBEDDING_DIMENSION
 
 """
 Patrón Pipeline de forma asíncrona con sistema integrado de logging.
@@ -31,17 +36,25 @@ Se han definido 3 stages:
 - ContextPreparationStage: Prepara el contexto del pipeline, ficheros y chunks.
 - DocumentationGeneratorStage: Genera la documentación para cada chunk.
 - EmbeddingIndexingStage: Genera el índice de embeddings para cada chunk.
+
+En modo batch las dos últimas se sustituyen por BatchDocumentationStage y BatchEmbeddingIndexingStage, que procesan
+todos los chunks en trabajos batch.
 """
 
 # Definición de tipos para el pipeline
 T = TypeVar('T')
 U = TypeVar('U')
 
+# Bytes que ocupa un embedding en pgvector (float4 por dimensión)
+EMBEDDING_STORAGE_BYTES = EMBEDDING_DIMENSION * 4
+
 @dataclass
 class StageProgress:
     """Clase para seguimiento de progreso de una etapa específica"""
     total_processed: int = 0
     total_time: float = 0.0
+    # Latencia de cada ejecución de la etapa, se usa para las estadísticas del benchmark
+    latencies: List[float] = field(default_factory=list)
 
 @dataclass
 class PipelineContext:
@@ -69,6 +82,7 @@ class PipelineContext:
         # Actualizar estadísticas
         progress.total_processed += 1
         progress.total_time = elapsed
+        progress.latencies.append(elapsed)
 
         # Decidir si mostrar un log basado en la frecuencia configurada
         if progress.total_processed % self.log_frequency == 0:
@@ -104,6 +118,27 @@ class PipelineContext:
                           f"tiempo: {progress.total_time:.1f}s")
         print("===========================\n")
 
+    def log_duplicate_savings(self):
+        """
+        Los chunks duplicados no se documentan ni se indexan, se estima lo ahorrado con el tamaño medio de la
+        documentación generada.
+        """
+        duplicate_chunks = self.stats.get('duplicate_chunks', 0)
+        docs_sizes = [
+            len(chunk_context.chunk.docs.encode("utf-8"))
+            for file_context in self.files
+            for chunk_context in file_context.chunks
+            if chunk_context.chunk.docs
+        ]
+        average_docs_size = sum(docs_sizes) / len(docs_sizes) if docs_sizes else 0
+
+        self.stats['llm_calls_saved'] = duplicate_chunks
+        self.stats['embeddings_saved'] = duplicate_chunks
+        self.stats['storage_saved_bytes'] = int(duplicate_chunks * (average_docs_size + EMBEDDING_STORAGE_BYTES))
+        print(f"Chunks duplicados omitidos: {duplicate_chunks}, llamadas al LLM ahorradas: {self.stats['llm_calls_saved']}, "
+              f"embeddings ahorrados: {self.stats['embeddings_saved']}, "
+              f"almacenamiento ahorrado: {self.stats['storage_saved_bytes'] / 1024:.1f} KB")
+
 
 @dataclass
 class FileContext:
@@ -148,7 +183,8 @@ class ChunkContext:
 
     @property
     def is_only_chunk_in_file(self) -> bool:
-        return len(self.file_context.chunks) == 1
+        # Se consultan los chunks del fichero en base de datos porque un worker de la cola puede preparar un único chunk
+        return len(self.file_context.file.chunks) == 1
 
     @property
     def pipeline_context(self) -> PipelineContext:
@@ -219,7 +255,9 @@ class Pipeline:
 
         # Etapas a nivel de pipeline
         for stage in self.pipeline_stages:
+            stage_start = time.time()
             context = await stage.process(context)
+            context.log_stage_completion(stage.name, "pipeline", elapsed=time.time() - stage_start)
 
         # Etapas a nivel de fichero
         for file_context in context.files:
@@ -268,37 +306,59 @@ class Pipeline:
 class ContextPreparationStage(PipelinePipelineStage):
     """Etapa que prepara los contextos para todos los ficheros y chunks"""
 
-    def prepare_chunk_context(self, context: FileContext):
-        for chunk in context.file.chunks:
-            chunk_code = get_start_to_end_lines_from_text_code(
-                context.file_code, chunk.start_line, chunk.end_line
-            )
+    def create_chunk_context(self, context: FileContext, chunk: FileChunk) -> ChunkContext:
+        chunk_code = get_start_to_end_lines_from_text_code(
+            context.file_code, chunk.start_line, chunk.end_line
+        )
 
-            # Obtener chunks referenciados
-            referenced_chunks = []
-            for ref_chunk in chunk.referenced_chunks:
-                ref_chunk_path = ref_chunk.file.path
-                ref_chunk_code = get_chunk_code(context.pipeline_context.db_session, ref_chunk, context.repo_path)
-                referenced_chunks.append((ref_chunk_path, ref_chunk_code))
-
-            # Obtener chunks que referencian a este
-            referencing_chunks = []
-            for ref_chunk in chunk.referencing_chunks:
-                ref_chunk_path = ref_chunk.file.path
-                ref_chunk_code = get_chunk_code(context.pipeline_context.db_session, ref_chunk, context.repo_path)
-                referencing_chunks.append((ref_chunk_path, ref_chunk_code))
-
-            # Crear contexto de chunk con referencia a su fichero padre
-            chunk_context = ChunkContext(
-                chunk=chunk,
-                file_context=context,
-                chunk_code=chunk_code,
-                referenced_chunks_path_and_code=referenced_chunks,
-                referencing_chunks_path_and_code=referencing_chunks
-            )
+        # Obtener chunks referenciados
+        referenced_chunks = []
+        for ref_chunk in chunk.referenced_chunks:
+            ref_chunk_path = ref_chunk.file.path
+            ref_chunk_code = get_chunk_code(context.pipeline_context.db_session, ref_chunk, context.repo_path)
+            referenced_chunks.append((ref_chunk_path, ref_chunk_code))
+
+        # Obtener chunks que referencian a este
+        referencing_chunks = []
+        for ref_chunk in chunk.referencing_chunks:
+            ref_chunk_path = ref_chunk.file.path
+            ref_chunk_code = get_chunk_code(context.pipeline_context.db_session, ref_chunk, context.repo_path)
+            referencing_chunks.append((ref_chunk_path, ref_chunk_code))
+
+        # Crear contexto de chunk con referencia a su fichero padre
+        return ChunkContext(
+            chunk=chunk,
+            file_context=context,
+            chunk_code=chunk_code,
+            referenced_chunks_path_and_code=referenced_chunks,
+            referencing_chunks_path_and_code=referencing_chunks
+        )
 
+    def prepare_chunk_context(self, context: FileContext):
+        for chunk in context.file.chunks:
+            # Los duplicados comparten la documentación y el embedding del chunk canónico
+            if chunk.duplicate_of_id is not None:
+                stats = context.pipeline_context.stats
+                stats['duplicate_chunks'] = stats.get('duplicate_chunks', 0) + 1
+                continue
             # Añadir el chunk al fichero
-            context.chunks.append(chunk_context)
+            context.chunks.append(self.create_chunk_context(context, chunk))
+
+    def create_file_context(self, context: PipelineContext, file: FSEntry) -> Optional[FileContext]:
+        """
+        Crea el contexto del fichero sin sus chunks. Devuelve None si el fichero está vacío.
+        """
+        file_code = get_fs_entry_text(file, context.repo_path)
+        if file_code == "":
+            return None
+        file_extra_docs = get_extra_docs_if_exists(file.path, context.extra_docs_path)
+
+        return FileContext(
+            file=file,
+            pipeline_context=context,
+            file_code=file_code,
+            file_extra_docs=file_extra_docs
+        )
 
     def prepare_file_and_chunk_context(self, context: PipelineContext):
 
@@ -308,23 +368,16 @@ class ContextPreparationStage(PipelinePipelineStage):
         )
 
         for file in files_query.all():
+            # ficheros sin chunks propios: solo metadatos o blobs ya chunkeados en otra ref
+            if not file.chunks:
+                continue
 
-            file_path = file.path
-            file_absolute_path = os.path.join(context.repo_path, file_path)
+            file_absolute_path = os.path.join(context.repo_path, file.path)
 
             try:
-
-                file_code = get_file_text(file_absolute_path)
-                if file_code == "":
+                file_context = self.create_file_context(context, file)
+                if file_context is None:
                     continue
-                file_extra_docs = get_extra_docs_if_exists(file_path, context.extra_docs_path)
-
-                file_context = FileContext(
-                    file=file,
-                    pipeline_context=context,
-                    file_code=file_code,
-                    file_extra_docs=file_extra_docs
-                )
 
                 self.prepare_chunk_context(file_context)
                 context.files.append(file_context)
@@ -367,6 +420,25 @@ class ContextPreparationStage(PipelinePipelineStage):
 
         return context
 
+def build_chunk_documentation_prompt(prompt_builder: DocPromptBuilder, chunk_context: ChunkContext) -> List[BaseMessage]:
+    """Construye el prompt de documentación de un chunk"""
+    prompt_builder.restart_prompt()
+
+    # Ahora usamos las propiedades para acceder a la información sin duplicidad
+    prompt_builder.add_prompt_chunk_code(chunk_context.chunk_code, chunk_context.file_path)
+    prompt_builder.add_prompt_file_code(
+        chunk_context.file_code,
+        chunk_context.is_only_chunk_in_file,
+        chunk_context.chunk.start_line,
+        chunk_context.chunk.end_line
+    )
+    prompt_builder.add_prompt_extra_docs(chunk_context.file_extra_docs)
+    prompt_builder.add_prompt_repo_map(chunk_context.pipeline_context.repo_tree_str)
+    prompt_builder.add_prompt_referenced_chunks(chunk_context.referenced_chunks_path_and_code)
+    prompt_builder.add_prompt_referencing_chunks(chunk_context.referencing_chunks_path_and_code)
+
+    return prompt_builder.build_prompt()
+
 class DocumentationGeneratorStage(ChunkPipelineStage):
     """Etapa que genera documentación para un chunk"""
 
@@ -375,23 +447,7 @@ class DocumentationGeneratorStage(ChunkPipelineStage):
         self.prompt_builder = prompt_builder
 
     async def process(self, chunk_context: ChunkContext) -> ChunkContext:
-        # Crear el prompt para la documentación
-        self.prompt_builder.restart_prompt()
-
-        # Ahora usamos las propiedades para acceder a la información sin duplicidad
-        self.prompt_builder.add_prompt_chunk_code(chunk_context.chunk_code, chunk_context.file_path)
-        self.prompt_builder.add_prompt_file_code(
-            chunk_context.file_code,
-            chunk_context.is_only_chunk_in_file,
-            chunk_context.chunk.start_line,
-            chunk_context.chunk.end_line
-        )
-        self.prompt_builder.add_prompt_extra_docs(chunk_context.file_extra_docs)
-        self.prompt_builder.add_prompt_repo_map(chunk_context.pipeline_context.repo_tree_str)
-        self.prompt_builder.add_prompt_referenced_chunks(chunk_context.referenced_chunks_path_and_code)
-        self.prompt_builder.add_prompt_referencing_chunks(chunk_context.referencing_chunks_path_and_code)
-
-        chunk_doc_prompt = self.prompt_builder.build_prompt()
+        chunk_doc_prompt = build_chunk_documentation_prompt(self.prompt_builder, chunk_context)
         chunk_doc_response = await self.llm_prompter.async_execute_prompt(chunk_doc_prompt)
         chunk_doc = chunk_doc_response.content
 
@@ -405,8 +461,8 @@ class EmbeddingIndexingStage(ChunkPipelineStage):
     """Etapa que genera un índice de embeddings para los chunks desde la documentación generada"""
     llm_embedder: AsyncEmbedder
 
-    def __init__(self):
-        self.llm_embedder = AsyncEmbedder()
+    def __init__(self, llm_embedder: AsyncEmbedder = None):
+        self.llm_embedder = llm_embedder or AsyncEmbedder()
 
     async def process(self, context: ChunkContext) -> ChunkContext:
         doc_to_index = context.results.get('documentation', None)
@@ -419,12 +475,90 @@ class EmbeddingIndexingStage(ChunkPipelineStage):
         return context
 
 
-async def run_documentation_pipeline(repo_path, files_to_ignore=None, log_frequency=10):
+class BatchDocumentationStage(PipelinePipelineStage):
+    """
+    Etapa que genera la documentación de todos los chunks en un único trabajo batch.
+    Sustituye a DocumentationGeneratorStage cuando el pipeline se ejecuta en modo batch.
+    """
+
+    def __init__(self, batch_runner: BatchRunner, prompt_builder: DocPromptBuilder, model: str = "gpt-4o-mini",
+                 temperature: float = LLM_TEMPERATURE):
+        self.batch_runner = batch_runner
+        self.prompt_builder = prompt_builder
+        self.model = model
+        self.temperature = temperature
+
+    async def process(self, context: PipelineContext) -> PipelineContext:
+        chunk_contexts = {}
+        requests = []
+        for file_context in context.files:
+            for chunk_context in file_context.chunks:
+                custom_id = f"doc-{chunk_context.chunk.chunk_id}"
+                chunk_contexts[custom_id] = chunk_context
+                chunk_doc_prompt = build_chunk_documentation_prompt(self.prompt_builder, chunk_context)
+                requests.append(build_chat_batch_request(custom_id, self.model, chunk_doc_prompt, self.temperature))
+
+        if len(requests) == 0:
+            return context
+
+        stage_start = time.time()
+        results = await self.batch_runner.run("documentation", CHAT_COMPLETIONS_ENDPOINT, requests)
+        elapsed = time.time() - stage_start
+
+        for custom_id, chunk_doc in results.items():
+            chunk_context = chunk_contexts[custom_id]
+            chunk_context.chunk.docs = chunk_doc
+            chunk_context.results['documentation'] = chunk_doc
+            context.log_stage_completion(self.name, "batch", chunk_context.chunk_id, elapsed)
+
+        return context
+
+class BatchEmbeddingIndexingStage(PipelinePipelineStage):
+    """Etapa que genera los embeddings de la documentación de todos los chunks en un único trabajo batch"""
+
+    def __init__(self, batch_runner: BatchRunner, model: str = EMBEDDER_MODEL):
+        self.batch_runner = batch_runner
+        self.model = model
+
+    async def process(self, context: PipelineContext) -> PipelineContext:
+        chunk_contexts = {}
+        requests = []
+        for file_context in context.files:
+            for chunk_context in file_context.chunks:
+                doc_to_index = chunk_context.results.get('documentation', None)
+                if doc_to_index:
+                    custom_id = f"embedding-{chunk_context.chunk.chunk_id}"
+                    chunk_contexts[custom_id] = chunk_context
+                    requests.append(build_embedding_batch_request(custom_id, self.model, doc_to_index))
+
+        if len(requests) == 0:
+            return context
+
+        stage_start = time.time()
+        results = await self.batch_runner.run("embedding", EMBEDDINGS_ENDPOINT, requests)
+        elapsed = time.time() - stage_start
+
+        for custom_id, embedding_index in results.items():
+            chunk_context = chunk_contexts[custom_id]
+            chunk_context.chunk.embedding = embedding_index
+            chunk_context.results['embedding_index'] = embedding_index
+            context.log_stage_completion(self.name, "batch", chunk_context.chunk_id, elapsed)
+
+        return context
+
+
+async def run_documentation_pipeline(repo_path, files_to_ignore=None, log_frequency=10, batch_mode=False,
+                                     batch_client: BatchJobClient = None, db_session: Session = None,
+                                     llm_prompter: AsyncLLMPrompter = None, llm_embedder: AsyncEmbedder = None):
+    """
+    En modo batch la documentación y los embeddings se generan mediante trabajos batch en lugar de peticiones
+    individuales por chunk.
+    """
 
     if files_to_ignore is None:
         files_to_ignore = []
 
-    db_session = DBConnection.get_session()
+    db_session = db_session or DBConnection.get_session()
 
     context = PipelineContext(
         repo_path=repo_path,
@@ -435,23 +569,33 @@ async def run_documentation_pipeline(repo_path, files_to_ignore=None, log_freque
         log_frequency=log_frequency
     )
 
-    llm_prompter = AsyncLLMPrompter()
+    llm_prompter = llm_prompter or create_llm_prompter()
     prompt_builder = DocPromptBuilder()
 
     pipeline = Pipeline(log_frequency=log_frequency)
 
     # Añadir etapas
     pipeline.add_pipeline_stage(ContextPreparationStage())
-    pipeline.add_chunk_stage(DocumentationGeneratorStage(llm_prompter, prompt_builder))
-    pipeline.add_chunk_stage(EmbeddingIndexingStage())
+    if batch_mode:
+        batch_runner = BatchRunner(
+            batch_client=batch_client or OpenAIBatchJobClient(),
+            work_dir=BATCH_WORK_DIR,
+            poll_interval=BATCH_POLL_INTERVAL
+        )
+        pipeline.add_pipeline_stage(BatchDocumentationStage(batch_runner, prompt_builder, model=llm_prompter.model))
+        pipeline.add_pipeline_stage(BatchEmbeddingIndexingStage(batch_runner))
+    else:
+        pipeline.add_chunk_stage(DocumentationGeneratorStage(llm_prompter, prompt_builder))
+        pipeline.add_chunk_stage(EmbeddingIndexingStage(llm_embedder))
 
     result_context = await pipeline.execute(context)
 
     db_session.commit()
 
+    result_context.log_duplicate_savings()
     print(f"Pipeline completado. Documentados {result_context.stats['total_files']} ficheros y {result_context.stats['total_chunks']} chunks.")
 
     return result_context
 
-def run_documentation_pipeline_sync(repo_path, files_to_ignore=None, log_frequency=2):
-    return asyncio.run(run_documentation_pipeline(repo_path, files_to_ignore, log_frequency))
\ No newline at end of file
+def run_documentation_pipeline_sync(repo_path, files_to_ignore=None, log_frequency=2, batch_mode=False):
+    return asyncio.run(run_documentation_pipeline(repo_path, files_to_ignore, log_frequency, batch_mode=batch_mode))
\ No newline at end of file
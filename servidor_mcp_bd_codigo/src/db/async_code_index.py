@@ -0,0 +1,238 @@
+import asyncio
+from typing import List, Dict
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from config import REPO_ROOT_ABSOLUTE_PATH, MAX_CHUNKS, MAX_REFERENCED_CHUNKS, MAX_REFERENCING_CHUNKS, \
+    EMBEDDER_MODEL_INSTANCE, SEARCH_MODE, MULTI_QUERY_MAX_QUERIES, SYMBOL_SEARCH_MAX_RESULTS, REPOSITORY_TREE_TOKEN_BUDGET
+from src.db.chunk_retrieval import get_chunks_with_neighbours, build_chunks_response, build_grouped_chunks_response
+from src.db.db_utils import get_search_directory, get_file_fs_entry, get_file_chunks_query, get_all_file_paths
+from src.db import hybrid_search, multi_query_search
+from src.db.file_listing import list_files
+from src.db.fs_entry_path_cache import FSEntryPathCache
+from src.db.hybrid_search import SEARCH_MODE_LEXICAL
+from src.db.query_embedding_cache import CachedQueryEmbedder
+from src.db.repository_tree import RepositoryTreeCache
+from src.db.search_planner import DirectorySearchPlanner
+from src.db.symbol_search import find_definitions, find_references, build_symbols_response
+from src.db.vector_index import VectorSearchParameters
+
+"""
+Acceso asíncrono al índice de código para las herramientas de los servidores MCP.
+
+Las herramientas de FastMCP son corrutinas: con la sesión síncrona cada consulta bloquea el event loop y las llamadas
+simultáneas de los agentes se atienden de una en una. Aquí cada llamada abre su propia AsyncSession (asyncpg) del pool
+y las consultas se esperan sin bloquear el loop.
+
+Las consultas son las mismas que las de la versión síncrona: se ejecutan con AsyncSession.run_sync, que pasa a la
+función una Session síncrona sobre la conexión asíncrona, de modo que el planificador de búsquedas y la recuperación de
+chunks no se duplican. Las funciones que se ejecutan así devuelven ids y valores, no objetos de la sesión. La lectura
+del código de los chunks (ficheros y blobs de git) se hace en un hilo.
+"""
+
+
+def search_chunk_ids(session: Session, planner: DirectorySearchPlanner, query: str, query_embedding,
+                     directory_path: str, max_results: int, ref: str, search_parameters: VectorSearchParameters,
+                     search_mode: str = SEARCH_MODE, path_cache: FSEntryPathCache = None) -> tuple:
+    """
+    Devuelve los ids de los chunks encontrados y la descripción de las búsquedas ejecutadas
+    """
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    chunk_ids, search_description = hybrid_search.search_chunk_ids(
+        session, planner, query, query_embedding, fs_entry, max_results, search_parameters, search_mode
+    )
+    return chunk_ids, f"{fs_entry.path or '/'}: {search_description}"
+
+
+def search_identifier_chunk_ids(session: Session, query: str, directory_path: str, max_results: int, ref: str,
+                                search_mode: str = SEARCH_MODE, path_cache: FSEntryPathCache = None) -> List[int]:
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    return hybrid_search.search_identifier_chunk_ids(session, query, fs_entry, max_results, search_mode)
+
+
+def search_multi_query_identifier_ids(session: Session, queries: List[str], directory_path: str, max_results: int,
+                                      ref: str, search_mode: str = SEARCH_MODE,
+                                      path_cache: FSEntryPathCache = None) -> Dict[int, List[int]]:
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    return multi_query_search.search_multi_query_identifier_chunk_ids(session, queries, fs_entry, max_results,
+                                                                      search_mode)
+
+
+def search_multi_query_ids(session: Session, planner: DirectorySearchPlanner, queries: Dict[int, str],
+                           query_embeddings: Dict[int, list], directory_path: str, max_results: int, ref: str,
+                           search_parameters: VectorSearchParameters, search_mode: str = SEARCH_MODE,
+                           path_cache: FSEntryPathCache = None) -> tuple:
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    query_chunk_ids, search_description = multi_query_search.search_multi_query_chunk_ids(
+        session, planner, queries, query_embeddings, fs_entry, max_results, search_parameters, search_mode
+    )
+    return query_chunk_ids, f"{fs_entry.path or '/'}: {search_description}"
+
+
+def get_file_chunk_ids(session: Session, file_path: str, ref: str = None,
+                       path_cache: FSEntryPathCache = None) -> List[int]:
+    fs_entry = get_file_fs_entry(session, file_path, ref, path_cache)
+    return [chunk.chunk_id for chunk in session.execute(get_file_chunks_query(fs_entry)).scalars()]
+
+
+class AsyncCodeIndex:
+    def __init__(self, session_maker: async_sessionmaker = None,
+                 embedder_instance: Embeddings = EMBEDDER_MODEL_INSTANCE, search_parameters: VectorSearchParameters = None,
+                 search_planner: DirectorySearchPlanner = None,
+                 repo_path: str = REPO_ROOT_ABSOLUTE_PATH, max_chunks: int = MAX_CHUNKS,
+                 max_referenced: int = MAX_REFERENCED_CHUNKS, max_referencing: int = MAX_REFERENCING_CHUNKS,
+                 log_search_plans: bool = True, search_mode: str = SEARCH_MODE,
+                 max_queries: int = MULTI_QUERY_MAX_QUERIES, path_cache: FSEntryPathCache = None):
+        if session_maker is None:
+            from src.db.db_connection import AsyncDBConnection
+            session_maker = AsyncDBConnection.get_session_maker()
+        self.session_maker = session_maker
+        if embedder_instance is not None and not isinstance(embedder_instance, CachedQueryEmbedder):
+            # La caché compartida está en la base de datos del índice
+            embedder_instance = CachedQueryEmbedder(embedder_instance, async_session_maker=session_maker)
+        self.embedder_instance = embedder_instance
+        self.search_parameters = search_parameters or VectorSearchParameters()
+        self.search_planner = search_planner or DirectorySearchPlanner()
+        self.repo_path = repo_path
+        self.max_chunks = max_chunks
+        self.max_referenced = max_referenced
+        self.max_referencing = max_referencing
+        self.log_search_plans = log_search_plans
+        self.search_mode = search_mode
+        self.max_queries = max_queries
+        # Las rutas de los directorios y ficheros se resuelven en memoria, la caché se recarga al cambiar el índice
+        self.path_cache = path_cache or FSEntryPathCache()
+        self.tree_cache = RepositoryTreeCache()
+
+    async def search_similar_chunk_ids(self, query: str, directory_path: str = None, max_results: int = 10,
+                                       ref: str = None) -> List[int]:
+        async with self.session_maker() as session:
+            chunk_ids = await session.run_sync(
+                search_identifier_chunk_ids, query, directory_path, max_results, ref, self.search_mode, self.path_cache
+            )
+        if chunk_ids:
+            if self.log_search_plans:
+                print(f"Búsqueda de identificadores: {query}")
+            return chunk_ids
+
+        query_embedding = None
+        if self.search_mode != SEARCH_MODE_LEXICAL:
+            query_embedding = await self.embedder_instance.aembed_query(query)
+        async with self.session_maker() as session:
+            # Los SET LOCAL de los parámetros de búsqueda duran hasta el final de esta transacción
+            async with session.begin():
+                chunk_ids, plans_description = await session.run_sync(
+                    search_chunk_ids, self.search_planner, query, query_embedding, directory_path, max_results, ref,
+                    self.search_parameters, self.search_mode, self.path_cache
+                )
+        if self.log_search_plans:
+            print(f"Plan de búsqueda en {plans_description}")
+        return chunk_ids
+
+    async def search_multi_query_chunk_ids(self, queries: List[str], directory_path: str = None,
+                                           max_results: int = 10, ref: str = None) -> List[List[int]]:
+        """
+        Ids de los chunks de cada consulta, sin repetir chunks entre consultas. Los embeddings de las consultas se
+        calculan en un lote y cada tipo de búsqueda se hace en una sola sentencia para todas las consultas.
+        """
+        if len(queries) > self.max_queries:
+            raise ValueError(f"Se admiten como mucho {self.max_queries} consultas, recibidas: {len(queries)}")
+        if not queries:
+            return []
+
+        async with self.session_maker() as session:
+            query_chunk_ids = await session.run_sync(
+                search_multi_query_identifier_ids, queries, directory_path, max_results, ref, self.search_mode,
+                self.path_cache
+            )
+        pending_queries = {query_index: query for query_index, query in enumerate(queries)
+                           if query_index not in query_chunk_ids}
+        if self.log_search_plans and query_chunk_ids:
+            print(f"Búsqueda de identificadores: {[queries[query_index] for query_index in query_chunk_ids]}")
+
+        if pending_queries:
+            query_embeddings = {}
+            if self.search_mode != SEARCH_MODE_LEXICAL:
+                embeddings = await self.embedder_instance.aembed_queries(list(pending_queries.values()))
+                query_embeddings = dict(zip(pending_queries, embeddings))
+            async with self.session_maker() as session:
+                async with session.begin():
+                    pending_chunk_ids, plans_description = await session.run_sync(
+                        search_multi_query_ids, self.search_planner, pending_queries, query_embeddings,
+                        directory_path, max_results, ref, self.search_parameters, self.search_mode, self.path_cache
+                    )
+            query_chunk_ids.update(pending_chunk_ids)
+            if self.log_search_plans:
+                print(f"Plan de búsqueda de {len(pending_queries)} consultas en {plans_description}")
+
+        return multi_query_search.deduplicate_query_chunk_ids(
+            [query_chunk_ids[query_index] for query_index in range(len(queries))]
+        )
+
+    async def get_file_chunk_ids(self, file_path: str, ref: str = None) -> List[int]:
+        async with self.session_maker() as session:
+            return await session.run_sync(get_file_chunk_ids, file_path, ref, self.path_cache)
+
+    async def get_chunks_response(self, chunk_ids: List[int]) -> dict:
+        """
+        Respuesta de las herramientas MCP para los chunks indicados, como get_chunks_response
+        """
+        async with self.session_maker() as session:
+            chunks, chunk_neighbours = await session.run_sync(
+                get_chunks_with_neighbours, chunk_ids, self.max_referenced, self.max_referencing
+            )
+        return await asyncio.to_thread(build_chunks_response, chunks, chunk_neighbours, chunk_ids, self.max_chunks,
+                                       self.repo_path)
+
+    async def search_chunks_response(self, query: str, directory_path: str = None, ref: str = None) -> dict:
+        chunk_ids = await self.search_similar_chunk_ids(query, directory_path, self.max_chunks, ref)
+        return await self.get_chunks_response(chunk_ids)
+
+    async def search_multi_query_response(self, queries: List[str], directory_path: str = None,
+                                          ref: str = None) -> Dict[str, dict]:
+        """
+        Respuesta de cada consulta, como search_chunks_response, agrupada por consulta. Las consultas repetidas se
+        buscan una vez y los chunks y vecinos de todas se recuperan en una sola consulta.
+        """
+        queries = list(dict.fromkeys(queries))
+        query_chunk_ids = await self.search_multi_query_chunk_ids(queries, directory_path, self.max_chunks, ref)
+        all_chunk_ids = [chunk_id for chunk_ids in query_chunk_ids for chunk_id in chunk_ids]
+        async with self.session_maker() as session:
+            chunks, chunk_neighbours = await session.run_sync(
+                get_chunks_with_neighbours, all_chunk_ids, self.max_referenced, self.max_referencing
+            )
+        return await asyncio.to_thread(build_grouped_chunks_response, chunks, chunk_neighbours,
+                                       dict(zip(queries, query_chunk_ids)), self.max_chunks, self.repo_path)
+
+    async def get_file_chunks_response(self, file_path: str, ref: str = None) -> dict:
+        return await self.get_chunks_response(await self.get_file_chunk_ids(file_path, ref))
+
+    async def get_definition_response(self, name: str, directory_path: str = None, ref: str = None,
+                                      max_results: int = SYMBOL_SEARCH_MAX_RESULTS) -> List[dict]:
+        async with self.session_maker() as session:
+            symbols = await session.run_sync(find_definitions, name, directory_path, ref, max_results, self.path_cache)
+        return await asyncio.to_thread(build_symbols_response, symbols, self.repo_path)
+
+    async def find_references_response(self, name: str, directory_path: str = None, ref: str = None,
+                                       max_results: int = SYMBOL_SEARCH_MAX_RESULTS) -> List[dict]:
+        async with self.session_maker() as session:
+            symbols = await session.run_sync(find_references, name, directory_path, ref, max_results, self.path_cache)
+        return await asyncio.to_thread(build_symbols_response, symbols, self.repo_path)
+
+    async def get_repository_tree(self, sub_path: str = None, ref: str = None, max_depth: int = None,
+                                  max_tokens: int = REPOSITORY_TREE_TOKEN_BUDGET) -> str:
+        async with self.session_maker() as session:
+            return await session.run_sync(self.tree_cache.get_tree_str, sub_path, ref, max_depth, max_tokens,
+                                          self.path_cache)
+
+    async def list_files(self, prefix: str = None, glob: str = None, ref: str = None, cursor: str = None,
+                         page_size: int = None, group_by_directory: bool = False) -> dict:
+        async with self.session_maker() as session:
+            return await session.run_sync(list_files, prefix, glob, ref, cursor, page_size, group_by_directory,
+                                          self.path_cache)
+
+    async def get_all_file_paths(self, ref: str = None) -> List[str]:
+        async with self.session_maker() as session:
+            return await session.run_sync(get_all_file_paths, ref, self.path_cache)
@@ -0,0 +1,201 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, union_all, and_, or_, cast, null, literal
+from sqlalchemy.orm import Session, aliased
+
+from config import REPO_ROOT_ABSOLUTE_PATH, MAX_CHUNKS, MAX_REFERENCED_CHUNKS, MAX_REFERENCING_CHUNKS
+from src.db.db_utils import NEIGHBOUR_DIRECTION_REFERENCED, NEIGHBOUR_DIRECTION_REFERENCING
+from src.db.models import FileChunk, FSEntry, ChunkNeighbour
+from src.utils.git_utils import get_git_blob_text
+from src.utils.utils import get_file_text, get_start_to_end_lines_from_text_code
+
+"""
+Recuperación de los chunks que devuelven las herramientas del servidor MCP.
+
+Para cada chunk encontrado se devuelven sus mejores vecinos en ambas direcciones, con la ruta de su fichero, las rutas
+de sus duplicados y su código. Los chunks, sus vecinos de chunk_neighbours y las rutas se obtienen con una única
+consulta (CTE con los chunks encontrados y sus vecinos), en lugar de recorrer las relaciones de cada chunk. El código
+se lee de cada fichero o blob una sola vez.
+"""
+
+
+@dataclass
+class RetrievedChunk:
+    chunk_id: int
+    path: str
+    start_line: int
+    end_line: int
+    # Blob de git del que se lee el código, None si se lee del directorio de trabajo
+    blob_sha: str = None
+    duplicate_paths: List[str] = field(default_factory=list)
+
+
+def get_chunks_with_neighbours(session: Session, chunk_ids: List[int], max_referenced: int,
+                               max_referencing: int) -> Tuple[Dict[int, RetrievedChunk], Dict[int, Dict[str, List[int]]]]:
+    """
+    Devuelve los chunks indicados y sus vecinos por id, y los ids de los vecinos de cada chunk por dirección ordenados
+    por peso
+    """
+    if not chunk_ids:
+        return {}, {}
+
+    hits = select(
+        FileChunk.chunk_id.label("hit_id"),
+        cast(null(), ChunkNeighbour.direction.type).label("direction"),
+        literal(0).label("rank"),
+        FileChunk.chunk_id.label("chunk_id")
+    ).where(FileChunk.chunk_id.in_(chunk_ids))
+    neighbours = select(
+        ChunkNeighbour.chunk_id.label("hit_id"),
+        ChunkNeighbour.direction,
+        ChunkNeighbour.rank,
+        ChunkNeighbour.neighbour_id.label("chunk_id")
+    ).where(ChunkNeighbour.chunk_id.in_(chunk_ids))\
+        .where(or_(
+            and_(ChunkNeighbour.direction == NEIGHBOUR_DIRECTION_REFERENCED, ChunkNeighbour.rank <= max_referenced),
+            and_(ChunkNeighbour.direction == NEIGHBOUR_DIRECTION_REFERENCING, ChunkNeighbour.rank <= max_referencing)
+        ))
+    related_chunks = union_all(hits, neighbours).cte("related_chunks")
+
+    duplicate_chunk = aliased(FileChunk)
+    duplicate_file = aliased(FSEntry)
+    stmt = select(
+        related_chunks.c.hit_id,
+        related_chunks.c.direction,
+        FileChunk.chunk_id,
+        FileChunk.start_line,
+        FileChunk.end_line,
+        FileChunk.blob_sha,
+        FSEntry.path,
+        FSEntry.blob_sha.label("file_blob_sha"),
+        duplicate_chunk.chunk_id.label("duplicate_id"),
+        duplicate_file.path.label("duplicate_path")
+    ).join(FileChunk, FileChunk.chunk_id == related_chunks.c.chunk_id)\
+        .join(FSEntry, FSEntry.id == FileChunk.file_id)\
+        .outerjoin(duplicate_chunk, duplicate_chunk.duplicate_of_id == FileChunk.chunk_id)\
+        .outerjoin(duplicate_file, duplicate_file.id == duplicate_chunk.file_id)\
+        .order_by(related_chunks.c.hit_id, related_chunks.c.direction, related_chunks.c.rank, duplicate_chunk.chunk_id)
+
+    chunks = {}
+    chunk_neighbours = {chunk_id: {NEIGHBOUR_DIRECTION_REFERENCED: [], NEIGHBOUR_DIRECTION_REFERENCING: []}
+                        for chunk_id in chunk_ids}
+    # Cada vecino aparece una vez por cada duplicado suyo, y los chunks compartidos una vez por cada chunk encontrado
+    added_neighbours = set()
+    added_duplicates = set()
+    for row in session.execute(stmt):
+        chunk = chunks.get(row.chunk_id)
+        if chunk is None:
+            chunk = chunks[row.chunk_id] = RetrievedChunk(
+                chunk_id=row.chunk_id,
+                path=row.path,
+                start_line=row.start_line,
+                end_line=row.end_line,
+                blob_sha=row.blob_sha or row.file_blob_sha
+            )
+        if row.direction is not None and (row.hit_id, row.direction, row.chunk_id) not in added_neighbours:
+            added_neighbours.add((row.hit_id, row.direction, row.chunk_id))
+            chunk_neighbours[row.hit_id][row.direction].append(row.chunk_id)
+        if row.duplicate_id is not None and row.duplicate_id not in added_duplicates:
+            added_duplicates.add(row.duplicate_id)
+            chunk.duplicate_paths.append(row.duplicate_path)
+    return chunks, chunk_neighbours
+
+
+class ChunkCodeReader:
+    """
+    Lee el código de los chunks leyendo cada fichero o blob una sola vez
+    """
+    def __init__(self, repo_path: str = REPO_ROOT_ABSOLUTE_PATH):
+        self.repo_path = repo_path
+        self.file_texts = {}
+
+    def get_chunk_code(self, chunk: RetrievedChunk) -> str:
+        source = chunk.blob_sha or chunk.path
+        if source not in self.file_texts:
+            if chunk.blob_sha is not None:
+                self.file_texts[source] = get_git_blob_text(self.repo_path, chunk.blob_sha)
+            else:
+                self.file_texts[source] = get_file_text(os.path.join(self.repo_path, chunk.path))
+        return get_start_to_end_lines_from_text_code(self.file_texts[source], chunk.start_line, chunk.end_line)
+
+
+def get_chunks_response(session: Session, chunk_ids: List[int], max_chunks: int = MAX_CHUNKS,
+                        max_referenced: int = MAX_REFERENCED_CHUNKS, max_referencing: int = MAX_REFERENCING_CHUNKS,
+                        repo_path: str = REPO_ROOT_ABSOLUTE_PATH) -> dict:
+    """
+    Respuesta de las herramientas MCP: cada chunk con sus chunks referenciados y referenciantes. Un chunk solo aparece
+    una vez en la respuesta, y se dejan de añadir chunks encontrados al llegar a max_chunks chunks incluidos.
+    """
+    chunks, chunk_neighbours = get_chunks_with_neighbours(session, chunk_ids, max_referenced, max_referencing)
+    return build_chunks_response(chunks, chunk_neighbours, chunk_ids, max_chunks, repo_path)
+
+
+def build_chunks_response(chunks: Dict[int, RetrievedChunk], chunk_neighbours: Dict[int, Dict[str, List[int]]],
+                          chunk_ids: List[int], max_chunks: int = MAX_CHUNKS,
+                          repo_path: str = REPO_ROOT_ABSOLUTE_PATH) -> dict:
+    """
+    Construye la respuesta a partir del resultado de get_chunks_with_neighbours, sin acceder a la base de datos
+    """
+    return add_chunks_to_response(chunks, chunk_neighbours, chunk_ids, max_chunks, set(), ChunkCodeReader(repo_path))
+
+
+def build_grouped_chunks_response(chunks: Dict[int, RetrievedChunk], chunk_neighbours: Dict[int, Dict[str, List[int]]],
+                                  query_chunk_ids: Dict[str, List[int]], max_chunks: int = MAX_CHUNKS,
+                                  repo_path: str = REPO_ROOT_ABSOLUTE_PATH) -> Dict[str, dict]:
+    """
+    Respuesta de varias consultas, la de cada una como build_chunks_response. Un chunk o vecino solo aparece en la
+    primera consulta en la que se incluye.
+    """
+    code_reader = ChunkCodeReader(repo_path)
+    included_chunk_ids = set()
+    return {
+        query: add_chunks_to_response(chunks, chunk_neighbours, chunk_ids, max_chunks, included_chunk_ids, code_reader)
+        for query, chunk_ids in query_chunk_ids.items()
+    }
+
+
+def add_chunks_to_response(chunks: Dict[int, RetrievedChunk], chunk_neighbours: Dict[int, Dict[str, List[int]]],
+                           chunk_ids: List[int], max_chunks: int, included_chunk_ids: set,
+                           code_reader: ChunkCodeReader) -> dict:
+    previously_included = len(included_chunk_ids)
+    response = {}
+
+    for chunk_id in chunk_ids:
+        if len(included_chunk_ids) - previously_included >= max_chunks:
+            break
+
+        if chunk_id not in included_chunk_ids and chunk_id in chunks:
+            included_chunk_ids.add(chunk_id)
+            neighbours = chunk_neighbours[chunk_id]
+            response[chunk_id] = {
+                **add_chunk_to_dict(chunks[chunk_id], code_reader),
+                "referenced_chunks": process_related_chunks(
+                    neighbours[NEIGHBOUR_DIRECTION_REFERENCED], chunks, included_chunk_ids, code_reader),
+                "referencing_chunks": process_related_chunks(
+                    neighbours[NEIGHBOUR_DIRECTION_REFERENCING], chunks, included_chunk_ids, code_reader)
+            }
+
+    return response
+
+
+def process_related_chunks(related_chunk_ids: List[int], chunks: Dict[int, RetrievedChunk], included_chunk_ids: set,
+                           code_reader: ChunkCodeReader) -> dict:
+    """
+    Añade los vecinos que no están ya en la respuesta
+    """
+    result_dict = {}
+    for related_chunk_id in related_chunk_ids:
+        if related_chunk_id not in included_chunk_ids:
+            included_chunk_ids.add(related_chunk_id)
+            result_dict[related_chunk_id] = add_chunk_to_dict(chunks[related_chunk_id], code_reader)
+    return result_dict
+
+
+def add_chunk_to_dict(chunk: RetrievedChunk, code_reader: ChunkCodeReader) -> dict:
+    return {
+        "path": chunk.path,
+        "chunk_content": code_reader.get_chunk_code(chunk),
+        "duplicate_paths": chunk.duplicate_paths
+    }
@@ -1,8 +1,11 @@
 import os
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, scoped_session
 
+from config import DB_ASYNC_POOL_SIZE, DB_ASYNC_MAX_OVERFLOW, DB_ASYNC_POOL_TIMEOUT
+
 class DBConnection:
     _instance = None
     _engine = None
@@ -51,4 +54,48 @@ class DBConnection:
         """
         Cierra la sesión asociada al hilo actual.
         """
-        DBConnection.get_session().remove()
\ No newline at end of file
+        DBConnection.get_session().remove()
+
+
+class AsyncDBConnection:
+    """
+    Singleton con el engine asíncrono (asyncpg) de los servidores MCP, con la misma configuración que DBConnection.
+
+    Las sesiones no se comparten entre tareas: cada llamada a una herramienta abre la suya con el session maker.
+    Uso:
+        async with AsyncDBConnection.get_session_maker()() as session:
+            ...
+    """
+    _instance = None
+
+    def __init__(self):
+        self.engine = create_async_engine(
+            f"postgresql+asyncpg://{DBConnection.DB_USER}:{DBConnection.DB_PASSWORD}@{DBConnection.DB_HOST}:"
+            f"{DBConnection.DB_PORT}/{DBConnection.DB_NAME}",
+            pool_size=DB_ASYNC_POOL_SIZE,
+            max_overflow=DB_ASYNC_MAX_OVERFLOW,
+            pool_timeout=DB_ASYNC_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+        # Sin expire_on_commit los resultados se pueden leer después de cerrar la sesión sin nuevas consultas
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def get_engine(cls):
+        return cls.get_instance().engine
+
+    @classmethod
+    def get_session_maker(cls):
+        return cls.get_instance().session_maker
+
+    @classmethod
+    async def dispose(cls):
+        if cls._instance is not None:
+            await cls._instance.engine.dispose()
+            cls._instance = None
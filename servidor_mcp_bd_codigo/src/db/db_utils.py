@@ -1,10 +1,20 @@
 import os
+from typing import List, Dict
 
-from src.db.db_connection import DBConnection
-from src.db.models import FSEntry, Ancestor, FileChunk
+from sqlalchemy import select, insert, delete, update, func, literal, or_, text
+from sqlalchemy.orm import aliased
+
+from src.db.models import FSEntry, Ancestor, FileChunk, ChunkNeighbour, GitRef, DocJob, Symbol, IndexState, \
+    chunk_references
 from sqlalchemy.orm import Session
 from src.utils.utils import get_file_text, get_start_to_end_lines_from_text_code
-from config import REPO_ROOT_ABSOLUTE_PATH
+from src.utils.git_utils import get_git_blob_text
+from config import REPO_ROOT_ABSOLUTE_PATH, CHUNK_NEIGHBOURS_TOP_K
+
+NEIGHBOUR_DIRECTION_REFERENCED = "referenced"
+NEIGHBOUR_DIRECTION_REFERENCING = "referencing"
+# Única fila de la tabla index_state
+INDEX_STATE_ID = 1
 
 def obtain_fsentry_relative_path(session: Session, fsentry_id: int) -> str:
 
@@ -15,7 +25,8 @@ def obtain_fsentry_relative_path(session: Session, fsentry_id: int) -> str:
     fsentry = session.query(FSEntry).filter(FSEntry.id == fsentry_id).first()
     return fsentry.path
 
-def add_fs_entry(session: Session, name: str, parent_id: int, is_directory: bool):
+def add_fs_entry(session: Session, name: str, parent_id: int, is_directory: bool, skip_reason: str = None,
+                 blob_sha: str = None):
     """
     Añade un nuevo archivo o directorio al sistema de archivos y gestiona automáticamente
     todas las relaciones en la tabla de ancestros.
@@ -29,7 +40,8 @@ def add_fs_entry(session: Session, name: str, parent_id: int, is_directory: bool
         parent_path = obtain_fsentry_relative_path(session, parent_id)
         path = os.path.join(parent_path, name)
 
-    entry = FSEntry(name=name, parent_id=parent_id, is_directory=is_directory, path=path)
+    entry = FSEntry(name=name, parent_id=parent_id, is_directory=is_directory, path=path, skip_reason=skip_reason,
+                    blob_sha=blob_sha)
     session.add(entry)
     # Necesario para obtener el ID asignado
     session.flush()
@@ -64,41 +76,256 @@ def add_fs_entry(session: Session, name: str, parent_id: int, is_directory: bool
     return entry
 
 def get_fsentry_relative_path(fsentry: FSEntry):
+    # La ruta relativa a la raíz de su árbol se guarda al crear la entrada, no hace falta recorrer los padres
     if fsentry is None:
         return ""
+    return fsentry.path
 
-    session = DBConnection.get_session()
-    root_node = session.query(FSEntry).filter(FSEntry.parent_id == None).first()
-
-    # Si estamos en el nodo raíz, devolvemos cadena vacía
-    if fsentry.id == root_node.id:
-        return ""
-
-    # Construir la ruta de forma recursiva
-    path_parts = []
-    current = fsentry
+def get_index_version(session: Session) -> int:
+    version = session.execute(select(IndexState.version).where(IndexState.id == INDEX_STATE_ID)).scalar()
+    return version or 0
 
-    while current is not None and current.id != root_node.id:
-        path_parts.insert(0, current.name)  # Insertamos al principio para mantener el orden correcto
-        current = current.parent  # Utilizamos la relación backref 'parent' para navegar hacia arriba
+def bump_index_version(session: Session):
+    """
+    Incrementa la versión del índice tras escribir el árbol de ficheros, invalida las cachés de rutas de los servidores
+    """
+    result = session.execute(
+        update(IndexState).where(IndexState.id == INDEX_STATE_ID).values(version=IndexState.version + 1),
+        execution_options={"synchronize_session": False}
+    )
+    if result.rowcount == 0:
+        session.execute(insert(IndexState).values(id=INDEX_STATE_ID, version=1))
 
-    return "/".join(path_parts)
+def get_fs_entry_text(fs_entry: FSEntry, repo_path: str = REPO_ROOT_ABSOLUTE_PATH) -> str:
+    """
+    Los ficheros indexados desde una rama se leen de su blob de git, el resto del directorio de trabajo
+    """
+    if fs_entry.blob_sha is not None:
+        return get_git_blob_text(repo_path, fs_entry.blob_sha)
+    return get_file_text(os.path.join(repo_path, fs_entry.path))
 
 def get_chunk_code(Session: Session, chunk: FileChunk, repo_path: str = REPO_ROOT_ABSOLUTE_PATH):
-    chunk_file = Session.query(FSEntry).filter(FSEntry.id == chunk.file_id).first()
-    chunk_file_path = os.path.join(repo_path, chunk_file.path)
-    file_code = get_file_text(chunk_file_path)
+    if chunk.blob_sha is not None:
+        file_code = get_git_blob_text(repo_path, chunk.blob_sha)
+    else:
+        chunk_file = Session.query(FSEntry).filter(FSEntry.id == chunk.file_id).first()
+        file_code = get_fs_entry_text(chunk_file, repo_path)
     chunk_code = get_start_to_end_lines_from_text_code(file_code, chunk.start_line, chunk.end_line)
     return chunk_code
 
-# busca el fichero sin tenenr en cuenta las mayúsulas
-def get_fs_entry_from_relative_path(session: Session, relative_path: str):
-    fs_entry = session.query(FSEntry).filter(
+# busca el fichero sin tenenr en cuenta las mayúsulas, si se indica root_id solo dentro de ese árbol
+# con path_cache (FSEntryPathCache) la ruta se resuelve en memoria en lugar de con ilike
+def get_fs_entry_from_relative_path(session: Session, relative_path: str, root_id: int = None, path_cache=None):
+    if path_cache is not None:
+        return path_cache.get_fs_entry(session, relative_path, root_id)
+    query = session.query(FSEntry).filter(
         FSEntry.path.ilike(relative_path)
-    ).first()
-    return fs_entry
+    )
+    if root_id is not None:
+        query = query.join(Ancestor, Ancestor.descendant_id == FSEntry.id).filter(Ancestor.ancestor_id == root_id)
+    return query.first()
 
-def get_root_fs_entry(session: Session):
-    root_node = session.query(FSEntry).filter(FSEntry.parent_id == None).first()
+def get_root_fs_entry(session: Session, ref: str = None, path_cache=None):
+    """
+    Devuelve la raíz del árbol de la ref indicada, o la primera raíz si no se indica ninguna
+    """
+    if path_cache is not None:
+        return path_cache.get_root_fs_entry(session, ref)
+    if ref is not None:
+        git_ref = get_git_ref(session, ref)
+        if git_ref is None:
+            raise ValueError(f"La ref {ref} no está indexada")
+        return git_ref.root
+    root_node = session.query(FSEntry).filter(FSEntry.parent_id == None).order_by(FSEntry.id).first()
     return root_node
 
+def get_git_ref(session: Session, ref: str):
+    return session.query(GitRef).filter(GitRef.name == ref).first()
+
+def get_search_directory(session: Session, directory_path: str = None, ref: str = None, path_cache=None):
+    """
+    Directorio en el que buscar. Si no se proporciona un directorio o no se encuentra, se busca desde el directorio
+    raíz de la ref
+    """
+    root_entry = get_root_fs_entry(session, ref, path_cache)
+    fs_entry = None
+    if directory_path:
+        fs_entry = get_fs_entry_from_relative_path(session, directory_path, root_entry.id, path_cache)
+    return fs_entry or root_entry
+
+def get_file_fs_entry(session: Session, file_path: str, ref: str = None, path_cache=None):
+    """
+    Fichero del árbol de la ref, o del árbol por defecto de get_root_fs_entry si no se indica, como
+    get_search_directory
+    """
+    root_entry = get_root_fs_entry(session, ref, path_cache)
+    fs_entry = None
+    if root_entry is not None:
+        fs_entry = get_fs_entry_from_relative_path(session, file_path, root_entry.id, path_cache)
+    if fs_entry is None:
+        raise FileNotFoundError(f"File not found: {file_path}")
+    return fs_entry
+
+def get_all_file_paths(session: Session, ref: str = None, path_cache=None) -> List[str]:
+    """
+    Rutas de las entradas del árbol de la ref, o del árbol por defecto si no se indica
+    """
+    if path_cache is not None:
+        return path_cache.get_all_paths(session, ref)
+    root_entry = get_root_fs_entry(session, ref)
+    if root_entry is None:
+        return []
+    query = session.query(FSEntry.path)\
+        .join(Ancestor, Ancestor.descendant_id == FSEntry.id)\
+        .filter(Ancestor.ancestor_id == root_entry.id)\
+        .order_by(FSEntry.id)
+    return [file.path for file in query.all()]
+
+def get_blob_chunk_ids(session: Session, blob_shas: List[str]) -> Dict[tuple, int]:
+    """
+    Devuelve (blob, línea inicial, línea final) -> id de los chunks ya creados para los blobs indicados
+    """
+    if not blob_shas:
+        return {}
+    rows = session.execute(
+        select(FileChunk.blob_sha, FileChunk.start_line, FileChunk.end_line, FileChunk.chunk_id)
+        .where(FileChunk.blob_sha.in_(list(blob_shas)))
+    ).all()
+    return {(blob_sha, start_line, end_line): chunk_id for blob_sha, start_line, end_line, chunk_id in rows}
+
+def get_file_chunks_query(fs_entry: FSEntry):
+    """
+    Chunks de un fichero: los suyos y, si se ha indexado desde git, los del mismo blob creados al indexar otra ref
+    """
+    if fs_entry.blob_sha is not None:
+        return select(FileChunk).where(or_(FileChunk.file_id == fs_entry.id, FileChunk.blob_sha == fs_entry.blob_sha))
+    return select(FileChunk).where(FileChunk.file_id == fs_entry.id)
+
+def compute_chunk_neighbours(session: Session, top_k: int = CHUNK_NEIGHBOURS_TOP_K, min_chunk_id: int = None):
+    """
+    Materializa en chunk_neighbours los top_k vecinos de cada chunk en cada dirección, ordenados por el peso de la
+    referencia. Se hace con un INSERT ... SELECT con ROW_NUMBER por dirección, sin cargar las aristas en Python.
+    Si se indica min_chunk_id solo se recalculan los chunks a partir de ese id.
+    """
+    delete_stmt = delete(ChunkNeighbour)
+    if min_chunk_id is not None:
+        delete_stmt = delete_stmt.where(ChunkNeighbour.chunk_id >= min_chunk_id)
+    session.execute(delete_stmt)
+
+    directions = [
+        (NEIGHBOUR_DIRECTION_REFERENCED, chunk_references.c.referencing_id, chunk_references.c.referenced_id),
+        (NEIGHBOUR_DIRECTION_REFERENCING, chunk_references.c.referenced_id, chunk_references.c.referencing_id)
+    ]
+    for direction, chunk_column, neighbour_column in directions:
+        ranked_edges = select(
+            chunk_column.label("chunk_id"),
+            neighbour_column.label("neighbour_id"),
+            chunk_references.c.weight.label("weight"),
+            func.row_number().over(
+                partition_by=chunk_column,
+                order_by=(chunk_references.c.weight.desc(), neighbour_column)
+            ).label("rank")
+        )
+        if min_chunk_id is not None:
+            ranked_edges = ranked_edges.where(chunk_column >= min_chunk_id)
+        ranked_edges = ranked_edges.subquery()
+
+        session.execute(
+            insert(ChunkNeighbour).from_select(
+                ["chunk_id", "direction", "rank", "neighbour_id", "weight"],
+                select(
+                    ranked_edges.c.chunk_id,
+                    literal(direction),
+                    ranked_edges.c.rank,
+                    ranked_edges.c.neighbour_id,
+                    ranked_edges.c.weight
+                ).where(ranked_edges.c.rank <= top_k)
+            )
+        )
+    session.flush()
+
+def mark_duplicate_chunks(session: Session) -> int:
+    """
+    Marca como duplicados los chunks con el mismo hash de contenido que otro con menor id, que queda como canónico.
+    Devuelve el número de chunks duplicados.
+    """
+    canonical_chunk = aliased(FileChunk)
+    canonical_chunk_id = select(func.min(canonical_chunk.chunk_id))\
+        .where(canonical_chunk.content_hash == FileChunk.content_hash)\
+        .scalar_subquery()
+
+    # solo se actualizan los chunks que no son canónicos y no estaban ya marcados
+    session.execute(
+        update(FileChunk)
+        .where(FileChunk.content_hash.is_not(None))
+        .where(FileChunk.chunk_id != canonical_chunk_id)
+        .where(or_(FileChunk.duplicate_of_id.is_(None), FileChunk.duplicate_of_id != canonical_chunk_id))
+        .values(duplicate_of_id=canonical_chunk_id),
+        execution_options={"synchronize_session": False}
+    )
+    session.flush()
+    return session.execute(
+        select(func.count()).select_from(FileChunk).where(FileChunk.duplicate_of_id.is_not(None))
+    ).scalar_one()
+
+def delete_file_chunks(session: Session, chunk_ids: List[int]) -> List[int]:
+    """
+    Borra los chunks con sus referencias, vecinos y trabajos de documentación. Las tablas dependientes se borran
+    explícitamente para no depender de los ON DELETE de la base de datos.
+    Devuelve los chunks que eran duplicados de los borrados: dejan de serlo y hay que volver a documentarlos.
+    """
+    if not chunk_ids:
+        return []
+    chunk_ids = list(chunk_ids)
+    orphan_duplicate_ids = session.execute(
+        select(FileChunk.chunk_id)
+        .where(FileChunk.duplicate_of_id.in_(chunk_ids))
+        .where(FileChunk.chunk_id.not_in(chunk_ids))
+    ).scalars().all()
+
+    session.execute(delete(chunk_references).where(
+        or_(chunk_references.c.referencing_id.in_(chunk_ids), chunk_references.c.referenced_id.in_(chunk_ids))
+    ))
+    session.execute(delete(ChunkNeighbour).where(
+        or_(ChunkNeighbour.chunk_id.in_(chunk_ids), ChunkNeighbour.neighbour_id.in_(chunk_ids))
+    ))
+    session.execute(delete(DocJob).where(DocJob.chunk_id.in_(chunk_ids)))
+    session.execute(delete(Symbol).where(Symbol.chunk_id.in_(chunk_ids)))
+    session.execute(
+        update(FileChunk).where(FileChunk.duplicate_of_id.in_(chunk_ids)).values(duplicate_of_id=None),
+        execution_options={"synchronize_session": False}
+    )
+    session.execute(
+        delete(FileChunk).where(FileChunk.chunk_id.in_(chunk_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    session.flush()
+    return list(orphan_duplicate_ids)
+
+def delete_fs_entries(session: Session, entry_ids: List[int]):
+    """
+    Borra las entradas del árbol y sus relaciones de ancestros. Los chunks de los ficheros se tienen que haber borrado antes.
+    """
+    if not entry_ids:
+        return
+    entry_ids = list(entry_ids)
+    session.execute(delete(Symbol).where(Symbol.file_id.in_(entry_ids)))
+    session.execute(delete(Ancestor).where(
+        or_(Ancestor.descendant_id.in_(entry_ids), Ancestor.ancestor_id.in_(entry_ids))
+    ))
+    session.execute(
+        delete(FSEntry).where(FSEntry.id.in_(entry_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    session.flush()
+
+def reset_postgres_sequence(session: Session, table_name: str, id_column: str):
+    """
+    Avanza la secuencia del id hasta el máximo de la tabla tras insertar filas con ids explícitos
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table_name}', '{id_column}'), "
+        f"(SELECT COALESCE(MAX({id_column}), 1) FROM {table_name}))"
+    ))
@@ -1 +1 @@
-delete from ancestors; delete from chunk_references; delete from fsentry cascade; delete from file_chunks cascade;
\ No newline at end of file
+delete from git_refs; delete from ancestors; delete from chunk_neighbours; delete from chunk_references; delete from fsentry cascade; delete from file_chunks cascade;
\ No newline at end of file
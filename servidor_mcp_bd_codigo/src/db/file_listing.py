@@ -0,0 +1,131 @@
+import re
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, aliased
+
+from config import FILE_LIST_PAGE_SIZE, FILE_LIST_MAX_PAGE_SIZE
+from src.db.db_utils import get_root_fs_entry
+from src.db.models import FSEntry
+from src.db.search_planner import get_closure_descendant_ids
+
+"""
+Listado paginado de los ficheros del repositorio para la herramienta list_repository_files_tool, en lugar de devolver
+todas las rutas en una sola respuesta como get_all_respository_files_list.
+
+Los filtros se aplican en la consulta: el árbol de la ref con la closure table, el prefijo con LIKE 'prefijo%'
+distinguiendo mayúsculas, para que pueda usar el índice de la ruta, y el glob traducido a una expresión regular
+(regexp_match, ~ en PostgreSQL). El directorio literal con el que empieza el glob (src/db/ en src/db/**/*.py) se añade
+también como prefijo, así la expresión regular solo se evalúa sobre las rutas de ese directorio. La paginación es por
+cursor sobre la ruta: el cursor es la última ruta devuelta y la página siguiente empieza después de ella, sin OFFSET.
+El total de ficheros solo se cuenta en la primera página. Con group_by_directory se devuelve el número de ficheros de
+cada directorio en lugar de las rutas, paginado igual por la ruta del directorio.
+"""
+
+
+def glob_to_regex(glob: str) -> str:
+    """
+    Expresión regular de un glob sobre la ruta relativa a la raíz: * y ? no cruzan directorios, ** sí, y [...] es una
+    clase de caracteres. Un glob sin / se compara con el nombre del fichero en cualquier directorio
+    """
+    if "/" not in glob:
+        glob = f"**/{glob}"
+    regex = []
+    index = 0
+    while index < len(glob):
+        if glob.startswith("**/", index):
+            regex.append("(.*/)?")
+            index += 3
+        elif glob.startswith("**", index):
+            regex.append(".*")
+            index += 2
+        elif glob[index] == "*":
+            regex.append("[^/]*")
+            index += 1
+        elif glob[index] == "?":
+            regex.append("[^/]")
+            index += 1
+        elif glob[index] == "[" and "]" in glob[index + 2:]:
+            class_end = glob.index("]", index + 2)
+            characters = glob[index + 1:class_end]
+            if characters.startswith("!"):
+                characters = f"^{characters[1:]}"
+            regex.append("[" + characters.replace("\\", "\\\\") + "]")
+            index = class_end + 1
+        else:
+            regex.append(re.escape(glob[index]))
+            index += 1
+    return f"^{''.join(regex)}$"
+
+
+def get_glob_prefix(glob: str) -> Optional[str]:
+    """
+    Directorio literal con el que empieza el glob, terminado en /, o None si el glob no empieza por un directorio sin
+    comodines
+    """
+    directories = []
+    for part in glob.split("/")[:-1]:
+        if any(character in part for character in "*?["):
+            break
+        directories.append(part)
+    if not directories:
+        return None
+    return "/".join(directories) + "/"
+
+
+def get_page_size(page_size: Optional[int]) -> int:
+    if not page_size:
+        return FILE_LIST_PAGE_SIZE
+    return max(1, min(page_size, FILE_LIST_MAX_PAGE_SIZE))
+
+
+def list_files(session: Session, prefix: str = None, glob: str = None, ref: str = None, cursor: str = None,
+               page_size: int = None, group_by_directory: bool = False, path_cache=None) -> dict:
+    """
+    Página de los ficheros del árbol de la ref cuya ruta empieza por prefix y cumple glob:
+        {"files": [ruta, ...], "total": ficheros que cumplen los filtros, "next_cursor": ruta o None}
+    o con group_by_directory:
+        {"directories": [{"path": ruta, "files": n}, ...], "total": ficheros, "next_cursor": ruta o None}
+    total solo se devuelve en la primera página (sin cursor)
+    """
+    page_size = get_page_size(page_size)
+    root_entry = get_root_fs_entry(session, ref, path_cache)
+    if root_entry is None:
+        raise FileNotFoundError("El repositorio no está indexado")
+
+    filters = [
+        FSEntry.id.in_(get_closure_descendant_ids(root_entry)),
+        FSEntry.is_directory == False
+    ]
+    if prefix:
+        filters.append(FSEntry.path.startswith(prefix.lstrip("/"), autoescape=True))
+    if glob:
+        glob_prefix = get_glob_prefix(glob)
+        if glob_prefix:
+            filters.append(FSEntry.path.startswith(glob_prefix, autoescape=True))
+        filters.append(FSEntry.path.regexp_match(glob_to_regex(glob)))
+
+    if group_by_directory:
+        directory = aliased(FSEntry)
+        stmt = select(directory.path, func.count(FSEntry.id))\
+            .join(directory, directory.id == FSEntry.parent_id)\
+            .where(*filters)\
+            .group_by(directory.path)
+        page_path = directory.path
+    else:
+        stmt = select(FSEntry.path).where(*filters)
+        page_path = FSEntry.path
+    if cursor is not None:
+        stmt = stmt.where(page_path > cursor)
+    # Una fila más para saber si hay página siguiente
+    rows = session.execute(stmt.order_by(page_path).limit(page_size + 1)).all()
+
+    page_rows = rows[:page_size]
+    if group_by_directory:
+        response = {"directories": [{"path": path, "files": count} for path, count in page_rows]}
+    else:
+        response = {"files": [path for path, in page_rows]}
+    if cursor is None:
+        response["total"] = session.execute(select(func.count(FSEntry.id)).where(*filters)).scalar()
+    response["next_cursor"] = page_rows[-1][0] if len(rows) > page_size else None
+    return response
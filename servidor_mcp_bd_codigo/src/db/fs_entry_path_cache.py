@@ -0,0 +1,182 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.db.db_utils import get_index_version
+from src.db.models import FSEntry, GitRef
+
+"""
+Caché en memoria de las rutas del árbol de ficheros para las herramientas de los servidores MCP.
+
+get_fs_entry_from_relative_path busca la ruta con ilike, que no puede usar un índice normal, y cada búsqueda en un
+directorio consulta antes la raíz de su árbol. La caché carga todas las entradas de fsentry y las refs de git en un
+trie por árbol (un nodo por componente de la ruta, en minúsculas), de modo que resolver una ruta a su id cuesta lo que
+la longitud de la ruta, la ruta de un id es una lectura de un diccionario y los listados por prefijo recorren solo el
+subárbol del prefijo.
+
+La caché se invalida con la versión del índice (tabla index_state), que las escrituras del árbol incrementan con
+bump_index_version: antes de cada uso se lee la versión, una lectura por clave primaria, y si ha cambiado se recarga el
+trie. Las entradas se devuelven con session.get, por clave primaria.
+"""
+
+
+class PathTrieNode:
+    __slots__ = ("children", "entry_ids")
+
+    def __init__(self):
+        # nombre en minúsculas -> nodo
+        self.children: Dict[str, "PathTrieNode"] = {}
+        # entradas con esta ruta sin tener en cuenta las mayúsculas, por orden de id
+        self.entry_ids: List[int] = []
+
+
+def split_path(relative_path: str) -> List[str]:
+    return [part for part in relative_path.strip().split("/") if part and part != "."]
+
+
+class FSEntryPathTrie:
+    def __init__(self, version: int):
+        self.version = version
+        # id de la raíz -> nodo raíz, por orden de id
+        self.roots: Dict[int, PathTrieNode] = {}
+        self.entry_paths: Dict[int, str] = {}
+        self.ref_root_ids: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, session: Session, version: int) -> "FSEntryPathTrie":
+        trie = cls(version)
+        children = {}
+        for entry_id, parent_id, name, path in session.execute(
+                select(FSEntry.id, FSEntry.parent_id, FSEntry.name, FSEntry.path).order_by(FSEntry.id)):
+            trie.entry_paths[entry_id] = path
+            if parent_id is None:
+                trie.roots[entry_id] = PathTrieNode()
+                trie.roots[entry_id].entry_ids.append(entry_id)
+            else:
+                children.setdefault(parent_id, []).append((entry_id, name.lower()))
+
+        # los hijos se añaden recorriendo el árbol desde cada raíz, las entradas sin raíz no son alcanzables
+        pending = [(root_id, node) for root_id, node in trie.roots.items()]
+        while pending:
+            entry_id, node = pending.pop()
+            for child_id, child_name in children.get(entry_id, []):
+                child_node = node.children.get(child_name)
+                if child_node is None:
+                    child_node = node.children[child_name] = PathTrieNode()
+                child_node.entry_ids.append(child_id)
+                pending.append((child_id, child_node))
+
+        trie.ref_root_ids = dict(session.execute(select(GitRef.name, GitRef.root_id)).all())
+        return trie
+
+    def get_root_id(self, ref: str = None) -> Optional[int]:
+        """
+        Raíz del árbol de la ref indicada, o la primera raíz si no se indica ninguna, como get_root_fs_entry
+        """
+        if ref is not None:
+            if ref not in self.ref_root_ids:
+                raise ValueError(f"La ref {ref} no está indexada")
+            return self.ref_root_ids[ref]
+        return next(iter(self.roots), None)
+
+    def get_node(self, relative_path: str, root_id: int) -> Optional[PathTrieNode]:
+        node = self.roots.get(root_id)
+        for part in split_path(relative_path):
+            if node is None:
+                return None
+            node = node.children.get(part.lower())
+        return node
+
+    def get_entry_id(self, relative_path: str, root_id: int = None) -> Optional[int]:
+        """
+        Id de la entrada con la ruta indicada sin tener en cuenta las mayúsculas, como get_fs_entry_from_relative_path.
+        Si varias entradas coinciden se prefiere la que tiene las mismas mayúsculas. Sin root_id se busca en todos los
+        árboles por orden.
+        """
+        root_ids = list(self.roots) if root_id is None else [root_id]
+        normalized_path = "/".join(split_path(relative_path))
+        for tree_root_id in root_ids:
+            node = self.get_node(relative_path, tree_root_id)
+            if node is not None and node.entry_ids:
+                return next((entry_id for entry_id in node.entry_ids
+                             if self.entry_paths[entry_id] == normalized_path), node.entry_ids[0])
+        return None
+
+    def get_path(self, entry_id: int) -> Optional[str]:
+        return self.entry_paths.get(entry_id)
+
+    def get_subtree_entry_ids(self, node: PathTrieNode) -> List[int]:
+        entry_ids = []
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            entry_ids.extend(node.entry_ids)
+            pending.extend(node.children.values())
+        return entry_ids
+
+    def list_prefix(self, prefix: str = "", root_id: int = None) -> List[str]:
+        """
+        Rutas del árbol que empiezan por el prefijo, ordenadas. Un prefijo terminado en / lista el contenido del
+        directorio y sus subdirectorios, si no el último componente puede ser el principio de un nombre.
+        """
+        if root_id is None:
+            root_id = self.get_root_id()
+        parts = split_path(prefix)
+        if not parts or prefix.rstrip().endswith("/"):
+            node = self.get_node(prefix, root_id)
+            if node is None:
+                return []
+            entry_ids = [entry_id for entry_id in self.get_subtree_entry_ids(node) if entry_id not in node.entry_ids]
+        else:
+            node = self.get_node("/".join(parts[:-1]), root_id)
+            if node is None:
+                return []
+            name_prefix = parts[-1].lower()
+            entry_ids = []
+            for child_name, child_node in node.children.items():
+                if child_name.startswith(name_prefix):
+                    entry_ids.extend(self.get_subtree_entry_ids(child_node))
+        return sorted(self.entry_paths[entry_id] for entry_id in entry_ids)
+
+    def get_all_paths(self, ref: str = None) -> List[str]:
+        """
+        Rutas de las entradas del árbol de la ref, o del árbol por defecto si no se indica, como get_all_file_paths
+        """
+        root_id = self.get_root_id(ref)
+        entry_ids = sorted(self.get_subtree_entry_ids(self.roots[root_id])) if root_id in self.roots else []
+        return [self.entry_paths[entry_id] for entry_id in entry_ids]
+
+
+class FSEntryPathCache:
+    """
+    Trie de las rutas del índice que se recarga cuando cambia la versión del índice. Se puede pasar como path_cache a
+    las funciones de db_utils que resuelven rutas.
+    """
+    def __init__(self):
+        self.trie: Optional[FSEntryPathTrie] = None
+
+    def load(self, session: Session) -> FSEntryPathTrie:
+        self.trie = FSEntryPathTrie.load(session, get_index_version(session))
+        return self.trie
+
+    def get_trie(self, session: Session) -> FSEntryPathTrie:
+        trie = self.trie
+        if trie is None or trie.version != get_index_version(session):
+            trie = self.load(session)
+        return trie
+
+    def get_fs_entry(self, session: Session, relative_path: str, root_id: int = None) -> Optional[FSEntry]:
+        entry_id = self.get_trie(session).get_entry_id(relative_path, root_id)
+        return None if entry_id is None else session.get(FSEntry, entry_id)
+
+    def get_root_fs_entry(self, session: Session, ref: str = None) -> Optional[FSEntry]:
+        root_id = self.get_trie(session).get_root_id(ref)
+        return None if root_id is None else session.get(FSEntry, root_id)
+
+    def get_all_paths(self, session: Session, ref: str = None) -> List[str]:
+        return self.get_trie(session).get_all_paths(ref)
+
+    def list_prefix(self, session: Session, prefix: str = "", ref: str = None) -> List[str]:
+        trie = self.get_trie(session)
+        return trie.list_prefix(prefix, trie.get_root_id(ref))
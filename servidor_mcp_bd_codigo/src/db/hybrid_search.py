@@ -0,0 +1,170 @@
+import re
+from typing import List
+
+from sqlalchemy import select, func, literal_column, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Session
+
+from config import SEARCH_MODE, HYBRID_SEARCH_CANDIDATES, HYBRID_SEARCH_RRF_K
+from src.chunker.chunk_identifiers import MIN_IDENTIFIER_LENGTH
+from src.db.models import FileChunk, FSEntry, SEARCH_VECTOR_COLUMN, ADD_SEARCH_VECTOR_SQL, \
+    CREATE_SEARCH_VECTOR_INDEX_SQL
+from src.db.search_planner import DirectorySearchPlanner, search_directory_chunks, get_directory_chunk_filter, \
+    get_closure_descendant_ids
+from src.db.vector_index import VectorSearchParameters
+
+"""
+Búsqueda léxica e híbrida sobre los chunks.
+
+La búsqueda por embeddings falla con consultas exactas (nombres de clases, mensajes de error, claves de configuración).
+La búsqueda léxica usa la columna search_vector (identificadores del código y documentación, con índice GIN) y ordena
+con ts_rank_cd normalizado por la longitud del documento, lo más parecido a BM25 que ofrece PostgreSQL.
+
+- vector: solo la búsqueda por similitud del planificador de búsquedas.
+- lexical: solo la búsqueda léxica, cualquiera de los términos de la consulta.
+- hybrid: combina los candidatos de ambas con reciprocal rank fusion (suma de 1 / (k + posición) en cada ranking).
+  Las consultas que son solo identificadores o un texto entre comillas se responden con la búsqueda léxica de todos los
+  términos, sin calcular el embedding; si no encuentra nada se hace la búsqueda híbrida.
+
+La búsqueda léxica solo está disponible en PostgreSQL, en otras bases de datos no devuelve resultados.
+"""
+
+SEARCH_MODE_VECTOR = "vector"
+SEARCH_MODE_LEXICAL = "lexical"
+SEARCH_MODE_HYBRID = "hybrid"
+SEARCH_MODES = [SEARCH_MODE_VECTOR, SEARCH_MODE_LEXICAL, SEARCH_MODE_HYBRID]
+
+# Normalización 1 de ts_rank_cd: divide el rango entre 1 + log(longitud del documento)
+LEXICAL_RANK_NORMALIZATION = 1
+QUERY_TERM_PATTERN = re.compile(r"[A-Za-z0-9]+")
+QUOTED_QUERY_PATTERN = re.compile(r"""^(["'`]).+\1$""", re.DOTALL)
+MAX_IDENTIFIER_QUERY_TOKENS = 3
+# snake_case, nombres con puntos o ::, camelCase, PascalCase con varias palabras y CONSTANTES
+IDENTIFIER_TOKEN_PATTERN = re.compile(
+    r"^[A-Za-z_$][\w$]*(?:(?:\.|::)[\w$]+)*\(?\)?$"
+)
+CODE_LIKE_TOKEN_PATTERN = re.compile(r"[_.:$]|[a-z][A-Z]|^[A-Z][a-z0-9]+[A-Z]|^[A-Z][A-Z0-9]+$|\(\)$")
+
+
+def is_identifier_query(query: str) -> bool:
+    """
+    Consulta formada solo por identificadores de código o por un texto exacto entre comillas
+    """
+    query = query.strip()
+    if QUOTED_QUERY_PATTERN.match(query):
+        return True
+    tokens = query.split()
+    return 0 < len(tokens) <= MAX_IDENTIFIER_QUERY_TOKENS and all(
+        IDENTIFIER_TOKEN_PATTERN.match(token) and CODE_LIKE_TOKEN_PATTERN.search(token) for token in tokens
+    )
+
+
+def get_query_fragments(query: str) -> List[List[str]]:
+    """
+    Términos de cada palabra de la consulta, en minúsculas: DBConnection.get_session -> [dbconnection, get, session].
+    Los términos más cortos que los identificadores indexados se descartan
+    """
+    fragments = []
+    for token in query.split():
+        terms = [term.lower() for term in QUERY_TERM_PATTERN.findall(token) if len(term) >= MIN_IDENTIFIER_LENGTH]
+        if terms:
+            fragments.append(terms)
+    return fragments
+
+
+def build_tsquery(query: str, match_all: bool):
+    """
+    tsquery con los términos de cada palabra obligatorios y las palabras unidas con AND u OR. Se une la versión
+    'simple' (identificadores) y la 'english' (documentación, con stemming)
+    """
+    operator = " & " if match_all else " | "
+    tsquery_text = operator.join(
+        f"({' & '.join(terms)})" if len(terms) > 1 else terms[0] for terms in get_query_fragments(query)
+    )
+    return func.to_tsquery("simple", tsquery_text).op("||")(func.to_tsquery("english", tsquery_text))
+
+
+def ensure_search_vector(session: Session):
+    """
+    Añade las columnas identifiers y search_vector y el índice GIN si la base de datos es anterior a la búsqueda
+    híbrida. Añadir la columna generada reescribe file_chunks una vez; los chunks existentes no tienen identificadores
+    hasta que se vuelven a chunkear, hasta entonces la búsqueda léxica solo encuentra su documentación.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    session.execute(text(f"ALTER TABLE {FileChunk.__tablename__} ADD COLUMN IF NOT EXISTS "
+                         f"{FileChunk.identifiers.name} text"))
+    session.execute(text(ADD_SEARCH_VECTOR_SQL))
+    session.execute(text(CREATE_SEARCH_VECTOR_INDEX_SQL))
+    session.commit()
+
+
+def get_search_vector():
+    return literal_column(f"{FileChunk.__tablename__}.{SEARCH_VECTOR_COLUMN}", TSVECTOR)
+
+
+def build_lexical_search_statement(query: str, fs_entry: FSEntry, max_results: int, match_all: bool = False):
+    tsquery = build_tsquery(query, match_all)
+    search_vector = get_search_vector()
+    rank = func.ts_rank_cd(search_vector, tsquery, LEXICAL_RANK_NORMALIZATION)
+    return select(FileChunk.chunk_id)\
+        .where(FileChunk.duplicate_of_id.is_(None))\
+        .where(search_vector.op("@@")(tsquery))\
+        .where(get_directory_chunk_filter(get_closure_descendant_ids(fs_entry)))\
+        .order_by(rank.desc(), FileChunk.chunk_id)\
+        .limit(max_results)
+
+
+def search_lexical_chunk_ids(session: Session, query: str, fs_entry: FSEntry, max_results: int,
+                             match_all: bool = False) -> List[int]:
+    if session.get_bind().dialect.name != "postgresql" or not get_query_fragments(query):
+        return []
+    return list(session.execute(build_lexical_search_statement(query, fs_entry, max_results, match_all)).scalars())
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], rrf_k: int = HYBRID_SEARCH_RRF_K) -> List[int]:
+    """
+    Los empates se resuelven por el orden de los rankings, el primero tiene prioridad
+    """
+    scores = {}
+    for ranking in rankings:
+        for position, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + position)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+
+
+def search_identifier_chunk_ids(session: Session, query: str, fs_entry: FSEntry, max_results: int,
+                                search_mode: str = SEARCH_MODE) -> List[int]:
+    """
+    Camino rápido de las consultas de identificadores, sin embedding. Devuelve una lista vacía si la consulta no es de
+    identificadores o no hay chunks con todos sus términos.
+    """
+    if search_mode == SEARCH_MODE_VECTOR or not is_identifier_query(query):
+        return []
+    return search_lexical_chunk_ids(session, query, fs_entry, max_results, match_all=True)
+
+
+def search_chunk_ids(session: Session, planner: DirectorySearchPlanner, query: str, query_embedding, fs_entry: FSEntry,
+                     max_results: int, search_parameters: VectorSearchParameters = None,
+                     search_mode: str = SEARCH_MODE, candidates: int = HYBRID_SEARCH_CANDIDATES,
+                     rrf_k: int = HYBRID_SEARCH_RRF_K) -> tuple:
+    """
+    Búsqueda en el modo indicado, query_embedding no se usa en el modo lexical. Devuelve los ids de los chunks y la
+    descripción de las búsquedas ejecutadas.
+    """
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Modo de búsqueda no soportado: {search_mode}, modos: {SEARCH_MODES}")
+    if search_mode == SEARCH_MODE_LEXICAL:
+        return search_lexical_chunk_ids(session, query, fs_entry, max_results), SEARCH_MODE_LEXICAL
+
+    vector_results = max_results if search_mode == SEARCH_MODE_VECTOR else max(max_results, candidates)
+    rows, plans = search_directory_chunks(session, planner, query_embedding, fs_entry, vector_results,
+                                          search_parameters)
+    vector_chunk_ids = [row[0].chunk_id for row in rows]
+    plans_description = " -> ".join(str(plan) for plan in plans)
+    if search_mode == SEARCH_MODE_VECTOR:
+        return vector_chunk_ids, plans_description
+
+    lexical_chunk_ids = search_lexical_chunk_ids(session, query, fs_entry, max(max_results, candidates))
+    fused_chunk_ids = reciprocal_rank_fusion([vector_chunk_ids, lexical_chunk_ids], rrf_k)[:max_results]
+    return fused_chunk_ids, f"{SEARCH_MODE_HYBRID} ({plans_description} + {len(lexical_chunk_ids)} léxicos)"
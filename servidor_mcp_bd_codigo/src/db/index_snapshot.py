@@ -0,0 +1,247 @@
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import select, insert, DateTime
+from sqlalchemy.orm import Session
+
+from src.db.db_connection import DBConnection
+from src.db.db_utils import reset_postgres_sequence, bump_index_version
+from src.db.models import FSEntry, Ancestor, FileChunk, ChunkNeighbour, GitRef, Symbol, chunk_references, \
+    INDEX_SCHEMA_VERSION, EMBEDDING_DIMENSION
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+"""
+Exportación e importación del índice completo para arrancar un entorno nuevo sin volver a chunkear ni documentar.
+
+A diferencia de ChunkGraphSnapshot, que exporta el grafo de chunks recién generado por el chunker, este snapshot se
+exporta desde la base de datos e incluye la documentación y los embeddings de los chunks:
+- Un fichero parquet (jsonl si no está instalado pyarrow) por tabla con las mismas columnas que la base de datos. La columna embedding de
+  file_chunks se sustituye por embedding_row, la fila del chunk en embeddings.npy (None si no tiene embedding).
+- embeddings.npy: Array contiguo float32 de forma (chunks con embedding, dimensión), se puede abrir con mmap.
+- manifest.json: Versión del esquema, dimensión de los embeddings, formato y número de filas de cada tabla.
+
+La importación comprueba la versión del esquema y la dimensión, y carga las tablas con COPY en una sola transacción.
+Se mantienen los ids, por lo que la base de datos de destino tiene que estar vacía.
+
+Uso:
+    python -m src.db.index_snapshot export /tmp/index_snapshot
+    python -m src.db.index_snapshot import /tmp/index_snapshot
+"""
+
+INDEX_SNAPSHOT_FORMATS = ["parquet", "jsonl"]
+DEFAULT_INDEX_SNAPSHOT_FORMAT = "jsonl" if pa is None else "parquet"
+INDEX_MANIFEST_FILE_NAME = "manifest.json"
+EMBEDDINGS_FILE_NAME = "embeddings.npy"
+# Marca de NULL de COPY, así los textos vacíos se distinguen de los NULL
+COPY_NULL = "\\N"
+
+# Orden de importación por las claves ajenas, junto a la columna id de las tablas con secuencia
+INDEX_SNAPSHOT_TABLES = [
+    (FSEntry.__table__, "id"),
+    (Ancestor.__table__, None),
+    (FileChunk.__table__, "chunk_id"),
+    (Symbol.__table__, "symbol_id"),
+    (chunk_references, None),
+    (ChunkNeighbour.__table__, None),
+    (GitRef.__table__, "id"),
+]
+# Orden de las filas para que los padres (fsentry.parent_id, file_chunks.duplicate_of_id) se inserten antes
+TABLE_ORDER_COLUMNS = {"fsentry": "id", "file_chunks": "chunk_id", "git_refs": "id"}
+
+
+def write_table_rows(rows: List[dict], table_path: str, export_format: str):
+    if export_format == "jsonl":
+        with open(table_path, "w", encoding="utf-8") as file:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+    else:
+        pq.write_table(pa.Table.from_pylist(rows), table_path)
+
+
+def read_table_rows(table_path: str, export_format: str) -> List[dict]:
+    if export_format == "jsonl":
+        with open(table_path, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file if line.strip() != ""]
+    return pq.read_table(table_path).to_pylist()
+
+
+def check_snapshot_format(export_format: str):
+    if export_format not in INDEX_SNAPSHOT_FORMATS:
+        raise ValueError(f"Formato no soportado: {export_format}, formatos: {INDEX_SNAPSHOT_FORMATS}")
+    if export_format == "parquet" and pa is None:
+        raise ImportError("Es necesario instalar pyarrow para usar snapshots en formato parquet")
+
+
+def export_index_snapshot(session: Session, output_dir: str, export_format: str = None) -> dict:
+    """
+    Exporta todas las tablas del índice y los embeddings. Devuelve el manifest escrito.
+    Sin export_format se usa parquet, o jsonl si no está instalado pyarrow.
+    """
+    export_format = export_format or DEFAULT_INDEX_SNAPSHOT_FORMAT
+    check_snapshot_format(export_format)
+    os.makedirs(output_dir, exist_ok=True)
+
+    row_counts = {}
+    embeddings = []
+    for table, _ in INDEX_SNAPSHOT_TABLES:
+        stmt = select(table)
+        if table.name in TABLE_ORDER_COLUMNS:
+            stmt = stmt.order_by(table.c[TABLE_ORDER_COLUMNS[table.name]])
+
+        rows = []
+        for row in session.execute(stmt).mappings():
+            row = dict(row)
+            if table.name == "file_chunks":
+                embedding = row.pop("embedding")
+                row["embedding_row"] = None if embedding is None else len(embeddings)
+                if embedding is not None:
+                    embeddings.append(np.asarray(embedding, dtype=np.float32))
+            rows.append(row)
+
+        write_table_rows(rows, os.path.join(output_dir, f"{table.name}.{export_format}"), export_format)
+        row_counts[table.name] = len(rows)
+
+    embedding_array = np.vstack(embeddings) if embeddings else np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    np.save(os.path.join(output_dir, EMBEDDINGS_FILE_NAME), np.ascontiguousarray(embedding_array, dtype=np.float32))
+
+    manifest = {
+        "schema_version": INDEX_SCHEMA_VERSION,
+        "embedding_dimension": EMBEDDING_DIMENSION,
+        "format": export_format,
+        "row_counts": row_counts,
+        "embeddings": int(embedding_array.shape[0]),
+        "exported_at": datetime.now().isoformat()
+    }
+    with open(os.path.join(output_dir, INDEX_MANIFEST_FILE_NAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def read_index_manifest(snapshot_dir: str) -> dict:
+    with open(os.path.join(snapshot_dir, INDEX_MANIFEST_FILE_NAME), "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+
+    if manifest.get("schema_version") != INDEX_SCHEMA_VERSION:
+        raise ValueError(
+            f"El snapshot tiene la versión de esquema {manifest.get('schema_version')} y el índice la {INDEX_SCHEMA_VERSION}"
+        )
+    if manifest.get("embedding_dimension") != EMBEDDING_DIMENSION:
+        raise ValueError(
+            f"El snapshot tiene embeddings de dimensión {manifest.get('embedding_dimension')} "
+            f"y el índice de dimensión {EMBEDDING_DIMENSION}"
+        )
+    check_snapshot_format(manifest["format"])
+    return manifest
+
+
+def get_csv_value(value):
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, np.ndarray):
+        return "[" + ",".join(map(str, value.tolist())) + "]"
+    return value
+
+
+def copy_rows(session: Session, table, rows: List[dict]):
+    """
+    En Postgres se carga con COPY ... FROM STDIN en la conexión de la sesión, en otras bases de datos con un insert
+    multi-fila
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        session.execute(insert(table), rows)
+        return
+
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([get_csv_value(row[column]) for column in columns])
+    buffer.seek(0)
+
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+
+
+def prepare_rows(table, rows: List[dict], embeddings: np.ndarray) -> List[dict]:
+    """
+    Recupera los embeddings de file_chunks y las fechas guardadas como texto en jsonl
+    """
+    datetime_columns = [column.name for column in table.columns if isinstance(column.type, DateTime)]
+    for row in rows:
+        for column in datetime_columns:
+            if isinstance(row.get(column), str):
+                row[column] = datetime.fromisoformat(row[column])
+        if table.name == "file_chunks":
+            embedding_row = row.pop("embedding_row")
+            row["embedding"] = None if embedding_row is None else embeddings[embedding_row]
+    return rows
+
+
+def import_index_snapshot(session: Session, snapshot_dir: str, commit: bool = True) -> Dict[str, int]:
+    """
+    Restaura el snapshot en una base de datos vacía manteniendo los ids. Si algo falla se hace rollback.
+    Devuelve el número de filas importadas por tabla.
+    """
+    manifest = read_index_manifest(snapshot_dir)
+    export_format = manifest["format"]
+    if session.execute(select(FSEntry.id).limit(1)).first() is not None:
+        raise ValueError("La base de datos ya tiene un índice, el snapshot solo se puede importar en una base de datos vacía")
+
+    embeddings = np.load(os.path.join(snapshot_dir, EMBEDDINGS_FILE_NAME), mmap_mode="r")
+    if embeddings.shape[0] > 0 and embeddings.shape[1] != EMBEDDING_DIMENSION:
+        raise ValueError(f"Los embeddings tienen dimensión {embeddings.shape[1]} y el índice {EMBEDDING_DIMENSION}")
+
+    row_counts = {}
+    try:
+        for table, id_column in INDEX_SNAPSHOT_TABLES:
+            rows = read_table_rows(os.path.join(snapshot_dir, f"{table.name}.{export_format}"), export_format)
+            copy_rows(session, table, prepare_rows(table, rows, embeddings))
+            if id_column is not None:
+                reset_postgres_sequence(session, table.name, id_column)
+            row_counts[table.name] = len(rows)
+        bump_index_version(session)
+
+        if commit:
+            session.commit()
+        else:
+            session.flush()
+    except Exception:
+        session.rollback()
+        raise
+
+    return row_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o importa el índice completo de la base de datos")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("snapshot_dir")
+    parser.add_argument("--format", choices=INDEX_SNAPSHOT_FORMATS, default=DEFAULT_INDEX_SNAPSHOT_FORMAT)
+    args = parser.parse_args()
+
+    session = DBConnection.get_session()
+    try:
+        if args.action == "export":
+            print(json.dumps(export_index_snapshot(session, args.snapshot_dir, args.format), indent=2))
+        else:
+            print(json.dumps(import_index_snapshot(session, args.snapshot_dir), indent=2))
+    finally:
+        DBConnection.close_current_session()
+
+
+if __name__ == "__main__":
+    main()
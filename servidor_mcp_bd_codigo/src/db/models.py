@@ -1,10 +1,11 @@
 import os
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Table, Integer, String, ForeignKey, DateTime, Text, create_engine, Boolean
+from sqlalchemy import Column, Table, Integer, String, ForeignKey, DateTime, Text, create_engine, Boolean, Index, \
+    UniqueConstraint, Float
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import func
+from sqlalchemy import func, event, DDL, inspect, text
 
 from src.db.db_connection import DBConnection
 
@@ -17,6 +18,10 @@ Esta tabla repite las relaciones, pero la consulta para obtener los chunks dentr
 """
 Base = declarative_base()
 
+# Versión del esquema del índice, se comprueba al importar un snapshot. Hay que incrementarla al cambiar las tablas
+INDEX_SCHEMA_VERSION = 3
+EMBEDDING_DIMENSION = 1536
+
 class FSEntry(Base):
     __tablename__ = 'fsentry'
     id = Column(Integer, primary_key=True)
@@ -24,6 +29,10 @@ class FSEntry(Base):
     parent_id = Column(Integer, ForeignKey('fsentry.id'), nullable=True)
     is_directory = Column(Boolean, nullable=False)
     path = Column(Text, nullable=False)
+    # Motivo por el que el fichero se guarda sin chunks (generado, minificado, binario...), None si se indexa
+    skip_reason = Column(Text, nullable=True)
+    # Blob de git del fichero si se ha indexado desde una rama en lugar de desde el directorio de trabajo
+    blob_sha = Column(String(40), nullable=True, index=True)
 
     children = relationship(
         "FSEntry",
@@ -46,11 +55,18 @@ class FSEntry(Base):
 
     chunks = relationship("FileChunk", backref="file")
 
-    def __init__(self, name, parent_id, is_directory, path):
+    __table_args__ = (
+        # Búsqueda por prefijo de la ruta (LIKE 'dir/%') en lugar de por la closure table
+        Index('ix_fsentry_path_prefix', 'path', postgresql_ops={'path': 'text_pattern_ops'}),
+    )
+
+    def __init__(self, name, parent_id, is_directory, path, skip_reason=None, blob_sha=None):
         self.name = name
         self.is_directory = is_directory
         self.parent_id = parent_id
         self.path = path
+        self.skip_reason = skip_reason
+        self.blob_sha = blob_sha
 
 class Ancestor(Base):
     __tablename__ = 'ancestors'
@@ -58,11 +74,25 @@ class Ancestor(Base):
     ancestor_id = Column(Integer, ForeignKey('fsentry.id'), primary_key=True)
     depth = Column(Integer, nullable=False)
 
+    # La clave primaria empieza por descendant_id, los descendientes de un directorio se buscan con este índice
+    __table_args__ = (
+        Index('ix_ancestors_ancestor_id', 'ancestor_id'),
+    )
+
+"""
+Cada arista guarda el número de veces que el chunk origen referencia al destino, la confianza con la que se ha resuelto
+la referencia y si ambos chunks están en el mismo fichero. El peso combina los tres valores y se usa para ordenar los
+vecinos de cada chunk en la tabla chunk_neighbours.
+"""
 chunk_references = Table(
     'chunk_references',
     Base.metadata,
     Column('referencing_id', Integer, ForeignKey('file_chunks.chunk_id'), primary_key=True),
-    Column('referenced_id', Integer, ForeignKey('file_chunks.chunk_id'), primary_key=True)
+    Column('referenced_id', Integer, ForeignKey('file_chunks.chunk_id'), primary_key=True),
+    Column('reference_count', Integer, nullable=False, default=1, server_default='1'),
+    Column('confidence', Float, nullable=False, default=1.0, server_default='1'),
+    Column('same_file', Boolean, nullable=False, default=False, server_default='false'),
+    Column('weight', Float, nullable=False, default=1.0, server_default='1')
 )
 
 class FileChunk(Base):
@@ -71,8 +101,16 @@ class FileChunk(Base):
     file_id = Column(Integer, ForeignKey('fsentry.id'))
     start_line = Column(Integer, nullable=False)
     end_line = Column(Integer, nullable=False)
-    embedding = Column(Vector(1536))
+    embedding = Column(Vector(EMBEDDING_DIMENSION))
     docs = Column(Text)
+    # sha256 del contenido sin comentarios ni espacios, los chunks con el mismo hash comparten docs y embedding
+    content_hash = Column(String(64), index=True)
+    # chunk canónico del que este es una copia, solo el canónico se documenta y se devuelve en las búsquedas
+    duplicate_of_id = Column(Integer, ForeignKey('file_chunks.chunk_id', ondelete='SET NULL'), index=True)
+    # blob de git del fichero, los ficheros sin cambios entre ramas comparten chunks, docs y embeddings
+    blob_sha = Column(String(40), index=True)
+    # identificadores del código del chunk y sus partes, separados por espacios, para la búsqueda léxica
+    identifiers = Column(Text)
     """
     chunk_x.referenced_chunks: Los chunks destino (a los que X apunta)
     chunk_x.referencing_chunks: Los chunks origen (que apuntan a X)
@@ -85,13 +123,209 @@ class FileChunk(Base):
         backref="referencing_chunks"
     )
 
-    def __init__(self, file_id: int, start_line: int, end_line: int):
+    duplicates = relationship(
+        "FileChunk",
+        foreign_keys=[duplicate_of_id],
+        backref=backref("duplicate_of", remote_side=[chunk_id])
+    )
+
+    def __init__(self, file_id: int, start_line: int, end_line: int, content_hash: str = None, blob_sha: str = None,
+                 identifiers: str = None):
         self.file_id = file_id
         self.start_line = start_line
         self.end_line = end_line
+        self.content_hash = content_hash
+        self.blob_sha = blob_sha
+        self.identifiers = identifiers
+
+# Documento de la búsqueda léxica: identificadores del código con peso A y documentación con peso B. Es una columna
+# generada de PostgreSQL con índice GIN, se crea fuera del modelo porque SQLite no tiene tsvector y para que los
+# snapshots no la exporten (se vuelve a generar al importar). En las bases de datos anteriores la añade
+# hybrid_search.ensure_search_vector
+SEARCH_VECTOR_COLUMN = "search_vector"
+SEARCH_VECTOR_INDEX_NAME = "ix_file_chunks_search_vector"
+SEARCH_VECTOR_EXPRESSION = ("setweight(to_tsvector('simple', coalesce(identifiers, '')), 'A') || "
+                            "setweight(to_tsvector('english', coalesce(docs, '')), 'B')")
+ADD_SEARCH_VECTOR_SQL = (f"ALTER TABLE {FileChunk.__tablename__} ADD COLUMN IF NOT EXISTS {SEARCH_VECTOR_COLUMN} "
+                         f"tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED")
+CREATE_SEARCH_VECTOR_INDEX_SQL = (f"CREATE INDEX IF NOT EXISTS {SEARCH_VECTOR_INDEX_NAME} ON {FileChunk.__tablename__} "
+                                  f"USING gin ({SEARCH_VECTOR_COLUMN})")
+event.listen(FileChunk.__table__, "after_create", DDL(ADD_SEARCH_VECTOR_SQL).execute_if(dialect="postgresql"))
+event.listen(FileChunk.__table__, "after_create", DDL(CREATE_SEARCH_VECTOR_INDEX_SQL).execute_if(dialect="postgresql"))
+
+class Symbol(Base):
+    """
+    Definiciones y referencias encontradas por tree-sitter al chunkear, con el chunk que las contiene. Las líneas
+    empiezan en 0, como las de los chunks.
+    kind: class | function | method (definiciones) | reference (llamadas)
+    """
+    __tablename__ = 'symbols'
+    symbol_id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False)
+    kind = Column(String(20), nullable=False)
+    # clase en la que está definido, None si no está dentro de una clase o es una referencia
+    class_name = Column(Text)
+    file_id = Column(Integer, ForeignKey('fsentry.id', ondelete='CASCADE'), nullable=False, index=True)
+    chunk_id = Column(Integer, ForeignKey('file_chunks.chunk_id', ondelete='CASCADE'), index=True)
+    start_line = Column(Integer, nullable=False)
+    end_line = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_symbols_name_kind', 'name', 'kind'),
+    )
+
+# Índice de trigramas para las búsquedas aproximadas por nombre (ILIKE '%name%'). pg_trgm es una extensión de contrib
+# que no siempre está instalada, sin ella esas búsquedas recorren la tabla
+SYMBOLS_TRIGRAM_INDEX_NAME = "ix_symbols_name_trgm"
+event.listen(Symbol.__table__, "after_create", DDL(
+    f"DO $$ BEGIN "
+    f"IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN "
+    f"CREATE EXTENSION IF NOT EXISTS pg_trgm; "
+    f"CREATE INDEX {SYMBOLS_TRIGRAM_INDEX_NAME} ON {Symbol.__tablename__} USING gin (name gin_trgm_ops); "
+    f"END IF; END $$"
+).execute_if(dialect="postgresql"))
+
+class GitRef(Base):
+    """
+    Rama o tag de git indexado. Cada ref tiene su propio árbol de fsentry con raíz en root_id, los chunks de los
+    ficheros se identifican por su blob y se comparten entre refs.
+    """
+    __tablename__ = 'git_refs'
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False, unique=True)
+    commit_sha = Column(String(40), nullable=False)
+    root_id = Column(Integer, ForeignKey('fsentry.id'), nullable=False)
+    indexed_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    root = relationship("FSEntry")
+
+class IndexState(Base):
+    """
+    Estado del índice, una sola fila. version se incrementa en cada escritura del árbol de ficheros (chunkeado,
+    actualización incremental o importación de un snapshot) y las cachés en memoria de los servidores la comparan para
+    saber si tienen que recargarse.
+    """
+    __tablename__ = 'index_state'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class ChunkNeighbour(Base):
+    """
+    Mejores vecinos de cada chunk según el peso de sus referencias, calculados al indexar.
+    direction: referenced (chunks a los que apunta) | referencing (chunks que le apuntan)
+    La clave primaria permite obtener los k mejores vecinos de un chunk con una sola lectura del índice.
+    """
+    __tablename__ = 'chunk_neighbours'
+    chunk_id = Column(Integer, ForeignKey('file_chunks.chunk_id', ondelete='CASCADE'), primary_key=True)
+    direction = Column(String(20), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    neighbour_id = Column(Integer, ForeignKey('file_chunks.chunk_id', ondelete='CASCADE'), nullable=False)
+    weight = Column(Float, nullable=False)
+
+class QueryEmbedding(Base):
+    """
+    Embeddings de las consultas de búsqueda compartidos entre los procesos del servidor. La clave es el hash del modelo
+    y del texto normalizado de la consulta.
+    """
+    __tablename__ = 'query_embeddings'
+    query_hash = Column(String(64), primary_key=True)
+    model = Column(Text, nullable=False)
+    embedding = Column(Vector(EMBEDDING_DIMENSION), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class DocJob(Base):
+    """
+    Cola de trabajos de documentación y embedding de chunks.
+    Los workers reclaman los trabajos con SELECT ... FOR UPDATE SKIP LOCKED, por lo que cualquier número de procesos
+    puede vaciar la cola de forma concurrente. Cada trabajo reclamado tiene un lease; si el worker muere el lease
+    expira y otro worker puede volver a reclamarlo. Tras max_attempts intentos fallidos el trabajo pasa a estado dead.
+    """
+    __tablename__ = 'doc_jobs'
+    job_id = Column(Integer, primary_key=True)
+    chunk_id = Column(Integer, ForeignKey('file_chunks.chunk_id', ondelete='CASCADE'), nullable=False)
+    # documentation | embedding
+    job_type = Column(String(20), nullable=False)
+    # pending | running | done | dead
+    status = Column(String(20), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    lease_owner = Column(Text)
+    lease_expires_at = Column(DateTime(timezone=True))
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('chunk_id', 'job_type', name='uq_doc_jobs_chunk_type'),
+        Index('ix_doc_jobs_claim', 'job_type', 'status', 'available_at'),
+    )
+
+    def __init__(self, chunk_id: int, job_type: str, max_attempts: int = 3):
+        self.chunk_id = chunk_id
+        self.job_type = job_type
+        self.status = 'pending'
+        self.attempts = 0
+        self.max_attempts = max_attempts
+
+
+"""
+create_all solo crea las tablas que no existen. Las columnas e índices añadidos después a tablas que ya existían se
+añaden con ALTER TABLE ... ADD COLUMN IF NOT EXISTS y CREATE INDEX IF NOT EXISTS al inicializar la conexión, así los
+servidores y el pipeline funcionan con bases de datos creadas con versiones anteriores del índice. Las columnas
+nuevas son nullable o tienen valor por defecto, por lo que las filas existentes siguen siendo válidas.
+"""
+UPGRADE_COLUMNS = [
+    FSEntry.__table__.c.skip_reason,
+    FSEntry.__table__.c.blob_sha,
+    chunk_references.c.reference_count,
+    chunk_references.c.confidence,
+    chunk_references.c.same_file,
+    chunk_references.c.weight,
+    FileChunk.__table__.c.content_hash,
+    FileChunk.__table__.c.duplicate_of_id,
+    FileChunk.__table__.c.blob_sha,
+    FileChunk.__table__.c.identifiers,
+]
+UPGRADE_INDEX_TABLES = [FSEntry.__table__, Ancestor.__table__, FileChunk.__table__]
+
+
+def get_add_column_sql(column, dialect) -> str:
+    sql = (f"ALTER TABLE {column.table.name} ADD COLUMN IF NOT EXISTS {column.name} "
+           f"{column.type.compile(dialect=dialect)}")
+    if column.server_default is not None:
+        sql += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable:
+        sql += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        sql += f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+        if foreign_key.ondelete:
+            sql += f" ON DELETE {foreign_key.ondelete}"
+    return sql
+
+
+def upgrade_index_schema(connection):
+    """
+    Añade a las tablas existentes las columnas e índices de UPGRADE_COLUMNS y UPGRADE_INDEX_TABLES que les falten.
+    Solo se ejecuta ALTER TABLE si falta alguna columna, para no bloquear las tablas en cada arranque.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    inspector = inspect(connection)
+    existing_columns = {}
+    for column in UPGRADE_COLUMNS:
+        table_name = column.table.name
+        if table_name not in existing_columns:
+            existing_columns[table_name] = {existing["name"] for existing in inspector.get_columns(table_name)}
+        if column.name not in existing_columns[table_name]:
+            connection.execute(text(get_add_column_sql(column, connection.dialect)))
+    for table in UPGRADE_INDEX_TABLES:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
 
 
 # No inicializar la conexión si así se indica en las variables de entorno
 if os.environ.get("INITIALIZE_DB", "true").lower() != "false":
     engine = DBConnection.get_engine()
     Base.metadata.create_all(engine)
+    with engine.begin() as upgrade_connection:
+        upgrade_index_schema(upgrade_connection)
@@ -0,0 +1,219 @@
+from dataclasses import replace
+from typing import List, Dict
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import select, literal, cast, union_all, func, true, Integer
+from sqlalchemy.orm import Session, aliased
+
+from config import SEARCH_MODE, HYBRID_SEARCH_CANDIDATES, HYBRID_SEARCH_RRF_K
+from src.db.hybrid_search import build_tsquery, get_search_vector, get_query_fragments, is_identifier_query, \
+    reciprocal_rank_fusion, LEXICAL_RANK_NORMALIZATION, SEARCH_MODES, SEARCH_MODE_VECTOR, SEARCH_MODE_LEXICAL, \
+    SEARCH_MODE_HYBRID
+from src.db.models import FileChunk, FSEntry, EMBEDDING_DIMENSION
+from src.db.search_planner import DirectorySearchPlanner, SearchPlan, get_directory_chunk_filter, \
+    get_closure_descendant_ids, get_path_prefix_descendant_ids, get_exact_distance, PLAN_ANN_POST_FILTER, \
+    PLAN_PATH_PREFIX, PLAN_EXACT
+from src.db.vector_index import VectorSearchParameters, set_vector_search_parameters
+from src.db.vector_quantization import VectorQuantization, get_compact_query, get_compact_distance
+
+"""
+Búsqueda de varias consultas relacionadas en el mismo directorio con una sola sentencia por tipo de búsqueda.
+
+Los agentes suelen lanzar varias búsquedas seguidas sobre el mismo tema, cada una con su llamada MCP, su embedding y
+sus consultas a la base de datos. Aquí los embeddings se calculan en un lote y las consultas se unen en una tabla
+(UNION ALL de una fila por consulta) que se cruza con un LATERAL que ejecuta la búsqueda de cada consulta, con el mismo
+plan del planificador para todas. En el modo híbrido la búsqueda léxica se hace igual, con el tsquery de cada consulta
+en la tabla.
+
+Los resultados se agrupan por consulta y cada chunk aparece solo en la consulta en la que tiene mejor posición.
+"""
+
+CANDIDATE_CHUNKS_ALIAS = "candidate_chunks"
+
+
+def get_query_embeddings_table(query_embeddings: Dict[int, list], quantization: VectorQuantization = None):
+    """
+    Tabla (query_index, embedding) con el embedding ya convertido a vector, para no convertirlo en cada fila. Con
+    cuantización incluye también el embedding compacto (compact_embedding)
+    """
+    vector_type = Vector(EMBEDDING_DIMENSION)
+    return union_all(*[
+        select(literal(query_index, Integer).label("query_index"),
+               cast(literal(embedding, vector_type), vector_type).label("embedding"),
+               *([get_compact_query(quantization.quantization, embedding).label("compact_embedding")]
+                 if quantization is not None else []))
+        for query_index, embedding in query_embeddings.items()
+    ]).subquery("queries")
+
+
+def get_query_tsqueries_table(queries: Dict[int, str], match_all: bool):
+    return union_all(*[
+        select(literal(query_index, Integer).label("query_index"), build_tsquery(query, match_all).label("tsquery"))
+        for query_index, query in queries.items()
+    ]).subquery("queries")
+
+
+def build_multi_query_search_statement(plan: SearchPlan, query_embeddings: Dict[int, list], fs_entry: FSEntry,
+                                       max_results: int):
+    """
+    Filas (query_index, chunk_id) de los max_results chunks más similares del directorio a cada consulta, ordenadas
+    """
+    queries = get_query_embeddings_table(query_embeddings, plan.quantization)
+    if plan.plan_type == PLAN_ANN_POST_FILTER:
+        # Los candidatos dependen de la consulta de la tabla exterior, dos niveles por encima
+        candidate_chunk = aliased(FileChunk, name=CANDIDATE_CHUNKS_ALIAS)
+        if plan.quantization is None:
+            candidate_distance = candidate_chunk.embedding.cosine_distance(queries.c.embedding)
+        else:
+            candidate_distance = get_compact_distance(plan.quantization, queries.c.compact_embedding,
+                                                      CANDIDATE_CHUNKS_ALIAS)
+        candidates = select(candidate_chunk.chunk_id, candidate_distance.label("distance"))\
+            .where(candidate_chunk.duplicate_of_id.is_(None))\
+            .order_by(candidate_distance)\
+            .limit(plan.candidates)\
+            .correlate(queries)\
+            .lateral("candidates")
+        # Como en build_search_statement, los candidatos de la columna compacta se reordenan con los embeddings completos
+        result_distance = candidates.c.distance if plan.quantization is None \
+            else FileChunk.embedding.cosine_distance(queries.c.embedding)
+        query_results = select(FileChunk.chunk_id, result_distance.label("distance"))\
+            .join(candidates, candidates.c.chunk_id == FileChunk.chunk_id)\
+            .where(get_directory_chunk_filter(get_closure_descendant_ids(fs_entry)))\
+            .order_by(result_distance)\
+            .limit(max_results)\
+            .lateral("query_results")
+    else:
+        if plan.plan_type == PLAN_PATH_PREFIX:
+            descendant_ids = get_path_prefix_descendant_ids(fs_entry)
+        else:
+            descendant_ids = get_closure_descendant_ids(fs_entry)
+        distance = get_exact_distance(FileChunk.embedding.cosine_distance(queries.c.embedding))
+        query_results = select(FileChunk.chunk_id, distance.label("distance"))\
+            .where(FileChunk.duplicate_of_id.is_(None))\
+            .where(get_directory_chunk_filter(descendant_ids))\
+            .order_by(distance)\
+            .limit(max_results)\
+            .lateral("query_results")
+    return select(queries.c.query_index, query_results.c.chunk_id)\
+        .select_from(queries)\
+        .join(query_results, true())\
+        .order_by(queries.c.query_index, query_results.c.distance)
+
+
+def build_multi_query_lexical_statement(queries: Dict[int, str], fs_entry: FSEntry, max_results: int,
+                                        match_all: bool = False):
+    queries_table = get_query_tsqueries_table(queries, match_all)
+    search_vector = get_search_vector()
+    rank = func.ts_rank_cd(search_vector, queries_table.c.tsquery, LEXICAL_RANK_NORMALIZATION)
+    query_results = select(FileChunk.chunk_id, rank.label("rank"))\
+        .where(FileChunk.duplicate_of_id.is_(None))\
+        .where(search_vector.op("@@")(queries_table.c.tsquery))\
+        .where(get_directory_chunk_filter(get_closure_descendant_ids(fs_entry)))\
+        .order_by(rank.desc(), FileChunk.chunk_id)\
+        .limit(max_results)\
+        .lateral("query_results")
+    return select(queries_table.c.query_index, query_results.c.chunk_id)\
+        .select_from(queries_table)\
+        .join(query_results, true())\
+        .order_by(queries_table.c.query_index, query_results.c.rank.desc(), query_results.c.chunk_id)
+
+
+def group_query_rows(rows, query_indexes) -> Dict[int, List[int]]:
+    query_chunk_ids = {query_index: [] for query_index in query_indexes}
+    for query_index, chunk_id in rows:
+        query_chunk_ids[query_index].append(chunk_id)
+    return query_chunk_ids
+
+
+def execute_multi_query_plan(session: Session, plan: SearchPlan, query_embeddings: Dict[int, list], fs_entry: FSEntry,
+                             max_results: int, search_parameters: VectorSearchParameters = None) -> Dict[int, List[int]]:
+    set_vector_search_parameters(session, plan.get_search_parameters(search_parameters or VectorSearchParameters()))
+    rows = session.execute(build_multi_query_search_statement(plan, query_embeddings, fs_entry, max_results)).all()
+    return group_query_rows(rows, query_embeddings)
+
+
+def search_multi_query_vector_chunk_ids(session: Session, planner: DirectorySearchPlanner,
+                                        query_embeddings: Dict[int, list], fs_entry: FSEntry, max_results: int,
+                                        search_parameters: VectorSearchParameters = None) -> tuple:
+    """
+    Devuelve los ids de los chunks de cada consulta y los planes ejecutados
+    """
+    plans = [planner.plan(session, fs_entry, max_results)]
+    query_chunk_ids = execute_multi_query_plan(session, plans[0], query_embeddings, fs_entry, max_results,
+                                               search_parameters)
+    # Como en search_directory_chunks, las consultas con pocos chunks del directorio se repiten de forma exacta
+    incomplete_queries = {query_index: query_embeddings[query_index]
+                          for query_index, chunk_ids in query_chunk_ids.items() if len(chunk_ids) < max_results}
+    if plans[0].plan_type == PLAN_ANN_POST_FILTER and incomplete_queries:
+        plans.append(replace(plans[0], plan_type=PLAN_EXACT, candidates=0, quantization=None))
+        query_chunk_ids.update(execute_multi_query_plan(session, plans[1], incomplete_queries, fs_entry, max_results,
+                                                        search_parameters))
+    return query_chunk_ids, plans
+
+
+def search_multi_query_lexical_chunk_ids(session: Session, queries: Dict[int, str], fs_entry: FSEntry,
+                                         max_results: int, match_all: bool = False) -> Dict[int, List[int]]:
+    searchable_queries = {query_index: query for query_index, query in queries.items() if get_query_fragments(query)}
+    if session.get_bind().dialect.name != "postgresql" or not searchable_queries:
+        return {query_index: [] for query_index in queries}
+    rows = session.execute(build_multi_query_lexical_statement(searchable_queries, fs_entry, max_results, match_all))
+    return group_query_rows(rows, queries)
+
+
+def search_multi_query_identifier_chunk_ids(session: Session, queries: List[str], fs_entry: FSEntry, max_results: int,
+                                            search_mode: str = SEARCH_MODE) -> Dict[int, List[int]]:
+    """
+    Camino rápido de las consultas de identificadores, devuelve solo las consultas con resultados
+    """
+    if search_mode == SEARCH_MODE_VECTOR:
+        return {}
+    identifier_queries = {query_index: query for query_index, query in enumerate(queries)
+                          if is_identifier_query(query)}
+    if not identifier_queries:
+        return {}
+    query_chunk_ids = search_multi_query_lexical_chunk_ids(session, identifier_queries, fs_entry, max_results,
+                                                           match_all=True)
+    return {query_index: chunk_ids for query_index, chunk_ids in query_chunk_ids.items() if chunk_ids}
+
+
+def search_multi_query_chunk_ids(session: Session, planner: DirectorySearchPlanner, queries: Dict[int, str],
+                                 query_embeddings: Dict[int, list], fs_entry: FSEntry, max_results: int,
+                                 search_parameters: VectorSearchParameters = None, search_mode: str = SEARCH_MODE,
+                                 candidates: int = HYBRID_SEARCH_CANDIDATES,
+                                 rrf_k: int = HYBRID_SEARCH_RRF_K) -> tuple:
+    """
+    Búsqueda de las consultas en el modo indicado, como hybrid_search.search_chunk_ids. Devuelve los ids de los chunks de
+    cada consulta y la descripción de las búsquedas ejecutadas.
+    """
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Modo de búsqueda no soportado: {search_mode}, modos: {SEARCH_MODES}")
+    if search_mode == SEARCH_MODE_LEXICAL:
+        return search_multi_query_lexical_chunk_ids(session, queries, fs_entry, max_results), SEARCH_MODE_LEXICAL
+
+    vector_results = max_results if search_mode == SEARCH_MODE_VECTOR else max(max_results, candidates)
+    vector_chunk_ids, plans = search_multi_query_vector_chunk_ids(session, planner, query_embeddings, fs_entry,
+                                                                  vector_results, search_parameters)
+    plans_description = " -> ".join(str(plan) for plan in plans)
+    if search_mode == SEARCH_MODE_VECTOR:
+        return vector_chunk_ids, plans_description
+
+    lexical_chunk_ids = search_multi_query_lexical_chunk_ids(session, queries, fs_entry, max(max_results, candidates))
+    fused_chunk_ids = {
+        query_index: reciprocal_rank_fusion([vector_chunk_ids[query_index], lexical_chunk_ids[query_index]],
+                                            rrf_k)[:max_results]
+        for query_index in queries
+    }
+    return fused_chunk_ids, f"{SEARCH_MODE_HYBRID} ({plans_description})"
+
+
+def deduplicate_query_chunk_ids(query_chunk_ids: List[List[int]]) -> List[List[int]]:
+    """
+    Deja cada chunk solo en la consulta en la que tiene mejor posición, con empate en la primera consulta
+    """
+    best_queries = {}
+    for query_index, chunk_ids in enumerate(query_chunk_ids):
+        for position, chunk_id in enumerate(chunk_ids):
+            if chunk_id not in best_queries or position < best_queries[chunk_id][1]:
+                best_queries[chunk_id] = (query_index, position)
+    return [[chunk_id for chunk_id in chunk_ids if best_queries[chunk_id][0] == query_index]
+            for query_index, chunk_ids in enumerate(query_chunk_ids)]
@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import EMBEDDER_MODEL, QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL_SECONDS, \
+    QUERY_EMBEDDING_CACHE_SHARED, QUERY_EMBEDDING_CACHE_METRICS_PATH
+from src.db.models import QueryEmbedding
+from src.utils.utils import write_file_atomically
+
+"""
+Caché de los embeddings de las consultas de búsqueda de los servidores MCP.
+
+Las búsquedas de los agentes repiten consultas con frecuencia, cada una con una llamada a la API de embeddings. La caché
+tiene dos niveles: un LRU en memoria de cada proceso y la tabla query_embeddings, compartida por todos los procesos del
+servidor. La clave es el hash del modelo y del texto normalizado de la consulta (mayúsculas, espacios y formas Unicode
+equivalentes comparten entrada). Las entradas caducan a los ttl_seconds en ambos niveles.
+
+Si la base de datos falla se calcula el embedding igualmente, la caché compartida nunca hace fallar una búsqueda.
+"""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).split()).casefold()
+
+
+def get_query_hash(query: str, model: str = EMBEDDER_MODEL) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class QueryEmbeddingCacheMetrics:
+    memory_hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    # errores de la caché compartida, la consulta se resuelve con el embedder
+    shared_errors: int = 0
+    hit_rate: float = 0.0
+    # tiempo total en llamadas al embedder por los fallos de caché
+    embedding_seconds: float = 0.0
+    memory_entries: int = 0
+
+    def to_prometheus(self) -> str:
+        return "".join(f"query_embedding_cache_{name} {value}\n" for name, value in asdict(self).items())
+
+
+def get_upsert_statement(session: Session, values: dict):
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(QueryEmbedding).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=[QueryEmbedding.query_hash],
+        set_={"embedding": stmt.excluded.embedding, "created_at": stmt.excluded.created_at}
+    )
+
+
+def get_missing_hashes(embeddings: Dict[str, Optional[List[float]]]) -> List[str]:
+    return [query_hash for query_hash, embedding in embeddings.items() if embedding is None]
+
+
+class CachedQueryEmbedder(Embeddings):
+    """
+    Embedder que cachea embed_query. embed_documents se delega sin cachear, lo usa la indexación con textos que no se
+    repiten.
+
+    La tabla compartida se lee con las sesiones de session_maker. Los métodos asíncronos usan async_session_maker si
+    se indica, con run_sync en el event loop del engine asíncrono: sus conexiones no se pueden usar desde otro hilo.
+    """
+    def __init__(self, embedder: Embeddings, session_maker: Callable[[], Session] = None, model: str = EMBEDDER_MODEL,
+                 memory_size: int = QUERY_EMBEDDING_CACHE_SIZE, ttl_seconds: float = QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+                 use_shared_cache: bool = QUERY_EMBEDDING_CACHE_SHARED,
+                 metrics_path: str = QUERY_EMBEDDING_CACHE_METRICS_PATH,
+                 async_session_maker: async_sessionmaker = None):
+        self.embedder = embedder
+        self.model = model
+        self.memory_size = memory_size
+        self.ttl_seconds = ttl_seconds
+        self.use_shared_cache = use_shared_cache
+        self.metrics_path = metrics_path
+        if use_shared_cache and session_maker is None and async_session_maker is None:
+            # Sesiones propias para no interferir con las transacciones de la sesión de las búsquedas
+            from src.db.db_connection import DBConnection
+            session_maker = sessionmaker(bind=DBConnection.get_engine())
+        self.session_maker = session_maker
+        self.async_session_maker = async_session_maker
+
+        # hash -> (embedding, instante de creación en time.monotonic)
+        self.memory_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = QueryEmbeddingCacheMetrics()
+
+    def add_metrics(self, **increments):
+        with self.lock:
+            for name, increment in increments.items():
+                setattr(self.metrics, name, getattr(self.metrics, name) + increment)
+
+    def get_memory_embedding(self, query_hash: str) -> Optional[List[float]]:
+        with self.lock:
+            entry = self.memory_cache.get(query_hash)
+            if entry is None:
+                return None
+            embedding, created_at = entry
+            if time.monotonic() - created_at > self.ttl_seconds:
+                del self.memory_cache[query_hash]
+                return None
+            self.memory_cache.move_to_end(query_hash)
+            return embedding
+
+    def add_memory_embedding(self, query_hash: str, embedding: List[float], created_at: float = None):
+        if self.memory_size <= 0:
+            return
+        with self.lock:
+            self.memory_cache[query_hash] = (embedding, time.monotonic() if created_at is None else created_at)
+            self.memory_cache.move_to_end(query_hash)
+            while len(self.memory_cache) > self.memory_size:
+                self.memory_cache.popitem(last=False)
+
+    def get_memory_embeddings(self, query_hashes: List[str]) -> Dict[str, Optional[List[float]]]:
+        embeddings = {}
+        for query_hash in query_hashes:
+            if query_hash not in embeddings:
+                embeddings[query_hash] = self.get_memory_embedding(query_hash)
+        self.add_metrics(memory_hits=len(embeddings) - len(get_missing_hashes(embeddings)))
+        return embeddings
+
+    def get_shared_embeddings(self, session: Session, query_hashes: List[str]) -> Dict[str, tuple]:
+        """
+        Devuelve los embeddings de la tabla compartida y su edad en segundos
+        """
+        rows = session.execute(
+            select(QueryEmbedding.query_hash, QueryEmbedding.embedding, QueryEmbedding.created_at)
+            .where(QueryEmbedding.query_hash.in_(query_hashes),
+                   QueryEmbedding.created_at >= self.get_expiration_cutoff())
+        ).all()
+        now = datetime.now(timezone.utc)
+        shared_entries = {}
+        for row in rows:
+            created_at = row.created_at if row.created_at.tzinfo else row.created_at.replace(tzinfo=timezone.utc)
+            shared_entries[row.query_hash] = ([float(value) for value in row.embedding],
+                                              (now - created_at).total_seconds())
+        return shared_entries
+
+    def add_shared_embeddings(self, session: Session, embeddings: Dict[str, List[float]]):
+        created_at = datetime.now(timezone.utc)
+        for query_hash, embedding in embeddings.items():
+            session.execute(get_upsert_statement(session, {
+                "query_hash": query_hash,
+                "model": self.model,
+                "embedding": embedding,
+                "created_at": created_at
+            }))
+        # Se aprovechan los fallos para borrar las entradas caducadas
+        session.execute(delete(QueryEmbedding).where(QueryEmbedding.created_at < self.get_expiration_cutoff()))
+        session.commit()
+
+    def get_expiration_cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+
+    def run_shared(self, action: str, operation: Callable, *args):
+        """
+        Ejecuta la operación sobre la tabla compartida con una sesión propia. Los errores se cuentan y devuelven None
+        """
+        if not self.use_shared_cache or self.session_maker is None:
+            return None
+        try:
+            with self.session_maker() as session:
+                return operation(session, *args)
+        except SQLAlchemyError as e:
+            print(f"Error {action} la caché de embeddings de consultas: {e}")
+            self.add_metrics(shared_errors=1)
+            return None
+
+    async def arun_shared(self, action: str, operation: Callable, *args):
+        if self.async_session_maker is None:
+            return await asyncio.to_thread(self.run_shared, action, operation, *args)
+        if not self.use_shared_cache:
+            return None
+        try:
+            async with self.async_session_maker() as session:
+                return await session.run_sync(operation, *args)
+        except SQLAlchemyError as e:
+            print(f"Error {action} la caché de embeddings de consultas: {e}")
+            self.add_metrics(shared_errors=1)
+            return None
+
+    def add_shared_hits(self, embeddings: Dict[str, Optional[List[float]]], shared_entries: Optional[Dict[str, tuple]]):
+        for query_hash, (embedding, age_seconds) in (shared_entries or {}).items():
+            # Se conserva la caducidad de la entrada compartida
+            self.add_memory_embedding(query_hash, embedding, time.monotonic() - age_seconds)
+            embeddings[query_hash] = embedding
+        self.add_metrics(shared_hits=len(shared_entries or {}))
+
+    def add_computed_embeddings(self, embeddings: Dict[str, Optional[List[float]]], missing_hashes: List[str],
+                                missing_embeddings: List[List[float]],
+                                embedding_seconds: float) -> Dict[str, List[float]]:
+        computed_embeddings = dict(zip(missing_hashes, missing_embeddings))
+        for query_hash, embedding in computed_embeddings.items():
+            self.add_memory_embedding(query_hash, embedding)
+            embeddings[query_hash] = embedding
+        self.add_metrics(misses=len(computed_embeddings), embedding_seconds=embedding_seconds)
+        return computed_embeddings
+
+    def get_embeddings(self, texts: List[str],
+                       embed_missing: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """
+        Embeddings de las consultas de la caché en memoria, de la tabla compartida o, los que faltan, calculados en una
+        sola llamada a embed_missing
+        """
+        query_hashes = [get_query_hash(text, self.model) for text in texts]
+        embeddings = self.get_memory_embeddings(query_hashes)
+        if get_missing_hashes(embeddings):
+            self.add_shared_hits(embeddings, self.run_shared("leyendo", self.get_shared_embeddings,
+                                                             get_missing_hashes(embeddings)))
+        missing_hashes = get_missing_hashes(embeddings)
+        if missing_hashes:
+            missing_texts = [texts[query_hashes.index(query_hash)] for query_hash in missing_hashes]
+            embedding_start = time.perf_counter()
+            missing_embeddings = embed_missing(missing_texts)
+            computed_embeddings = self.add_computed_embeddings(embeddings, missing_hashes, missing_embeddings,
+                                                               time.perf_counter() - embedding_start)
+            self.run_shared("guardando en", self.add_shared_embeddings, computed_embeddings)
+        self.write_metrics()
+        return [embeddings[query_hash] for query_hash in query_hashes]
+
+    async def aget_embeddings(self, texts: List[str],
+                              aembed_missing: Callable[[List[str]], Awaitable[List[List[float]]]]) -> List[List[float]]:
+        """
+        Como get_embeddings, los aciertos en memoria no salen del event loop
+        """
+        query_hashes = [get_query_hash(text, self.model) for text in texts]
+        embeddings = self.get_memory_embeddings(query_hashes)
+        if get_missing_hashes(embeddings):
+            self.add_shared_hits(embeddings, await self.arun_shared("leyendo", self.get_shared_embeddings,
+                                                                    get_missing_hashes(embeddings)))
+        missing_hashes = get_missing_hashes(embeddings)
+        if missing_hashes:
+            missing_texts = [texts[query_hashes.index(query_hash)] for query_hash in missing_hashes]
+            embedding_start = time.perf_counter()
+            missing_embeddings = await aembed_missing(missing_texts)
+            computed_embeddings = self.add_computed_embeddings(embeddings, missing_hashes, missing_embeddings,
+                                                               time.perf_counter() - embedding_start)
+            await self.arun_shared("guardando en", self.add_shared_embeddings, computed_embeddings)
+        self.write_metrics()
+        return [embeddings[query_hash] for query_hash in query_hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.get_embeddings([text], lambda texts: [self.embedder.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings de varias consultas. Las que no están en la caché se calculan en una sola llamada a embed_documents
+        del embedder, que en los modelos de OpenAI devuelve los mismos embeddings que embed_query.
+        """
+        return self.get_embeddings(texts, self.embedder.embed_documents)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async def aembed_missing(texts: List[str]) -> List[List[float]]:
+            return [await self.embedder.aembed_query(texts[0])]
+        return (await self.aget_embeddings([text], aembed_missing))[0]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self.aget_embeddings(texts, self.embedder.aembed_documents)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_documents(texts)
+
+    def get_metrics(self) -> QueryEmbeddingCacheMetrics:
+        with self.lock:
+            self.metrics.memory_entries = len(self.memory_cache)
+            requests = self.metrics.memory_hits + self.metrics.shared_hits + self.metrics.misses
+            hits = self.metrics.memory_hits + self.metrics.shared_hits
+            self.metrics.hit_rate = hits / requests if requests else 0.0
+            return QueryEmbeddingCacheMetrics(**asdict(self.metrics))
+
+    def write_metrics(self):
+        if self.metrics_path is None:
+            return
+        write_file_atomically(self.metrics_path, self.get_metrics().to_prometheus())
@@ -0,0 +1,181 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import TREE_STR_IGNORE_DIRS, REPOSITORY_TREE_TOKEN_BUDGET, REPOSITORY_TREE_MAX_RENDERED
+from src.chunker.chunk_size import load_token_counter
+from src.db.db_utils import get_index_version, get_root_fs_entry, get_fs_entry_from_relative_path
+from src.db.models import FSEntry, Ancestor
+
+"""
+Árbol del repositorio para la herramienta get_repository_tree_tool, construido desde las tablas fsentry y ancestors en
+lugar de recorrer el sistema de ficheros en cada llamada.
+
+El árbol de cada raíz se carga con una consulta a la closure table y se guarda en memoria junto a los árboles ya
+renderizados, hasta que cambia la versión del índice (tabla index_state).
+
+Al renderizar se puede limitar la profundidad y el número de tokens. Los directorios se expanden por niveles, de menos
+a más profundos, mientras sus hijos quepan en el presupuesto: los que no se expanden (los grandes o los que superan la
+profundidad) se muestran como una línea con el número de ficheros y directorios que contienen. Los tokens se cuentan
+con el contador de chunk_size, por línea: nombre, conectores y salto de línea.
+"""
+
+BRANCH_CONNECTOR = "├── "
+LAST_BRANCH_CONNECTOR = "└── "
+VERTICAL_PREFIX = "│   "
+EMPTY_PREFIX = "    "
+
+
+@dataclass
+class RepositoryTreeNode:
+    entry_id: int
+    name: str
+    is_directory: bool
+    # Por nombre, como ordena treelib los nodos en el árbol del sistema de ficheros
+    children: List["RepositoryTreeNode"] = field(default_factory=list)
+    file_count: int = 0
+    directory_count: int = 0
+    # Tokens de la etiqueta de la línea, la de directorio contraído en los directorios
+    label_tokens: int = 0
+
+    def get_label(self, expanded: bool) -> str:
+        if not self.is_directory or expanded or not self.children:
+            return self.name
+        return f"{self.name}/ ({self.file_count} files, {self.directory_count} directories)"
+
+
+def load_repository_tree(session: Session, root_entry: FSEntry,
+                         ignored_dirs: List[str] = None) -> Dict[int, RepositoryTreeNode]:
+    """
+    Carga el árbol de la raíz indicada, devuelve los nodos por id de entrada
+    """
+    ignored_dirs = TREE_STR_IGNORE_DIRS if ignored_dirs is None else ignored_dirs
+    rows = session.execute(
+        select(FSEntry.id, FSEntry.parent_id, FSEntry.name, FSEntry.is_directory)
+        .join(Ancestor, Ancestor.descendant_id == FSEntry.id)
+        .where(Ancestor.ancestor_id == root_entry.id)
+        .order_by(Ancestor.depth)
+    ).all()
+
+    nodes = {}
+    for entry_id, parent_id, name, is_directory in rows:
+        # Los padres tienen menos profundidad, los hijos de los directorios ignorados se descartan con ellos
+        if entry_id != root_entry.id and (parent_id not in nodes or (is_directory and name in ignored_dirs)):
+            continue
+        node = nodes[entry_id] = RepositoryTreeNode(entry_id=entry_id, name=name, is_directory=is_directory)
+        if entry_id != root_entry.id:
+            nodes[parent_id].children.append(node)
+
+    # Recuentos de abajo a arriba: los nodos se han añadido por profundidad
+    for node in reversed(list(nodes.values())):
+        node.children.sort(key=lambda child: child.name)
+        for child in node.children:
+            node.file_count += child.file_count + (0 if child.is_directory else 1)
+            node.directory_count += child.directory_count + (1 if child.is_directory else 0)
+
+    token_counter = load_token_counter()
+    node_list = list(nodes.values())
+    for node, label_tokens in zip(node_list, token_counter([node.get_label(False) for node in node_list])):
+        node.label_tokens = label_tokens
+    return nodes
+
+
+class RepositoryTreeRenderer:
+    def __init__(self):
+        prefix_tokens = load_token_counter()([VERTICAL_PREFIX, EMPTY_PREFIX, BRANCH_CONNECTOR, LAST_BRANCH_CONNECTOR])
+        self.prefix_tokens = max(prefix_tokens[:2])
+        self.connector_tokens = max(prefix_tokens[2:])
+
+    def get_line_tokens(self, node: RepositoryTreeNode, depth: int) -> int:
+        if depth == 0:
+            return node.label_tokens + 1
+        return (depth - 1) * self.prefix_tokens + self.connector_tokens + node.label_tokens + 1
+
+    def get_expanded_ids(self, root: RepositoryTreeNode, max_depth: int = None, token_budget: int = None) -> set:
+        """
+        Directorios que se expanden, por niveles mientras sus hijos quepan en el presupuesto
+        """
+        expanded_ids = set()
+        used_tokens = self.get_line_tokens(root, 0)
+        pending = deque([(root, 0)])
+        while pending:
+            node, depth = pending.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            children_tokens = sum(self.get_line_tokens(child, depth + 1) for child in node.children)
+            if token_budget is not None and used_tokens + children_tokens > token_budget:
+                continue
+            expanded_ids.add(node.entry_id)
+            used_tokens += children_tokens
+            pending.extend((child, depth + 1) for child in node.children if child.is_directory)
+        return expanded_ids
+
+    def render(self, root: RepositoryTreeNode, max_depth: int = None, token_budget: int = None) -> str:
+        expanded_ids = self.get_expanded_ids(root, max_depth, token_budget)
+        lines = [root.get_label(root.entry_id in expanded_ids)]
+        # Recorrido en profundidad con una pila de (nodo, prefijo de su línea, es el último hijo)
+        pending = [(child, "", index == len(root.children) - 1) for index, child in enumerate(root.children)]
+        pending = pending[::-1] if root.entry_id in expanded_ids else []
+        while pending:
+            node, prefix, is_last = pending.pop()
+            expanded = node.entry_id in expanded_ids
+            connector = LAST_BRANCH_CONNECTOR if is_last else BRANCH_CONNECTOR
+            lines.append(f"{prefix}{connector}{node.get_label(expanded)}")
+            if expanded:
+                child_prefix = prefix + (EMPTY_PREFIX if is_last else VERTICAL_PREFIX)
+                for index in reversed(range(len(node.children))):
+                    pending.append((node.children[index], child_prefix, index == len(node.children) - 1))
+        return "\n".join(lines) + "\n"
+
+
+class RepositoryTreeCache:
+    """
+    Árboles cargados por raíz y árboles renderizados por (entrada, profundidad, presupuesto) de la versión actual del
+    índice
+    """
+    def __init__(self, max_rendered: int = REPOSITORY_TREE_MAX_RENDERED):
+        self.version = None
+        self.trees: Dict[int, Dict[int, RepositoryTreeNode]] = {}
+        self.rendered: Dict[tuple, str] = {}
+        self.max_rendered = max_rendered
+        # Se crea en el primer uso, al cargar el contador de tokens
+        self.renderer = None
+
+    def check_version(self, session: Session):
+        version = get_index_version(session)
+        if version != self.version:
+            self.version = version
+            self.trees = {}
+            self.rendered = {}
+
+    def get_tree_str(self, session: Session, sub_path: str = None, ref: str = None, max_depth: int = None,
+                     token_budget: Optional[int] = REPOSITORY_TREE_TOKEN_BUDGET, path_cache=None) -> str:
+        """
+        Árbol del directorio sub_path (relativo a la raíz de la ref) o de la raíz si no se indica
+        """
+        self.check_version(session)
+        root_entry = get_root_fs_entry(session, ref, path_cache)
+        if root_entry is None:
+            raise FileNotFoundError("El repositorio no está indexado")
+        fs_entry = root_entry
+        if sub_path:
+            fs_entry = get_fs_entry_from_relative_path(session, sub_path, root_entry.id, path_cache)
+            if fs_entry is None:
+                raise FileNotFoundError(f"Directory not found: {sub_path}")
+
+        render_key = (fs_entry.id, max_depth, token_budget)
+        if render_key not in self.rendered:
+            if root_entry.id not in self.trees:
+                self.trees[root_entry.id] = load_repository_tree(session, root_entry)
+            tree = self.trees[root_entry.id]
+            if fs_entry.id not in tree:
+                raise FileNotFoundError(f"Directory not found: {sub_path}")
+            if self.renderer is None:
+                self.renderer = RepositoryTreeRenderer()
+            if len(self.rendered) >= self.max_rendered:
+                self.rendered = {}
+            self.rendered[render_key] = self.renderer.render(tree[fs_entry.id], max_depth, token_budget)
+        return self.rendered[render_key]
@@ -0,0 +1,273 @@
+import math
+from dataclasses import dataclass, replace
+from typing import Optional, Dict
+
+from sqlalchemy import select, or_, func, text
+from sqlalchemy.orm import Session, aliased
+
+from config import SEARCH_PLANNER_EXACT_MAX_CHUNKS, SEARCH_PLANNER_ANN_OVERFETCH, SEARCH_PLANNER_ANN_MAX_CANDIDATES, \
+    VECTOR_QUANTIZATION, VECTOR_QUANTIZATION_RERANK_FACTOR
+from src.db.db_utils import get_index_version
+from src.db.models import FileChunk, FSEntry, Ancestor
+from src.db.vector_index import VectorSearchParameters, set_vector_search_parameters
+from src.db.vector_quantization import VectorQuantization, get_vector_quantization, get_compact_query, \
+    get_compact_distance
+
+"""
+Planificador de las búsquedas por similitud dentro de un directorio.
+
+Filtrar los chunks con un IN sobre la closure table impide usar el índice aproximado: PostgreSQL calcula la distancia a
+todos los chunks del subárbol. Según el número estimado de chunks del subárbol se elige uno de estos planes:
+
+- exact: búsqueda exacta filtrando con la closure table. Para subárboles pequeños es más rápida que el índice.
+- ann_post_filter: el índice aproximado devuelve los candidatos más cercanos de todo el índice y después se filtran
+  los del directorio. Se piden más candidatos cuanto menor es la proporción de chunks del subárbol, si después de
+  filtrar quedan menos resultados de los pedidos se repite la búsqueda con el plan exacto.
+- path_prefix: búsqueda exacta filtrando los ficheros por el prefijo de su ruta (índice text_pattern_ops), que evita
+  recorrer la closure table en subárboles grandes con una proporción pequeña del total. Las rutas son relativas a la
+  raíz de cada árbol, por lo que solo se usa si hay un único árbol indexado.
+
+Los planes exactos ordenan por distance + 0: PostgreSQL no puede resolver ese orden con el índice vectorial, pero sigue
+usando el resto de índices (closure table, ix_fsentry_path_prefix). El número de chunks de cada subárbol se guarda en
+el planificador hasta que cambia la versión del índice.
+
+Si se ha configurado una cuantización (vector_quantization.py) y existe su columna, el plan ann_post_filter busca en dos
+fases: los candidatos se piden a la columna compacta, multiplicados por el factor de reordenación, y se ordenan con la
+distancia de los embeddings completos.
+"""
+
+PLAN_EXACT = "exact"
+PLAN_ANN_POST_FILTER = "ann_post_filter"
+PLAN_PATH_PREFIX = "path_prefix"
+
+
+def get_exact_distance(distance):
+    """
+    Distancia que no coincide con la expresión del índice vectorial, para que la ordenación calcule todas las distancias
+    del filtro sin desactivar los demás índices
+    """
+    return distance + 0
+
+
+@dataclass
+class SearchPlan:
+    plan_type: str
+    subtree_chunks: int
+    total_chunks: int
+    # Candidatos que se piden al índice aproximado antes de filtrar por directorio
+    candidates: int = 0
+    # Columna compacta de la primera fase de ann_post_filter, None para buscar con los embeddings completos
+    quantization: Optional[VectorQuantization] = None
+
+    def get_search_parameters(self, search_parameters: VectorSearchParameters) -> VectorSearchParameters:
+        """
+        hnsw devuelve como mucho ef_search resultados, se amplía para obtener todos los candidatos
+        """
+        return replace(search_parameters, ef_search=max(search_parameters.ef_search, self.candidates))
+
+    def __str__(self):
+        return (f"{self.plan_type} (chunks del subárbol: {self.subtree_chunks}/{self.total_chunks}"
+                f"{f', candidatos: {self.candidates}' if self.candidates else ''}"
+                f"{f', cuantización: {self.quantization}' if self.quantization else ''})")
+
+
+def get_closure_descendant_ids(fs_entry: FSEntry):
+    return select(Ancestor.descendant_id).where(Ancestor.ancestor_id == fs_entry.id)
+
+
+def get_path_prefix_descendant_ids(fs_entry: FSEntry):
+    descendant_ids = select(FSEntry.id)
+    if fs_entry.path:
+        descendant_ids = descendant_ids.where(or_(
+            FSEntry.path == fs_entry.path,
+            FSEntry.path.startswith(f"{fs_entry.path}/", autoescape=True)
+        ))
+    return descendant_ids
+
+
+def get_directory_chunk_filter(descendant_ids):
+    """
+    Condición de los chunks canónicos que pertenecen a los ficheros indicados
+    """
+    descendant_ids = descendant_ids.scalar_subquery()
+    # Los chunks de los ficheros indexados desde git pertenecen al primer fichero con ese blob, que puede estar en otra ref
+    descendant_blobs = select(FSEntry.blob_sha).where(
+        FSEntry.id.in_(descendant_ids),
+        FSEntry.blob_sha.is_not(None)
+    ).scalar_subquery()
+
+    # Los duplicados no tienen embedding propio, el chunk canónico está en el directorio si lo está alguna de sus copias
+    duplicate_chunk = aliased(FileChunk)
+    duplicate_in_directory = select(duplicate_chunk.chunk_id)\
+        .where(duplicate_chunk.duplicate_of_id == FileChunk.chunk_id)\
+        .where(duplicate_chunk.file_id.in_(descendant_ids))\
+        .exists()
+
+    return or_(
+        FileChunk.file_id.in_(descendant_ids),
+        FileChunk.blob_sha.in_(descendant_blobs),
+        duplicate_in_directory
+    )
+
+
+def build_search_statement(plan: SearchPlan, query_embedding, fs_entry: FSEntry, max_results: int):
+    """
+    Consulta de los max_results chunks más similares del directorio, devuelve filas (FileChunk, distancia)
+    """
+    distance = FileChunk.embedding.cosine_distance(query_embedding)
+    if plan.plan_type == PLAN_ANN_POST_FILTER:
+        candidate_distance = distance
+        if plan.quantization is not None:
+            candidate_distance = get_compact_distance(
+                plan.quantization, get_compact_query(plan.quantization.quantization, query_embedding)
+            )
+        # El límite impide que PostgreSQL combine la subconsulta con el filtro, así se resuelve con el índice
+        candidates = select(FileChunk.chunk_id, candidate_distance.label('distance'))\
+            .where(FileChunk.duplicate_of_id.is_(None))\
+            .order_by(candidate_distance)\
+            .limit(plan.candidates)\
+            .subquery()
+        # Con la columna compacta los candidatos se reordenan con la distancia de los embeddings completos
+        result_distance = candidates.c.distance if plan.quantization is None else distance
+        return select(FileChunk, result_distance.label('distance'))\
+            .join(candidates, candidates.c.chunk_id == FileChunk.chunk_id)\
+            .where(get_directory_chunk_filter(get_closure_descendant_ids(fs_entry)))\
+            .order_by(result_distance)\
+            .limit(max_results)
+
+    if plan.plan_type == PLAN_PATH_PREFIX:
+        descendant_ids = get_path_prefix_descendant_ids(fs_entry)
+    else:
+        descendant_ids = get_closure_descendant_ids(fs_entry)
+    return select(FileChunk, get_exact_distance(distance).label('distance'))\
+        .where(FileChunk.duplicate_of_id.is_(None))\
+        .where(get_directory_chunk_filter(descendant_ids))\
+        .order_by('distance')\
+        .limit(max_results)
+
+
+class DirectorySearchPlanner:
+    def __init__(self, exact_max_chunks: int = SEARCH_PLANNER_EXACT_MAX_CHUNKS,
+                 ann_overfetch: float = SEARCH_PLANNER_ANN_OVERFETCH,
+                 ann_max_candidates: int = SEARCH_PLANNER_ANN_MAX_CANDIDATES,
+                 quantization: str = VECTOR_QUANTIZATION,
+                 rerank_factor: int = VECTOR_QUANTIZATION_RERANK_FACTOR):
+        self.exact_max_chunks = exact_max_chunks
+        self.ann_overfetch = ann_overfetch
+        self.ann_max_candidates = ann_max_candidates
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.vector_quantization = None
+        self.quantization_checked = False
+        # Chunks de cada subárbol (id de la entrada -> chunks) y si hay un único árbol, de la versión actual del índice
+        self.version = None
+        self.subtree_chunks: Dict[int, int] = {}
+        self.single_tree = None
+
+    def check_version(self, session: Session):
+        version = get_index_version(session)
+        if version != self.version:
+            self.version = version
+            self.subtree_chunks = {}
+            self.single_tree = None
+
+    def get_vector_quantization(self, session: Session) -> Optional[VectorQuantization]:
+        """
+        La existencia de la columna compacta se comprueba en la primera búsqueda aproximada del planificador
+        """
+        if not self.quantization_checked:
+            self.vector_quantization = get_vector_quantization(session, self.quantization)
+            self.quantization_checked = True
+        return self.vector_quantization
+
+    def estimate_subtree_chunks(self, session: Session, fs_entry: FSEntry) -> int:
+        """
+        Chunks canónicos de los ficheros del subárbol. No incluye los chunks compartidos con otra ref por blob, que
+        solo hacen el subárbol más grande de lo estimado. Se cuentan una vez por versión del índice.
+        """
+        subtree_chunks = self.subtree_chunks.get(fs_entry.id)
+        if subtree_chunks is None:
+            subtree_chunks = self.subtree_chunks[fs_entry.id] = session.execute(
+                select(func.count())
+                .select_from(Ancestor)
+                .join(FileChunk, FileChunk.file_id == Ancestor.descendant_id)
+                .where(Ancestor.ancestor_id == fs_entry.id, FileChunk.duplicate_of_id.is_(None))
+            ).scalar_one()
+        return subtree_chunks
+
+    def estimate_total_chunks(self, session: Session) -> int:
+        # En PostgreSQL se usa la estimación de las estadísticas para no recorrer la tabla
+        if session.get_bind().dialect.name == "postgresql":
+            estimated_rows = session.execute(
+                text("SELECT reltuples FROM pg_class WHERE relname = :table"), {"table": FileChunk.__tablename__}
+            ).scalar()
+            if estimated_rows is not None and estimated_rows > 0:
+                return int(estimated_rows)
+        return session.execute(select(func.count()).select_from(FileChunk)).scalar_one()
+
+    def has_single_tree(self, session: Session) -> bool:
+        if self.single_tree is None:
+            self.single_tree = session.execute(
+                select(func.count()).select_from(FSEntry).where(FSEntry.parent_id.is_(None))
+            ).scalar_one() <= 1
+        return self.single_tree
+
+    def get_ann_candidates(self, subtree_chunks: int, total_chunks: int, max_results: int) -> int:
+        """
+        Candidatos necesarios para que, con los chunks del directorio repartidos entre el total, queden max_results
+        después de filtrar
+        """
+        selectivity = subtree_chunks / max(total_chunks, subtree_chunks, 1)
+        if selectivity == 0:
+            return math.inf
+        return max(max_results, math.ceil(max_results / selectivity * self.ann_overfetch))
+
+    def get_ann_plan(self, session: Session, subtree_chunks: int, total_chunks: int, candidates: int) -> SearchPlan:
+        vector_quantization = self.get_vector_quantization(session)
+        if vector_quantization is not None:
+            candidates = min(candidates * self.rerank_factor, self.ann_max_candidates)
+        return SearchPlan(PLAN_ANN_POST_FILTER, subtree_chunks, total_chunks, candidates, vector_quantization)
+
+    def plan(self, session: Session, fs_entry: FSEntry, max_results: int, plan_type: str = None) -> SearchPlan:
+        """
+        Elige el plan de la búsqueda, o crea el plan indicado en plan_type
+        """
+        self.check_version(session)
+        subtree_chunks = self.estimate_subtree_chunks(session, fs_entry)
+        total_chunks = self.estimate_total_chunks(session)
+        if plan_type == PLAN_ANN_POST_FILTER:
+            candidates = self.get_ann_candidates(subtree_chunks, total_chunks, max_results)
+            return self.get_ann_plan(session, subtree_chunks, total_chunks, min(candidates, self.ann_max_candidates))
+        if plan_type is not None:
+            return SearchPlan(plan_type, subtree_chunks, total_chunks)
+
+        if subtree_chunks <= self.exact_max_chunks:
+            return SearchPlan(PLAN_EXACT, subtree_chunks, total_chunks)
+
+        candidates = self.get_ann_candidates(subtree_chunks, total_chunks, max_results)
+        if candidates <= self.ann_max_candidates:
+            return self.get_ann_plan(session, subtree_chunks, total_chunks, candidates)
+        if self.has_single_tree(session):
+            return SearchPlan(PLAN_PATH_PREFIX, subtree_chunks, total_chunks)
+        return SearchPlan(PLAN_EXACT, subtree_chunks, total_chunks)
+
+
+def execute_search_plan(session: Session, plan: SearchPlan, query_embedding, fs_entry: FSEntry, max_results: int,
+                        search_parameters: VectorSearchParameters = None) -> list:
+    set_vector_search_parameters(session, plan.get_search_parameters(search_parameters or VectorSearchParameters()))
+    return session.execute(build_search_statement(plan, query_embedding, fs_entry, max_results)).all()
+
+
+def search_directory_chunks(session: Session, planner: DirectorySearchPlanner, query_embedding, fs_entry: FSEntry,
+                            max_results: int, search_parameters: VectorSearchParameters = None,
+                            plan_type: str = None) -> tuple:
+    """
+    Ejecuta la búsqueda con el plan elegido. Devuelve las filas (FileChunk, distancia) y los planes ejecutados.
+    """
+    plans = [planner.plan(session, fs_entry, max_results, plan_type)]
+    results = execute_search_plan(session, plans[0], query_embedding, fs_entry, max_results, search_parameters)
+    # Si el directorio tiene pocos chunks entre los candidatos del índice aproximado se repite de forma exacta
+    if plans[0].plan_type == PLAN_ANN_POST_FILTER and len(results) < max_results:
+        plans.append(replace(plans[0], plan_type=PLAN_EXACT, candidates=0, quantization=None))
+        results = execute_search_plan(session, plans[1], query_embedding, fs_entry, max_results, search_parameters)
+    return results, plans
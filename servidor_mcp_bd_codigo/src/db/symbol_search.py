@@ -0,0 +1,143 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from config import REPO_ROOT_ABSOLUTE_PATH, SYMBOL_SEARCH_MAX_RESULTS, SYMBOL_DEFINITION_MAX_LINES
+from src.chunker.chunk_symbols import DEFINITION_KINDS, SYMBOL_KIND_REFERENCE
+from src.db.chunk_retrieval import ChunkCodeReader, RetrievedChunk
+from src.db.db_utils import get_search_directory
+from src.db.models import Symbol, FSEntry
+from src.db.search_planner import get_closure_descendant_ids
+
+"""
+Búsqueda de definiciones y referencias en la tabla symbols para las herramientas de ir a la definición y buscar
+referencias.
+
+El nombre se busca primero de forma exacta con el índice (name, kind). Un nombre cualificado (Clase.metodo o
+Clase::metodo) filtra además por la clase de los métodos. Si no hay ninguna coincidencia exacta se buscan los nombres
+que contienen el texto, ordenados por longitud: con pg_trgm disponible lo acelera el índice de trigramas.
+
+Las referencias son las llamadas que tree-sitter encuentra al chunkear, sin resolver a qué definición apuntan: se
+buscan solo por el nombre del método o función.
+"""
+
+QUALIFIED_NAME_SEPARATOR = re.compile(r"::|\.")
+
+
+@dataclass
+class FoundSymbol:
+    name: str
+    kind: str
+    class_name: Optional[str]
+    path: str
+    # Líneas empezando en 0, como en la tabla symbols
+    start_line: int
+    end_line: int
+    chunk_id: Optional[int]
+    # Blob de git del que se lee el código, None si se lee del directorio de trabajo
+    blob_sha: str = None
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.class_name}.{self.name}" if self.class_name else self.name
+
+
+def parse_symbol_name(name: str) -> Tuple[Optional[str], str]:
+    """
+    Devuelve la clase y el nombre del símbolo, Clase.metodo -> (Clase, metodo)
+    """
+    parts = [part for part in QUALIFIED_NAME_SEPARATOR.split(name.strip()) if part]
+    if not parts:
+        raise ValueError(f"Nombre de símbolo no válido: {name!r}")
+    if len(parts) == 1:
+        return None, parts[0]
+    return parts[-2], parts[-1]
+
+
+def escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_symbols_statement(kinds: List[str], fs_entry: FSEntry, max_results: int):
+    return select(
+        Symbol.name,
+        Symbol.kind,
+        Symbol.class_name,
+        FSEntry.path,
+        Symbol.start_line,
+        Symbol.end_line,
+        Symbol.chunk_id,
+        FSEntry.blob_sha
+    ).join(FSEntry, FSEntry.id == Symbol.file_id)\
+        .where(Symbol.kind.in_(kinds))\
+        .where(Symbol.file_id.in_(get_closure_descendant_ids(fs_entry)))\
+        .limit(max_results)
+
+
+def find_symbols(session: Session, name: str, kinds: List[str], fs_entry: FSEntry,
+                 max_results: int = SYMBOL_SEARCH_MAX_RESULTS) -> List[FoundSymbol]:
+    """
+    Símbolos de los tipos indicados en el subárbol de fs_entry con el nombre indicado o, si no hay ninguno, con un
+    nombre que lo contiene
+    """
+    class_name, symbol_name = parse_symbol_name(name)
+    if SYMBOL_KIND_REFERENCE in kinds:
+        class_name = None
+
+    stmt = get_symbols_statement(kinds, fs_entry, max_results)
+    exact_stmt = stmt.where(Symbol.name == symbol_name)
+    if class_name is not None:
+        exact_stmt = exact_stmt.where(Symbol.class_name == class_name)
+    rows = session.execute(exact_stmt.order_by(FSEntry.path, Symbol.start_line)).all()
+    if not rows:
+        rows = session.execute(
+            stmt.where(Symbol.name.ilike(f"%{escape_like(symbol_name)}%", escape="\\"))
+                .order_by(func.length(Symbol.name), Symbol.name, FSEntry.path, Symbol.start_line)
+        ).all()
+    return [FoundSymbol(**row._mapping) for row in rows]
+
+
+def find_definitions(session: Session, name: str, directory_path: str = None, ref: str = None,
+                     max_results: int = SYMBOL_SEARCH_MAX_RESULTS, path_cache=None) -> List[FoundSymbol]:
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    return find_symbols(session, name, DEFINITION_KINDS, fs_entry, max_results)
+
+
+def find_references(session: Session, name: str, directory_path: str = None, ref: str = None,
+                    max_results: int = SYMBOL_SEARCH_MAX_RESULTS, path_cache=None) -> List[FoundSymbol]:
+    fs_entry = get_search_directory(session, directory_path, ref, path_cache)
+    return find_symbols(session, name, [SYMBOL_KIND_REFERENCE], fs_entry, max_results)
+
+
+def build_symbols_response(symbols: List[FoundSymbol], repo_path: str = REPO_ROOT_ABSOLUTE_PATH,
+                           definition_max_lines: int = SYMBOL_DEFINITION_MAX_LINES) -> List[dict]:
+    """
+    Respuesta de las herramientas MCP: cada símbolo con su ruta, sus líneas empezando en 1 y su código. De las
+    definiciones se incluyen como mucho definition_max_lines líneas, de las referencias la línea de la llamada.
+    """
+    code_reader = ChunkCodeReader(repo_path)
+    response = []
+    for symbol in symbols:
+        code_end_line = symbol.start_line
+        if symbol.kind != SYMBOL_KIND_REFERENCE:
+            code_end_line = min(symbol.end_line, symbol.start_line + definition_max_lines - 1)
+        code = code_reader.get_chunk_code(RetrievedChunk(
+            chunk_id=symbol.chunk_id,
+            path=symbol.path,
+            start_line=symbol.start_line,
+            end_line=code_end_line,
+            blob_sha=symbol.blob_sha
+        ))
+        response.append({
+            "name": symbol.qualified_name,
+            "kind": symbol.kind,
+            "path": symbol.path,
+            "start_line": symbol.start_line + 1,
+            "end_line": symbol.end_line + 1,
+            "code": code,
+            "truncated": code_end_line < symbol.end_line
+        })
+    return response
@@ -0,0 +1,227 @@
+import argparse
+import json
+import math
+import re
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from sqlalchemy import text, select, func
+from sqlalchemy.orm import Session
+
+from config import VECTOR_INDEX_TYPE, VECTOR_INDEX_HNSW_M, VECTOR_INDEX_HNSW_EF_CONSTRUCTION, \
+    VECTOR_INDEX_IVFFLAT_LISTS, VECTOR_SEARCH_HNSW_EF_SEARCH, VECTOR_SEARCH_IVFFLAT_PROBES
+from src.db.db_connection import DBConnection
+from src.db.models import FileChunk
+
+"""
+Gestión del índice aproximado (pgvector) sobre file_chunks.embedding.
+
+Sin índice, cada búsqueda por similitud recorre todos los chunks. Se puede crear un índice HNSW (mejor relación entre
+recall y latencia, más lento de construir) o IVFFlat (rápido de construir, se entrena con los embeddings existentes,
+por lo que hay que reconstruirlo si el índice crece mucho). El índice usa vector_cosine_ops, la misma distancia con la
+que ordena search_similar_chunks.
+
+El recall de cada búsqueda se ajusta con hnsw.ef_search o ivfflat.probes, que se fijan con SET LOCAL en la transacción
+de la consulta. El benchmark benchmarks/vector_index_benchmark.py compara recall y latencia con la búsqueda exacta.
+
+Uso:
+    python -m src.db.vector_index create --type hnsw --m 16 --ef-construction 64
+    python -m src.db.vector_index create --type ivfflat --lists 100
+    python -m src.db.vector_index rebuild
+    python -m src.db.vector_index info
+"""
+
+INDEX_TYPE_HNSW = "hnsw"
+INDEX_TYPE_IVFFLAT = "ivfflat"
+INDEX_TYPE_NONE = "none"
+VECTOR_INDEX_TYPES = [INDEX_TYPE_HNSW, INDEX_TYPE_IVFFLAT, INDEX_TYPE_NONE]
+VECTOR_INDEX_NAME = "ix_file_chunks_embedding_ann"
+VECTOR_INDEX_OPS = "vector_cosine_ops"
+# Recomendación de pgvector para ivfflat: filas / 1000 hasta un millón de filas y raíz cuadrada a partir de ahí
+IVFFLAT_ROWS_PER_LIST = 1000
+IVFFLAT_SQRT_THRESHOLD = 1_000_000
+
+
+@dataclass
+class VectorIndexConfig:
+    index_type: str = VECTOR_INDEX_TYPE
+    m: int = VECTOR_INDEX_HNSW_M
+    ef_construction: int = VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+    # 0 para calcularlas según el número de embeddings
+    lists: int = VECTOR_INDEX_IVFFLAT_LISTS
+
+
+@dataclass
+class VectorSearchParameters:
+    ef_search: int = VECTOR_SEARCH_HNSW_EF_SEARCH
+    probes: int = VECTOR_SEARCH_IVFFLAT_PROBES
+
+
+def check_index_type(index_type: str):
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Tipo de índice no soportado: {index_type}, tipos: {VECTOR_INDEX_TYPES}")
+
+
+def get_ivfflat_default_lists(row_count: int) -> int:
+    if row_count > IVFFLAT_SQRT_THRESHOLD:
+        return int(math.sqrt(row_count))
+    return max(1, row_count // IVFFLAT_ROWS_PER_LIST)
+
+
+def build_create_index_sql(config: VectorIndexConfig, lists: int = None, concurrently: bool = False) -> str:
+    check_index_type(config.index_type)
+    if config.index_type == INDEX_TYPE_HNSW:
+        parameters = f"m = {int(config.m)}, ef_construction = {int(config.ef_construction)}"
+    else:
+        parameters = f"lists = {int(lists or config.lists)}"
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{VECTOR_INDEX_NAME} ON {FileChunk.__tablename__} "
+        f"USING {config.index_type} (embedding {VECTOR_INDEX_OPS}) WITH ({parameters})"
+    )
+
+
+def execute_index_statement(session: Session, sql: str, concurrently: bool = False):
+    """
+    Las sentencias CONCURRENTLY no se pueden ejecutar dentro de una transacción, se lanzan en una conexión en
+    autocommit. El resto se ejecutan en la transacción de la sesión y se confirman.
+    """
+    if concurrently:
+        with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(sql))
+    else:
+        session.execute(text(sql))
+        session.commit()
+
+
+def get_vector_index_info(session: Session) -> Optional[dict]:
+    """
+    Tipo, parámetros y tamaño del índice, o None si no existe
+    """
+    row = session.execute(
+        text("SELECT indexdef, pg_relation_size(indexname::regclass) FROM pg_indexes WHERE indexname = :name"),
+        {"name": VECTOR_INDEX_NAME}
+    ).first()
+    if row is None:
+        return None
+    index_definition, size_bytes = row
+    index_type = re.search(r"USING (\w+)", index_definition).group(1)
+    parameters = re.search(r"WITH \((.*)\)", index_definition)
+    return {
+        "name": VECTOR_INDEX_NAME,
+        "index_type": index_type,
+        "parameters": dict(
+            (key.strip(), int(value.strip().strip("'"))) for key, value in
+            (parameter.split("=") for parameter in parameters.group(1).split(","))
+        ) if parameters else {},
+        "size_bytes": size_bytes
+    }
+
+
+def drop_vector_index(session: Session, concurrently: bool = False):
+    execute_index_statement(
+        session, f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {VECTOR_INDEX_NAME}", concurrently
+    )
+
+
+def create_vector_index(session: Session, config: VectorIndexConfig = None, concurrently: bool = False) -> Optional[dict]:
+    """
+    Crea el índice con los parámetros indicados, sustituyendo el existente. Con el tipo none solo se borra.
+    Devuelve la información del índice creado.
+    """
+    config = config or VectorIndexConfig()
+    check_index_type(config.index_type)
+    drop_vector_index(session, concurrently)
+    if config.index_type == INDEX_TYPE_NONE:
+        return None
+
+    lists = None
+    if config.index_type == INDEX_TYPE_IVFFLAT and not config.lists:
+        embeddings = session.execute(
+            select(func.count()).select_from(FileChunk).where(FileChunk.embedding.is_not(None))
+        ).scalar_one()
+        lists = get_ivfflat_default_lists(embeddings)
+    execute_index_statement(session, build_create_index_sql(config, lists, concurrently), concurrently)
+    return get_vector_index_info(session)
+
+
+def rebuild_vector_index(session: Session, concurrently: bool = False) -> Optional[dict]:
+    """
+    Reconstruye el índice con sus parámetros actuales, por ejemplo para volver a entrenar las listas de ivfflat
+    después de añadir muchos embeddings
+    """
+    if get_vector_index_info(session) is None:
+        raise ValueError(f"No existe el índice {VECTOR_INDEX_NAME}")
+    execute_index_statement(
+        session, f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}{VECTOR_INDEX_NAME}", concurrently
+    )
+    return get_vector_index_info(session)
+
+
+def ensure_vector_index(session: Session, config: VectorIndexConfig = None) -> Optional[dict]:
+    """
+    Crea el índice configurado si no existe. Si ya existe no se modifica aunque cambien los parámetros, para cambiarlos
+    hay que usar create_vector_index.
+    """
+    config = config or VectorIndexConfig()
+    if session.get_bind().dialect.name != "postgresql" or config.index_type == INDEX_TYPE_NONE:
+        return None
+    index_info = get_vector_index_info(session)
+    if index_info is None:
+        index_info = create_vector_index(session, config)
+        print(f"Creado el índice vectorial {index_info}")
+    elif index_info["index_type"] != config.index_type:
+        print(f"El índice vectorial es de tipo {index_info['index_type']} y se ha configurado {config.index_type}, "
+              f"se mantiene el existente")
+    return index_info
+
+
+def set_vector_search_parameters(session: Session, parameters: VectorSearchParameters = None):
+    """
+    Fija ef_search y probes para las consultas de la transacción actual
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    parameters = parameters or VectorSearchParameters()
+    session.execute(text(f"SET LOCAL hnsw.ef_search = {int(parameters.ef_search)}"))
+    session.execute(text(f"SET LOCAL ivfflat.probes = {int(parameters.probes)}"))
+
+
+def set_exact_vector_search(session: Session, exact: bool):
+    """
+    Desactiva los escaneos por índice en la transacción actual para forzar la búsqueda exacta
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    session.execute(text(f"SET LOCAL enable_indexscan = {'off' if exact else 'on'}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestiona el índice vectorial de file_chunks.embedding")
+    parser.add_argument("action", choices=["create", "rebuild", "drop", "info"])
+    parser.add_argument("--type", choices=VECTOR_INDEX_TYPES, default=VECTOR_INDEX_TYPE)
+    parser.add_argument("--m", type=int, default=VECTOR_INDEX_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=VECTOR_INDEX_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=VECTOR_INDEX_IVFFLAT_LISTS)
+    parser.add_argument("--concurrently", action="store_true", help="Sin bloquear las escrituras en file_chunks")
+    args = parser.parse_args()
+
+    session = DBConnection.get_session()
+    try:
+        if args.action == "create":
+            config = VectorIndexConfig(index_type=args.type, m=args.m, ef_construction=args.ef_construction,
+                                       lists=args.lists)
+            print(f"Creando índice {asdict(config)}")
+            result = create_vector_index(session, config, args.concurrently)
+        elif args.action == "rebuild":
+            result = rebuild_vector_index(session, args.concurrently)
+        elif args.action == "drop":
+            result = drop_vector_index(session, args.concurrently)
+        else:
+            result = get_vector_index_info(session)
+        print(json.dumps(result, indent=2))
+    finally:
+        DBConnection.close_current_session()
+
+
+if __name__ == "__main__":
+    main()
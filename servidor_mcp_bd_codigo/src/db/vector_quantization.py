@@ -0,0 +1,280 @@
+import argparse
+import json
+from dataclasses import dataclass
+from typing import Optional, List
+
+from pgvector.sqlalchemy import HALFVEC, BIT
+from sqlalchemy import text, literal, cast, literal_column, func
+from sqlalchemy.orm import Session
+
+from config import VECTOR_QUANTIZATION, VECTOR_INDEX_HNSW_M, VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+from src.db.db_connection import DBConnection
+from src.db.models import FileChunk, EMBEDDING_DIMENSION
+from src.db.vector_index import execute_index_statement
+
+"""
+Representaciones compactas de file_chunks.embedding para la búsqueda en dos fases.
+
+Los embeddings completos (vector de float32, 6 KB por chunk con 1536 dimensiones) hacen que la tabla y el grafo HNSW
+sean grandes y poco cacheables. Se puede añadir una columna generada con una versión compacta del embedding y su
+índice:
+
+- halfvec: float16, la mitad de tamaño y casi el mismo orden de los vecinos. Necesita pgvector >= 0.7.
+- binary: un bit por dimensión (1 si es positiva), 32 veces más pequeño, comparado con la distancia de Hamming. Con
+  pgvector >= 0.7 se usa binary_quantize y un índice HNSW bit_hamming_ops. Con versiones anteriores se cuantiza con
+  una función SQL y no hay índice: la primera fase recorre la columna de bits, mucho más pequeña que los embeddings.
+
+La búsqueda aproximada del planificador pide a la columna compacta rerank_factor veces más candidatos y los reordena con
+la distancia coseno de los embeddings completos, que solo se leen para esos candidatos.
+
+Añadir la columna reescribe la tabla, en índices grandes es mejor hacerlo fuera de las horas de uso.
+
+Uso:
+    python -m src.db.vector_quantization enable --quantization binary
+    python -m src.db.vector_quantization disable --quantization binary
+    python -m src.db.vector_quantization info
+"""
+
+QUANTIZATION_NONE = "none"
+QUANTIZATION_HALFVEC = "halfvec"
+QUANTIZATION_BINARY = "binary"
+QUANTIZATIONS = [QUANTIZATION_NONE, QUANTIZATION_HALFVEC, QUANTIZATION_BINARY]
+COMPACT_QUANTIZATIONS = [QUANTIZATION_HALFVEC, QUANTIZATION_BINARY]
+QUANTIZATION_COLUMNS = {
+    QUANTIZATION_HALFVEC: "embedding_halfvec",
+    QUANTIZATION_BINARY: "embedding_binary"
+}
+QUANTIZATION_INDEX_NAMES = {
+    QUANTIZATION_HALFVEC: "ix_file_chunks_embedding_halfvec_ann",
+    QUANTIZATION_BINARY: "ix_file_chunks_embedding_binary_ann"
+}
+QUANTIZATION_INDEX_OPS = {
+    QUANTIZATION_HALFVEC: "halfvec_cosine_ops",
+    QUANTIZATION_BINARY: "bit_hamming_ops"
+}
+# Versión de pgvector con halfvec, binary_quantize y el operador <~> indexable sobre bit
+NATIVE_QUANTIZATION_PGVECTOR_VERSION = (0, 7, 0)
+BINARY_QUANTIZE_FUNCTION = "file_chunks_binary_quantize"
+
+
+@dataclass
+class VectorQuantization:
+    quantization: str
+    # Con pgvector < 0.7 la distancia de Hamming se calcula con bit_count, sin índice
+    native: bool = True
+
+    @property
+    def column(self) -> str:
+        return QUANTIZATION_COLUMNS[self.quantization]
+
+    def __str__(self):
+        return self.quantization if self.native else f"{self.quantization} sin índice"
+
+
+def check_quantization(quantization: str):
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Cuantización no soportada: {quantization}, tipos: {QUANTIZATIONS}")
+
+
+def get_pgvector_version(session: Session) -> tuple:
+    version = session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar_one()
+    return tuple(int(part) for part in version.split("."))
+
+
+def has_native_quantization(session: Session) -> bool:
+    return get_pgvector_version(session) >= NATIVE_QUANTIZATION_PGVECTOR_VERSION
+
+
+def get_binary_quantize_function_sql() -> str:
+    """
+    Equivalente de binary_quantize para pgvector < 0.7. Es IMMUTABLE para poder usarla en la columna generada
+    """
+    return (
+        f"CREATE OR REPLACE FUNCTION {BINARY_QUANTIZE_FUNCTION}(embedding vector) RETURNS bit({EMBEDDING_DIMENSION}) "
+        f"LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ "
+        f"SELECT string_agg(CASE WHEN value > 0 THEN '1' ELSE '0' END, '' ORDER BY position)::bit({EMBEDDING_DIMENSION}) "
+        f"FROM unnest(embedding::real[]) WITH ORDINALITY AS dimensions(value, position) $$"
+    )
+
+
+def get_quantization_expression(quantization: str, native: bool) -> str:
+    if quantization == QUANTIZATION_HALFVEC:
+        return f"embedding::halfvec({EMBEDDING_DIMENSION})"
+    if native:
+        return f"binary_quantize(embedding)::bit({EMBEDDING_DIMENSION})"
+    return f"{BINARY_QUANTIZE_FUNCTION}(embedding)"
+
+
+def build_add_quantization_column_sql(quantization: str, native: bool) -> str:
+    column_type = f"halfvec({EMBEDDING_DIMENSION})" if quantization == QUANTIZATION_HALFVEC \
+        else f"bit({EMBEDDING_DIMENSION})"
+    return (
+        f"ALTER TABLE {FileChunk.__tablename__} ADD COLUMN IF NOT EXISTS {QUANTIZATION_COLUMNS[quantization]} "
+        f"{column_type} GENERATED ALWAYS AS ({get_quantization_expression(quantization, native)}) STORED"
+    )
+
+
+def build_create_quantization_index_sql(quantization: str, m: int = VECTOR_INDEX_HNSW_M,
+                                        ef_construction: int = VECTOR_INDEX_HNSW_EF_CONSTRUCTION) -> str:
+    return (
+        f"CREATE INDEX IF NOT EXISTS {QUANTIZATION_INDEX_NAMES[quantization]} ON {FileChunk.__tablename__} "
+        f"USING hnsw ({QUANTIZATION_COLUMNS[quantization]} {QUANTIZATION_INDEX_OPS[quantization]}) "
+        f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    )
+
+
+def get_binary_query_bits(query_embedding) -> str:
+    """
+    Bits de la consulta con el mismo criterio que la columna binaria
+    """
+    return "".join("1" if value > 0 else "0" for value in query_embedding)
+
+
+def get_compact_query(quantization: str, query_embedding):
+    """
+    Embedding de la consulta convertido al tipo de la columna compacta
+    """
+    if quantization == QUANTIZATION_HALFVEC:
+        halfvec_type = HALFVEC(EMBEDDING_DIMENSION)
+        return cast(literal(query_embedding, halfvec_type), halfvec_type)
+    bit_type = BIT(EMBEDDING_DIMENSION)
+    return cast(literal(get_binary_query_bits(query_embedding), bit_type), bit_type)
+
+
+def get_compact_distance(quantization: VectorQuantization, compact_query, table_name: str = FileChunk.__tablename__):
+    """
+    Distancia de la primera fase entre la columna compacta de la tabla (o su alias) y la consulta ya convertida
+    """
+    if quantization.quantization == QUANTIZATION_HALFVEC:
+        column = literal_column(f"{table_name}.{quantization.column}", HALFVEC(EMBEDDING_DIMENSION))
+        return column.cosine_distance(compact_query)
+    column = literal_column(f"{table_name}.{quantization.column}", BIT(EMBEDDING_DIMENSION))
+    if quantization.native:
+        return column.hamming_distance(compact_query)
+    return func.bit_count(column.op("#")(compact_query))
+
+
+def has_quantization_column(session: Session, quantization: str) -> bool:
+    return session.execute(
+        text("SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        {"table": FileChunk.__tablename__, "column": QUANTIZATION_COLUMNS[quantization]}
+    ).first() is not None
+
+
+def get_vector_quantization(session: Session, quantization: str) -> Optional[VectorQuantization]:
+    """
+    Cuantización con la que buscar, o None si no está configurada o no se ha creado su columna
+    """
+    check_quantization(quantization)
+    if quantization == QUANTIZATION_NONE or session.get_bind().dialect.name != "postgresql" \
+            or not has_quantization_column(session, quantization):
+        return None
+    return VectorQuantization(quantization, has_native_quantization(session))
+
+
+def get_quantization_info(session: Session) -> List[dict]:
+    """
+    Tamaño de los embeddings completos y de cada columna compacta creada, con su índice
+    """
+    table = FileChunk.__tablename__
+    info = [{
+        "quantization": QUANTIZATION_NONE,
+        "column": "embedding",
+        "column_bytes": session.execute(text(f"SELECT coalesce(sum(pg_column_size(embedding)), 0) FROM {table}"))
+        .scalar_one(),
+        "table_bytes": session.execute(text(f"SELECT pg_total_relation_size('{table}')")).scalar_one()
+    }]
+    for quantization in COMPACT_QUANTIZATIONS:
+        if not has_quantization_column(session, quantization):
+            continue
+        column = QUANTIZATION_COLUMNS[quantization]
+        index_name = QUANTIZATION_INDEX_NAMES[quantization]
+        info.append({
+            "quantization": quantization,
+            "column": column,
+            "column_bytes": session.execute(text(f"SELECT coalesce(sum(pg_column_size({column})), 0) FROM {table}"))
+            .scalar_one(),
+            "index": index_name,
+            "index_bytes": session.execute(
+                text("SELECT pg_relation_size(indexname::regclass) FROM pg_indexes WHERE indexname = :name"),
+                {"name": index_name}
+            ).scalar()
+        })
+    return info
+
+
+def enable_vector_quantization(session: Session, quantization: str, m: int = VECTOR_INDEX_HNSW_M,
+                               ef_construction: int = VECTOR_INDEX_HNSW_EF_CONSTRUCTION) -> VectorQuantization:
+    """
+    Crea la columna compacta y, si la versión de pgvector lo permite, su índice HNSW. Si ya existen no se modifican
+    """
+    check_quantization(quantization)
+    if quantization == QUANTIZATION_NONE:
+        raise ValueError("Indica la cuantización a crear")
+    native = has_native_quantization(session)
+    if quantization == QUANTIZATION_HALFVEC and not native:
+        raise ValueError(f"halfvec necesita pgvector >= "
+                         f"{'.'.join(map(str, NATIVE_QUANTIZATION_PGVECTOR_VERSION))}, "
+                         f"versión instalada: {'.'.join(map(str, get_pgvector_version(session)))}")
+    if quantization == QUANTIZATION_BINARY and not native:
+        execute_index_statement(session, get_binary_quantize_function_sql())
+    execute_index_statement(session, build_add_quantization_column_sql(quantization, native))
+    if native:
+        execute_index_statement(session, build_create_quantization_index_sql(quantization, m, ef_construction))
+    session.execute(text(f"ANALYZE {FileChunk.__tablename__}"))
+    session.commit()
+    return VectorQuantization(quantization, native)
+
+
+def disable_vector_quantization(session: Session, quantization: str):
+    """
+    Borra la columna compacta, con ella se borra su índice
+    """
+    check_quantization(quantization)
+    if quantization == QUANTIZATION_NONE:
+        return
+    execute_index_statement(
+        session, f"ALTER TABLE {FileChunk.__tablename__} DROP COLUMN IF EXISTS {QUANTIZATION_COLUMNS[quantization]}"
+    )
+    if quantization == QUANTIZATION_BINARY:
+        execute_index_statement(session, f"DROP FUNCTION IF EXISTS {BINARY_QUANTIZE_FUNCTION}(vector)")
+
+
+def ensure_vector_quantization(session: Session, quantization: str = VECTOR_QUANTIZATION) -> Optional[VectorQuantization]:
+    """
+    Crea la columna de la cuantización configurada si no existe
+    """
+    check_quantization(quantization)
+    if session.get_bind().dialect.name != "postgresql" or quantization == QUANTIZATION_NONE:
+        return None
+    vector_quantization = get_vector_quantization(session, quantization)
+    if vector_quantization is None:
+        vector_quantization = enable_vector_quantization(session, quantization)
+        print(f"Creada la columna de embeddings compactos {vector_quantization}")
+    return vector_quantization
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestiona las columnas compactas de file_chunks.embedding")
+    parser.add_argument("action", choices=["enable", "disable", "info"])
+    parser.add_argument("--quantization", choices=COMPACT_QUANTIZATIONS, default=QUANTIZATION_BINARY)
+    parser.add_argument("--m", type=int, default=VECTOR_INDEX_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=VECTOR_INDEX_HNSW_EF_CONSTRUCTION)
+    args = parser.parse_args()
+
+    session = DBConnection.get_session()
+    try:
+        if args.action == "enable":
+            print(f"Creando columna {args.quantization}")
+            result = str(enable_vector_quantization(session, args.quantization, args.m, args.ef_construction))
+        elif args.action == "disable":
+            result = disable_vector_quantization(session, args.quantization)
+        else:
+            result = get_quantization_info(session)
+        print(json.dumps(result, indent=2))
+    finally:
+        DBConnection.close_current_session()
+
+
+if __name__ == "__main__":
+    main()
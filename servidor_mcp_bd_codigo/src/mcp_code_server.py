@@ -1,28 +1,32 @@
 from dotenv import load_dotenv
 load_dotenv(dotenv_path="../.env")
 
-from src.utils.llm_strings_formatter import format_retrieved_chunks_into_string
+from src.utils.llm_strings_formatter import format_retrieved_chunks_into_string, format_grouped_chunks_into_string, \
+    format_symbols_into_string
 
-import os.path
+import asyncio
+import json
 from mcp.server.fastmcp import FastMCP
 from mcp.types import CallToolResult, TextContent
-from config import REPO_ROOT_ABSOLUTE_PATH, MAX_CHUNKS, MAX_REFERENCED_CHUNKS, MAX_REFERENCING_CHUNKS
-from src.db.db_connection import DBConnection
-from src.mcp_tools import get_code_repository_rag_docs_from_query, get_code_from_repository_file, get_all_files_list
-from src.utils.proyect_tree import generate_repo_tree_str
-
-from src.pg_vector_tools import PGVectorTools
+from config import MAX_CHUNKS, MAX_REFERENCED_CHUNKS, MAX_REFERENCING_CHUNKS, \
+    REPOSITORY_TREE_TOKEN_BUDGET
+from src.db.db_connection import DBConnection, AsyncDBConnection
+from src.db.async_code_index import AsyncCodeIndex
+from src.db.hybrid_search import ensure_search_vector
+from src.db.vector_index import ensure_vector_index
+from src.db.vector_quantization import ensure_vector_quantization
 
 db_session = DBConnection.get_session()
 mcp = FastMCP("postgre")
-pgvector_tools = PGVectorTools(db_session=db_session)
+# Las herramientas usan sesiones asíncronas del pool para atender llamadas simultáneas sin bloquear el event loop
+code_index = AsyncCodeIndex()
 
 def get_prueba_base_datos():
     return "query base de datos"
 
 
 @mcp.tool()
-async def get_code_repository_rag_docs_from_query_tool(query: str, directory: str = None) -> TextContent:
+async def get_code_repository_rag_docs_from_query_tool(query: str, directory: str = None, ref: str = None) -> TextContent:
     """
     Returns chunks of code from the repository subdirectory that are similar or relevant to the provided query.
 
@@ -30,6 +34,8 @@ async def get_code_repository_rag_docs_from_query_tool(query: str, directory: st
     :param directory: Subdirectory where to perform the search. The search runs recursively,
                  including all files in this directory and at any level of subdirectories
                  within it. If None, the repository root directory will be used.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
     :return: dictionary with the following structure:
         {
             "chunk_id": chunk_id,
@@ -40,11 +46,10 @@ async def get_code_repository_rag_docs_from_query_tool(query: str, directory: st
         }
     """
 
-    json_response = get_code_repository_rag_docs_from_query(
+    json_response = await code_index.search_chunks_response(
         query=query,
-        directory=directory,
-        db_session=db_session,
-        pgvector_tools=pgvector_tools
+        directory_path=directory,
+        ref=ref
     )
     pretty_response = format_retrieved_chunks_into_string(json_response)
     return TextContent(
@@ -54,11 +59,40 @@ async def get_code_repository_rag_docs_from_query_tool(query: str, directory: st
 
 
 @mcp.tool()
-async def get_file_from_repository_tool(file_path: str) -> TextContent:
+async def get_code_repository_rag_docs_from_queries_tool(queries: list[str], directory: str = None,
+                                                         ref: str = None) -> TextContent:
+    """
+    Runs several related searches at once, faster than calling get_code_repository_rag_docs_from_query_tool
+    once per query. Returns the chunks of code similar or relevant to each query, grouped by query. A chunk relevant to
+    several queries is only returned once, under the query where it ranks best.
+
+    :param queries: List of related queries to search for in the code repository.
+    :param directory: Subdirectory where to perform the searches, recursively. If None, the repository root directory
+                 will be used.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
+    :return: for each query, the chunks with the same structure as get_code_repository_rag_docs_from_query_tool
+    """
+    response = await code_index.search_multi_query_response(
+        queries=queries,
+        directory_path=directory,
+        ref=ref
+    )
+    pretty_response = format_grouped_chunks_into_string(response)
+    return TextContent(
+        text=pretty_response,
+        type='text'
+    )
+
+
+@mcp.tool()
+async def get_file_from_repository_tool(file_path: str, ref: str = None) -> TextContent:
     """
     Returns all the chunks associated with a file in the repository.
     It also includes chunks that reference and are referenced by these chunks.
     :param file_path: The relative path to the file in the repository, from the repository root.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
     :return: dictionary with the following structure:
         {
             "chunk_id": chunk_id,
@@ -68,10 +102,9 @@ async def get_file_from_repository_tool(file_path: str) -> TextContent:
             "referencing chunks": list of chunks that are referenced by this chunk
         }
     """
-    response = get_code_from_repository_file(
+    response = await code_index.get_file_chunks_response(
         file_path=file_path,
-        db_session=db_session,
-        pgvector_tools=pgvector_tools
+        ref=ref
     )
     pretty_response = format_retrieved_chunks_into_string(response)
     return TextContent(
@@ -80,32 +113,121 @@ async def get_file_from_repository_tool(file_path: str) -> TextContent:
     )
 
 @mcp.tool()
-async def get_repository_tree_tool(sub_path: str = None) -> TextContent:
+async def get_definition_tool(name: str, directory: str = None, ref: str = None) -> TextContent:
+    """
+    Returns where a class, function or method is defined and its code. Much faster than a search when the name of
+    the symbol is known. If there is no symbol with that exact name, the symbols whose name contains it are returned.
+    :param name: Name of the symbol. Methods can be qualified with their class: Class.method or Class::method.
+    :param directory: Subdirectory where to look for the definition, recursively. If None, the repository root
+                 directory will be used.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
+    :return: each definition with its kind, file path, lines and code.
+    """
+    response = await code_index.get_definition_response(
+        name=name,
+        directory_path=directory,
+        ref=ref
+    )
+    return TextContent(
+        text=format_symbols_into_string(name, response),
+        type='text'
+    )
+
+
+@mcp.tool()
+async def find_references_tool(name: str, directory: str = None, ref: str = None) -> TextContent:
+    """
+    Returns the places where a function or method is called, with the line of each call.
+    :param name: Name of the function or method. A class qualifier (Class.method) is ignored, calls are matched by
+                 name.
+    :param directory: Subdirectory where to look for references, recursively. If None, the repository root
+                 directory will be used.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
+    :return: each call with its file path, line and code.
+    """
+    response = await code_index.find_references_response(
+        name=name,
+        directory_path=directory,
+        ref=ref
+    )
+    return TextContent(
+        text=format_symbols_into_string(name, response),
+        type='text'
+    )
+
+
+@mcp.tool()
+async def get_repository_tree_tool(sub_path: str = None, max_depth: int = None, max_tokens: int = None,
+                                   ref: str = None) -> TextContent:
     """
     Returns a tree of the files and directories in the repository.
+    Directories that do not fit in the size limit are collapsed into a single line with their number of files and
+    subdirectories; call the tool again with their path as sub_path to expand them.
     :param sub_path:
         The sub-path directory to list, relative to the repository root.
         If not indicated, the root directory is listed.
+    :param max_depth: Maximum number of directory levels to expand. If None, there is no depth limit.
+    :param max_tokens: Approximate maximum size of the tree in tokens. If None, the server default is used.
+    :param ref: Git branch or tag to list, if the repository has been indexed from several refs.
+                If None, the default index is used.
     :return: String representation of the tree.
     """
-
-    if sub_path is None:
-        sub_path = REPO_ROOT_ABSOLUTE_PATH
-    else:
-        sub_path = os.path.join(REPO_ROOT_ABSOLUTE_PATH, sub_path)
-
-    repo_tree_str = generate_repo_tree_str(sub_path)
+    repo_tree_str = await code_index.get_repository_tree(
+        sub_path=sub_path,
+        ref=ref,
+        max_depth=max_depth,
+        max_tokens=max_tokens or REPOSITORY_TREE_TOKEN_BUDGET
+    )
     return TextContent(
         text=repo_tree_str,
         type='text'
     )
 
 @mcp.tool()
-async def get_all_respository_files_list() -> TextContent:
+async def list_repository_files_tool(prefix: str = None, glob: str = None, cursor: str = None, page_size: int = None,
+                                     group_by_directory: bool = False, ref: str = None) -> TextContent:
+    """
+    Lists the repository files one page at a time, as JSON. Use the filters instead of listing the whole repository.
+    :param prefix: Only files whose path, relative to the repository root, starts with this text (case-sensitive),
+                   e.g. "src/db/".
+    :param glob: Only files whose path matches this glob pattern. * and ? do not match "/", ** matches any number of
+                 directories. A pattern without "/" is matched against the file name, e.g. "*.py" or "src/**/test_*.py".
+    :param cursor: The next_cursor returned by the previous call, to get the next page. If None, the first page.
+    :param page_size: Maximum number of files (or directories) in the page. If None, the server default is used.
+    :param group_by_directory: If True, returns the number of matching files in each directory instead of the paths.
+    :param ref: Git branch or tag to list, if the repository has been indexed from several refs.
+                If None, the default index is used.
+    :return: JSON with the structure:
+        {
+            "files": list of file paths relative to the repository root, sorted,
+            "directories": with group_by_directory, list of {"path": directory path, "files": number of files},
+            "total": number of files that match the filters, only in the first page (without cursor),
+            "next_cursor": cursor for the next page, null if this is the last page
+        }
+    """
+    response = await code_index.list_files(
+        prefix=prefix,
+        glob=glob,
+        ref=ref,
+        cursor=cursor,
+        page_size=page_size,
+        group_by_directory=group_by_directory
+    )
+    return TextContent(
+        text=json.dumps(response, ensure_ascii=False),
+        type='text'
+    )
+
+
+@mcp.tool()
+async def get_all_respository_files_list(ref: str = None) -> TextContent:
     """
     Devuelve una lista en formato string serializable a JSON de todos los ficheros en el repositorio respecto a su ruta relativa
+    :param ref: Rama o tag de git del que listar los ficheros, si no se indica los del índice por defecto
     """
-    files_list = get_all_files_list(db_session=db_session)
+    files_list = await code_index.get_all_file_paths(ref=ref)
     files_list_str=str(files_list)
     return TextContent(
         text=files_list_str,
@@ -113,10 +235,25 @@ async def get_all_respository_files_list() -> TextContent:
     )
 
 
+async def run_server():
+    """
+    Ejecuta el servidor SSE y, al pararlo, cierra el pool asíncrono en el mismo event loop en el que se crearon sus
+    conexiones
+    """
+    try:
+        await mcp.run_sse_async()
+    finally:
+        await AsyncDBConnection.dispose()
+
+
 if __name__ == "__main__":
     try:
+        ensure_search_vector(db_session)
+        ensure_vector_index(db_session)
+        ensure_vector_quantization(db_session)
+        code_index.path_cache.load(db_session)
         print("Starting MCP server...")
-        mcp.run(transport='sse')
+        asyncio.run(run_server())
 
     finally:
         DBConnection.close_current_session()
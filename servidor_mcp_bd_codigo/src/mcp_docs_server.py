@@ -3,22 +3,23 @@ load_dotenv(dotenv_path="../.env")
 
 from utils.llm_strings_formatter import format_retrieved_chunks_into_string
 
+import asyncio
 import os.path
 from mcp.server.fastmcp import FastMCP
 from mcp.types import CallToolResult, TextContent
 from config import REPO_ROOT_ABSOLUTE_PATH, MAX_CHUNKS, MAX_REFERENCED_CHUNKS, MAX_REFERENCING_CHUNKS
-from src.db.db_connection import DBConnection
-from mcp_tools import get_code_repository_rag_docs_from_query, get_code_from_repository_file, get_all_files_list
+from src.db.db_connection import DBConnection, AsyncDBConnection
+from src.db.async_code_index import AsyncCodeIndex
+from src.db.hybrid_search import ensure_search_vector
 from src.utils.proyect_tree import generate_repo_tree_str
 
-from src.pg_vector_tools import PGVectorTools
-
 db_session = DBConnection.get_session()
 mcp = FastMCP("postgre")
-pgvector_tools = PGVectorTools(db_session=db_session)
+# Las herramientas usan sesiones asíncronas del pool para atender llamadas simultáneas sin bloquear el event loop
+code_index = AsyncCodeIndex()
 
 @mcp.tool()
-async def get_docs_rag_from_query(query: str, directory: str = None) -> TextContent:
+async def get_docs_rag_from_query(query: str, directory: str = None, ref: str = None) -> TextContent:
     """
     Returns chunks of documentation from the repository subdirectory that are similar or relevant to the provided query.
 
@@ -26,6 +27,8 @@ async def get_docs_rag_from_query(query: str, directory: str = None) -> TextCont
     :param directory: Subdirectory where to perform the search. The search runs recursively,
                  including all files in this directory and at any level of subdirectories
                  within it. If None, the repository root directory will be used.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
     :return: dictionary with the following structure:
         {
             "chunk_id": chunk_id,
@@ -36,11 +39,10 @@ async def get_docs_rag_from_query(query: str, directory: str = None) -> TextCont
         }
     """
 
-    json_response = get_code_repository_rag_docs_from_query(
+    json_response = await code_index.search_chunks_response(
         query=query,
-        directory=directory,
-        db_session=db_session,
-        pgvector_tools=pgvector_tools
+        directory_path=directory,
+        ref=ref
     )
     pretty_response = format_retrieved_chunks_into_string(json_response)
     return TextContent(
@@ -50,11 +52,13 @@ async def get_docs_rag_from_query(query: str, directory: str = None) -> TextCont
 
 
 @mcp.tool()
-async def get_file_from_docs(file_path: str) -> TextContent:
+async def get_file_from_docs(file_path: str, ref: str = None) -> TextContent:
     """
     Returns all the chunks associated with a file in the repository.
     It also includes chunks that reference and are referenced by these chunks.
     :param file_path: The relative path to the file in the repository, from the repository root.
+    :param ref: Git branch or tag to search in, if the repository has been indexed from several refs.
+                If None, the default index is used.
     :return: dictionary with the following structure:
         {
             "chunk_id": chunk_id,
@@ -64,10 +68,9 @@ async def get_file_from_docs(file_path: str) -> TextContent:
             "referencing chunks": list of chunks that are referenced by this chunk
         }
     """
-    response = get_code_from_repository_file(
+    response = await code_index.get_file_chunks_response(
         file_path=file_path,
-        db_session=db_session,
-        pgvector_tools=pgvector_tools
+        ref=ref
     )
     pretty_response = format_retrieved_chunks_into_string(response)
     return TextContent(
@@ -90,7 +93,7 @@ async def get_docs_repository_tree(sub_path: str = None) -> TextContent:
     else:
         sub_path = os.path.join(REPO_ROOT_ABSOLUTE_PATH, sub_path)
 
-    repo_tree_str = generate_repo_tree_str(sub_path)
+    repo_tree_str = await asyncio.to_thread(generate_repo_tree_str, sub_path)
     return TextContent(
         text=repo_tree_str,
         type='text'
@@ -101,7 +104,7 @@ async def get_all_respository_files_list() -> TextContent:
     """
     Devuelve una lista en formato string serializable a JSON de todos los ficheros en el repositorio respecto a su ruta relativa
     """
-    files_list = get_all_files_list(db_session=db_session)
+    files_list = await code_index.get_all_file_paths()
     files_list_str=str(files_list)
     return TextContent(
         text=files_list_str,
@@ -109,10 +112,22 @@ async def get_all_respository_files_list() -> TextContent:
     )
 
 
+async def run_server():
+    """
+    Ejecuta el servidor SSE y, al pararlo, cierra el pool asíncrono en el mismo event loop en el que se crearon sus
+    conexiones
+    """
+    try:
+        await mcp.run_sse_async()
+    finally:
+        await AsyncDBConnection.dispose()
+
+
 if __name__ == "__main__":
     try:
+        ensure_search_vector(db_session)
         print("Starting MCP server...")
-        mcp.run(transport='sse')
+        asyncio.run(run_server())
 
     finally:
         DBConnection.close_current_session()
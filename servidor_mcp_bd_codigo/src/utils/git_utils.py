@@ -0,0 +1,90 @@
+import subprocess
+from dataclasses import dataclass
+from typing import List
+
+from config import MAX_LINE_LENGTH
+
+"""
+Lectura de ficheros directamente desde los objetos de git (árboles y blobs), sin necesidad de hacer checkout de cada
+rama en un directorio de trabajo.
+"""
+
+GIT_SYMLINK_MODE = "120000"
+
+
+@dataclass
+class GitTreeBlob:
+    path: str
+    blob_sha: str
+    size_bytes: int
+
+
+def run_git_command(repo_path: str, *args: str, input_bytes: bytes = None) -> bytes:
+    result = subprocess.run(
+        ["git", "-C", repo_path, *args],
+        input=input_bytes,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)}: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+    return result.stdout
+
+
+def resolve_git_commit(repo_path: str, ref: str) -> str:
+    return run_git_command(repo_path, "rev-parse", "--verify", f"{ref}^{{commit}}").decode("utf-8").strip()
+
+
+def list_git_tree_blobs(repo_path: str, commit_sha: str) -> List[GitTreeBlob]:
+    """
+    Devuelve los ficheros del commit ordenados por ruta. Se omiten los submódulos y los enlaces simbólicos.
+    """
+    output = run_git_command(repo_path, "ls-tree", "-r", "-l", "-z", "--full-tree", commit_sha)
+    blobs = []
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        # formato: <modo> <tipo> <sha> <tamaño>\t<ruta>
+        entry_info, path = entry.split(b"\t", 1)
+        mode, object_type, blob_sha, size_bytes = entry_info.decode("utf-8").split()
+        if object_type != "blob" or mode == GIT_SYMLINK_MODE:
+            continue
+        blobs.append(GitTreeBlob(path=path.decode("utf-8"), blob_sha=blob_sha, size_bytes=int(size_bytes)))
+    blobs.sort(key=lambda blob: blob.path)
+    return blobs
+
+
+def read_git_blobs(repo_path: str, blob_shas: List[str]) -> dict[str, bytes]:
+    """
+    Lee varios blobs con un único proceso git cat-file --batch
+    """
+    if not blob_shas:
+        return {}
+    output = run_git_command(repo_path, "cat-file", "--batch", input_bytes="\n".join(blob_shas).encode("utf-8") + b"\n")
+
+    blobs = {}
+    position = 0
+    for blob_sha in blob_shas:
+        # cabecera: <sha> <tipo> <tamaño>\n, seguida del contenido y un salto de línea
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].decode("utf-8").split()
+        if header[-1] == "missing":
+            raise RuntimeError(f"No existe el blob {blob_sha}")
+        size_bytes = int(header[2])
+        blobs[blob_sha] = output[header_end + 1:header_end + 1 + size_bytes]
+        position = header_end + 1 + size_bytes + 1
+    return blobs
+
+
+def decode_blob_text(blob_content: bytes) -> str:
+    """
+    Mismo resultado que get_file_text (saltos de línea universales y líneas truncadas) para que los números de línea
+    de los chunks coincidan
+    """
+    text = blob_content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    return "".join(line[:MAX_LINE_LENGTH] for line in text.splitlines(keepends=True))
+
+
+def get_git_blob_text(repo_path: str, blob_sha: str) -> str:
+    return decode_blob_text(read_git_blobs(repo_path, [blob_sha])[blob_sha])
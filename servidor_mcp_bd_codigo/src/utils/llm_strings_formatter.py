@@ -10,6 +10,7 @@ def format_retrieved_chunks_into_string(response: dict[int, dict]) -> str:
             "chunk_id": chunk_id,
             "chunk_content": chunk_content,
             "path": absolute path of the chunk's file,
+            "duplicate_paths": paths of the files with an identical chunk
             "referenced_chunks": list of chunks that reference this chunk
             "referencing chunks": list of chunks that are referenced by this chunk
         }
@@ -18,6 +19,8 @@ def format_retrieved_chunks_into_string(response: dict[int, dict]) -> str:
     for chunk_id, chunk in response.items():
         chunk_str = ""
         chunk_str += f"->Chunk {chunk_id} in file {chunk["path"]}:\n"
+        if chunk.get("duplicate_paths"):
+            chunk_str += f"Also found in: {", ".join(chunk["duplicate_paths"])}\n"
         chunk_str = apend_with_x_tab_to_text(chunk_str, chunk["chunk_content"], 1)
         formatted_string += chunk_str
         if chunk['referenced_chunks'] != {}:
@@ -37,6 +40,43 @@ def format_retrieved_chunks_into_string(response: dict[int, dict]) -> str:
         formatted_string += "\n\n"
 
     return formatted_string
-    
-    
-    
\ No newline at end of file
+
+
+def format_grouped_chunks_into_string(response: dict[str, dict[int, dict]]) -> str:
+    """
+    Formatea la respuesta de la búsqueda de varias consultas: los chunks de cada consulta con el formato de
+    format_retrieved_chunks_into_string bajo una cabecera con la consulta.
+    """
+    formatted_string = ""
+    for query, query_response in response.items():
+        formatted_string += f"### Results for query: {query}\n\n"
+        if query_response:
+            formatted_string += format_retrieved_chunks_into_string(query_response)
+        else:
+            formatted_string += "No new chunks, the relevant chunks are already included in previous queries.\n\n"
+    return formatted_string
+
+
+def format_symbols_into_string(name: str, response: list[dict]) -> str:
+    """
+    Formatea las definiciones o referencias encontradas de un símbolo. Formato de entrada por cada símbolo:
+        {
+            "name": name of the symbol, Class.method for methods,
+            "kind": class, function, method or reference,
+            "path": relative path of the symbol's file,
+            "start_line", "end_line": lines of the symbol, starting at 1,
+            "code": code of the symbol,
+            "truncated": whether the code has been cut
+        }
+    """
+    if not response:
+        return f"No symbols found for: {name}\n"
+    formatted_string = ""
+    for symbol in response:
+        symbol_str = f"->{symbol["kind"]} {symbol["name"]} in file {symbol["path"]}, " \
+                     f"lines {symbol["start_line"]}-{symbol["end_line"]}:\n"
+        code = symbol["code"]
+        if symbol["truncated"]:
+            code += "\n..."
+        formatted_string += apend_with_x_tab_to_text(symbol_str, code, 1) + "\n\n"
+    return formatted_string
@@ -1,8 +1,6 @@
-import contextlib
 from typing import List
 import os
 from treelib import Tree
-import io
 from config import TREE_STR_IGNORE_DIRS
 
 
@@ -91,13 +89,7 @@ def generate_repo_tree_str(repo_path: str):
         ignored_dirs=TREE_STR_IGNORE_DIRS,
         ignored_files=[]
     )
-    f = io.StringIO()
-    with contextlib.redirect_stdout(f):
-        tree.show()
-
-    repo_tree_str = f.getvalue()
-
-    return repo_tree_str
+    return tree.show(stdout=False)
 
 if __name__ == "__main__":
     target_path = "/home/martin/open_source/ia-core-tools/app/static/vendor"
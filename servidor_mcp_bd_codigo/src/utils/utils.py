@@ -55,6 +55,16 @@ def get_file_absolute_path_from_proyect_relative_path(relative_path: str, proyec
 def get_file_absolute_path_from_path(path: Path):
     return os.path.abspath(path)
 
+def write_file_atomically(path: str, text: str):
+    """
+    Escribe el fichero en un temporal y lo renombra, para que quien lo lea (por ejemplo el textfile collector de
+    Prometheus) no lo encuentre a medias
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
 def execute_and_stream_command(command: str):
     proceso = subprocess.Popen(
         command,
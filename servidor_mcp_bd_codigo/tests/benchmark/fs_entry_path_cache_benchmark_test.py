@@ -0,0 +1,13 @@
+from benchmarks.fs_entry_path_cache_benchmark import run_fs_entry_path_cache_benchmark
+
+
+def test_path_cache_matches_the_queries_and_is_faster(database_url):
+    report = run_fs_entry_path_cache_benchmark(database_url, num_packages=3, subpackages_per_package=2,
+                                               files_per_directory=5, num_lookups=30)
+
+    assert report["files"] == 45
+    for operation in report["operations"].values():
+        assert operation["matches"]
+        assert operation["trie"]["count"] == 30
+        # el trie no accede a la base de datos
+        assert operation["speedup"]["trie"] > 1
@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks.hybrid_search_evaluation import run_hybrid_search_evaluation, MODE_HYBRID_RRF
+from src.db.hybrid_search import SEARCH_MODE_VECTOR, SEARCH_MODE_LEXICAL, SEARCH_MODE_HYBRID
+
+
+@pytest.mark.requires_database
+def test_hybrid_search_evaluation_on_example_files(test_database_url):
+    report = run_hybrid_search_evaluation(test_database_url, k=3)
+
+    modes = report["modes"]
+    assert modes.keys() == {SEARCH_MODE_VECTOR, SEARCH_MODE_LEXICAL, MODE_HYBRID_RRF, SEARCH_MODE_HYBRID}
+    assert modes[SEARCH_MODE_HYBRID]["recall"] == 1.0
+    assert modes[SEARCH_MODE_HYBRID]["recall"] >= modes[SEARCH_MODE_VECTOR]["recall"]
+    assert modes[SEARCH_MODE_LEXICAL]["embedding_calls"] == 0
+    assert modes[SEARCH_MODE_VECTOR]["embedding_calls"] == report["queries"]
+    # las consultas de identificadores no calculan el embedding
+    assert modes[SEARCH_MODE_HYBRID]["embedding_calls"] < modes[MODE_HYBRID_RRF]["embedding_calls"]
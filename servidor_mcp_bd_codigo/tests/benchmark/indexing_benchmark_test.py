@@ -0,0 +1,30 @@
+import os
+
+from benchmarks.indexing_benchmark import run_indexing_benchmark, compare_reports
+from benchmarks.synthetic_repo import generate_synthetic_repo, parse_language_mix
+
+
+def test_parse_language_mix_normalizes_proportions():
+    assert parse_language_mix("python=3,java=1") == {"python": 0.75, "java": 0.25}
+
+
+def test_synthetic_repo_generation(tmp_path):
+    repo_path = generate_synthetic_repo(str(tmp_path / "repo"), num_files=12, language_mix="python=1,java=1",
+                                        files_per_directory=5)
+
+    generated_files = [f for d in os.listdir(repo_path) if d.startswith("package_") for f in os.listdir(os.path.join(repo_path, d))]
+    assert len(generated_files) == 12
+    assert os.path.exists(os.path.join(repo_path, "example_files", "PGVectorTools.py"))
+
+
+def test_indexing_benchmark_report(tmp_path):
+    repo_path = generate_synthetic_repo(str(tmp_path / "repo"), num_files=5, functions_per_file=3)
+
+    report = run_indexing_benchmark(repo_path)
+
+    assert report["chunking"]["chunks"] > 0
+    assert report["chunking"]["db_round_trips"] > 0
+    assert report["pipeline"]["llm_calls"] == report["pipeline"]["chunks"]
+    assert report["pipeline"]["stage_latencies"]["DocumentationGeneratorStage"]["count"] == report["pipeline"]["chunks"]
+    assert "ContextPreparationStage" in report["pipeline"]["stage_latencies"]
+    assert "chunking.chunks_per_second" in compare_reports(report, report)
@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.mcp_concurrency_benchmark import run_mcp_concurrency_benchmark, MODE_SYNC, MODE_ASYNC
+
+
+@pytest.mark.requires_database
+def test_mcp_concurrency_benchmark_async_throughput_scales(test_database_url):
+    report = run_mcp_concurrency_benchmark(
+        test_database_url,
+        num_chunks=200,
+        concurrency_levels=[1, 8],
+        num_calls=16,
+        embedding_latency=0.05
+    )
+
+    sync_results, async_results = report["modes"][MODE_SYNC], report["modes"][MODE_ASYNC]
+    assert [result["latency"]["count"] for result in sync_results + async_results] == [16] * 4
+    # Con la sesión síncrona las llamadas se atienden de una en una aunque lleguen a la vez
+    assert sync_results[1]["throughput"] < sync_results[0]["throughput"] * 1.5
+    assert async_results[1]["throughput"] > async_results[0]["throughput"] * 2
@@ -0,0 +1,21 @@
+import pytest
+
+from benchmarks.multi_query_benchmark import run_multi_query_benchmark, MODE_SEQUENTIAL, MODE_BATCHED
+
+
+@pytest.mark.requires_database
+def test_multi_query_benchmark_batched_faster_than_sequential(test_database_url):
+    report = run_multi_query_benchmark(
+        test_database_url,
+        num_chunks=300,
+        query_counts=[1, 4],
+        repetitions=3,
+        embedding_latency=0.05
+    )
+
+    single_query, four_queries = report["results"]
+    assert [result[mode]["count"] for result in report["results"] for mode in [MODE_SEQUENTIAL, MODE_BATCHED]] \
+        == [3] * 4
+    # Con varias consultas el lote ahorra las latencias del embedder y de las consultas de cada llamada
+    assert four_queries["speedup"] > 2
+    assert four_queries[MODE_BATCHED]["mean"] < single_query[MODE_SEQUENTIAL]["mean"] * 2
@@ -0,0 +1,13 @@
+from benchmarks.repository_tree_benchmark import run_repository_tree_benchmark
+
+
+def test_db_tree_matches_the_filesystem_tree(database_url):
+    report = run_repository_tree_benchmark(database_url, num_packages=3, subpackages_per_package=2, files_per_directory=5,
+                                           num_calls=5, token_budget=100)
+
+    assert report["files"] == 45
+    assert report["matches"]
+    assert report["db_cached"]["count"] == 5
+    assert report["tokens"]["budget_tree"] <= 100 < report["tokens"]["full_tree"]
+    # el árbol en caché no recorre el sistema de ficheros ni carga el árbol
+    assert report["speedup"]["db_cached"] > 1
@@ -0,0 +1,28 @@
+import pytest
+
+from benchmarks.search_planner_benchmark import run_search_planner_benchmark, PLAN_AUTO
+from src.db.search_planner import DirectorySearchPlanner, PLAN_EXACT, PLAN_PATH_PREFIX, PLAN_ANN_POST_FILTER
+
+
+@pytest.mark.requires_database
+def test_search_planner_benchmark_across_subtree_sizes(test_database_url):
+    report = run_search_planner_benchmark(
+        test_database_url,
+        num_chunks=3000,
+        subtree_sizes=[30, 1500],
+        num_queries=10,
+        planner=DirectorySearchPlanner(exact_max_chunks=100)
+    )
+
+    small_subtree, large_subtree = report["subtrees"]
+    assert small_subtree["chosen_plan"] == PLAN_EXACT
+    assert large_subtree["chosen_plan"] == PLAN_ANN_POST_FILTER
+    for subtree in report["subtrees"]:
+        # los planes exactos devuelven los mismos chunks y el aproximado repite la búsqueda si le faltan resultados
+        assert subtree["plans"][PLAN_PATH_PREFIX]["recall"] == 1.0
+        assert subtree["plans"][PLAN_ANN_POST_FILTER]["recall"] >= 0.9
+        assert subtree["plans"][PLAN_AUTO]["executed_plans"].keys() <= {
+            subtree["chosen_plan"], f"{PLAN_ANN_POST_FILTER} -> {PLAN_EXACT}"
+        }
+    # en el subárbol pequeño el índice no tiene suficientes candidatos del directorio
+    assert f"{PLAN_ANN_POST_FILTER} -> {PLAN_EXACT}" in small_subtree["plans"][PLAN_ANN_POST_FILTER]["executed_plans"]
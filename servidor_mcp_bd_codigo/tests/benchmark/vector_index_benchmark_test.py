@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks.vector_index_benchmark import run_vector_index_benchmark
+from src.db.vector_index import VectorIndexConfig, INDEX_TYPE_HNSW, INDEX_TYPE_IVFFLAT
+
+
+@pytest.mark.requires_database
+def test_vector_index_recall_improves_with_search_parameters(test_database_url):
+    report = run_vector_index_benchmark(
+        test_database_url,
+        num_vectors=2000,
+        num_queries=20,
+        k=10,
+        index_configs=[VectorIndexConfig(index_type=INDEX_TYPE_HNSW, m=8, ef_construction=32),
+                       VectorIndexConfig(index_type=INDEX_TYPE_IVFFLAT, lists=20)],
+        ef_search_values=[10, 40, 200],
+        probes_values=[1, 20],
+        num_clusters=20
+    )
+
+    assert report["exact"]["recall"] == 1.0
+    hnsw_report, ivfflat_report = report["indexes"]
+    assert hnsw_report["uses_index"] and ivfflat_report["uses_index"]
+    assert hnsw_report["parameters"] == {"m": 8, "ef_construction": 32}
+    assert ivfflat_report["size_bytes"] > 0
+
+    hnsw_recalls = [search["recall"] for search in hnsw_report["searches"]]
+    assert hnsw_recalls == sorted(hnsw_recalls)
+    assert hnsw_recalls[-1] >= 0.95
+    # Revisando todas las listas ivfflat devuelve los resultados exactos
+    ivfflat_recalls = [search["recall"] for search in ivfflat_report["searches"]]
+    assert ivfflat_recalls[0] <= ivfflat_recalls[-1] == 1.0
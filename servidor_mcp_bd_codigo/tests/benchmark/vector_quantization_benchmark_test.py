@@ -0,0 +1,28 @@
+import pytest
+
+from benchmarks.vector_quantization_benchmark import run_vector_quantization_benchmark
+from src.db.vector_quantization import QUANTIZATION_NONE, QUANTIZATION_BINARY
+
+
+@pytest.mark.requires_database
+def test_binary_quantization_recall_improves_with_rerank_factor(test_database_url):
+    report = run_vector_quantization_benchmark(
+        test_database_url,
+        num_vectors=1000,
+        num_queries=10,
+        k=5,
+        rerank_factors=[1, 20],
+        quantizations=[QUANTIZATION_BINARY],
+        m=8,
+        ef_construction=32,
+        num_clusters=10
+    )
+
+    assert report["exact"]["recall"] == 1.0
+    full_report = report["quantizations"][QUANTIZATION_NONE]
+    binary_report = report["quantizations"][QUANTIZATION_BINARY]
+    # un bit por dimensión frente a cuatro bytes
+    assert binary_report["column_bytes"] * 16 < full_report["column_bytes"]
+    recalls = [search["recall"] for search in binary_report["searches"]]
+    assert recalls[0] <= recalls[-1]
+    assert recalls[-1] >= 0.9
@@ -0,0 +1,118 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from src.chunker.chunk_graph_snapshot import ChunkGraphSnapshot, import_chunk_graph_snapshot
+from src.chunker.repo_chunker import FileChunker
+from src.db.models import FSEntry, Ancestor, FileChunk, Symbol, chunk_references
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path
+
+from config import ROOT_DIR
+
+EXAMPLE_FILES_PATH = get_file_absolute_path_from_proyect_relative_path('tests/chunker/example_files')
+
+
+def export_example_files(export_dir: str, export_format: str = "jsonl") -> ChunkGraphSnapshot:
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        file_chunker = FileChunker(chunk_max_line_size=50)
+        return file_chunker.chunk_repo(EXAMPLE_FILES_PATH, [], export_dir=export_dir, export_format=export_format)
+
+
+def get_chunk_graph(session) -> tuple[set, set]:
+    """
+    Devuelve los chunks y las referencias identificados por ruta y líneas, para poder comparar grafos con ids distintos
+    """
+    chunk_keys = {}
+    for chunk, path in session.execute(select(FileChunk, FSEntry.path).join(FSEntry, FileChunk.file_id == FSEntry.id)):
+        chunk_keys[chunk.chunk_id] = (path, chunk.start_line, chunk.end_line)
+    references = {
+        (chunk_keys[referencing_id], chunk_keys[referenced_id], weight)
+        for referencing_id, referenced_id, weight in session.execute(
+            select(chunk_references.c.referencing_id, chunk_references.c.referenced_id, chunk_references.c.weight)
+        )
+    }
+    return set(chunk_keys.values()), references
+
+
+def get_symbols(session) -> set:
+    """
+    Símbolos identificados por ruta y líneas, con el chunk que los contiene
+    """
+    chunk = aliased(FileChunk)
+    return set(session.execute(
+        select(Symbol.name, Symbol.kind, Symbol.class_name, FSEntry.path, Symbol.start_line, Symbol.end_line,
+               chunk.start_line, chunk.end_line)
+        .join(FSEntry, Symbol.file_id == FSEntry.id)
+        .outerjoin(chunk, Symbol.chunk_id == chunk.chunk_id)
+    ).all())
+
+
+def test_export_does_not_need_db_and_writes_all_tables(tmp_path):
+    export_dir = str(tmp_path / "snapshot")
+    snapshot = export_example_files(export_dir)
+
+    for table_name in ["fsentry", "ancestors", "file_chunks", "definitions", "symbols", "chunk_references"]:
+        assert os.path.exists(os.path.join(export_dir, f"{table_name}.jsonl"))
+
+    paths = {entry["path"] for entry in snapshot.fs_entries}
+    assert "" in paths
+    assert "PGVectorTools.py" in paths
+    assert os.path.join("repo_directory_example", "dir_a", "dir_b") in paths
+    assert "PGVectorTools" in {definition["name"] for definition in snapshot.definitions}
+    assert len(snapshot.references) > 0
+
+    # cada entrada tiene una relación de ancestro por nivel de profundidad, incluida ella misma
+    for entry in snapshot.fs_entries:
+        depth = 0 if entry["path"] == "" else len(entry["path"].split(os.sep))
+        entry_ancestors = [a for a in snapshot.ancestors if a["descendant_id"] == entry["id"]]
+        assert sorted(a["depth"] for a in entry_ancestors) == list(range(depth + 1))
+
+    read_snapshot = ChunkGraphSnapshot.read(export_dir)
+    assert read_snapshot.get_tables() == snapshot.get_tables()
+
+
+def test_imported_snapshot_matches_db_chunking(tmp_path, sqlite_session_maker_factory):
+    export_dir = str(tmp_path / "snapshot")
+    export_example_files(export_dir)
+
+    db_session_maker = sqlite_session_maker_factory()
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        FileChunker(chunk_max_line_size=50, session=db_session_maker()).chunk_repo(EXAMPLE_FILES_PATH, [])
+    expected_chunks, expected_references = get_chunk_graph(db_session_maker())
+    expected_symbols = get_symbols(db_session_maker())
+
+    import_session_maker = sqlite_session_maker_factory()
+    row_counts = import_chunk_graph_snapshot(import_session_maker(), export_dir)
+    imported_chunks, imported_references = get_chunk_graph(import_session_maker())
+
+    assert row_counts["file_chunks"] == len(expected_chunks)
+    assert imported_chunks == expected_chunks
+    assert imported_references == expected_references
+    # mismas definiciones, con la clase de los métodos, y mismas llamadas
+    assert row_counts["symbols"] == len(expected_symbols)
+    assert get_symbols(import_session_maker()) == expected_symbols
+    assert {kind for _, kind, *_ in expected_symbols} == {"class", "function", "method", "reference"}
+    assert any(class_name == "PGVectorTools" for _, _, class_name, *_ in expected_symbols)
+
+
+def test_import_offsets_ids_of_existing_rows(tmp_path, sqlite_session_maker):
+    export_dir = str(tmp_path / "snapshot")
+    snapshot = export_example_files(export_dir)
+
+    import_chunk_graph_snapshot(sqlite_session_maker(), export_dir)
+    import_chunk_graph_snapshot(sqlite_session_maker(), export_dir)
+
+    session = sqlite_session_maker()
+    assert session.query(FSEntry).count() == 2 * len(snapshot.fs_entries)
+    assert session.query(Ancestor).count() == 2 * len(snapshot.ancestors)
+    assert session.query(FileChunk).count() == 2 * len(snapshot.chunks)
+
+    roots = session.query(FSEntry).filter(FSEntry.parent_id == None).order_by(FSEntry.id).all()
+    assert [root.id for root in roots] == [1, len(snapshot.fs_entries) + 1]
+    second_root_descendants = session.query(Ancestor).filter(Ancestor.ancestor_id == roots[1].id).count()
+    assert second_root_descendants == len(snapshot.fs_entries)
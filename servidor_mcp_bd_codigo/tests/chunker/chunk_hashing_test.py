@@ -0,0 +1,68 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from grep_ast.tsl import get_parser
+
+from src.chunker.chunk_hashing import get_normalized_code_lines, compute_content_hash
+from src.chunker.repo_chunker import FileChunker
+from src.db.db_utils import mark_duplicate_chunks
+from src.db.models import FSEntry, FileChunk
+
+from config import ROOT_DIR
+
+ORIGINAL_CODE = '''def add(a, b):
+    # suma dos números
+    return a + b
+'''
+
+REFORMATTED_CODE = '''def add(a,   b):
+    return a + b  # mismo código con otro formato
+
+'''
+
+STRING_WITH_HASH_CODE = '''def add(a, b):
+    return "# no es un comentario"
+'''
+
+
+def get_code_hash(code: str) -> str:
+    tree = get_parser("python").parse(bytes(code, "utf-8"))
+    return compute_content_hash(get_normalized_code_lines(code, tree.root_node))
+
+
+def test_hash_ignores_comments_and_whitespace():
+    assert get_code_hash(ORIGINAL_CODE) == get_code_hash(REFORMATTED_CODE)
+    assert get_code_hash(ORIGINAL_CODE) != get_code_hash(STRING_WITH_HASH_CODE)
+    assert compute_content_hash(["", "   "]) is None
+
+    # se mantienen las líneas para poder seguir usando los rangos de los chunks
+    tree = get_parser("python").parse(bytes(ORIGINAL_CODE, "utf-8"))
+    assert len(get_normalized_code_lines(ORIGINAL_CODE, tree.root_node)) == len(ORIGINAL_CODE.splitlines())
+
+
+def test_duplicate_files_point_to_canonical_chunk(tmp_path, sqlite_session):
+    repo_path = tmp_path / "repo"
+    (repo_path / "vendor").mkdir(parents=True)
+    (repo_path / "original.py").write_text(ORIGINAL_CODE)
+    (repo_path / "vendor" / "copy.py").write_text(REFORMATTED_CODE)
+    (repo_path / "other.py").write_text(STRING_WITH_HASH_CODE)
+
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        FileChunker(chunk_max_line_size=50, session=sqlite_session).chunk_repo(str(repo_path), [])
+
+    chunks_by_path = {
+        chunk.file.path: chunk
+        for chunk in sqlite_session.query(FileChunk).join(FSEntry, FSEntry.id == FileChunk.file_id)
+    }
+    original_chunk = chunks_by_path["original.py"]
+    copy_chunk = chunks_by_path[str(Path("vendor") / "copy.py")]
+    other_chunk = chunks_by_path["other.py"]
+
+    assert original_chunk.duplicate_of_id is None
+    assert other_chunk.duplicate_of_id is None
+    assert copy_chunk.duplicate_of_id == original_chunk.chunk_id
+    assert [duplicate.file.path for duplicate in original_chunk.duplicates] == [str(Path("vendor") / "copy.py")]
+
+    # volver a marcar no cambia nada
+    assert mark_duplicate_chunks(sqlite_session) == 1
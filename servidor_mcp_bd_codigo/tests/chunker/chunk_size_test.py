@@ -0,0 +1,78 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from src.chunker.chunk_size import FileTokenCounter, TokenSizeMeasure, LineSizeMeasure, SIZE_UNIT_LINES, \
+    SIZE_UNIT_TOKENS
+from src.chunker.repo_chunker import FileChunker
+
+from config import ROOT_DIR
+
+CHUNK_MAX_TOKENS = 400
+
+
+def create_mixed_line_length_repo(repo_path: Path):
+    """
+    Funciones con el mismo número de líneas, la mitad con líneas cortas y la otra mitad con líneas muy largas
+    """
+    repo_path.mkdir()
+    functions = []
+    for function_index in range(12):
+        if function_index % 2 == 0:
+            body = [f"    value_{line} = {line}" for line in range(15)]
+        else:
+            body = [f"    value_{line} = [{', '.join(f'compute_item_{item}(value_{line})' for item in range(12))}]"
+                    for line in range(15)]
+        functions.append("\n".join([f"def function_{function_index}():", *body, "    return None", ""]))
+    (repo_path / "mixed.py").write_text("\n".join(functions))
+
+
+def export_chunk_sizes(repo_path: Path, export_dir: Path, size_unit: str) -> dict:
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        FileChunker(chunk_max_line_size=40, size_unit=size_unit, chunk_max_tokens=CHUNK_MAX_TOKENS)\
+            .chunk_repo(str(repo_path), [], export_dir=str(export_dir))
+    with open(export_dir / "manifest.json") as file:
+        return json.load(file)["chunk_sizes"]
+
+
+def test_token_measure_splits_by_tokens_at_line_boundaries():
+    token_counter = FileTokenCounter()
+    lines = ["x = 1"] * 30 + ["y = [" + ", ".join(f"item_{i}" for i in range(40)) + "]"] * 10
+    token_counter.set_file_content("\n".join(lines) + "\n")
+    total_tokens = token_counter.count(0, len(lines) - 1)
+    assert token_counter.count(0, 0) > 0
+    assert token_counter.count(5, 4) == 0
+
+    measure = TokenSizeMeasure(token_counter, max_tokens=total_tokens // 3)
+    ranges = measure.split(0, len(lines) - 1)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(lines) - 1
+    # los rangos son consecutivos y no superan el límite, aunque tengan un número de líneas muy distinto
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+    assert all(measure.size(start_line, end_line) <= measure.max_size for start_line, end_line in ranges)
+    range_lines = [end_line - start_line for start_line, end_line in ranges]
+    assert range_lines[0] > 2 * range_lines[-1]
+
+    # el solapamiento no supera su parte del límite de tokens
+    assert measure.add_overlap(5, 10, overlap_size=3) == (2, 13)
+    assert measure.add_overlap(35, 37, overlap_size=3) == (35, 37)
+
+
+def test_line_measure_keeps_equal_line_split():
+    assert LineSizeMeasure(max_size=50).split(0, 120) == [(0, 41), (41, 82), (82, 123)]
+
+
+def test_token_sizing_bounds_chunk_tokens(tmp_path):
+    repo_path = tmp_path / "repo"
+    create_mixed_line_length_repo(repo_path)
+
+    line_sizes = export_chunk_sizes(repo_path, tmp_path / "lines", SIZE_UNIT_LINES)
+    token_sizes = export_chunk_sizes(repo_path, tmp_path / "tokens", SIZE_UNIT_TOKENS)
+
+    assert os.path.exists(tmp_path / "tokens" / "file_chunks.jsonl")
+    assert sum(token_sizes["token_histogram"].values()) == token_sizes["chunks"]
+    # con líneas los chunks de líneas largas superan el límite de tokens, con tokens no
+    assert line_sizes["chunks_over_max_tokens"] > token_sizes["chunks_over_max_tokens"]
+    assert token_sizes["tokens"]["max"] < line_sizes["tokens"]["max"]
+    assert token_sizes["tokens"]["p90"] <= CHUNK_MAX_TOKENS < line_sizes["tokens"]["p90"]
@@ -0,0 +1,10 @@
+def run():
+    return 1
+
+
+class Worker:
+    def run(self):
+        return self.helper()
+
+    def helper(self):
+        return 2
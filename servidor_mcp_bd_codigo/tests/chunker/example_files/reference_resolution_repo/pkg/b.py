@@ -0,0 +1,9 @@
+from pkg.a import run
+
+
+class Other:
+    def run(self):
+        return run()
+
+    def helper(self):
+        return 3
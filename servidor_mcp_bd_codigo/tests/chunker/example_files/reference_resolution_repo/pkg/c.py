@@ -0,0 +1,5 @@
+import pkg.a as module_a
+
+
+def main():
+    return module_a.run()
@@ -1,5 +1,7 @@
 import os
 from unittest.mock import MagicMock, patch
+
+import pytest
 from src.chunker.repo_chunker import FileChunker
 from src.utils.utils import get_file_absolute_path_from_path, get_file_absolute_path_from_proyect_relative_path
 from src.db.models import FSEntry
@@ -27,6 +29,15 @@ def create_fsentry_side_effect(created_fsentries, cls, *args, **kwargs):
 
     return instance
 
+@pytest.fixture(autouse=True)
+def restore_fsentry_constructor():
+    """
+    Al deshacer el patch de FSEntry.__new__ la clase se queda con el slot de construcción del patch y deja de aceptar
+    argumentos, por lo que se restaura para no afectar al resto de tests.
+    """
+    yield
+    FSEntry.__new__ = staticmethod(lambda cls, *args, **kwargs: object.__new__(cls))
+
 def test_recursive_db_repository_creation():
     created_fsentries = []
     side_effect_function = lambda cls, *args, **kwargs: create_fsentry_side_effect(created_fsentries, cls, *args, **kwargs)
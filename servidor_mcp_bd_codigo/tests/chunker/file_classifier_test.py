@@ -0,0 +1,90 @@
+import base64
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from src.chunker.file_classifier import FileClassifier, CATEGORY_SOURCE, CATEGORY_BINARY, CATEGORY_LOCKFILE, \
+    CATEGORY_GENERATED, CATEGORY_MINIFIED, CATEGORY_DATA, CATEGORY_TOO_LARGE, ACTION_INDEX, ACTION_METADATA_ONLY, \
+    ACTION_SKIP
+from src.chunker.repo_chunker import FileChunker
+
+from config import ROOT_DIR
+
+SOURCE_CODE = '''def add(a, b):
+    return a + b
+
+
+class Calculator:
+    def sum(self, values):
+        return sum(values)
+'''
+
+
+def create_example_repo(repo_path: Path) -> dict:
+    """
+    Crea un repositorio con un fichero de cada categoría, devuelve nombre de fichero -> categoría esperada
+    """
+    repo_path.mkdir(parents=True)
+    files = {
+        "main.py": (SOURCE_CODE, CATEGORY_SOURCE),
+        "bundle.js": ("var a=1;b=a+1;" * 200 + "\n" + "function f(){return a}" * 50, CATEGORY_MINIFIED),
+        "package-lock.json": ('{"lockfileVersion": 3}\n', CATEGORY_LOCKFILE),
+        "api_pb2.py": ("DESCRIPTOR = None\n", CATEGORY_GENERATED),
+        "models_gen.go": ("// Code generated by sqlc. DO NOT EDIT.\npackage db\n", CATEGORY_GENERATED),
+        "blob.txt": ("\n".join(base64.b64encode(os.urandom(150)).decode() for _ in range(20)), CATEGORY_DATA),
+    }
+    for file_name, (content, _) in files.items():
+        (repo_path / file_name).write_text(content)
+    (repo_path / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + os.urandom(64))
+
+    expected_categories = {file_name: category for file_name, (_, category) in files.items()}
+    expected_categories["logo.png"] = CATEGORY_BINARY
+    return expected_categories
+
+
+def test_classifier_categories(tmp_path):
+    repo_path = tmp_path / "repo"
+    expected_categories = create_example_repo(repo_path)
+
+    classifier = FileClassifier()
+    for file_name, category in expected_categories.items():
+        classification = classifier.classify(str(repo_path / file_name))
+        assert classification.category == category, file_name
+        expected_action = ACTION_INDEX if category == CATEGORY_SOURCE else ACTION_METADATA_ONLY
+        assert classification.action == expected_action
+
+    assert classifier.report.files_by_category[CATEGORY_GENERATED] == 2
+    assert classifier.report.bytes_avoided == sum(
+        os.path.getsize(repo_path / file_name) for file_name in expected_categories if file_name != "main.py"
+    )
+
+    small_classifier = FileClassifier(max_file_bytes=10, skip_categories=[CATEGORY_TOO_LARGE])
+    classification = small_classifier.classify(str(repo_path / "main.py"))
+    assert classification.category == CATEGORY_TOO_LARGE
+    assert classification.action == ACTION_SKIP
+
+
+def test_chunker_keeps_metadata_only_entries_without_chunks(tmp_path):
+    repo_path = tmp_path / "repo"
+    create_example_repo(repo_path)
+    export_dir = tmp_path / "snapshot"
+
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        file_chunker = FileChunker(chunk_max_line_size=50, file_classifier=FileClassifier(skip_categories=[CATEGORY_BINARY]))
+        snapshot = file_chunker.chunk_repo(str(repo_path), [], export_dir=str(export_dir))
+
+    entries = {entry["path"]: entry for entry in snapshot.fs_entries}
+    chunked_file_ids = {chunk["file_id"] for chunk in snapshot.chunks}
+
+    assert "logo.png" not in entries
+    assert entries["main.py"]["skip_reason"] is None
+    assert entries["main.py"]["id"] in chunked_file_ids
+    for path in ["bundle.js", "package-lock.json", "api_pb2.py", "blob.txt"]:
+        assert entries[path]["skip_reason"] is not None
+        assert entries[path]["id"] not in chunked_file_ids
+
+    with open(export_dir / "manifest.json") as file:
+        manifest = json.load(file)
+    assert manifest["file_classification"]["estimated_tokens_avoided"] > 0
@@ -0,0 +1,101 @@
+import shutil
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+from src.chunker.repo_chunker import FileChunker
+from src.db.db_utils import get_root_fs_entry, get_fs_entry_from_relative_path, get_file_chunks_query, get_chunk_code
+from src.db.models import FileChunk
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path, get_file_text
+
+from config import ROOT_DIR
+
+EXAMPLE_FILES_PATH = Path(get_file_absolute_path_from_proyect_relative_path('tests/chunker/example_files'))
+MAIN_FILES = ["PGVectorTools.py", "modelTools.py", "class_test2_example.py"]
+
+
+def git(repo_path: Path, *args: str):
+    subprocess.run(
+        ["git", "-C", str(repo_path), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def create_example_git_repo(repo_path: Path):
+    """
+    main con tres ficheros, feature modifica uno y añade otro
+    """
+    repo_path.mkdir()
+    git(repo_path, "init", "-b", "main")
+    (repo_path / "src").mkdir()
+    for file_name in MAIN_FILES:
+        shutil.copy(EXAMPLE_FILES_PATH / file_name, repo_path / "src" / file_name)
+    git(repo_path, "add", ".")
+    git(repo_path, "commit", "-m", "main")
+
+    git(repo_path, "checkout", "-b", "feature")
+    with open(repo_path / "src" / "modelTools.py", "a") as file:
+        file.write("\n\ndef feature_function():\n    return get_model_tools()\n")
+    shutil.copy(EXAMPLE_FILES_PATH / "example_javascript.js", repo_path / "src" / "example_javascript.js")
+    git(repo_path, "add", ".")
+    git(repo_path, "commit", "-m", "feature")
+    # el directorio de trabajo no se usa al indexar desde git
+    git(repo_path, "checkout", "main")
+
+
+def chunk_refs(session_maker, repo_path: Path, refs: list) -> list:
+    summaries = []
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        for ref in refs:
+            file_chunker = FileChunker(chunk_max_line_size=50, session=session_maker())
+            summaries.append(file_chunker.chunk_git_ref(str(repo_path), ref))
+    return summaries
+
+
+def test_unchanged_files_share_chunks_between_branches(tmp_path, sqlite_session_maker_factory):
+    repo_path = tmp_path / "repo"
+    create_example_git_repo(repo_path)
+
+    shared_session_maker = sqlite_session_maker_factory()
+    main_summary, feature_summary = chunk_refs(shared_session_maker, repo_path, ["main", "feature"])
+
+    # cada rama indexada por separado
+    separate_chunks = 0
+    for ref in ["main", "feature"]:
+        session_maker = sqlite_session_maker_factory()
+        chunk_refs(session_maker, repo_path, [ref])
+        separate_chunks += session_maker().query(FileChunk).count()
+
+    session = shared_session_maker()
+    shared_chunks = session.query(FileChunk).count()
+    assert main_summary["reused_blobs"] == 0
+    assert feature_summary["files"] == 4
+    assert feature_summary["reused_blobs"] == 2
+    assert main_summary["new_chunks"] + feature_summary["new_chunks"] == shared_chunks
+    assert shared_chunks < separate_chunks
+
+    main_root = get_root_fs_entry(session, "main")
+    feature_root = get_root_fs_entry(session, "feature")
+    unchanged_path = str(Path("src") / "PGVectorTools.py")
+    main_file = get_fs_entry_from_relative_path(session, unchanged_path, main_root.id)
+    feature_file = get_fs_entry_from_relative_path(session, unchanged_path, feature_root.id)
+    assert main_file.id != feature_file.id
+    assert main_file.blob_sha == feature_file.blob_sha
+
+    main_chunks = session.execute(get_file_chunks_query(main_file)).scalars().all()
+    feature_chunks = session.execute(get_file_chunks_query(feature_file)).scalars().all()
+    assert len(main_chunks) > 0
+    assert {chunk.chunk_id for chunk in main_chunks} == {chunk.chunk_id for chunk in feature_chunks}
+
+    # el fichero modificado tiene chunks distintos en cada rama, y su código se lee del blob de la rama
+    changed_path = str(Path("src") / "modelTools.py")
+    feature_changed_file = get_fs_entry_from_relative_path(session, changed_path, feature_root.id)
+    feature_changed_chunks = session.execute(get_file_chunks_query(feature_changed_file)).scalars().all()
+    last_chunk = max(feature_changed_chunks, key=lambda chunk: chunk.end_line)
+    assert "feature_function" in get_chunk_code(session, last_chunk, str(repo_path))
+    assert "feature_function" not in get_file_text(str(repo_path / "src" / "modelTools.py"))
+
+    # volver a indexar el mismo commit no crea nada
+    assert chunk_refs(shared_session_maker, repo_path, ["feature"])[0]["files"] == 0
+    assert shared_session_maker().query(FileChunk).count() == shared_chunks
@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from grep_ast.tsl import get_parser
+
+from src.chunker.reference_resolver import ReferenceResolver, iterate_nodes, get_module_path, \
+    resolve_python_relative_module, get_reference
+from src.chunker.repo_chunker import FileChunker
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path
+
+from config import ROOT_DIR
+
+REFERENCE_REPO_PATH = get_file_absolute_path_from_proyect_relative_path(
+    'tests/chunker/example_files/reference_resolution_repo'
+)
+
+
+def get_file_edges(tmp_path, max_fanout: int = 5):
+    """
+    Devuelve las aristas entre ficheros del repositorio de ejemplo y las estadísticas del resolver
+    """
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        file_chunker = FileChunker(chunk_max_line_size=100)
+        file_chunker.chunk_creator.reference_resolver = ReferenceResolver(max_fanout=max_fanout)
+        snapshot = file_chunker.chunk_repo(REFERENCE_REPO_PATH, [], export_dir=str(tmp_path))
+
+    entry_paths = {entry["id"]: entry["path"] for entry in snapshot.fs_entries}
+    chunk_paths = {chunk["chunk_id"]: entry_paths[chunk["file_id"]] for chunk in snapshot.chunks}
+    edges = {
+        (chunk_paths[edge["referencing_id"]], chunk_paths[edge["referenced_id"]])
+        for edge in snapshot.references
+    }
+    return edges, file_chunker.chunk_creator.reference_resolver.stats
+
+
+def get_call_name_node(code: str, name: str):
+    tree = get_parser("python").parse(bytes(code, "utf-8"))
+    return next(node for node in iterate_nodes(tree.root_node, ["identifier"]) if node.text.decode("utf-8") == name)
+
+
+def test_module_paths():
+    assert get_module_path(os.path.join("src", "db", "models.py")) == "src.db.models"
+    assert get_module_path(os.path.join("src", "db", "__init__.py")) == "src.db"
+    assert get_module_path(os.path.join("app", "utils", "index.js")) == "app.utils"
+    assert resolve_python_relative_module("src.chunker.repo_chunker", ".chunk_creator") == "src.chunker.chunk_creator"
+    assert resolve_python_relative_module("src.chunker.repo_chunker", "..db") == "src.db"
+
+
+def test_imports_and_scopes_prune_name_matches(tmp_path):
+    edges, stats = get_file_edges(tmp_path)
+    a_path = os.path.join("pkg", "a.py")
+    b_path = os.path.join("pkg", "b.py")
+    c_path = os.path.join("pkg", "c.py")
+
+    # run() importado de pkg.a, no los métodos run de las clases
+    assert (b_path, a_path) in edges
+    # module_a.run() apunta a pkg.a
+    assert (c_path, a_path) in edges
+    assert (c_path, b_path) not in edges
+    # self.helper() se resuelve en la propia clase, no en Other.helper
+    assert (a_path, b_path) not in edges
+
+    assert stats.resolved_edges < stats.naive_edges
+
+
+def test_ambiguous_weak_reference_is_pruned_by_max_fanout():
+    resolver = ReferenceResolver(max_fanout=2)
+    resolver.register_file(file_id=1, relative_path="caller.py")
+    resolver.register_chunk(chunk_id=1, file_id=1)
+    resolver.add_reference(1, get_reference(get_call_name_node("obj.get()", "get")))
+
+    candidate_chunk_ids = [2, 3, 4]
+    for chunk_id in candidate_chunk_ids:
+        resolver.register_file(file_id=chunk_id, relative_path=f"module_{chunk_id}.py")
+        resolver.register_chunk(chunk_id=chunk_id, file_id=chunk_id)
+        resolver.add_definition(chunk_id, "get", class_name=f"Class{chunk_id}")
+
+    assert resolver.resolve(1, "get", candidate_chunk_ids) == []
+    assert resolver.stats.pruned_references == 1
+    assert resolver.stats.naive_edges == 3
+
+    # sin información de ámbito se enlaza con todas las definiciones
+    resolved = resolver.resolve(5, "get", candidate_chunk_ids)
+    assert [candidate.chunk_id for candidate in resolved] == candidate_chunk_ids
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.code_indexer.batch_jobs import LocalBatchJobClient, BatchRunner, build_chat_batch_request, \
+    build_embedding_batch_request, parse_batch_output_text, CHAT_COMPLETIONS_ENDPOINT
+from src.code_indexer.prompt_builder import DocPromptBuilder
+from src.code_indexer.repo_async_pipeline import PipelineContext, FileContext, ChunkContext, \
+    BatchDocumentationStage, BatchEmbeddingIndexingStage
+from src.db.models import FSEntry, FileChunk
+from langchain_core.messages import SystemMessage, HumanMessage
+
+
+@pytest.fixture
+def batch_runner(tmp_path):
+    client = LocalBatchJobClient(
+        work_dir=str(tmp_path / "outputs"),
+        chat_responder=lambda body: f"docs: {len(body['messages'])} messages",
+        embedding_responder=lambda text: [1.0, 2.0, float(len(text))]
+    )
+    return BatchRunner(batch_client=client, work_dir=str(tmp_path), poll_interval=0, max_requests_per_batch=2)
+
+
+@pytest.fixture
+def pipeline_context():
+    context = PipelineContext(
+        repo_path="/repo",
+        extra_docs_path="",
+        db_session=MagicMock(),
+        files_to_ignore=[],
+        repo_tree_str="repo\n└── file.py"
+    )
+    file = MagicMock(spec=FSEntry)
+    file.path = "file.py"
+    file_context = FileContext(file=file, pipeline_context=context, file_code="a = 1\nb = 2\nc = 3")
+    for chunk_id in range(1, 4):
+        chunk = MagicMock(spec=FileChunk)
+        chunk.chunk_id = chunk_id
+        chunk.start_line = chunk_id - 1
+        chunk.end_line = chunk_id
+        file_context.chunks.append(ChunkContext(chunk=chunk, file_context=file_context, chunk_code="a = 1"))
+    context.files.append(file_context)
+    context.stats['total_chunks'] = 3
+    return context
+
+
+def test_chat_batch_request_format():
+    request = build_chat_batch_request(
+        "doc-1", "gpt-4o-mini", [SystemMessage(content="system"), HumanMessage(content="user")], 0.5
+    )
+    assert request["url"] == CHAT_COMPLETIONS_ENDPOINT
+    assert request["body"]["messages"] == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "user"}
+    ]
+
+
+def test_parse_batch_output_skips_errors():
+    output_text = "\n".join([
+        json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {"data": [{"embedding": [0.5]}]}}, "error": None}),
+        json.dumps({"custom_id": "b", "response": None, "error": {"message": "rate limit"}}),
+    ])
+    assert parse_batch_output_text(output_text) == {"a": [0.5]}
+
+
+def test_batch_runner_splits_requests_into_files(batch_runner, tmp_path):
+    requests = [build_embedding_batch_request(f"embedding-{i}", "model", "text") for i in range(5)]
+    results = asyncio.run(batch_runner.run("embedding", "/v1/embeddings", requests))
+
+    assert len(results) == 5
+    assert len([f for f in os.listdir(tmp_path) if f.startswith("embedding_")]) == 3
+
+
+def test_batch_documentation_and_embedding_stages(batch_runner, pipeline_context):
+    documentation_stage = BatchDocumentationStage(batch_runner, DocPromptBuilder())
+    embedding_stage = BatchEmbeddingIndexingStage(batch_runner)
+
+    context = asyncio.run(documentation_stage.process(pipeline_context))
+    context = asyncio.run(embedding_stage.process(context))
+
+    for chunk_context in context.files[0].chunks:
+        assert chunk_context.chunk.docs == "docs: 2 messages"
+        assert chunk_context.chunk.embedding == [1.0, 2.0, float(len("docs: 2 messages"))]
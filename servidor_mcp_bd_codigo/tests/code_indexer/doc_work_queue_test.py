@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from config import ROOT_DIR, TEST_EXAMPLE_FILES_PATH
+from src.code_indexer.doc_work_queue import compute_failure_transition, build_claim_statement, enqueue_chunk_jobs, \
+    get_queue_stats, DocQueueWorker, ChunkDocumentationJobHandler, JOB_TYPE_DOCUMENTATION, STATUS_DEAD, \
+    STATUS_PENDING, STATUS_DONE
+from src.code_indexer.repo_async_pipeline import EmbeddingIndexingStage
+from src.db.models import Base, FSEntry, FileChunk
+
+FAKE_LLM_LATENCY = 0.1
+NUM_CHUNKS = 40
+
+
+def test_failure_transition_retries_with_backoff():
+    assert compute_failure_transition(attempts=1, max_attempts=3, base_backoff=5) == (STATUS_PENDING, 5)
+    assert compute_failure_transition(attempts=2, max_attempts=3, base_backoff=5) == (STATUS_PENDING, 10)
+
+
+def test_failure_transition_dead_letter():
+    assert compute_failure_transition(attempts=3, max_attempts=3, base_backoff=5) == (STATUS_DEAD, 0.0)
+
+
+def test_claim_statement_skips_locked_rows():
+    stmt = build_claim_statement("worker-1", [JOB_TYPE_DOCUMENTATION], batch_size=5)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "RETURNING" in sql
+
+
+class FakeLLMPrompter:
+    model = "fake"
+
+    async def async_execute_prompt(self, prompt_messages):
+        await asyncio.sleep(FAKE_LLM_LATENCY)
+        return SimpleNamespace(content="documentación generada")
+
+
+class FakeEmbedder:
+    async def async_embed_document(self, document: str):
+        await asyncio.sleep(FAKE_LLM_LATENCY)
+        return [0.1] * 1536
+
+
+def run_worker_process(database_url: str, worker_index: int):
+    engine = create_engine(database_url)
+    session = sessionmaker(bind=engine)()
+    embedding_stage = EmbeddingIndexingStage()
+    embedding_stage.llm_embedder = FakeEmbedder()
+    handler = ChunkDocumentationJobHandler(
+        session=session,
+        repo_path=os.path.join(ROOT_DIR, TEST_EXAMPLE_FILES_PATH),
+        llm_prompter=FakeLLMPrompter(),
+        embedding_stage=embedding_stage
+    )
+    worker = DocQueueWorker(session=session, handler=handler, worker_id=f"worker-{worker_index}", batch_size=2,
+                            poll_interval=0.01)
+    asyncio.run(worker.run(stop_when_empty=True))
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def database_session(pg_engine):
+    session = sessionmaker(bind=pg_engine)()
+
+    root = FSEntry(name="example_files", parent_id=None, is_directory=True, path="")
+    session.add(root)
+    session.flush()
+    file = FSEntry(name="PGVectorTools.py", parent_id=root.id, is_directory=False, path="PGVectorTools.py")
+    session.add(file)
+    session.flush()
+    session.add_all([FileChunk(file_id=file.id, start_line=i, end_line=i + 10) for i in range(NUM_CHUNKS)])
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(pg_engine)
+
+
+def reset_queue(session):
+    session.execute(text("DELETE FROM doc_jobs"))
+    session.execute(text("UPDATE file_chunks SET docs = NULL, embedding = NULL"))
+    session.commit()
+    enqueue_chunk_jobs(session, JOB_TYPE_DOCUMENTATION)
+
+
+def measure_throughput(session, database_url: str, num_workers: int) -> float:
+    reset_queue(session)
+    context = multiprocessing.get_context("fork")
+    start_time = time.time()
+    processes = [context.Process(target=run_worker_process, args=(database_url, i)) for i in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start_time
+
+    stats = get_queue_stats(session)
+    assert stats["documentation"] == {STATUS_DONE: NUM_CHUNKS}
+    assert stats["embedding"] == {STATUS_DONE: NUM_CHUNKS}
+    return 2 * NUM_CHUNKS / elapsed
+
+
+@pytest.mark.requires_database
+def test_workers_scale_linearly(database_session, test_database_url):
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+
+        throughputs = {num_workers: measure_throughput(database_session, test_database_url, num_workers) for num_workers in [1, 2, 4]}
+
+    print(f"Trabajos por segundo según el número de workers: {throughputs}")
+    # El throughput debe crecer de forma lineal con el número de workers, con cierto margen por el arranque de procesos
+    for num_workers, throughput in throughputs.items():
+        assert throughput >= 0.6 * num_workers * throughputs[1]
@@ -0,0 +1,174 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+
+from config import ROOT_DIR
+from src.chunker import repo_chunker
+from src.chunker.incremental_chunker import update_changed_files
+from src.chunker.repo_chunker import FileChunker
+from src.code_indexer.index_watcher import IndexWatcher, ChangeDebouncer, is_inotify_available
+from src.db.models import FSEntry, FileChunk, chunk_references
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path
+
+EXAMPLE_FILES_PATH = Path(get_file_absolute_path_from_proyect_relative_path('tests/chunker/example_files'))
+REPO_FILES = ["PGVectorTools.py", "modelTools.py", "class_test2_example.py", "example_java.java"]
+CONVERGENCE_TIMEOUT = 30
+
+
+def create_example_repo(repo_path: Path):
+    (repo_path / "src").mkdir(parents=True)
+    for file_name in REPO_FILES:
+        shutil.copy(EXAMPLE_FILES_PATH / file_name, repo_path / "src" / file_name)
+
+
+def chunk_full_repo(session_maker, repo_path: Path):
+    FileChunker(chunk_max_line_size=50, session=session_maker()).chunk_repo(str(repo_path), [])
+    return session_maker
+
+
+def get_index_state(session) -> dict:
+    """
+    Contenido del índice independiente de los ids asignados
+    """
+    chunk_keys = {
+        chunk.chunk_id: (chunk.file.path, chunk.start_line, chunk.end_line, chunk.content_hash)
+        for chunk in session.query(FileChunk)
+    }
+    references = {
+        (chunk_keys[referencing_id], chunk_keys[referenced_id], round(weight, 6))
+        for referencing_id, referenced_id, weight in session.execute(
+            select(chunk_references.c.referencing_id, chunk_references.c.referenced_id, chunk_references.c.weight)
+        )
+    }
+    return {
+        "entries": {(entry.path, entry.is_directory) for entry in session.query(FSEntry)},
+        "chunks": set(chunk_keys.values()),
+        "references": references
+    }
+
+
+def wait_until(condition, timeout: float = CONVERGENCE_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "el índice no ha convergido"
+        time.sleep(0.05)
+
+
+def test_debouncer_waits_for_quiet_period_and_max_delay():
+    debouncer = ChangeDebouncer(debounce_seconds=1.0, max_delay_seconds=3.0)
+    debouncer.add({"a.py"}, changed_at=0.0)
+    debouncer.add({"b.py"}, changed_at=0.8)
+    assert debouncer.pop_ready(now=1.5) is None
+    assert debouncer.pop_ready(now=1.9) == ({"a.py", "b.py"}, 0.0)
+    assert debouncer.pop_ready(now=10.0) is None
+
+    # una ráfaga continua se procesa como mucho max_delay_seconds después del primer cambio
+    for changed_at in [0.0, 0.9, 1.8, 2.7]:
+        debouncer.add({"c.py"}, changed_at=changed_at)
+        assert debouncer.pop_ready(now=changed_at + 0.1) is None
+    assert debouncer.pop_ready(now=3.0) == ({"c.py"}, 0.0)
+
+
+def test_update_only_parses_changed_files(tmp_path, sqlite_session_maker_factory):
+    repo_path = tmp_path / "repo"
+    create_example_repo(repo_path)
+    parsed_paths = []
+
+    def parse_file(code_text, file_path):
+        parsed_paths.append(os.path.relpath(file_path, repo_path))
+        return parse_file_abstract_syntaxis_tree(code_text, file_path)
+
+    parse_file_abstract_syntaxis_tree = repo_chunker.parse_file_abstract_syntaxis_tree
+    with patch('importlib.resources.files') as mock_files, \
+            patch.object(repo_chunker, "parse_file_abstract_syntaxis_tree", side_effect=parse_file):
+        mock_files.return_value = Path(ROOT_DIR)
+        session_maker = chunk_full_repo(sqlite_session_maker_factory(), repo_path)
+
+        # la primera actualización del proceso analiza todos los ficheros y guarda su análisis
+        file_parses = {}
+        parsed_paths.clear()
+        update_changed_files(session_maker(), str(repo_path), [], chunk_max_line_size=50, file_parses=file_parses)
+        assert sorted(parsed_paths) == sorted(os.path.join("src", file_name) for file_name in REPO_FILES)
+
+        # modelTools.py, con las referencias a PGVectorTools.py, no cambia y se registra con su análisis guardado
+        with open(repo_path / "src" / "PGVectorTools.py", "a") as file:
+            file.write("\n\ndef watched_function():\n    return getLLM(None)\n")
+        shutil.copy(EXAMPLE_FILES_PATH / "example_javascript.js", repo_path / "src" / "example_javascript.js")
+        os.remove(repo_path / "src" / "class_test2_example.py")
+        changed_paths = [os.path.join("src", "PGVectorTools.py"), os.path.join("src", "example_javascript.js")]
+        parsed_paths.clear()
+        update_changed_files(session_maker(), str(repo_path), changed_paths, chunk_max_line_size=50,
+                             file_parses=file_parses)
+        assert sorted(parsed_paths) == sorted(changed_paths)
+        assert os.path.join("src", "class_test2_example.py") not in file_parses
+
+        expected_state = get_index_state(chunk_full_repo(sqlite_session_maker_factory(), repo_path)())
+
+    # las referencias entre ficheros se resuelven igual que al chunkear el repositorio completo
+    assert get_index_state(session_maker()) == expected_state
+
+
+@pytest.mark.parametrize("use_inotify", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(not is_inotify_available(), reason="inotify no disponible"))
+])
+def test_watcher_converges_to_full_index(tmp_path, use_inotify, sqlite_session_maker_factory):
+    repo_path = tmp_path / "repo"
+    create_example_repo(repo_path)
+
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        session_maker = chunk_full_repo(sqlite_session_maker_factory(), repo_path)
+
+        session = session_maker()
+        unchanged_chunk_ids = {
+            chunk.chunk_id for chunk in session.query(FileChunk).join(FSEntry)
+            .filter(FSEntry.name == "PGVectorTools.py")
+        }
+        session.close()
+
+        requeued_chunk_ids = []
+        watcher = IndexWatcher(
+            session_maker=session_maker,
+            repo_path=str(repo_path),
+            debounce_seconds=0.3,
+            max_delay_seconds=5,
+            poll_interval=0.05,
+            use_inotify=use_inotify,
+            on_chunks_changed=lambda _, chunk_ids: requeued_chunk_ids.extend(chunk_ids),
+            chunk_max_line_size=50
+        )
+        watcher.start()
+        try:
+            with open(repo_path / "src" / "modelTools.py", "a") as file:
+                file.write("\n\ndef watched_function():\n    return get_model_tools()\n")
+            (repo_path / "src" / "js").mkdir()
+            shutil.copy(EXAMPLE_FILES_PATH / "example_javascript.js", repo_path / "src" / "js" / "example_javascript.js")
+            os.remove(repo_path / "src" / "class_test2_example.py")
+
+            wait_until(lambda: watcher.get_metrics().pending_changes > 0)
+            assert watcher.get_metrics().index_lag_seconds > 0
+            wait_until(lambda: watcher.is_idle() and watcher.get_metrics().updates > 0)
+        finally:
+            watcher.stop()
+
+        metrics = watcher.get_metrics()
+        assert metrics.index_lag_seconds == 0
+        assert metrics.failed_updates == 0
+        assert metrics.new_chunks > 0 and metrics.deleted_chunks > 0
+
+        expected_state = get_index_state(chunk_full_repo(sqlite_session_maker_factory(), repo_path)())
+
+    session = session_maker()
+    assert get_index_state(session) == expected_state
+    # los chunks de los ficheros sin cambios se mantienen, con su documentación
+    unchanged_file = session.query(FSEntry).filter(FSEntry.name == "PGVectorTools.py").one()
+    assert {chunk.chunk_id for chunk in unchanged_file.chunks} == unchanged_chunk_ids
+
+    requeued_files = {session.get(FileChunk, chunk_id).file.name for chunk_id in requeued_chunk_ids}
+    assert {"modelTools.py", "example_javascript.js"} <= requeued_files
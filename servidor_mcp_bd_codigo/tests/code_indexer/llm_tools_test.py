@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from src.code_indexer.llm_tools import LLMEndpoint, LLMEndpointRouter, LoadBalancedLLMPrompter
+
+
+class ThrottlingError(Exception):
+    pass
+
+
+class FakeEndpointChat:
+    """
+    Endpoint falso que simula la latencia del proveedor y el throttling cuando se supera su capacidad real.
+    """
+    def __init__(self, latency: float = 0.001, throttle_above: int = None, fail_always: bool = False):
+        self.latency = latency
+        self.throttle_above = throttle_above
+        self.fail_always = fail_always
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def ainvoke(self, prompt_messages):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.fail_always or (self.throttle_above is not None and self.in_flight > self.throttle_above):
+                raise ThrottlingError("429 Too Many Requests")
+            return f"response {self.calls}"
+        finally:
+            self.in_flight -= 1
+
+
+async def run_requests(prompter, num_requests):
+    return await asyncio.gather(*[prompter.async_execute_prompt([]) for _ in range(num_requests)])
+
+
+def test_weighted_round_robin_distribution():
+    fast_a = FakeEndpointChat()
+    fast_b = FakeEndpointChat()
+    router = LLMEndpointRouter([
+        LLMEndpoint(name="a", llm_chat=fast_a, weight=3),
+        LLMEndpoint(name="b", llm_chat=fast_b, weight=1),
+    ])
+
+    selections = [router.select_endpoint().name for _ in range(8)]
+
+    assert selections.count("a") == 6
+    assert selections.count("b") == 2
+
+
+def test_concurrency_limit_per_endpoint():
+    chat = FakeEndpointChat(latency=0.01)
+    prompter = LoadBalancedLLMPrompter([LLMEndpoint(name="a", llm_chat=chat, max_concurrency=3)])
+
+    responses = asyncio.run(run_requests(prompter, 20))
+
+    assert len(responses) == 20
+    assert chat.max_in_flight <= 3
+
+
+def test_traffic_shifts_away_from_throttled_endpoint():
+    throttled = FakeEndpointChat(latency=0.005, throttle_above=1)
+    healthy = FakeEndpointChat(latency=0.005)
+    prompter = LoadBalancedLLMPrompter([
+        LLMEndpoint(name="throttled", llm_chat=throttled, weight=1, max_concurrency=8),
+        LLMEndpoint(name="healthy", llm_chat=healthy, weight=1, max_concurrency=8),
+    ], max_attempts=5)
+    prompter.router.base_cooldown = 0.05
+
+    responses = asyncio.run(run_requests(prompter, 60))
+
+    stats = prompter.router.get_endpoint_stats()
+    assert len(responses) == 60
+    assert stats["throttled"]["errors"] > 0
+    assert healthy.calls > throttled.calls
+    assert stats["healthy"]["effective_weight"] > stats["throttled"]["effective_weight"]
+
+
+def test_all_endpoints_failing_raises_last_error():
+    prompter = LoadBalancedLLMPrompter([
+        LLMEndpoint(name="a", llm_chat=FakeEndpointChat(fail_always=True)),
+        LLMEndpoint(name="b", llm_chat=FakeEndpointChat(fail_always=True)),
+    ], max_attempts=2)
+    prompter.router.base_cooldown = 0.01
+
+    with pytest.raises(ThrottlingError):
+        asyncio.run(prompter.async_execute_prompt([]))
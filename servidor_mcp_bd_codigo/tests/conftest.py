@@ -0,0 +1,106 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.db.models import Base
+
+"""
+Bases de datos de los tests.
+
+Los tests que se pueden ejecutar con SQLite usan una base de datos en memoria con las tablas del índice
+(sqlite_session_maker, sqlite_session o, si necesitan varias, sqlite_session_maker_factory). Los que necesitan
+PostgreSQL con pgvector se marcan con @pytest.mark.requires_database y solo se ejecutan si se indica una base de datos
+de pruebas en TEST_DATABASE_URL; la reciben con el fixture test_database_url o, con las tablas recién creadas, con
+pg_engine. database_url ejecuta el test con SQLite y, si está configurada, también con la base de datos de pruebas.
+"""
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+REQUIRES_DATABASE_REASON = "TEST_DATABASE_URL no configurada"
+SQLITE_DATABASE_URL = "sqlite://"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "requires_database: el test necesita la base de datos PostgreSQL de pruebas")
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL is not None:
+        return
+    skip_database = pytest.mark.skip(reason=REQUIRES_DATABASE_REASON)
+    for item in items:
+        if "requires_database" in item.keywords:
+            item.add_marker(skip_database)
+
+
+def create_sqlite_engine():
+    """
+    SQLite en memoria con las tablas del índice, la misma conexión para todas las sesiones e hilos. LIKE distingue
+    mayúsculas, como en PostgreSQL
+    """
+    engine = create_engine(SQLITE_DATABASE_URL, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect",
+                 lambda connection, _: connection.execute("PRAGMA case_sensitive_like = ON"))
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def create_test_database_engine(database_url: str = None):
+    """
+    Base de datos de pruebas con la extensión vector y las tablas del índice vacías
+    """
+    engine = create_engine(database_url or TEST_DATABASE_URL)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def sqlite_session_maker_factory():
+    """
+    Crea session makers de bases de datos SQLite independientes, para los tests que necesitan más de una
+    """
+    engines = []
+
+    def create_session_maker():
+        engines.append(create_sqlite_engine())
+        return sessionmaker(bind=engines[-1])
+
+    yield create_session_maker
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def sqlite_session_maker(sqlite_session_maker_factory):
+    return sqlite_session_maker_factory()
+
+
+@pytest.fixture
+def sqlite_session(sqlite_session_maker):
+    session = sqlite_session_maker()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def test_database_url():
+    if TEST_DATABASE_URL is None:
+        pytest.skip(REQUIRES_DATABASE_REASON)
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def pg_engine(test_database_url):
+    engine = create_test_database_engine(test_database_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(params=[SQLITE_DATABASE_URL] + ([TEST_DATABASE_URL] if TEST_DATABASE_URL else []))
+def database_url(request):
+    return request.param
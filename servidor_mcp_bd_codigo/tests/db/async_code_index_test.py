@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import insert, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.db.async_code_index import AsyncCodeIndex
+from src.db.chunk_retrieval import get_chunks_response
+from src.db.db_utils import add_fs_entry, compute_chunk_neighbours
+from src.db.models import Base, FileChunk, QueryEmbedding, chunk_references, EMBEDDING_DIMENSION
+
+EMBEDDING_LATENCY = 0.2
+NUM_CONCURRENT_SEARCHES = 5
+
+
+class SlowEmbedder(Embeddings):
+    """
+    Embedder con la latencia de la API, devuelve el mismo embedding para las consultas que empiezan igual
+    """
+    def embed_query(self, text: str):
+        time.sleep(EMBEDDING_LATENCY)
+        return get_embedding(int(text.split()[0]))
+
+    async def aembed_query(self, text: str):
+        await asyncio.sleep(EMBEDDING_LATENCY)
+        return get_embedding(int(text.split()[0]))
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def get_embedding(seed: int):
+    return np.random.default_rng(seed).random(EMBEDDING_DIMENSION, dtype=np.float32)
+
+
+def populate_code_index(session, repo_path):
+    """
+    src/a.py con dos chunks que referencian a los de docs/b.py
+    """
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    for directory_name, file_name in [("src", "a.py"), ("docs", "b.py")]:
+        (repo_path / directory_name).mkdir(exist_ok=True)
+        (repo_path / directory_name / file_name).write_text("\n".join(f"{file_name}_{line}" for line in range(20)))
+        directory = add_fs_entry(session, name=directory_name, parent_id=root.id, is_directory=True)
+        file_entry = add_fs_entry(session, name=file_name, parent_id=directory.id, is_directory=False)
+        session.execute(insert(FileChunk), [
+            {"file_id": file_entry.id, "start_line": line, "end_line": line + 9, "embedding": get_embedding(line)}
+            for line in [0, 10]
+        ])
+    session.execute(insert(chunk_references), [
+        {"referencing_id": 1, "referenced_id": 3, "weight": 1.0},
+        {"referencing_id": 2, "referenced_id": 4, "weight": 1.0},
+    ])
+    compute_chunk_neighbours(session)
+    session.commit()
+
+
+async def create_async_code_index(engine, repo_path, embedder=None) -> AsyncCodeIndex:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.run_sync(populate_code_index, repo_path)
+    return AsyncCodeIndex(session_maker, embedder, repo_path=str(repo_path), max_chunks=2, log_search_plans=False)
+
+
+def test_async_code_index_file_chunks(tmp_path, sqlite_session):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        try:
+            code_index = await create_async_code_index(engine, tmp_path)
+            response, file_paths = await asyncio.gather(
+                code_index.get_file_chunks_response("src/a.py"),
+                code_index.get_all_file_paths()
+            )
+            with pytest.raises(FileNotFoundError):
+                await code_index.get_file_chunks_response("src/missing.py")
+            return response, file_paths
+        finally:
+            # Sin cerrar las conexiones de aiosqlite el proceso no termina
+            await engine.dispose()
+
+    response, file_paths = asyncio.run(run())
+    assert sorted(file_paths) == sorted(["", "src", "src/a.py", "docs", "docs/b.py"])
+
+    # Misma respuesta que la versión síncrona
+    populate_code_index(sqlite_session, tmp_path)
+    assert response == get_chunks_response(sqlite_session, [1, 2], max_chunks=2, repo_path=str(tmp_path))
+    assert response[1]["chunk_content"] == "\n".join(f"a.py_{line}" for line in range(10))
+    assert list(response[1]["referenced_chunks"]) == [3]
+
+
+def test_async_code_index_caches_query_embeddings_in_its_database(tmp_path):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        try:
+            code_index = await create_async_code_index(engine, tmp_path, SlowEmbedder())
+            embedding = await code_index.embedder_instance.aembed_query("0 query")
+            async with code_index.session_maker() as session:
+                cached_embeddings = (await session.scalars(select(QueryEmbedding.embedding))).all()
+            return embedding, cached_embeddings, code_index.embedder_instance.get_metrics()
+        finally:
+            await engine.dispose()
+
+    embedding, cached_embeddings, metrics = asyncio.run(run())
+    assert len(cached_embeddings) == 1
+    assert np.allclose(cached_embeddings[0], embedding)
+    assert (metrics.misses, metrics.shared_errors) == (1, 0)
+
+
+@pytest.mark.requires_database
+@pytest.mark.usefixtures("pg_engine")
+def test_async_code_index_concurrent_searches(tmp_path, test_database_url):
+    async def run():
+        engine = create_async_engine(make_url(test_database_url).set(drivername="postgresql+asyncpg"),
+                                     pool_size=NUM_CONCURRENT_SEARCHES)
+        try:
+            code_index = await create_async_code_index(engine, tmp_path, SlowEmbedder())
+            search_start = time.perf_counter()
+            search_results = await asyncio.gather(*[
+                code_index.search_similar_chunk_ids(f"{seed} query", directory_path="docs", max_results=2)
+                for seed in [0, 10] * NUM_CONCURRENT_SEARCHES
+            ])
+            elapsed = time.perf_counter() - search_start
+            response = await code_index.search_chunks_response("0 query", directory_path="docs")
+            async with code_index.session_maker() as session:
+                cached_queries = await session.scalar(select(func.count()).select_from(QueryEmbedding))
+            return search_results, elapsed, response, cached_queries
+        finally:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.drop_all)
+            await engine.dispose()
+
+    search_results, elapsed, response, cached_queries = asyncio.run(run())
+    # Las búsquedas no bloquean el event loop, las latencias del embedder se solapan
+    assert elapsed < EMBEDDING_LATENCY * NUM_CONCURRENT_SEARCHES
+    assert search_results == [[3, 4], [4, 3]] * NUM_CONCURRENT_SEARCHES
+    assert list(response) == [3]
+    assert list(response[3]["referencing_chunks"]) == [1]
+    # la caché compartida de embeddings usa la base de datos del índice
+    assert cached_queries == 2
@@ -0,0 +1,58 @@
+from sqlalchemy import insert
+
+from src.db.chunk_retrieval import get_chunks_with_neighbours
+from src.db.db_utils import compute_chunk_neighbours, add_fs_entry, NEIGHBOUR_DIRECTION_REFERENCED, \
+    NEIGHBOUR_DIRECTION_REFERENCING
+from src.db.models import FileChunk, ChunkNeighbour, chunk_references
+
+
+def create_chunk_graph(session, edges):
+    """
+    Crea en la base de datos un fichero, 5 chunks y las aristas indicadas como (origen, destino, peso)
+    """
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    file = add_fs_entry(session, name="file.py", parent_id=root.id, is_directory=False)
+    for i in range(5):
+        session.add(FileChunk(file_id=file.id, start_line=i * 10, end_line=i * 10 + 9))
+    session.flush()
+
+    session.execute(insert(chunk_references), [
+        {"referencing_id": referencing_id, "referenced_id": referenced_id, "weight": weight}
+        for referencing_id, referenced_id, weight in edges
+    ])
+    session.flush()
+
+
+def test_neighbours_are_ranked_by_weight_and_limited_to_top_k(sqlite_session):
+    session = sqlite_session
+    create_chunk_graph(session, [
+        (1, 2, 0.5),
+        (1, 3, 2.0),
+        (1, 4, 1.0),
+        (1, 5, 0.1),
+        (2, 3, 1.0),
+        (4, 3, 3.0),
+    ])
+
+    compute_chunk_neighbours(session, top_k=2)
+
+    _, chunk_neighbours = get_chunks_with_neighbours(session, [1], max_referenced=3, max_referencing=3)
+    assert chunk_neighbours[1][NEIGHBOUR_DIRECTION_REFERENCED] == [3, 4]
+    assert chunk_neighbours[1][NEIGHBOUR_DIRECTION_REFERENCING] == []
+
+    _, chunk_neighbours = get_chunks_with_neighbours(session, [3], max_referenced=1, max_referencing=1)
+    assert chunk_neighbours[3][NEIGHBOUR_DIRECTION_REFERENCING] == [4]
+
+
+def test_recompute_from_min_chunk_id_keeps_previous_neighbours(sqlite_session):
+    session = sqlite_session
+    create_chunk_graph(session, [(1, 2, 1.0), (3, 4, 1.0)])
+    compute_chunk_neighbours(session)
+
+    session.execute(insert(chunk_references), [{"referencing_id": 3, "referenced_id": 5, "weight": 2.0}])
+    compute_chunk_neighbours(session, min_chunk_id=3)
+
+    referenced_neighbours = session.query(ChunkNeighbour)\
+        .filter(ChunkNeighbour.direction == NEIGHBOUR_DIRECTION_REFERENCED)\
+        .order_by(ChunkNeighbour.chunk_id, ChunkNeighbour.rank).all()
+    assert [(n.chunk_id, n.neighbour_id) for n in referenced_neighbours] == [(1, 2), (3, 5), (3, 4)]
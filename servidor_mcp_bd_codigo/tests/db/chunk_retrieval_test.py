@@ -0,0 +1,80 @@
+from sqlalchemy import insert, event
+
+from src.db.chunk_retrieval import get_chunks_response, get_chunks_with_neighbours, build_grouped_chunks_response
+from src.db.db_utils import add_fs_entry, compute_chunk_neighbours
+from src.db.models import FileChunk, chunk_references
+
+MAX_RETRIEVAL_STATEMENTS = 2
+
+
+def create_retrieval_index(session, repo_path):
+    """
+    a.py con dos chunks, b.py con uno y c.py con un duplicado del chunk de b.py
+    """
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    files = {}
+    for name in ["a.py", "b.py", "c.py"]:
+        (repo_path / name).write_text("\n".join(f"{name}_line_{line}" for line in range(20)))
+        files[name] = add_fs_entry(session, name=name, parent_id=root.id, is_directory=False)
+    session.add_all([
+        FileChunk(file_id=files["a.py"].id, start_line=0, end_line=9),
+        FileChunk(file_id=files["a.py"].id, start_line=10, end_line=19),
+        FileChunk(file_id=files["b.py"].id, start_line=0, end_line=9),
+        FileChunk(file_id=files["c.py"].id, start_line=0, end_line=9),
+    ])
+    session.flush()
+    session.get(FileChunk, 4).duplicate_of_id = 3
+    session.execute(insert(chunk_references), [
+        {"referencing_id": 1, "referenced_id": 2, "weight": 2.0},
+        {"referencing_id": 1, "referenced_id": 3, "weight": 1.0},
+        {"referencing_id": 2, "referenced_id": 3, "weight": 0.5},
+    ])
+    compute_chunk_neighbours(session)
+    session.commit()
+
+
+def test_retrieval_returns_hits_neighbours_and_code_in_bounded_statements(tmp_path, sqlite_session):
+    session = sqlite_session
+    create_retrieval_index(session, tmp_path)
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    response = get_chunks_response(session, [1, 3, 2], max_chunks=10, max_referenced=1, max_referencing=2,
+                                   repo_path=str(tmp_path))
+
+    assert len(statements) <= MAX_RETRIEVAL_STATEMENTS
+    # el chunk 2 ya se ha incluido como vecino del 1, y el 3 solo tiene como vecinos chunks ya incluidos
+    assert list(response) == [1, 3]
+    assert response[1]["path"] == "a.py"
+    assert response[1]["chunk_content"].splitlines() == [f"a.py_line_{line}" for line in range(10)]
+    assert list(response[1]["referenced_chunks"]) == [2]
+    assert response[1]["referenced_chunks"][2]["chunk_content"].startswith("a.py_line_10")
+    assert response[1]["referencing_chunks"] == {}
+    assert response[3]["duplicate_paths"] == ["c.py"]
+    assert response[3]["referenced_chunks"] == {} and response[3]["referencing_chunks"] == {}
+
+
+def test_retrieval_stops_at_max_chunks(tmp_path, sqlite_session):
+    session = sqlite_session
+    create_retrieval_index(session, tmp_path)
+
+    response = get_chunks_response(session, [3, 1], max_chunks=2, max_referenced=1, max_referencing=2,
+                                   repo_path=str(tmp_path))
+
+    assert list(response) == [3]
+    assert list(response[3]["referencing_chunks"]) == [1, 2]
+
+
+def test_grouped_retrieval_includes_each_chunk_once(tmp_path, sqlite_session):
+    session = sqlite_session
+    create_retrieval_index(session, tmp_path)
+
+    chunks, chunk_neighbours = get_chunks_with_neighbours(session, [3, 1, 2], max_referenced=1, max_referencing=2)
+    response = build_grouped_chunks_response(chunks, chunk_neighbours, {"first": [3], "second": [1, 2]},
+                                             max_chunks=1, repo_path=str(tmp_path))
+
+    # max_chunks se aplica a cada consulta y los vecinos de la primera no se repiten en la segunda
+    assert list(response) == ["first", "second"]
+    assert list(response["first"]) == [3]
+    assert list(response["first"][3]["referencing_chunks"]) == [1, 2]
+    assert response["second"] == {}
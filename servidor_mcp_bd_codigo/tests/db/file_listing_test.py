@@ -0,0 +1,108 @@
+import re
+
+import pytest
+
+from src.db.db_utils import add_fs_entry, bump_index_version
+from src.db.file_listing import get_glob_prefix, glob_to_regex, list_files
+from src.db.fs_entry_path_cache import FSEntryPathCache
+from src.db.models import GitRef
+
+
+@pytest.fixture
+def tree_session(sqlite_session):
+    """
+    Directorio de trabajo con src/db (models.py, utils.py, 25 módulos), src/main.py, docs/readme.md, README.md y
+    tests/test_main.py, y el árbol de la ref main con src/app.py
+    """
+    session = sqlite_session
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    src = add_fs_entry(session, name="src", parent_id=root.id, is_directory=True)
+    db = add_fs_entry(session, name="db", parent_id=src.id, is_directory=True)
+    for name in ["models.py", "utils.py"] + [f"module_{index:02d}.py" for index in range(25)]:
+        add_fs_entry(session, name=name, parent_id=db.id, is_directory=False)
+    add_fs_entry(session, name="main.py", parent_id=src.id, is_directory=False)
+    docs = add_fs_entry(session, name="docs", parent_id=root.id, is_directory=True)
+    add_fs_entry(session, name="readme.md", parent_id=docs.id, is_directory=False)
+    add_fs_entry(session, name="README.md", parent_id=root.id, is_directory=False)
+    tests = add_fs_entry(session, name="tests", parent_id=root.id, is_directory=True)
+    add_fs_entry(session, name="test_main.py", parent_id=tests.id, is_directory=False)
+
+    ref_root = add_fs_entry(session, name="main", parent_id=None, is_directory=True)
+    ref_src = add_fs_entry(session, name="src", parent_id=ref_root.id, is_directory=True)
+    add_fs_entry(session, name="app.py", parent_id=ref_src.id, is_directory=False, blob_sha="a" * 40)
+    session.add(GitRef(name="main", commit_sha="b" * 40, root_id=ref_root.id))
+    bump_index_version(session)
+    session.commit()
+    return session
+
+
+@pytest.mark.parametrize("glob, matches, no_matches", [
+    ("*.py", ["main.py", "src/db/models.py"], ["README.md", "src/main.pyc"]),
+    ("src/*.py", ["src/main.py"], ["src/db/models.py", "main.py"]),
+    ("src/**/*.py", ["src/main.py", "src/db/models.py"], ["tests/test_main.py"]),
+    ("test_?ain.[pq]y", ["tests/test_main.py"], ["tests/test_mmain.py", "tests/test_main.ry"]),
+    ("[!a-m]*.md", ["README.md", "docs/readme.md"], ["docs/guide.md"]),
+])
+def test_glob_to_regex(glob, matches, no_matches):
+    regex = re.compile(glob_to_regex(glob))
+    assert all(regex.match(path) for path in matches)
+    assert not any(regex.match(path) for path in no_matches)
+
+
+@pytest.mark.parametrize("glob, prefix", [
+    ("*.py", None),
+    ("src/*.py", "src/"),
+    ("src/db/**/*.py", "src/db/"),
+    ("src/d?/*.py", "src/"),
+    ("**/test_*.py", None),
+    ("docs/readme.md", "docs/"),
+])
+def test_glob_prefix(glob, prefix):
+    assert get_glob_prefix(glob) == prefix
+
+
+def test_filters_and_refs(tree_session):
+    assert list_files(tree_session, glob="*.md") == {
+        "files": ["README.md", "docs/readme.md"], "total": 2, "next_cursor": None
+    }
+    assert list_files(tree_session, prefix="src/", glob="src/*.py")["files"] == ["src/main.py"]
+    assert list_files(tree_session, prefix="src/db/mod")["total"] == 26
+    assert list_files(tree_session, prefix="SRC/DB/Mod")["total"] == 0
+    assert list_files(tree_session, glob="src/db/mod*.py")["total"] == 26
+    assert list_files(tree_session, glob="src/**/main.py")["files"] == ["src/main.py"]
+    assert list_files(tree_session, prefix="src_%")["files"] == []
+    assert list_files(tree_session, ref="main", path_cache=FSEntryPathCache())["files"] == ["src/app.py"]
+    assert list_files(tree_session, group_by_directory=True) == {
+        "directories": [
+            {"path": "", "files": 1},
+            {"path": "docs", "files": 1},
+            {"path": "src", "files": 1},
+            {"path": "src/db", "files": 27},
+            {"path": "tests", "files": 1}
+        ],
+        "total": 31,
+        "next_cursor": None
+    }
+
+
+def test_cursor_pagination_returns_every_file_once(tree_session):
+    pages = []
+    cursor = None
+    while True:
+        page = list_files(tree_session, cursor=cursor, page_size=7)
+        pages.append(page["files"])
+        # el total solo se cuenta en la primera página
+        assert ("total" in page) == (cursor is None)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [len(files) for files in pages] == [7, 7, 7, 7, 3]
+    all_files = [path for files in pages for path in files]
+    assert all_files == sorted(all_files) and len(set(all_files)) == 31
+
+    directories = list_files(tree_session, group_by_directory=True, page_size=2)
+    assert [directory["path"] for directory in directories["directories"]] == ["", "docs"]
+    next_directories = list_files(tree_session, group_by_directory=True, page_size=2,
+                                  cursor=directories["next_cursor"])
+    assert [directory["path"] for directory in next_directories["directories"]] == ["src", "src/db"]
@@ -0,0 +1,74 @@
+import pytest
+
+from src.db.db_utils import add_fs_entry, bump_index_version, get_index_version, get_fs_entry_from_relative_path, \
+    get_search_directory, get_file_fs_entry, get_root_fs_entry, get_all_file_paths
+from src.db.fs_entry_path_cache import FSEntryPathCache
+from src.db.models import GitRef
+
+
+@pytest.fixture
+def tree_session(sqlite_session):
+    """
+    Árbol del directorio de trabajo con src/db/models.py, src/db/utils.py, src/Main.py y docs/readme.md, y el árbol de la
+    ref main con src/app.py
+    """
+    session = sqlite_session
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    src = add_fs_entry(session, name="src", parent_id=root.id, is_directory=True)
+    db = add_fs_entry(session, name="db", parent_id=src.id, is_directory=True)
+    for name in ["models.py", "utils.py"]:
+        add_fs_entry(session, name=name, parent_id=db.id, is_directory=False)
+    add_fs_entry(session, name="Main.py", parent_id=src.id, is_directory=False)
+    docs = add_fs_entry(session, name="docs", parent_id=root.id, is_directory=True)
+    add_fs_entry(session, name="readme.md", parent_id=docs.id, is_directory=False)
+
+    ref_root = add_fs_entry(session, name="main", parent_id=None, is_directory=True)
+    ref_src = add_fs_entry(session, name="src", parent_id=ref_root.id, is_directory=True)
+    add_fs_entry(session, name="app.py", parent_id=ref_src.id, is_directory=False, blob_sha="a" * 40)
+    session.add(GitRef(name="main", commit_sha="b" * 40, root_id=ref_root.id))
+    bump_index_version(session)
+    session.commit()
+    return session
+
+
+def test_cached_lookups_match_the_queries(tree_session):
+    cache = FSEntryPathCache()
+    for path in ["", "src", "SRC/db/Models.py", "src/main.py", "docs/readme.md", "src/app.py", "missing.py"]:
+        assert cache.get_fs_entry(tree_session, path) == get_fs_entry_from_relative_path(tree_session, path)
+    for ref in [None, "main"]:
+        assert get_root_fs_entry(tree_session, ref, cache) == get_root_fs_entry(tree_session, ref)
+        assert get_search_directory(tree_session, "src", ref, cache) == get_search_directory(tree_session, "src", ref)
+        assert get_all_file_paths(tree_session, ref, cache) == get_all_file_paths(tree_session, ref)
+    # sin ref solo el árbol del directorio de trabajo, sin las rutas de las refs
+    assert sorted(get_all_file_paths(tree_session, path_cache=cache)) == [
+        "", "docs", "docs/readme.md", "src", "src/Main.py", "src/db", "src/db/models.py", "src/db/utils.py"
+    ]
+    assert get_file_fs_entry(tree_session, "src/app.py", "main", cache).blob_sha == "a" * 40
+    for path_cache in [cache, None]:
+        with pytest.raises(FileNotFoundError):
+            get_file_fs_entry(tree_session, "src/Main.py", "main", path_cache)
+        with pytest.raises(FileNotFoundError):
+            get_file_fs_entry(tree_session, "src/app.py", path_cache=path_cache)
+    with pytest.raises(ValueError):
+        get_root_fs_entry(tree_session, "develop", cache)
+
+    trie = cache.get_trie(tree_session)
+    assert trie.get_path(get_fs_entry_from_relative_path(tree_session, "src/Main.py").id) == "src/Main.py"
+    assert cache.list_prefix(tree_session, "src/") == ["src/Main.py", "src/db", "src/db/models.py", "src/db/utils.py"]
+    assert cache.list_prefix(tree_session, "src/db/MO") == ["src/db/models.py"]
+    assert cache.list_prefix(tree_session, "src/", ref="main") == ["src/app.py"]
+    assert cache.list_prefix(tree_session, "tests/") == []
+
+
+def test_cache_is_reloaded_when_the_index_version_changes(tree_session):
+    cache = FSEntryPathCache()
+    version = get_index_version(tree_session)
+    assert cache.get_trie(tree_session).version == version
+
+    docs = get_fs_entry_from_relative_path(tree_session, "docs")
+    add_fs_entry(tree_session, name="usage.md", parent_id=docs.id, is_directory=False)
+    assert cache.get_fs_entry(tree_session, "docs/usage.md") is None
+
+    bump_index_version(tree_session)
+    assert get_index_version(tree_session) == version + 1
+    assert cache.get_fs_entry(tree_session, "docs/usage.md").path == "docs/usage.md"
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from src.chunker.chunk_identifiers import get_chunk_identifiers
+from src.db.db_utils import add_fs_entry, get_fs_entry_from_relative_path
+from src.db.hybrid_search import is_identifier_query, get_query_fragments, reciprocal_rank_fusion, \
+    search_lexical_chunk_ids, search_identifier_chunk_ids, search_chunk_ids, ensure_search_vector, SEARCH_MODE_VECTOR, \
+    SEARCH_MODE_LEXICAL, SEARCH_MODE_HYBRID
+from src.db.models import Base, FileChunk, EMBEDDING_DIMENSION, SEARCH_VECTOR_COLUMN, SEARCH_VECTOR_INDEX_NAME
+from src.db.search_planner import DirectorySearchPlanner
+
+CHUNK_CODE = {
+    "src/session.py": ["class DBConnection:", "    def get_session(self):", "        return self.session"],
+    "src/config.py": ["REPO_BASE_FOLDER = os.getenv('REPO_BASE_FOLDER')", "MAX_RESULTS = 10"],
+    "docs/user.java": ["public void setRating(Double rating) {", "    this.rating = rating;", "}"],
+}
+
+
+def get_embedding(seed: int):
+    return np.random.default_rng(seed).random(EMBEDDING_DIMENSION, dtype=np.float32)
+
+
+def test_chunk_identifiers_split_code_names():
+    identifiers = get_chunk_identifiers(["def getHTTPResponse_code(self):", "    return MAX_RESULTS + x"]).split()
+    assert identifiers == ["def", "gethttpresponse_code", "get", "http", "response", "code", "self", "return",
+                           "max_results", "max", "results"]
+
+
+def test_identifier_query_detection():
+    for query in ["getUidEvent", "REPO_BASE_FOLDER", "DBConnection.get_session", "PGVectorTools",
+                  "create_pgvector_table()", "\"Connection refused by server\""]:
+        assert is_identifier_query(query), query
+    for query in ["how are sessions created", "Session", "user rating", "a b c d_e", ""]:
+        assert not is_identifier_query(query), query
+    assert get_query_fragments("DBConnection.get_session a ()") == [["dbconnection", "get", "session"]]
+
+
+def test_reciprocal_rank_fusion_prefers_chunks_in_both_rankings():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4]], rrf_k=60) == [3, 1, 2, 4]
+    # con el mismo rango gana el primer ranking
+    assert reciprocal_rank_fusion([[1], [2]]) == [1, 2]
+
+
+def test_lexical_search_needs_postgresql(sqlite_session):
+    root = add_fs_entry(sqlite_session, name="repo", parent_id=None, is_directory=True)
+    assert search_lexical_chunk_ids(sqlite_session, "getUidEvent", root, 5) == []
+    assert search_identifier_chunk_ids(sqlite_session, "getUidEvent", root, 5) == []
+
+
+@pytest.fixture
+def pg_session(pg_engine):
+    session = sessionmaker(bind=pg_engine)()
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    directories = {}
+    for chunk_index, (path, code_lines) in enumerate(CHUNK_CODE.items()):
+        directory_name, file_name = path.split("/")
+        if directory_name not in directories:
+            directories[directory_name] = add_fs_entry(session, name=directory_name, parent_id=root.id,
+                                                       is_directory=True)
+        file_entry = add_fs_entry(session, name=file_name, parent_id=directories[directory_name].id,
+                                  is_directory=False)
+        session.execute(insert(FileChunk), [{
+            "file_id": file_entry.id, "start_line": 0, "end_line": len(code_lines) - 1,
+            "identifiers": get_chunk_identifiers(code_lines), "embedding": get_embedding(chunk_index)
+        }])
+    session.execute(text("UPDATE file_chunks SET docs = 'Stores the rating given by the user' WHERE chunk_id = 3"))
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(pg_engine)
+
+
+@pytest.mark.requires_database
+def test_lexical_search_matches_identifiers_and_docs(pg_session):
+    root = get_fs_entry_from_relative_path(pg_session, "")
+    assert search_identifier_chunk_ids(pg_session, "REPO_BASE_FOLDER", root, 5) == [2]
+    assert search_identifier_chunk_ids(pg_session, "DBConnection.get_session", root, 5) == [1]
+    assert search_identifier_chunk_ids(pg_session, "getRating", root, 5) == []
+    assert search_identifier_chunk_ids(pg_session, "REPO_BASE_FOLDER", root, 5, SEARCH_MODE_VECTOR) == []
+    # la documentación se busca con stemming, ratings -> rating
+    assert search_lexical_chunk_ids(pg_session, "user ratings", root, 5) == [3]
+    assert search_lexical_chunk_ids(pg_session, "REPO_BASE_FOLDER", get_fs_entry_from_relative_path(pg_session, "docs"),
+                                    5) == []
+
+
+@pytest.mark.requires_database
+def test_ensure_search_vector_upgrades_existing_databases(pg_session):
+    root = get_fs_entry_from_relative_path(pg_session, "")
+    # base de datos creada antes de la búsqueda híbrida
+    pg_session.execute(text(f"DROP INDEX {SEARCH_VECTOR_INDEX_NAME}"))
+    pg_session.execute(text(f"ALTER TABLE file_chunks DROP COLUMN {SEARCH_VECTOR_COLUMN}, DROP COLUMN identifiers"))
+    pg_session.commit()
+
+    ensure_search_vector(pg_session)
+    ensure_search_vector(pg_session)
+    assert search_lexical_chunk_ids(pg_session, "user ratings", root, 5) == [3]
+    assert pg_session.execute(text("SELECT count(*) FROM pg_indexes WHERE indexname = :name"),
+                              {"name": SEARCH_VECTOR_INDEX_NAME}).scalar_one() == 1
+
+
+@pytest.mark.requires_database
+def test_search_modes(pg_session):
+    root = get_fs_entry_from_relative_path(pg_session, "")
+    planner = DirectorySearchPlanner()
+    # el embedding de la consulta es el del chunk 1, el texto coincide con el chunk 3
+    query_embedding = get_embedding(0)
+
+    vector_ids, _ = search_chunk_ids(pg_session, planner, "rating", query_embedding, root, 3,
+                                     search_mode=SEARCH_MODE_VECTOR)
+    lexical_ids, _ = search_chunk_ids(pg_session, planner, "rating", None, root, 3, search_mode=SEARCH_MODE_LEXICAL)
+    hybrid_ids, description = search_chunk_ids(pg_session, planner, "rating", query_embedding, root, 2,
+                                               search_mode=SEARCH_MODE_HYBRID)
+    assert vector_ids[0] == 1
+    assert lexical_ids == [3]
+    assert hybrid_ids == reciprocal_rank_fusion([vector_ids, lexical_ids])[:2]
+    assert 3 in hybrid_ids
+    assert description.startswith(SEARCH_MODE_HYBRID)
+    with pytest.raises(ValueError):
+        search_chunk_ids(pg_session, planner, "rating", query_embedding, root, 3, search_mode="bm25")
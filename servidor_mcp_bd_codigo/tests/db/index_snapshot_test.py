@@ -0,0 +1,124 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from src.chunker.repo_chunker import FileChunker
+from src.db.index_snapshot import export_index_snapshot, import_index_snapshot, INDEX_MANIFEST_FILE_NAME, \
+    DEFAULT_INDEX_SNAPSHOT_FORMAT
+from src.db.models import FSEntry, Ancestor, FileChunk, ChunkNeighbour, chunk_references, EMBEDDING_DIMENSION
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path
+
+from config import ROOT_DIR
+
+EXAMPLE_FILES_PATH = get_file_absolute_path_from_proyect_relative_path('tests/chunker/example_files')
+
+
+def create_documented_index(session_maker):
+    """
+    Chunkea los ficheros de ejemplo y añade documentación y embedding a la mitad de los chunks
+    """
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        FileChunker(chunk_max_line_size=50, session=session_maker()).chunk_repo(EXAMPLE_FILES_PATH, [])
+
+    session = session_maker()
+    random_generator = np.random.default_rng(0)
+    for chunk in session.query(FileChunk).order_by(FileChunk.chunk_id).all()[::2]:
+        chunk.docs = f"Documentación del chunk {chunk.chunk_id}, con \"comillas\", comas y\nsaltos de línea"
+        chunk.embedding = random_generator.random(EMBEDDING_DIMENSION, dtype=np.float32)
+    session.commit()
+
+
+def get_index_contents(session) -> dict:
+    chunks = {
+        chunk.chunk_id: (chunk.file_id, chunk.start_line, chunk.end_line, chunk.docs, chunk.content_hash,
+                         None if chunk.embedding is None else np.asarray(chunk.embedding, dtype=np.float32).tobytes())
+        for chunk in session.query(FileChunk)
+    }
+    return {
+        "fsentry": {(entry.id, entry.parent_id, entry.path) for entry in session.query(FSEntry)},
+        "ancestors": {(a.descendant_id, a.ancestor_id, a.depth) for a in session.query(Ancestor)},
+        "file_chunks": chunks,
+        "chunk_references": set(session.execute(select(chunk_references)).all()),
+        "chunk_neighbours": {(n.chunk_id, n.direction, n.rank, n.neighbour_id) for n in session.query(ChunkNeighbour)}
+    }
+
+
+def assert_round_trip(source_session_maker, target_session_maker, snapshot_dir: str, export_format: str = "jsonl"):
+    manifest = export_index_snapshot(source_session_maker(), snapshot_dir, export_format=export_format)
+    embeddings = np.load(os.path.join(snapshot_dir, "embeddings.npy"))
+    assert embeddings.dtype == np.float32 and embeddings.flags["C_CONTIGUOUS"]
+    assert embeddings.shape == (manifest["embeddings"], EMBEDDING_DIMENSION)
+
+    row_counts = import_index_snapshot(target_session_maker(), snapshot_dir)
+    assert row_counts == manifest["row_counts"]
+
+    # Las sesiones se cierran para no dejar transacciones abiertas que bloqueen el borrado de las tablas
+    with source_session_maker() as source_session, target_session_maker() as target_session:
+        expected_contents = get_index_contents(source_session)
+        assert get_index_contents(target_session) == expected_contents
+    assert any(chunk[5] is not None for chunk in expected_contents["file_chunks"].values())
+
+
+def test_round_trip_restores_docs_embeddings_and_ids(tmp_path, sqlite_session_maker_factory):
+    source_session_maker = sqlite_session_maker_factory()
+    create_documented_index(source_session_maker)
+    assert_round_trip(source_session_maker, sqlite_session_maker_factory(), str(tmp_path / "snapshot"))
+
+
+def test_round_trip_with_the_default_format(tmp_path, sqlite_session_maker_factory):
+    # parquet si está instalado pyarrow, si no jsonl
+    source_session_maker = sqlite_session_maker_factory()
+    create_documented_index(source_session_maker)
+    snapshot_dir = str(tmp_path / "snapshot")
+    assert_round_trip(source_session_maker, sqlite_session_maker_factory(), snapshot_dir, export_format=None)
+
+    with open(os.path.join(snapshot_dir, INDEX_MANIFEST_FILE_NAME)) as file:
+        assert json.load(file)["format"] == DEFAULT_INDEX_SNAPSHOT_FORMAT
+    assert os.path.exists(os.path.join(snapshot_dir, f"fsentry.{DEFAULT_INDEX_SNAPSHOT_FORMAT}"))
+
+
+def test_import_checks_schema_version_and_empty_database(tmp_path, sqlite_session_maker_factory):
+    snapshot_dir = str(tmp_path / "snapshot")
+    source_session_maker = sqlite_session_maker_factory()
+    create_documented_index(source_session_maker)
+    export_index_snapshot(source_session_maker(), snapshot_dir, export_format="jsonl")
+
+    with pytest.raises(ValueError, match="ya tiene un índice"):
+        import_index_snapshot(source_session_maker(), snapshot_dir)
+
+    manifest_path = os.path.join(snapshot_dir, INDEX_MANIFEST_FILE_NAME)
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    with open(manifest_path, "w") as file:
+        json.dump({**manifest, "embedding_dimension": 768}, file)
+    with pytest.raises(ValueError, match="dimensión"):
+        import_index_snapshot(sqlite_session_maker_factory()(), snapshot_dir)
+
+    with open(manifest_path, "w") as file:
+        json.dump({**manifest, "schema_version": manifest["schema_version"] + 1}, file)
+    with pytest.raises(ValueError, match="versión de esquema"):
+        import_index_snapshot(sqlite_session_maker_factory()(), snapshot_dir)
+
+
+@pytest.mark.requires_database
+def test_postgres_import_with_copy(tmp_path, sqlite_session_maker, pg_engine):
+    create_documented_index(sqlite_session_maker)
+
+    target_session_maker = sessionmaker(bind=pg_engine)
+    assert_round_trip(sqlite_session_maker, target_session_maker, str(tmp_path / "snapshot"))
+
+    # las secuencias continúan después de los ids importados
+    session = target_session_maker()
+    root = session.query(FSEntry).filter(FSEntry.parent_id == None).one()
+    new_entry = FSEntry(name="new.py", parent_id=root.id, is_directory=False, path="new.py")
+    session.add(new_entry)
+    session.flush()
+    assert new_entry.id == session.query(FSEntry).count()
+    session.rollback()
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import inspect, text, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from src.db.db_utils import add_fs_entry
+from src.db.models import FileChunk, chunk_references, upgrade_index_schema, UPGRADE_COLUMNS
+
+
+@pytest.mark.requires_database
+def test_upgrade_index_schema_adds_the_new_columns_to_existing_databases(pg_engine):
+    # base de datos creada antes de las columnas nuevas, con un chunk y una referencia
+    with pg_engine.begin() as connection:
+        for column in UPGRADE_COLUMNS:
+            if column.name != "identifiers":
+                connection.execute(text(f"ALTER TABLE {column.table.name} DROP COLUMN {column.name}"))
+        connection.execute(text("DROP INDEX ix_fsentry_path_prefix"))
+        connection.execute(text("DROP INDEX ix_ancestors_ancestor_id"))
+        connection.execute(text("INSERT INTO fsentry (id, name, parent_id, is_directory, path) "
+                                "VALUES (100, 'a.py', NULL, false, 'a.py')"))
+        connection.execute(text("INSERT INTO file_chunks (chunk_id, file_id, start_line, end_line) "
+                                "VALUES (100, 100, 0, 10), (101, 100, 11, 20)"))
+        connection.execute(text("INSERT INTO chunk_references (referencing_id, referenced_id) VALUES (100, 101)"))
+
+    with pg_engine.begin() as connection:
+        upgrade_index_schema(connection)
+    with pg_engine.begin() as connection:
+        upgrade_index_schema(connection)
+
+    inspector = inspect(pg_engine)
+    for column in UPGRADE_COLUMNS:
+        assert column.name in {existing["name"] for existing in inspector.get_columns(column.table.name)}
+    assert "ix_fsentry_path_prefix" in {index["name"] for index in inspector.get_indexes("fsentry")}
+    assert "ix_ancestors_ancestor_id" in {index["name"] for index in inspector.get_indexes("ancestors")}
+
+    session = sessionmaker(bind=pg_engine)()
+    try:
+        # las filas existentes toman los valores por defecto y el modelo se puede usar
+        assert session.execute(select(chunk_references)).one() == (100, 101, 1, 1.0, False, 1.0)
+        add_fs_entry(session, name="b.py", parent_id=None, is_directory=False, blob_sha="a" * 40)
+        session.execute(insert(FileChunk), [{"file_id": 100, "start_line": 21, "end_line": 30, "content_hash": "h",
+                                             "duplicate_of_id": 100}])
+        session.flush()
+    finally:
+        session.rollback()
+        session.close()
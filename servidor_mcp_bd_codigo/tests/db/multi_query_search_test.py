@@ -0,0 +1,149 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from src.chunker.chunk_identifiers import get_chunk_identifiers
+from src.db.async_code_index import AsyncCodeIndex
+from src.db.db_utils import add_fs_entry, get_fs_entry_from_relative_path
+from src.db.hybrid_search import search_chunk_ids, SEARCH_MODE_VECTOR, SEARCH_MODE_HYBRID
+from src.db.models import Base, FileChunk, EMBEDDING_DIMENSION
+from src.db.multi_query_search import deduplicate_query_chunk_ids, execute_multi_query_plan, \
+    search_multi_query_chunk_ids, search_multi_query_identifier_chunk_ids
+from src.db.search_planner import DirectorySearchPlanner, SearchPlan, execute_search_plan, PLAN_EXACT, \
+    PLAN_PATH_PREFIX, PLAN_ANN_POST_FILTER
+
+NUM_CHUNKS = 60
+
+
+def get_embeddings():
+    return np.random.default_rng(0).random((NUM_CHUNKS, EMBEDDING_DIMENSION), dtype=np.float32)
+
+
+def test_deduplicate_keeps_chunk_in_best_ranked_query():
+    assert deduplicate_query_chunk_ids([[1, 2, 3], [2, 4], [5, 3, 1]]) == [[1], [2, 4], [5, 3]]
+    assert deduplicate_query_chunk_ids([]) == []
+
+
+@pytest.fixture
+def pg_session(pg_engine):
+    """
+    Un chunk por línea, la mitad en src y la otra mitad en docs
+    """
+    session = sessionmaker(bind=pg_engine)()
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    for directory_index, directory_name in enumerate(["src", "docs"]):
+        directory = add_fs_entry(session, name=directory_name, parent_id=root.id, is_directory=True)
+        file_entry = add_fs_entry(session, name="module.py", parent_id=directory.id, is_directory=False)
+        session.execute(insert(FileChunk), [{
+            "file_id": file_entry.id, "start_line": line, "end_line": line, "embedding": embedding,
+            "identifiers": get_chunk_identifiers([f"def {directory_name}_function{line}(): pass"])
+        } for line, embedding in enumerate(get_embeddings()[directory_index::2])])
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(pg_engine)
+
+
+@pytest.mark.requires_database
+def test_multi_query_plans_match_single_query_searches(pg_session):
+    embeddings = get_embeddings()
+    query_embeddings = {0: embeddings[4], 1: embeddings[11], 2: embeddings[30]}
+    for path in ["", "src"]:
+        fs_entry = get_fs_entry_from_relative_path(pg_session, path)
+        for plan_type in [PLAN_EXACT, PLAN_PATH_PREFIX, PLAN_ANN_POST_FILTER]:
+            plan = SearchPlan(plan_type, NUM_CHUNKS, NUM_CHUNKS, candidates=NUM_CHUNKS)
+            query_chunk_ids = execute_multi_query_plan(pg_session, plan, query_embeddings, fs_entry, 4)
+            for query_index, query_embedding in query_embeddings.items():
+                rows = execute_search_plan(pg_session, plan, query_embedding, fs_entry, 4)
+                assert query_chunk_ids[query_index] == [row[0].chunk_id for row in rows], (path, plan_type)
+            pg_session.commit()
+
+
+@pytest.mark.requires_database
+def test_multi_query_search_modes(pg_session):
+    root = get_fs_entry_from_relative_path(pg_session, "")
+    planner = DirectorySearchPlanner()
+    embeddings = get_embeddings()
+    queries = {0: "function7 helper", 1: "unrelated words"}
+    query_embeddings = {0: embeddings[3], 1: embeddings[8]}
+
+    for search_mode in [SEARCH_MODE_VECTOR, SEARCH_MODE_HYBRID]:
+        query_chunk_ids, _ = search_multi_query_chunk_ids(pg_session, planner, queries, query_embeddings, root, 3,
+                                                          search_mode=search_mode)
+        for query_index, query in queries.items():
+            chunk_ids, _ = search_chunk_ids(pg_session, planner, query, query_embeddings[query_index], root, 3,
+                                            search_mode=search_mode)
+            assert query_chunk_ids[query_index] == chunk_ids, search_mode
+
+    # solo las consultas de identificadores con resultados
+    assert search_multi_query_identifier_chunk_ids(
+        pg_session, ["src_function7", "unrelated words", "missing_function"], root, 3
+    ) == {0: [8]}
+
+
+@pytest.mark.requires_database
+@pytest.mark.usefixtures("pg_engine")
+def test_async_code_index_multi_query_response(tmp_path, test_database_url):
+    embeddings = get_embeddings()
+
+    class BatchEmbedder(Embeddings):
+        """
+        Embedder que guarda los lotes de consultas, el embedding es el del chunk indicado en la consulta
+        """
+        def __init__(self):
+            self.batches = []
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+        def embed_documents(self, texts):
+            self.batches.append(texts)
+            return [embeddings[int(text.split()[-1])] for text in texts]
+
+    async def run():
+        engine = create_async_engine(make_url(test_database_url).set(drivername="postgresql+asyncpg"))
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.drop_all)
+                await connection.run_sync(Base.metadata.create_all)
+            session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+            async with session_maker() as session:
+                root = await session.run_sync(add_fs_entry, name="repo", parent_id=None, is_directory=True)
+                file_entry = await session.run_sync(add_fs_entry, name="a.py", parent_id=root.id, is_directory=False)
+                await session.execute(insert(FileChunk), [
+                    {"file_id": file_entry.id, "start_line": line, "end_line": line, "embedding": embedding,
+                     "identifiers": get_chunk_identifiers([f"value_{line} = {line}"])}
+                    for line, embedding in enumerate(embeddings)
+                ])
+                await session.commit()
+            (tmp_path / "a.py").write_text("\n".join(f"value_{line} = {line}" for line in range(NUM_CHUNKS)))
+
+            embedder = BatchEmbedder()
+            code_index = AsyncCodeIndex(session_maker, embedder, repo_path=str(tmp_path), max_chunks=2,
+                                        log_search_plans=False, max_queries=4)
+            response = await code_index.search_multi_query_response(
+                ["chunk 5", "value_20", "chunk 5", "chunk 40"]
+            )
+            with pytest.raises(ValueError):
+                await code_index.search_multi_query_chunk_ids(["chunk 1"] * 5)
+            return response, embedder.batches
+        finally:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.drop_all)
+            await engine.dispose()
+
+    response, batches = asyncio.run(run())
+    # las consultas repetidas se buscan una vez y value_20 no necesita embedding
+    assert batches == [["chunk 5", "chunk 40"]]
+    assert list(response) == ["chunk 5", "value_20", "chunk 40"]
+    assert list(response["chunk 5"])[0] == 6
+    assert list(response["value_20"]) == [21]
+    assert response["value_20"][21]["chunk_content"] == "value_20 = 20"
+    assert list(response["chunk 40"])[0] == 41
+    assert all(len(query_response) == 2 for query_response in [response["chunk 5"], response["chunk 40"]])
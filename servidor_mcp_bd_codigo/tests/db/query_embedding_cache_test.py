@@ -0,0 +1,108 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import create_engine, update, select, func
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import QueryEmbedding
+from src.db.query_embedding_cache import CachedQueryEmbedder, normalize_query
+
+EMBEDDING_DIMENSION = 1536
+
+
+class CountingEmbedder(Embeddings):
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, text: str):
+        self.queries.append(text)
+        return [float(len(self.queries))] * EMBEDDING_DIMENSION
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_query_embedding_cache_memory_and_shared_hits(tmp_path, sqlite_session_maker):
+    session_maker = sqlite_session_maker
+    embedder = CountingEmbedder()
+    metrics_path = tmp_path / "query_embedding_cache.prom"
+    cached_embedder = CachedQueryEmbedder(embedder, session_maker, memory_size=2, metrics_path=str(metrics_path))
+
+    first_embedding = cached_embedder.embed_query("Where is  the DB session created?")
+    assert normalize_query("  where is the db\tSESSION created? ") == "where is the db session created?"
+    assert cached_embedder.embed_query("  where is the db\tSESSION created? ") == first_embedding
+    assert len(embedder.queries) == 1
+
+    # Otro proceso reutiliza el embedding de la tabla compartida
+    other_embedder = CachedQueryEmbedder(embedder, session_maker)
+    assert other_embedder.embed_query("where is the db session created?") == first_embedding
+    assert len(embedder.queries) == 1
+    assert other_embedder.get_metrics().shared_hits == 1
+
+    # El LRU descarta la entrada menos usada, que se recupera de la tabla compartida
+    cached_embedder.embed_query("second query")
+    cached_embedder.embed_query("third query")
+    assert cached_embedder.embed_query("where is the db session created?") == first_embedding
+    assert len(embedder.queries) == 3
+
+    metrics = cached_embedder.get_metrics()
+    assert (metrics.memory_hits, metrics.shared_hits, metrics.misses) == (1, 1, 3)
+    assert metrics.hit_rate == 0.4
+    assert metrics.memory_entries == 2
+    assert "query_embedding_cache_misses 3" in metrics_path.read_text()
+
+
+def test_query_embedding_cache_expiration(sqlite_session_maker):
+    session_maker = sqlite_session_maker
+    embedder = CountingEmbedder()
+    cached_embedder = CachedQueryEmbedder(embedder, session_maker, ttl_seconds=60)
+    cached_embedder.embed_query("expired query")
+    cached_embedder.embed_query("valid query")
+
+    # Se caduca la entrada en ambos niveles
+    query_hash = next(iter(cached_embedder.memory_cache))
+    embedding, _ = cached_embedder.memory_cache[query_hash]
+    cached_embedder.memory_cache[query_hash] = (embedding, time.monotonic() - 120)
+    with session_maker() as session:
+        session.execute(update(QueryEmbedding).where(QueryEmbedding.query_hash == query_hash)
+                        .values(created_at=datetime.now(timezone.utc) - timedelta(seconds=120)))
+        session.commit()
+
+    cached_embedder.embed_query("expired query")
+    cached_embedder.embed_query("valid query")
+    assert embedder.queries == ["expired query", "valid query", "expired query"]
+    with session_maker() as session:
+        assert session.execute(select(func.count()).select_from(QueryEmbedding)).scalar_one() == 2
+
+
+def test_query_embedding_cache_without_database():
+    embedder = CountingEmbedder()
+
+    def broken_session_maker():
+        raise_engine = create_engine("sqlite:////nonexistent/directory/cache.db")
+        return sessionmaker(bind=raise_engine)()
+
+    cached_embedder = CachedQueryEmbedder(embedder, broken_session_maker)
+    assert cached_embedder.embed_query("query") == cached_embedder.embed_query("query")
+    assert len(embedder.queries) == 1
+    assert cached_embedder.get_metrics().shared_errors == 2
+
+
+def test_query_embedding_cache_batches_missing_queries(sqlite_session_maker):
+    embedder = CountingEmbedder()
+    batches = []
+    embedder.embed_documents = lambda texts: batches.append(list(texts)) or [embedder.embed_query(text)
+                                                                              for text in texts]
+    cached_embedder = CachedQueryEmbedder(embedder, sqlite_session_maker)
+    cached_query_embedding = cached_embedder.embed_query("cached query")
+
+    embeddings = cached_embedder.embed_queries(["first query", "cached query", "second query", "First  query"])
+
+    # Solo se calculan las consultas que no están en la caché, una vez cada una y en un solo lote
+    assert batches == [["first query", "second query"]]
+    assert embeddings[1] == cached_query_embedding
+    assert embeddings[0] == embeddings[3] != embeddings[2]
+    assert cached_embedder.embed_query("second query") == embeddings[2]
+    metrics = cached_embedder.get_metrics()
+    assert (metrics.memory_hits, metrics.misses) == (2, 3)
@@ -0,0 +1,74 @@
+import pytest
+
+from src.chunker.chunk_size import load_token_counter
+from src.db.db_utils import add_fs_entry, bump_index_version, get_fs_entry_from_relative_path
+from src.db.fs_entry_path_cache import FSEntryPathCache
+from src.db.repository_tree import RepositoryTreeCache
+
+
+@pytest.fixture
+def tree_session(sqlite_session):
+    """
+    repo con src/db (20 ficheros), src/main.py, docs/readme.md, README.md y un directorio .git ignorado
+    """
+    session = sqlite_session
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    git = add_fs_entry(session, name=".git", parent_id=root.id, is_directory=True)
+    add_fs_entry(session, name="HEAD", parent_id=git.id, is_directory=False)
+    src = add_fs_entry(session, name="src", parent_id=root.id, is_directory=True)
+    db = add_fs_entry(session, name="db", parent_id=src.id, is_directory=True)
+    for index in range(20):
+        add_fs_entry(session, name=f"module_{index:02d}.py", parent_id=db.id, is_directory=False)
+    add_fs_entry(session, name="main.py", parent_id=src.id, is_directory=False)
+    docs = add_fs_entry(session, name="docs", parent_id=root.id, is_directory=True)
+    add_fs_entry(session, name="readme.md", parent_id=docs.id, is_directory=False)
+    add_fs_entry(session, name="README.md", parent_id=root.id, is_directory=False)
+    bump_index_version(session)
+    session.commit()
+    return session
+
+
+def test_tree_depth_and_subtree(tree_session):
+    tree_cache = RepositoryTreeCache()
+
+    assert tree_cache.get_tree_str(tree_session, max_depth=1, token_budget=None) == (
+        "repo\n"
+        "├── README.md\n"
+        "├── docs/ (1 files, 0 directories)\n"
+        "└── src/ (21 files, 1 directories)\n"
+    )
+    assert tree_cache.get_tree_str(tree_session, sub_path="src/db", max_depth=None, token_budget=None).splitlines()[:3] == [
+        "db", "├── module_00.py", "├── module_01.py"
+    ]
+    full_tree = tree_cache.get_tree_str(tree_session, token_budget=None)
+    assert "    ├── db\n    │   ├── module_00.py" in full_tree
+    assert ".git" not in full_tree and "HEAD" not in full_tree
+    with pytest.raises(FileNotFoundError):
+        tree_cache.get_tree_str(tree_session, sub_path="tests")
+
+
+def test_token_budget_collapses_large_directories(tree_session):
+    tree_cache = RepositoryTreeCache()
+    full_tokens = sum(load_token_counter()([tree_cache.get_tree_str(tree_session, token_budget=None)]))
+
+    budget = full_tokens // 2
+    tree_str = tree_cache.get_tree_str(tree_session, token_budget=budget)
+    assert sum(load_token_counter()([tree_str])) <= budget
+    # src/db es el directorio grande, el resto del árbol cabe
+    assert "    ├── db/ (20 files, 0 directories)\n    └── main.py" in tree_str
+    assert "docs\n│   └── readme.md" in tree_str
+
+
+def test_rendered_trees_are_cached_per_index_version(tree_session):
+    path_cache = FSEntryPathCache()
+    tree_cache = RepositoryTreeCache()
+    tree_str = tree_cache.get_tree_str(tree_session, "docs", path_cache=path_cache)
+    assert tree_cache.get_tree_str(tree_session, "docs", path_cache=path_cache) is tree_str
+
+    docs = get_fs_entry_from_relative_path(tree_session, "docs")
+    add_fs_entry(tree_session, name="usage.md", parent_id=docs.id, is_directory=False)
+    assert tree_cache.get_tree_str(tree_session, "docs", path_cache=path_cache) == tree_str
+    bump_index_version(tree_session)
+    assert tree_cache.get_tree_str(tree_session, "docs", path_cache=path_cache) == (
+        "docs\n├── readme.md\n└── usage.md\n"
+    )
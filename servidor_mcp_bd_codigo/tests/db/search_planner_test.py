@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import insert
+
+from src.db.db_utils import add_fs_entry, get_fs_entry_from_relative_path, bump_index_version
+from src.db.models import FileChunk
+from src.db.search_planner import DirectorySearchPlanner, get_closure_descendant_ids, \
+    get_path_prefix_descendant_ids, PLAN_EXACT, PLAN_ANN_POST_FILTER, PLAN_PATH_PREFIX
+from src.db.vector_index import VectorSearchParameters
+
+
+@pytest.fixture
+def session(sqlite_session):
+    return sqlite_session
+
+
+def add_directory_with_chunks(session, parent_id: int, name: str, num_chunks: int):
+    directory = add_fs_entry(session, name=name, parent_id=parent_id, is_directory=True)
+    file_entry = add_fs_entry(session, name="module.py", parent_id=directory.id, is_directory=False)
+    session.execute(insert(FileChunk), [
+        {"file_id": file_entry.id, "start_line": line, "end_line": line + 1} for line in range(num_chunks)
+    ])
+    return directory
+
+
+def create_tree(session):
+    """
+    Los directorios src_main y src%main comparten prefijo con src para comprobar los límites del prefijo de la ruta
+    """
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    src = add_directory_with_chunks(session, root.id, "src", 10)
+    add_directory_with_chunks(session, src.id, "small", 5)
+    add_directory_with_chunks(session, src.id, "large", 300)
+    add_directory_with_chunks(session, root.id, "src_main", 20)
+    add_directory_with_chunks(session, root.id, "src%main", 20)
+    add_directory_with_chunks(session, root.id, "other", 2000)
+    session.commit()
+    return root
+
+
+def test_path_prefix_matches_closure_descendants(session):
+    create_tree(session)
+    for path in ["src", "src/large", "src_main"]:
+        fs_entry = get_fs_entry_from_relative_path(session, path)
+        closure_ids = set(session.execute(get_closure_descendant_ids(fs_entry)).scalars())
+        path_ids = set(session.execute(get_path_prefix_descendant_ids(fs_entry)).scalars())
+        assert path_ids == closure_ids
+
+
+def test_planner_chooses_plan_by_subtree_chunks(session):
+    root = create_tree(session)
+    planner = DirectorySearchPlanner(exact_max_chunks=50, ann_overfetch=2.0, ann_max_candidates=100)
+
+    small_plan = planner.plan(session, get_fs_entry_from_relative_path(session, "src/small"), max_results=10)
+    assert (small_plan.plan_type, small_plan.subtree_chunks) == (PLAN_EXACT, 5)
+
+    # 2000 de 2355 chunks: se piden al índice el doble de los candidatos necesarios para encontrar 10 en el directorio
+    other_plan = planner.plan(session, get_fs_entry_from_relative_path(session, "other"), max_results=10)
+    assert other_plan.plan_type == PLAN_ANN_POST_FILTER
+    assert other_plan.candidates == 24
+    assert other_plan.get_search_parameters(VectorSearchParameters(ef_search=10)).ef_search == 24
+
+    # subárbol grande con una proporción pequeña del total
+    src_entry = get_fs_entry_from_relative_path(session, "src")
+    assert planner.plan(session, src_entry, max_results=10).plan_type == PLAN_PATH_PREFIX
+    # las rutas de otro árbol (una ref de git) coinciden con las del primero, no se puede filtrar por prefijo
+    add_directory_with_chunks(session, add_fs_entry(session, name="ref", parent_id=None, is_directory=True).id, "src", 1)
+    bump_index_version(session)
+    assert planner.plan(session, src_entry, max_results=10).plan_type == PLAN_EXACT
+    assert planner.plan(session, root, max_results=10).plan_type == PLAN_ANN_POST_FILTER
+
+
+def test_subtree_chunks_are_counted_once_per_index_version(session):
+    create_tree(session)
+    planner = DirectorySearchPlanner()
+    src_entry = get_fs_entry_from_relative_path(session, "src")
+    assert planner.plan(session, src_entry, max_results=10).subtree_chunks == 315
+
+    add_directory_with_chunks(session, src_entry.id, "new", 5)
+    assert planner.plan(session, src_entry, max_results=10).subtree_chunks == 315
+    bump_index_version(session)
+    assert planner.plan(session, src_entry, max_results=10).subtree_chunks == 320
@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+
+from config import ROOT_DIR
+from src.chunker.repo_chunker import FileChunker
+from src.db.db_utils import delete_file_chunks, delete_fs_entries, get_file_fs_entry
+from src.db.models import FileChunk, Symbol
+from src.db.symbol_search import find_definitions, find_references, build_symbols_response, parse_symbol_name
+from src.utils.utils import get_file_absolute_path_from_proyect_relative_path
+
+REFERENCE_REPO_PATH = get_file_absolute_path_from_proyect_relative_path(
+    'tests/chunker/example_files/reference_resolution_repo'
+)
+A_PATH = os.path.join("pkg", "a.py")
+B_PATH = os.path.join("pkg", "b.py")
+C_PATH = os.path.join("pkg", "c.py")
+
+
+@pytest.fixture
+def symbols_session(sqlite_session):
+    session = sqlite_session
+    with patch('importlib.resources.files') as mock_files:
+        mock_files.return_value = Path(ROOT_DIR)
+        FileChunker(chunk_max_line_size=100, session=session).chunk_repo(REFERENCE_REPO_PATH, [])
+    return session
+
+
+def test_parse_symbol_name():
+    assert parse_symbol_name("run") == (None, "run")
+    assert parse_symbol_name("Worker.run") == ("Worker", "run")
+    assert parse_symbol_name("pkg::Worker::run") == ("Worker", "run")
+    with pytest.raises(ValueError):
+        parse_symbol_name(" . ")
+
+
+def test_definitions_are_found_by_name_and_class(symbols_session):
+    definitions = find_definitions(symbols_session, "run")
+    assert [(symbol.path, symbol.qualified_name, symbol.kind) for symbol in definitions] == [
+        (A_PATH, "run", "function"),
+        (A_PATH, "Worker.run", "method"),
+        (B_PATH, "Other.run", "method"),
+    ]
+    assert all(symbol.chunk_id is not None for symbol in definitions)
+
+    worker_run = find_definitions(symbols_session, "Worker::run")
+    assert [(symbol.path, symbol.start_line, symbol.end_line) for symbol in worker_run] == [(A_PATH, 5, 6)]
+    response = build_symbols_response(worker_run, repo_path=REFERENCE_REPO_PATH, definition_max_lines=1)
+    assert response == [{
+        "name": "Worker.run",
+        "kind": "method",
+        "path": A_PATH,
+        "start_line": 6,
+        "end_line": 7,
+        "code": "    def run(self):",
+        "truncated": True
+    }]
+
+    assert [symbol.kind for symbol in find_definitions(symbols_session, "Worker")] == ["class"]
+    # sin coincidencias exactas se devuelven los nombres que contienen el texto
+    assert [symbol.name for symbol in find_definitions(symbols_session, "mai")] == ["main"]
+    assert find_definitions(symbols_session, "run", directory_path=C_PATH) == []
+
+
+def test_references_and_deleted_files(symbols_session):
+    references = find_references(symbols_session, "Worker.helper")
+    response = build_symbols_response(references, repo_path=REFERENCE_REPO_PATH)
+    assert [(symbol["path"], symbol["start_line"], symbol["code"]) for symbol in response] == [
+        (A_PATH, 7, "        return self.helper()")
+    ]
+    assert {symbol.path for symbol in find_references(symbols_session, "run")} == {B_PATH, C_PATH}
+
+    # los símbolos se borran con los chunks y las entradas de sus ficheros
+    b_entry = get_file_fs_entry(symbols_session, B_PATH)
+    b_chunk_ids = symbols_session.execute(
+        select(FileChunk.chunk_id).where(FileChunk.file_id == b_entry.id)
+    ).scalars().all()
+    delete_file_chunks(symbols_session, b_chunk_ids)
+    delete_fs_entries(symbols_session, [b_entry.id])
+    assert symbols_session.execute(select(Symbol).where(Symbol.file_id == b_entry.id)).first() is None
+    assert {symbol.path for symbol in find_references(symbols_session, "run")} == {C_PATH}
@@ -0,0 +1,24 @@
+import pytest
+
+from src.db.vector_index import VectorIndexConfig, build_create_index_sql, get_ivfflat_default_lists, \
+    INDEX_TYPE_HNSW, INDEX_TYPE_IVFFLAT
+
+
+def test_create_index_sql_uses_configured_parameters():
+    hnsw_sql = build_create_index_sql(VectorIndexConfig(index_type=INDEX_TYPE_HNSW, m=24, ef_construction=100))
+    assert hnsw_sql == ("CREATE INDEX ix_file_chunks_embedding_ann ON file_chunks USING hnsw "
+                        "(embedding vector_cosine_ops) WITH (m = 24, ef_construction = 100)")
+
+    ivfflat_sql = build_create_index_sql(VectorIndexConfig(index_type=INDEX_TYPE_IVFFLAT, lists=0), lists=40,
+                                         concurrently=True)
+    assert ivfflat_sql.startswith("CREATE INDEX CONCURRENTLY ")
+    assert ivfflat_sql.endswith("USING ivfflat (embedding vector_cosine_ops) WITH (lists = 40)")
+
+    with pytest.raises(ValueError):
+        build_create_index_sql(VectorIndexConfig(index_type="flat"))
+
+
+def test_ivfflat_default_lists_grow_with_rows():
+    assert get_ivfflat_default_lists(0) == 1
+    assert get_ivfflat_default_lists(50_000) == 50
+    assert get_ivfflat_default_lists(4_000_000) == 2000
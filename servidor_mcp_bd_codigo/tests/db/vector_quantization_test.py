@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from src.db.db_utils import add_fs_entry, get_fs_entry_from_relative_path
+from src.db.models import Base, FileChunk, EMBEDDING_DIMENSION
+from src.db.multi_query_search import execute_multi_query_plan
+from src.db.search_planner import DirectorySearchPlanner, SearchPlan, execute_search_plan, PLAN_EXACT, \
+    PLAN_ANN_POST_FILTER
+from src.db.vector_quantization import get_binary_query_bits, build_add_quantization_column_sql, \
+    build_create_quantization_index_sql, get_vector_quantization, enable_vector_quantization, \
+    disable_vector_quantization, get_quantization_info, has_native_quantization, QUANTIZATION_BINARY, \
+    QUANTIZATION_HALFVEC, QUANTIZATION_NONE, BINARY_QUANTIZE_FUNCTION
+
+NUM_CHUNKS = 80
+
+
+def get_embeddings():
+    return np.random.default_rng(1).normal(size=(NUM_CHUNKS, EMBEDDING_DIMENSION)).astype(np.float32)
+
+
+def test_quantization_sql_and_query_bits():
+    assert get_binary_query_bits([0.5, -0.1, 0.0, 2.0]) == "1001"
+    assert build_add_quantization_column_sql(QUANTIZATION_HALFVEC, native=True) == (
+        "ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS embedding_halfvec halfvec(1536) "
+        "GENERATED ALWAYS AS (embedding::halfvec(1536)) STORED"
+    )
+    assert f"AS ({BINARY_QUANTIZE_FUNCTION}(embedding))" in build_add_quantization_column_sql(QUANTIZATION_BINARY,
+                                                                                               native=False)
+    assert build_create_quantization_index_sql(QUANTIZATION_BINARY, m=8, ef_construction=32).endswith(
+        "USING hnsw (embedding_binary bit_hamming_ops) WITH (m = 8, ef_construction = 32)"
+    )
+
+
+def test_planner_without_quantization_column_uses_full_vectors(sqlite_session):
+    root = add_fs_entry(sqlite_session, name="repo", parent_id=None, is_directory=True)
+
+    assert get_vector_quantization(sqlite_session, QUANTIZATION_BINARY) is None
+    with pytest.raises(ValueError):
+        get_vector_quantization(sqlite_session, "int8")
+    plan = DirectorySearchPlanner(quantization=QUANTIZATION_BINARY, rerank_factor=4).plan(
+        sqlite_session, root, 10, PLAN_ANN_POST_FILTER
+    )
+    assert plan.quantization is None
+
+
+@pytest.fixture
+def pg_session(pg_engine):
+    session = sessionmaker(bind=pg_engine)()
+    root = add_fs_entry(session, name="repo", parent_id=None, is_directory=True)
+    file_entry = add_fs_entry(session, name="module.py", parent_id=root.id, is_directory=False)
+    session.execute(insert(FileChunk), [
+        {"file_id": file_entry.id, "start_line": line, "end_line": line, "embedding": embedding}
+        for line, embedding in enumerate(get_embeddings())
+    ])
+    session.commit()
+    yield session
+    session.rollback()
+    for quantization in [QUANTIZATION_BINARY, QUANTIZATION_HALFVEC]:
+        disable_vector_quantization(session, quantization)
+    session.close()
+    Base.metadata.drop_all(pg_engine)
+
+
+@pytest.mark.requires_database
+def test_two_stage_search_reranks_with_full_vectors(pg_session):
+    quantizations = [QUANTIZATION_BINARY]
+    if has_native_quantization(pg_session):
+        quantizations.append(QUANTIZATION_HALFVEC)
+    else:
+        with pytest.raises(ValueError):
+            enable_vector_quantization(pg_session, QUANTIZATION_HALFVEC)
+    root = get_fs_entry_from_relative_path(pg_session, "")
+    embeddings = get_embeddings()
+    query_embeddings = {0: embeddings[3], 1: -embeddings[40]}
+
+    for quantization in quantizations:
+        vector_quantization = enable_vector_quantization(pg_session, quantization)
+        planner = DirectorySearchPlanner(quantization=quantization, rerank_factor=2)
+        plan = planner.plan(pg_session, root, 5, PLAN_ANN_POST_FILTER)
+        assert plan.quantization == vector_quantization
+        assert quantization in str(plan)
+
+        # con todos los chunks como candidatos la segunda fase da el resultado exacto
+        plan.candidates = NUM_CHUNKS
+        exact_plan = SearchPlan(PLAN_EXACT, NUM_CHUNKS, NUM_CHUNKS)
+        multi_query_chunk_ids = execute_multi_query_plan(pg_session, plan, query_embeddings, root, 5)
+        for query_index, query_embedding in query_embeddings.items():
+            rows = execute_search_plan(pg_session, plan, query_embedding, root, 5)
+            exact_rows = execute_search_plan(pg_session, exact_plan, query_embedding, root, 5)
+            assert [row[0].chunk_id for row in rows] == [row[0].chunk_id for row in exact_rows]
+            assert [row[1] for row in rows] == pytest.approx([row[1] for row in exact_rows])
+            assert multi_query_chunk_ids[query_index] == [row[0].chunk_id for row in rows]
+        # el embedding más cercano a sí mismo también es el primero con la distancia de la columna compacta
+        plan.candidates = 1
+        assert execute_search_plan(pg_session, plan, embeddings[3], root, 1)[0][0].chunk_id == 4
+        pg_session.commit()
+
+    info = {column["quantization"]: column for column in get_quantization_info(pg_session)}
+    assert info[QUANTIZATION_BINARY]["column_bytes"] * 16 < info[QUANTIZATION_NONE]["column_bytes"]
@@ -25,8 +25,12 @@ class CodeAgent(SpecializedAgent):
             model=model,
             tools_str= [
                 "get_code_repository_rag_docs_from_query_tool",
+                "get_code_repository_rag_docs_from_queries_tool",
                 "get_file_from_repository_tool",
+                "get_definition_tool",
+                "find_references_tool",
                 "get_repository_tree_tool",
+                "list_repository_files_tool",
                 "get_all_respository_files_list"
             ],
             prompt_only_tools=[